@@ -11,6 +11,7 @@ Version: 2.0.0
 
 import os
 import json
+import asyncio
 import logging
 import hmac
 import hashlib
@@ -18,7 +19,7 @@ from datetime import datetime
 from typing import Dict, Any, Optional
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import PlainTextResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
@@ -29,6 +30,15 @@ from dotenv import load_dotenv
 from scripts.ai_sdr_agent import SerenaSDRAgent
 from scripts.agent_tools.supabase_tools import SupabaseTools
 from scripts.agent_tools.whatsapp_tools import WhatsAppTools
+from scripts.agent_tools.mcp_transport import close_transport, close_async_transport, get_pool_metrics
+from scripts.agent_tools.lead_cache import get_lead_cache
+from scripts.agent_tools.ocr_cache import get_ocr_cache
+from scripts.agent_tools.db_pool import close_db_pool
+from scripts.agent_tools.local_ocr import close_local_ocr
+from scripts.agent_tools.media_storage import get_media_storage
+from scripts.agent_tools.message_queue import get_message_queue, QueueWorkerPool
+from scripts.agent_tools.lead_executor import LeadSerialExecutor
+from scripts.agent_tools.message_dedup import get_message_deduplicator
 
 # Carregar variáveis de ambiente
 load_dotenv()
@@ -43,25 +53,72 @@ logger = logging.getLogger(__name__)
 # Configurações
 WHATSAPP_VERIFY_TOKEN = os.getenv("WHATSAPP_VERIFY_TOKEN", "serena_webhook_verify_token")
 WHATSAPP_APP_SECRET = os.getenv("WHATSAPP_APP_SECRET", "")
+AGENT_STREAM_RESPONSES = os.getenv("AGENT_STREAM_RESPONSES", "true").lower() == "true"
+MESSAGE_QUEUE_WORKERS = int(os.getenv("MESSAGE_QUEUE_WORKERS", "4"))
+LEAD_TURN_TIMEOUT = float(os.getenv("LEAD_TURN_TIMEOUT", os.getenv("MESSAGE_QUEUE_HANDLER_TIMEOUT", "180")))
+LEAD_LOCK_TTL = float(os.getenv("LEAD_LOCK_TTL", "30"))
+LEAD_DEBOUNCE_SECONDS = float(os.getenv("LEAD_DEBOUNCE_SECONDS", "1.5"))
+LEAD_DEBOUNCE_MAX_SECONDS = float(os.getenv("LEAD_DEBOUNCE_MAX_SECONDS", "4"))
+MEDIA_MESSAGE_TYPES = ("image", "document")
 
 # Instâncias globais
 sdr_agent = None
 supabase_tools = None
 whatsapp_tools = None
+message_queue = None
+worker_pool = None
+lead_executor = None
+
+# Tarefas em segundo plano sem await (referência mantida até concluírem)
+background_tasks = set()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Gerencia ciclo de vida da aplicação."""
-    global sdr_agent, supabase_tools, whatsapp_tools
+    global sdr_agent, supabase_tools, whatsapp_tools, message_queue, worker_pool, lead_executor
     
     logger.info("Inicializando Serena SDR Webhook Service...")
     
     try:
         # Inicializar ferramentas
-        sdr_agent = SerenaSDRAgent()
+        # O agente usa as mesmas ferramentas do Supabase (e o mesmo cache de leads)
         supabase_tools = SupabaseTools()
+        sdr_agent = SerenaSDRAgent(supabase_tools=supabase_tools)
         whatsapp_tools = WhatsAppTools()
         logger.info("Ferramentas inicializadas com sucesso")
+        
+        # Mensagens de um mesmo lead em série e, quando em rajada, em um único turno;
+        # o executor conclui cada mensagem (a fila só espera ele aceitar)
+        lead_executor = LeadSerialExecutor(
+            process_message_async,
+            key=lambda message_data: message_data['phone_number'],
+            merge=merge_message_batch,
+            can_merge=can_merge_message,
+            debounce=LEAD_DEBOUNCE_SECONDS,
+            max_wait=LEAD_DEBOUNCE_MAX_SECONDS,
+            redis_url=os.getenv("LEAD_LOCK_REDIS_URL") or os.getenv("REDIS_URL"),
+            turn_timeout=LEAD_TURN_TIMEOUT,
+            lock_ttl=LEAD_LOCK_TTL
+        )
+        await lead_executor.start()
+        
+        # Fila durável entre o webhook e o agente, consumida por um pool fixo de workers
+        message_queue = get_message_queue()
+        await message_queue.start()
+        worker_pool = QueueWorkerPool(
+            message_queue,
+            lead_executor.submit,
+            concurrency=MESSAGE_QUEUE_WORKERS,
+            on_dead_letter=notify_dead_letter,
+            key=lambda message_data: message_data['phone_number']
+        )
+        await worker_pool.start()
+        
+        # Cobertura e planos das localidades frequentes, sem atrasar a inicialização
+        app.state.coverage_warmup = asyncio.create_task(asyncio.to_thread(sdr_agent.serena_tools.warm_coverage_cache))
+        
+        # Índice local de áreas de operação para qualificar sem chamar o MCP
+        sdr_agent.serena_tools.start_coverage_index_sync()
     except Exception as e:
         logger.error(f"Erro ao inicializar ferramentas: {str(e)}")
         raise
@@ -69,6 +126,17 @@ async def lifespan(app: FastAPI):
     yield
     
     logger.info("Encerrando Serena SDR Webhook Service...")
+    await worker_pool.stop()
+    # Devolve à fila as mensagens aceitas e ainda não processadas
+    await lead_executor.close()
+    await message_queue.close()
+    await get_message_deduplicator().close()
+    close_transport()
+    await close_async_transport()
+    close_db_pool()
+    close_local_ocr()
+    sdr_agent.serena_tools.coverage_cache.close()
+    sdr_agent.serena_tools.coverage_index.stop()
 
 # Criar aplicação FastAPI
 app = FastAPI(
@@ -125,6 +193,7 @@ def extract_message_data(webhook_data: Dict[str, Any]) -> Optional[Dict[str, Any
             return None
         
         message = messages[0]
+        message_id = message.get('id')
         phone_number = message.get('from', '')
         message_type = message.get('type', 'text')
         timestamp = message.get('timestamp', str(int(datetime.now().timestamp())))
@@ -144,12 +213,18 @@ def extract_message_data(webhook_data: Dict[str, Any]) -> Optional[Dict[str, Any
         elif message_type == 'image':
             media_id = message.get('image', {}).get('id', '')
             message_text = message.get('image', {}).get('caption', '[Imagem recebida]')
+        elif message_type == 'document':
+            # Conta de luz enviada como arquivo (geralmente PDF)
+            document = message.get('document', {})
+            media_id = document.get('id', '')
+            message_text = document.get('caption') or f"[Documento recebido: {document.get('filename', 'arquivo')}]"
         
         return {
             'phone_number': phone_number,
             'message_text': message_text,
             'message_type': message_type,
             'media_id': media_id,
+            'message_id': message_id,
             'timestamp': timestamp
         }
         
@@ -157,27 +232,60 @@ def extract_message_data(webhook_data: Dict[str, Any]) -> Optional[Dict[str, Any
         logger.error(f"Erro ao extrair dados da mensagem: {str(e)}")
         return None
 
+def can_merge_message(batch: list, message_data: Dict[str, Any]) -> bool:
+    """Uma rajada vira um único turno, mas com no máximo uma mídia (o agente analisa uma por vez)."""
+    if message_data.get('message_type') not in MEDIA_MESSAGE_TYPES:
+        return True
+    return not any(item.get('message_type') in MEDIA_MESSAGE_TYPES for item in batch)
+
+def merge_message_batch(batch: list) -> Dict[str, Any]:
+    """Combina mensagens em rajada de um mesmo lead em um único turno do agente."""
+    media = next((item for item in batch if item.get('message_type') in MEDIA_MESSAGE_TYPES), None)
+    merged = dict(media or batch[-1])
+    merged['message_text'] = "\n".join(item['message_text'] for item in batch if item.get('message_text'))
+    merged['message_id'] = batch[-1].get('message_id')
+    merged['message_ids'] = [item.get('message_id') for item in batch]
+    return merged
+
+async def send_reply(phone_number: str, text: str):
+    """Envia uma mensagem ao lead; falha do WhatsApp vira exceção (a fila tenta de novo)."""
+    result = await whatsapp_tools.send_text_message_async(phone_number, text)
+    if not result.get('success'):
+        raise RuntimeError(f"Falha ao enviar mensagem pelo WhatsApp: {result.get('error')}")
+
 async def process_message_async(message_data: Dict[str, Any]):
-    """Processa mensagem de forma assíncrona."""
+    """
+    Processa mensagem retirada da fila.
+    
+    Falhas antes de qualquer envio ao lead são propagadas para que a fila
+    tente de novo; depois que algo foi enviado, a falha é apenas registrada
+    (uma nova tentativa duplicaria a resposta).
+    """
     phone_number = message_data['phone_number']
     user_message = message_data['message_text']
     message_type = message_data['message_type']
     media_id = message_data.get('media_id')
+    message_id = message_data.get('message_id')
+    delivered = False
     
     try:
         logger.info(f"Processando mensagem de {phone_number}: {user_message[:50]}...")
         
-        # Registrar mensagem do usuário
-        await supabase_tools.record_message(
+        # Exibir "digitando..." imediatamente, em paralelo com o restante
+        if message_id:
+            typing_task = asyncio.create_task(whatsapp_tools.send_typing_indicator_async(message_id))
+            background_tasks.add(typing_task)
+            typing_task.add_done_callback(background_tasks.discard)
+        
+        # Recuperar lead + histórico (um único lote MCP) e registrar a mensagem do usuário
+        context = await supabase_tools.load_message_context_async(
             phone_number=phone_number,
-            direction='user',
             content=user_message,
             message_type=message_type,
-            media_id=media_id
+            media_id=media_id,
+            whatsapp_message_id=message_id
         )
-        
-        # Recuperar dados e estado do lead
-        lead_data = await supabase_tools.get_lead_by_phone(phone_number)
+        lead_data = context['lead']
         
         if not lead_data:
             # Criar lead se não existir
@@ -187,50 +295,73 @@ async def process_message_async(message_data: Dict[str, Any]):
                 'conversation_state': 'INITIAL',
                 'created_at': datetime.now().isoformat()
             }
-            await supabase_tools.create_or_update_lead(lead_data)
+            await supabase_tools.create_or_update_lead_async(lead_data)
+        
+        # Em modo streaming, cada trecho da resposta vai para a fila assim que
+        # fica completo e é enviado em ordem enquanto o modelo ainda gera o resto
+        loop = asyncio.get_running_loop()
+        chunk_queue: asyncio.Queue = asyncio.Queue()
+        
+        async def send_chunks():
+            nonlocal delivered
+            while True:
+                chunk = await chunk_queue.get()
+                if chunk is None:
+                    break
+                await send_reply(phone_number, chunk)
+                delivered = True
+        
+        def on_chunk(chunk: str):
+            loop.call_soon_threadsafe(chunk_queue.put_nowait, chunk)
+        
+        sender = asyncio.create_task(send_chunks())
         
         # Executar agente
-        agent_response = await sdr_agent.run_agent(
-            lead_id=phone_number,
-            user_message=user_message,
-            message_type=message_type,
-            media_id=media_id,
-            conversation_state=lead_data.get('conversation_state', 'INITIAL')
-        )
+        try:
+            agent_response = await asyncio.to_thread(
+                sdr_agent.run_agent,
+                lead_id=phone_number,
+                user_message=user_message,
+                message_type=message_type,
+                media_id=media_id,
+                lead_data=lead_data,
+                conversation_state=lead_data.get('conversation_state', 'INITIAL'),
+                conversation_history=context['history'],
+                on_chunk=on_chunk if AGENT_STREAM_RESPONSES else None
+            )
+        finally:
+            chunk_queue.put_nowait(None)
+            await sender
         
         if agent_response.get('success'):
             response_text = agent_response.get('response')
             
-            # Enviar resposta via WhatsApp
-            await whatsapp_tools.send_text_message(phone_number, response_text)
+            # Enviar resposta via WhatsApp (no streaming ela já foi entregue)
+            if not agent_response.get('streamed'):
+                await send_reply(phone_number, response_text)
+                delivered = True
             
-            # Registrar resposta do bot
-            await supabase_tools.record_message(
-                phone_number=phone_number,
-                direction='bot',
-                content=response_text,
-                message_type='text'
-            )
-            
-            # Atualizar última mensagem no lead
-            await supabase_tools.update_lead_last_message(phone_number)
+            # Registrar resposta do bot e atualizar última mensagem (um único lote MCP)
+            await supabase_tools.record_bot_reply_async(phone_number, response_text)
             
             logger.info(f"Resposta enviada com sucesso para {phone_number}")
         else:
             # Enviar mensagem de erro genérica
             error_message = "Desculpe, tive um problema técnico. Por favor, tente novamente em alguns instantes."
-            await whatsapp_tools.send_text_message(phone_number, error_message)
+            await send_reply(phone_number, error_message)
             logger.error(f"Falha no agente para {phone_number}: {agent_response.get('error')}")
             
     except Exception as e:
         logger.error(f"Erro ao processar mensagem: {str(e)}")
-        try:
-            await whatsapp_tools.send_text_message(
-                phone_number,
-                "Desculpe, ocorreu um erro. Nossa equipe foi notificada e resolveremos em breve."
-            )
-        except:
-            pass
+        if not delivered:
+            raise
+
+async def notify_dead_letter(message_data: Dict[str, Any], error: str):
+    """Avisa o lead quando a mensagem esgotou as tentativas e foi para a dead-letter queue."""
+    await whatsapp_tools.send_text_message_async(
+        message_data['phone_number'],
+        "Desculpe, ocorreu um erro. Nossa equipe foi notificada e resolveremos em breve."
+    )
 
 @app.get("/")
 async def health_check_and_verify(request: Request):
@@ -262,11 +393,8 @@ async def health_check_and_verify(request: Request):
     }
 
 @app.post("/webhook/whatsapp")
-async def handle_whatsapp_webhook(
-    request: Request,
-    background_tasks: BackgroundTasks
-):
-    """Recebe e processa webhooks do WhatsApp."""
+async def handle_whatsapp_webhook(request: Request):
+    """Recebe webhooks do WhatsApp e enfileira as mensagens (a resposta à Meta não espera o agente)."""
     # Verificar assinatura
     payload_bytes = await request.body()
     signature = request.headers.get("x-hub-signature-256", "")
@@ -278,14 +406,27 @@ async def handle_whatsapp_webhook(
     try:
         # Parse do payload
         payload = json.loads(payload_bytes)
-        logger.debug(f"Webhook recebido: {json.dumps(payload, indent=2)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Webhook recebido: {json.dumps(payload, indent=2)}")
         
         # Extrair dados da mensagem
         message_data = extract_message_data(payload)
         
         if message_data:
-            # Processar mensagem em background
-            background_tasks.add_task(process_message_async, message_data)
+            # Reentrega da Meta: a mensagem já foi enfileirada antes
+            message_id = message_data.get('message_id')
+            deduplicator = get_message_deduplicator()
+            if message_id and await deduplicator.is_duplicate(message_id):
+                return {"status": "received", "queued": False, "duplicate": True}
+            
+            # Apenas grava na fila durável; os workers processam
+            try:
+                await message_queue.enqueue(message_data)
+            except Exception:
+                # Não enfileirada: a próxima reentrega não pode ser tratada como duplicada
+                if message_id:
+                    await deduplicator.forget(message_id)
+                raise
             return {"status": "received", "queued": True}
         else:
             # Não é uma mensagem de usuário (pode ser status, etc)
@@ -311,10 +452,25 @@ async def metrics():
     """Endpoint de métricas básicas."""
     try:
         # Buscar métricas do Supabase
-        metrics = await supabase_tools.get_conversation_metrics()
+        metrics = await supabase_tools.get_conversation_metrics_async()
         return {
             "status": "ok",
             "metrics": metrics,
+            "mcp_pools": get_pool_metrics(),
+            "lead_cache": get_lead_cache().stats(),
+            "ocr_cache": get_ocr_cache().stats(),
+            "coverage_cache": sdr_agent.serena_tools.coverage_cache.stats() if sdr_agent else None,
+            "coverage_index": sdr_agent.serena_tools.coverage_index.stats() if sdr_agent else None,
+            "local_ocr": sdr_agent.ocr_tools.local_ocr.stats() if sdr_agent else None,
+            "pdf": sdr_agent.ocr_tools.pdf_extractor.stats() if sdr_agent else None,
+            "message_queue": await message_queue.stats() if message_queue else None,
+            "workers": worker_pool.stats() if worker_pool else None,
+            "lead_executor": lead_executor.stats() if lead_executor else None,
+            "message_dedup": get_message_deduplicator().stats(),
+            "media_storage": get_media_storage().stats() if get_media_storage() else None,
+            "image_preprocessing": sdr_agent.ocr_tools.preprocessor.stats() if sdr_agent else None,
+            "llm_usage": sdr_agent.usage_stats() if sdr_agent else None,
+            "faq_fast_path": sdr_agent.faq_router.stats() if sdr_agent else None,
             "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
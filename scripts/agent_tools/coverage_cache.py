@@ -0,0 +1,302 @@
+# =============================================================================
+# SERENA SDR - COVERAGE CACHE
+# =============================================================================
+
+"""
+Coverage Cache Module
+
+Cache das consultas de cobertura e de planos da Serena (MCP).
+
+As áreas de operação e os planos de GD mudam no máximo uma vez por dia por
+cidade, mas eram consultados remotamente a cada lead. O cache responde da
+memória e usa stale-while-revalidate: depois do TTL, a entrada antiga ainda
+é devolvida imediatamente enquanto uma atualização roda em segundo plano.
+
+- Chaves normalizadas: cidade sem acentos/caixa, UF em maiúsculas e
+  id_distribuidora para os planos
+- Apenas respostas bem-sucedidas são armazenadas
+- Compartilhado pelo processo (todas as instâncias de SerenaTools)
+- Aquecido na inicialização com as localidades mais frequentes
+
+Author: Serena SDR System
+Version: 1.0.0
+Created: 2026-10-17
+"""
+
+import os
+import copy
+import time
+import asyncio
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Callable, Awaitable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_city(cidade: Optional[str]) -> str:
+    """
+    Normaliza o nome da cidade para a chave do cache.
+    
+    Args:
+        cidade: Nome da cidade em qualquer grafia (ex.: " São  Paulo")
+    
+    Returns:
+        str: Nome sem acentos, em minúsculas e com espaços simples (ex.: "sao paulo")
+    """
+    folded = unicodedata.normalize("NFKD", cidade or "")
+    folded = "".join(char for char in folded if not unicodedata.combining(char))
+    return " ".join(folded.lower().replace("-", " ").split())
+
+
+def normalize_state(estado: Optional[str]) -> str:
+    """
+    Normaliza a sigla do estado (ex.: " pe" -> "PE").
+    
+    Args:
+        estado: Sigla do estado
+    
+    Returns:
+        str: Sigla em maiúsculas
+    """
+    return (estado or "").strip().upper()
+
+
+def coverage_key(cidade: str = None, estado: str = None, codigo_ibge: str = None) -> str:
+    """Chave das áreas de operação (IBGE tem prioridade sobre cidade/UF)."""
+    if codigo_ibge:
+        return f"areas:ibge:{str(codigo_ibge).strip()}"
+    return f"areas:{normalize_city(cidade)}:{normalize_state(estado)}"
+
+
+def plans_key(cidade: str = None, estado: str = None, id_distribuidora: str = None) -> str:
+    """Chave dos planos (id_distribuidora tem prioridade sobre cidade/UF)."""
+    if id_distribuidora:
+        return f"planos:distribuidora:{str(id_distribuidora).strip()}"
+    return f"planos:{normalize_city(cidade)}:{normalize_state(estado)}"
+
+
+def parse_locations(value: str) -> List[Tuple[str, str]]:
+    """
+    Lê a lista de localidades de aquecimento.
+    
+    Args:
+        value: Localidades no formato "Cidade/UF", separadas por vírgula
+    
+    Returns:
+        List: Pares (cidade, estado)
+    """
+    locations = []
+    for item in (value or "").split(","):
+        if "/" not in item:
+            continue
+        cidade, estado = item.rsplit("/", 1)
+        if cidade.strip() and estado.strip():
+            locations.append((cidade.strip(), normalize_state(estado)))
+    return locations
+
+
+class CoverageCache:
+    """Cache em memória com stale-while-revalidate para cobertura e planos."""
+    
+    def __init__(self, fresh_ttl: int = 3600, stale_ttl: int = 86400, max_size: int = 2000,
+                 refresh_workers: int = 2):
+        """
+        Inicializa o cache.
+        
+        Args:
+            fresh_ttl: Idade (s) até a qual a entrada é devolvida sem atualização
+            stale_ttl: Idade (s) até a qual a entrada ainda é devolvida enquanto
+                é atualizada em segundo plano; depois disso a consulta é remota
+            max_size: Máximo de entradas mantidas
+            refresh_workers: Threads das atualizações em segundo plano
+        """
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = max(stale_ttl, fresh_ttl)
+        self.max_size = max_size
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        # chave -> (instante da consulta, resposta), do menos para o mais recentemente usado
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._refreshing = set()
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="coverage-refresh")
+    
+    def _lookup(self, key: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """
+        Consulta a entrada e atualiza os contadores.
+        
+        Returns:
+            Tuple: (resposta ou None, se precisa ser atualizada em segundo plano)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            age = time.monotonic() - entry[0] if entry is not None else None
+            
+            if entry is None or age >= self.stale_ttl:
+                self.misses += 1
+                return None, False
+            
+            self._entries.move_to_end(key)
+            if age < self.fresh_ttl:
+                self.hits += 1
+                return copy.deepcopy(entry[1]), False
+            
+            self.stale_hits += 1
+            refresh = key not in self._refreshing
+            if refresh:
+                self._refreshing.add(key)
+            return copy.deepcopy(entry[1]), refresh
+    
+    def _store(self, key: str, result: Dict[str, Any]):
+        """Grava a resposta se a consulta foi bem-sucedida."""
+        if not result or not result.get("success"):
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), copy.deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def _refreshed(self, key: str, result: Optional[Dict[str, Any]]):
+        """Registra o fim de uma atualização em segundo plano."""
+        if result and result.get("success"):
+            self._store(key, result)
+            failed = False
+        else:
+            # Mantém a entrada antiga: uma falha remota não deve apagar a cobertura conhecida
+            failed = True
+            logger.warning(f"Atualização do cache de cobertura falhou para {key}")
+        with self._lock:
+            self._refreshing.discard(key)
+            self.refreshes += 1
+            if failed:
+                self.refresh_failures += 1
+    
+    def _refresh(self, key: str, loader: Callable[[], Dict[str, Any]]):
+        """Executa a atualização de uma entrada (thread de segundo plano)."""
+        result = None
+        try:
+            result = loader()
+        except Exception as e:
+            logger.warning(f"Erro ao atualizar cache de cobertura ({key}): {str(e)}")
+        finally:
+            self._refreshed(key, result)
+    
+    async def _refresh_async(self, key: str, loader: Callable[[], Awaitable[Dict[str, Any]]]):
+        """Executa a atualização de uma entrada (tarefa de segundo plano)."""
+        result = None
+        try:
+            result = await loader()
+        except Exception as e:
+            logger.warning(f"Erro ao atualizar cache de cobertura ({key}): {str(e)}")
+        finally:
+            self._refreshed(key, result)
+    
+    def get_or_load(self, key: str, loader: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Devolve a resposta em cache ou consulta com o loader.
+        
+        Args:
+            key: Chave normalizada (coverage_key/plans_key)
+            loader: Consulta remota, chamada em caso de ausência ou para atualizar
+        
+        Returns:
+            Dict: Resposta (cópia) no mesmo formato do loader
+        """
+        cached, refresh = self._lookup(key)
+        if refresh:
+            self._executor.submit(self._refresh, key, loader)
+        if cached is not None:
+            return cached
+        
+        result = loader()
+        self._store(key, result)
+        return result
+    
+    async def get_or_load_async(self, key: str, loader: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Versão assíncrona de get_or_load (loader é uma corrotina).
+        
+        Args:
+            key: Chave normalizada (coverage_key/plans_key)
+            loader: Consulta remota assíncrona
+        
+        Returns:
+            Dict: Resposta (cópia) no mesmo formato do loader
+        """
+        cached, refresh = self._lookup(key)
+        if refresh:
+            task = asyncio.create_task(self._refresh_async(key, loader))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if cached is not None:
+            return cached
+        
+        result = await loader()
+        self._store(key, result)
+        return result
+    
+    def invalidate(self, key: str = None):
+        """
+        Remove uma entrada (ou todas, sem chave).
+        
+        Args:
+            key: Chave normalizada
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retorna os contadores do cache.
+        
+        Returns:
+            Dict: hits (frescos e antigos), misses, atualizações e tamanho
+        """
+        with self._lock:
+            total = self.hits + self.stale_hits + self.misses
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.stale_hits) / total, 4) if total else 0.0,
+                "refreshes": self.refreshes,
+                "refresh_failures": self.refresh_failures,
+                "size": len(self._entries),
+                "fresh_ttl": self.fresh_ttl,
+                "stale_ttl": self.stale_ttl
+            }
+    
+    def close(self):
+        """Encerra as threads de atualização."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Instância global do cache
+_coverage_cache: Optional[CoverageCache] = None
+_coverage_cache_lock = threading.Lock()
+
+
+def get_coverage_cache() -> CoverageCache:
+    """Retorna o cache de cobertura compartilhado pelo processo."""
+    global _coverage_cache
+    with _coverage_cache_lock:
+        if _coverage_cache is None:
+            _coverage_cache = CoverageCache(
+                fresh_ttl=int(os.getenv('COVERAGE_CACHE_TTL_SECONDS', '3600')),
+                stale_ttl=int(os.getenv('COVERAGE_CACHE_STALE_SECONDS', '86400')),
+                max_size=int(os.getenv('COVERAGE_CACHE_MAX_SIZE', '2000'))
+            )
+    return _coverage_cache
+
@@ -0,0 +1,289 @@
+# =============================================================================
+# SERENA SDR - COVERAGE INDEX
+# =============================================================================
+
+"""
+Coverage Index Module
+
+Índice local das áreas de operação de GD para qualificação sem chamadas ao MCP.
+
+A qualificação depende de cidade/UF, tipo de pessoa e valor da conta: a área
+precisa ser atendida por uma distribuidora qualificada e o valor precisa
+atingir o mínimo da configuração do agente (min_invoice_amount). O índice
+mantém as áreas em dicionários por cidade normalizada (sem acentos/caixa) +
+UF e por código IBGE, sincronizados periodicamente com o MCP e gravados em
+disco para que um reinício já comece com o índice carregado.
+
+- Sem índice válido (vazio ou desatualizado) ou cidade ausente do índice,
+  quem chama consulta o MCP (o índice só decide sobre áreas que conhece)
+- A confirmação oficial continua no MCP (cadastro/contrato)
+
+Author: Serena SDR System
+Version: 1.0.0
+Created: 2026-10-17
+"""
+
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from typing import Dict, Any, Optional, List, Tuple, Callable
+
+from .coverage_cache import normalize_city, normalize_state
+
+logger = logging.getLogger(__name__)
+
+# Tipos de pessoa aceitos pela API da Serena
+PERSON_TYPES = ("natural", "juridical")
+
+
+class CoverageIndex:
+    """Índice em memória de áreas de operação por cidade/UF e IBGE."""
+    
+    def __init__(self, min_invoice_amount: float = 200.0, snapshot_path: str = None,
+                 max_age_seconds: int = 172800):
+        """
+        Inicializa o índice (carregando o snapshot em disco, se houver).
+        
+        Args:
+            min_invoice_amount: Valor mínimo da conta para qualificação
+            snapshot_path: Arquivo JSON com a última sincronização (opcional)
+            max_age_seconds: Idade máxima (s) do índice para decidir localmente
+        """
+        self.min_invoice_amount = min_invoice_amount
+        self.snapshot_path = snapshot_path
+        self.max_age_seconds = max_age_seconds
+        self.synced_at = 0.0
+        self.syncs = 0
+        self.sync_failures = 0
+        self.local_decisions = 0
+        self.fallbacks = 0
+        # Substituídos inteiros a cada sincronização (leitura sem lock)
+        self._by_city: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self._by_ibge: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        
+        if snapshot_path:
+            self._load_snapshot()
+    
+    @staticmethod
+    def _compact(area: Dict[str, Any]) -> Dict[str, Any]:
+        """Mantém apenas os campos usados na qualificação."""
+        return {
+            "cidade": area.get("city", ""),
+            "estado": normalize_state(area.get("state")),
+            "codigo_ibge": str(area.get("ibgeCode") or ""),
+            "id_distribuidora": area.get("energyUtilityPublicId"),
+            "distribuidora": area.get("energyUtilityName"),
+            "qualificada": bool(area.get("energyUtilityQualified"))
+        }
+    
+    def load(self, areas: List[Dict[str, Any]], synced_at: float = None):
+        """
+        Reconstrói o índice a partir da lista de áreas do MCP.
+        
+        Args:
+            areas: Áreas no formato de consultar_areas_operacao_gd
+            synced_at: Instante (epoch) da sincronização (padrão: agora)
+        """
+        by_city: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        by_ibge: Dict[str, List[Dict[str, Any]]] = {}
+        for area in areas:
+            entry = self._compact(area)
+            by_city.setdefault((normalize_city(entry["cidade"]), entry["estado"]), []).append(entry)
+            if entry["codigo_ibge"]:
+                by_ibge.setdefault(entry["codigo_ibge"], []).append(entry)
+        
+        self._by_city, self._by_ibge = by_city, by_ibge
+        self.synced_at = synced_at or time.time()
+        logger.info(f"Índice de cobertura carregado: {len(areas)} áreas em {len(by_city)} cidades")
+    
+    def _load_snapshot(self):
+        """Carrega a última sincronização gravada em disco."""
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as snapshot:
+                data = json.load(snapshot)
+            self.load(data.get("areas", []), synced_at=data.get("synced_at"))
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Snapshot do índice de cobertura ignorado: {str(e)}")
+    
+    def _save_snapshot(self, areas: List[Dict[str, Any]]):
+        """Grava a sincronização em disco (escrita atômica)."""
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as snapshot:
+                json.dump({"synced_at": self.synced_at, "areas": areas}, snapshot, ensure_ascii=False)
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception as e:
+            logger.warning(f"Erro ao gravar snapshot do índice de cobertura: {str(e)}")
+    
+    def sync(self, fetch_areas: Callable[[], Dict[str, Any]]) -> bool:
+        """
+        Sincroniza o índice com o MCP.
+        
+        Uma resposta vazia ou com erro não substitui o índice atual.
+        
+        Args:
+            fetch_areas: Consulta de todas as áreas (resposta de consultar_areas_operacao_gd)
+        
+        Returns:
+            bool: True se o índice foi atualizado
+        """
+        try:
+            result = fetch_areas()
+            areas = result.get("areas") or []
+            if not result.get("success") or not areas:
+                raise ValueError(result.get("error") or "nenhuma área retornada")
+        except Exception as e:
+            with self._lock:
+                self.sync_failures += 1
+            logger.warning(f"Sincronização do índice de cobertura falhou: {str(e)}")
+            return False
+        
+        self.load(areas)
+        if self.snapshot_path:
+            self._save_snapshot(areas)
+        with self._lock:
+            self.syncs += 1
+        return True
+    
+    def start(self, fetch_areas: Callable[[], Dict[str, Any]], interval_seconds: int = 21600):
+        """
+        Inicia a sincronização periódica em uma thread daemon.
+        
+        Args:
+            fetch_areas: Consulta de todas as áreas
+            interval_seconds: Intervalo entre sincronizações
+        """
+        if self._thread is not None:
+            return
+        
+        def run():
+            while not self._stop.is_set():
+                self.sync(fetch_areas)
+                self._stop.wait(interval_seconds)
+        
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="coverage-index-sync", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Interrompe a sincronização periódica."""
+        self._stop.set()
+        self._thread = None
+    
+    @property
+    def ready(self) -> bool:
+        """Se o índice está carregado e dentro da idade máxima."""
+        return bool(self._by_city) and time.time() - self.synced_at < self.max_age_seconds
+    
+    def lookup(self, cidade: str = None, estado: str = None, codigo_ibge: str = None) -> List[Dict[str, Any]]:
+        """
+        Busca as áreas de uma localidade.
+        
+        Args:
+            cidade: Nome da cidade em qualquer grafia
+            estado: Sigla do estado
+            codigo_ibge: Código IBGE (prioridade sobre cidade/UF)
+        
+        Returns:
+            List: Áreas da localidade (vazia se não atendida)
+        """
+        if codigo_ibge:
+            return list(self._by_ibge.get(str(codigo_ibge).strip(), []))
+        return list(self._by_city.get((normalize_city(cidade), normalize_state(estado)), []))
+    
+    def qualify(self, cidade: str, estado: str, tipo_pessoa: str, valor_conta: float) -> Optional[Dict[str, Any]]:
+        """
+        Decide a qualificação localmente.
+        
+        Args:
+            cidade: Cidade do lead
+            estado: Estado do lead
+            tipo_pessoa: "natural" ou "juridical"
+            valor_conta: Valor da conta de energia
+        
+        Returns:
+            Dict: qualificado, motivo e áreas encontradas; None quando a decisão
+                precisa do MCP (índice indisponível, entrada fora do padrão ou
+                cidade ausente do índice)
+        """
+        try:
+            valor = float(valor_conta)
+        except (TypeError, ValueError):
+            valor = None
+        
+        if not self.ready or tipo_pessoa not in PERSON_TYPES or valor is None or not cidade or not estado:
+            with self._lock:
+                self.fallbacks += 1
+            return None
+        
+        areas = self.lookup(cidade, estado)
+        if not areas:
+            # Grafia diferente ou área nova: a ausência no índice não é uma recusa
+            with self._lock:
+                self.fallbacks += 1
+            return None
+        
+        if not any(area["qualificada"] for area in areas):
+            qualificado, motivo = False, "Distribuidora da região não atendida"
+        elif valor < self.min_invoice_amount:
+            qualificado, motivo = False, f"Valor da conta abaixo do mínimo de R$ {self.min_invoice_amount:.2f}"
+        else:
+            qualificado, motivo = True, "Área atendida e valor acima do mínimo"
+        
+        with self._lock:
+            self.local_decisions += 1
+        return {"qualificado": qualificado, "motivo": motivo, "areas": areas}
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retorna os contadores do índice.
+        
+        Returns:
+            Dict: Tamanho, idade, sincronizações e decisões locais/encaminhadas ao MCP
+        """
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "cities": len(self._by_city),
+                "ibge_codes": len(self._by_ibge),
+                "age_seconds": round(time.time() - self.synced_at) if self.synced_at else None,
+                "syncs": self.syncs,
+                "sync_failures": self.sync_failures,
+                "local_decisions": self.local_decisions,
+                "fallbacks": self.fallbacks
+            }
+
+
+# Instância global do índice
+_coverage_index: Optional[CoverageIndex] = None
+_coverage_index_lock = threading.Lock()
+
+
+def get_coverage_index() -> CoverageIndex:
+    """Retorna o índice de cobertura compartilhado pelo processo."""
+    global _coverage_index
+    with _coverage_index_lock:
+        if _coverage_index is None:
+            # Import tardio: a configuração valida as credenciais ao ser carregada
+            # e o pacote agent_tools também é importado sem elas
+            from utils.config import get_config
+            
+            _coverage_index = CoverageIndex(
+                min_invoice_amount=get_config().min_invoice_amount,
+                snapshot_path=os.getenv(
+                    'COVERAGE_INDEX_PATH',
+                    os.path.join(tempfile.gettempdir(), 'serena_coverage_index.json')
+                ),
+                max_age_seconds=int(os.getenv('COVERAGE_INDEX_MAX_AGE_SECONDS', '172800'))
+            )
+    return _coverage_index
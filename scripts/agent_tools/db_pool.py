@@ -0,0 +1,236 @@
+# =============================================================================
+# SERENA SDR - DATABASE POOL
+# =============================================================================
+
+"""
+Database Pool Module
+
+Pool de conexões Postgres (psycopg2) compartilhado pelo processo.
+
+Evita abrir uma conexão nova (TCP + TLS + autenticação) a cada chamada das
+ferramentas que acessam o banco diretamente. As conexões são emprestadas e
+devolvidas ao pool, validadas antes do uso quando ficaram ociosas e abertas
+com statement_timeout.
+
+Author: Serena SDR System
+Version: 1.0.0
+Created: 2026-10-17
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Callable
+
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+logger = logging.getLogger(__name__)
+
+
+class DatabasePoolTimeout(Exception):
+    """Nenhuma conexão ficou disponível dentro do tempo limite."""
+
+
+class DatabasePool:
+    """Pool de conexões thread-safe com health check e statement timeout."""
+    
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10,
+                 statement_timeout_ms: int = 15000, acquire_timeout: float = 10.0,
+                 health_check_interval: float = 30.0):
+        """
+        Inicializa o pool.
+        
+        Args:
+            dsn: String de conexão do Postgres
+            min_size: Conexões abertas na inicialização
+            max_size: Máximo de conexões simultâneas
+            statement_timeout_ms: Timeout de cada statement em milissegundos
+            acquire_timeout: Tempo máximo (s) de espera por uma conexão livre
+            health_check_interval: Ociosidade (s) a partir da qual a conexão é validada antes do uso
+        """
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        self._pool = ThreadedConnectionPool(
+            min_size,
+            max_size,
+            dsn,
+            options=f"-c statement_timeout={statement_timeout_ms}"
+        )
+        # ThreadedConnectionPool falha quando esgotado; o semáforo faz esperar
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._last_used: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self.borrowed = 0
+        self.discarded = 0
+        self.timeouts = 0
+    
+    def _is_healthy(self, conn) -> bool:
+        """Valida a conexão se ela está fechada ou ficou ociosa por muito tempo."""
+        if conn.closed:
+            return False
+        
+        idle_since = self._last_used.get(id(conn))
+        if idle_since is not None and time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+    
+    def _discard(self, conn):
+        """Fecha e remove uma conexão inválida do pool."""
+        with self._lock:
+            self._last_used.pop(id(conn), None)
+            self.discarded += 1
+        self._pool.putconn(conn, close=True)
+    
+    def _acquire(self):
+        """Empresta uma conexão saudável do pool."""
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise DatabasePoolTimeout(f"Nenhuma conexão livre em {self.acquire_timeout}s")
+        
+        try:
+            for _ in range(self.max_size + 1):
+                conn = self._pool.getconn()
+                if self._is_healthy(conn):
+                    with self._lock:
+                        self.borrowed += 1
+                    return conn
+                logger.warning("Conexão inválida descartada do pool")
+                self._discard(conn)
+            
+            raise psycopg2.OperationalError("Não foi possível obter uma conexão válida do pool")
+        
+        except Exception:
+            self._slots.release()
+            raise
+    
+    def _release(self, conn, broken: bool = False):
+        """Devolve a conexão ao pool (ou a descarta se quebrada)."""
+        try:
+            if broken or conn.closed:
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+        finally:
+            self._slots.release()
+    
+    @contextmanager
+    def connection(self):
+        """
+        Empresta uma conexão do pool.
+        
+        Faz commit ao final do bloco, rollback em caso de erro, e sempre
+        devolve a conexão ao pool.
+        
+        Yields:
+            Conexão psycopg2
+        """
+        conn = self._acquire()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self._release(conn, broken=broken)
+    
+    def run(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Executa func(conn, *args, **kwargs) com uma conexão emprestada.
+        
+        Args:
+            func: Função que recebe a conexão como primeiro argumento
+        
+        Returns:
+            Retorno da função
+        """
+        with self.connection() as conn:
+            return func(conn, *args, **kwargs)
+    
+    async def run_async(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Versão assíncrona de run(): executa em uma thread sem bloquear o event loop.
+        
+        Args:
+            func: Função que recebe a conexão como primeiro argumento
+        
+        Returns:
+            Retorno da função
+        """
+        return await asyncio.to_thread(self.run, func, *args, **kwargs)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retorna métricas do pool.
+        
+        Returns:
+            Dict: Tamanho máximo, conexões em uso e contadores
+        """
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "in_use": len(self._pool._used),
+                "idle": len(self._pool._pool),
+                "borrowed": self.borrowed,
+                "discarded": self.discarded,
+                "timeouts": self.timeouts
+            }
+    
+    def close(self):
+        """Fecha todas as conexões do pool."""
+        self._pool.closeall()
+
+
+# Instância global do pool
+_db_pool: Optional[DatabasePool] = None
+_db_pool_lock = threading.Lock()
+
+
+def get_db_pool() -> DatabasePool:
+    """Retorna o pool de conexões compartilhado pelo processo."""
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is None:
+            dsn = os.getenv("DB_CONNECTION_STRING") or os.getenv("SECRET_DB_CONNECTION_STRING")
+            if not dsn:
+                raise ValueError("DB_CONNECTION_STRING não encontrada nas variáveis de ambiente")
+            
+            _db_pool = DatabasePool(
+                dsn,
+                min_size=int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+                max_size=int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+                statement_timeout_ms=int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '15000')),
+                acquire_timeout=float(os.getenv('DB_POOL_ACQUIRE_TIMEOUT', '10')),
+                health_check_interval=float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', '30'))
+            )
+            logger.info("Pool de conexões Postgres inicializado")
+    return _db_pool
+
+
+def close_db_pool():
+    """Fecha o pool compartilhado (shutdown da aplicação)."""
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is not None:
+            _db_pool.close()
+            _db_pool = None
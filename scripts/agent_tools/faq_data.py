@@ -16,6 +16,8 @@ import logging
 from typing import Dict, List, Any, Optional
 from pathlib import Path
 
+from .faq_engine import get_faq_engine
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -98,58 +100,14 @@ def carregar_faq_data() -> List[Dict[str, Any]]:
     """
     Carrega os dados do FAQ da Serena.
     
-    Tenta carregar do arquivo knowledge_base/faq_serena.txt primeiro,
-    se não encontrar, usa os dados padrão.
+    Os itens vêm do motor de FAQ, que lê knowledge_base/faq_serena.txt uma
+    única vez (recarregando quando o arquivo muda); se não encontrar o
+    arquivo, usa os dados padrão.
     
     Returns:
         List[Dict[str, Any]]: Lista de dicionários com dados do FAQ
     """
-    try:
-        # Tenta carregar do arquivo knowledge_base/faq_serena.txt
-        faq_path = Path("knowledge_base/faq_serena.txt")
-        if faq_path.exists():
-            logger.info(f"Carregando FAQ do arquivo: {faq_path}")
-            with open(faq_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
-            # Parse do arquivo de texto
-            faq_data = []
-            lines = content.split('\n')
-            current_item = {}
-            
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                    
-                if line.startswith('ID:'):
-                    if current_item:
-                        faq_data.append(current_item)
-                    current_item = {"id": int(line.split(':', 1)[1].strip())}
-                elif line.startswith('Categoria:'):
-                    current_item["categoria"] = line.split(':', 1)[1].strip()
-                elif line.startswith('Pergunta:'):
-                    current_item["pergunta"] = line.split(':', 1)[1].strip()
-                elif line.startswith('Resposta:'):
-                    current_item["resposta"] = line.split(':', 1)[1].strip()
-                elif line.startswith('Palavras-chave:'):
-                    keywords = line.split(':', 1)[1].strip()
-                    current_item["palavras_chave"] = [k.strip() for k in keywords.split(',')]
-            
-            # Adiciona o último item
-            if current_item:
-                faq_data.append(current_item)
-            
-            if faq_data:
-                logger.info(f"FAQ carregado com {len(faq_data)} itens do arquivo")
-                return faq_data
-                
-    except Exception as e:
-        logger.warning(f"Erro ao carregar FAQ do arquivo: {e}")
-    
-    # Fallback para dados padrão
-    logger.info("Usando dados padrão do FAQ")
-    return DEFAULT_FAQ_STRUCTURE
+    return get_faq_engine().items
 
 def buscar_faq_por_categoria(categoria: str) -> List[Dict[str, Any]]:
     """
@@ -172,29 +130,12 @@ def buscar_faq_por_palavra_chave(palavra: str) -> List[Dict[str, Any]]:
         palavra (str): Palavra-chave para busca
         
     Returns:
-        List[Dict[str, Any]]: Lista de itens que contêm a palavra-chave
+        List[Dict[str, Any]]: Lista de itens que contêm a palavra-chave,
+            do mais para o menos relevante
     """
-    faq_data = carregar_faq_data()
-    palavra_lower = palavra.lower()
-    
-    resultados = []
-    for item in faq_data:
-        # Busca na pergunta
-        if palavra_lower in item.get("pergunta", "").lower():
-            resultados.append(item)
-            continue
-            
-        # Busca na resposta
-        if palavra_lower in item.get("resposta", "").lower():
-            resultados.append(item)
-            continue
-            
-        # Busca nas palavras-chave
-        palavras_chave = item.get("palavras_chave", [])
-        if any(palavra_lower in kw.lower() for kw in palavras_chave):
-            resultados.append(item)
-    
-    return resultados
+    # Índice invertido: ignora acentos e variações (instalar/instalação)
+    engine = get_faq_engine()
+    return [item for item, _ in engine.search(palavra, top_k=len(engine.items))]
 
 def obter_categorias_disponiveis() -> List[str]:
     """
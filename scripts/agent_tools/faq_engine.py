@@ -0,0 +1,335 @@
+# =============================================================================
+# SERENA SDR - FAQ ENGINE
+# =============================================================================
+
+"""
+FAQ Engine Module
+
+Motor de busca do FAQ da Serena com índice invertido e pontuação BM25.
+
+O FAQ é lido e indexado uma única vez (não a cada consulta) e as buscas
+percorrem apenas as listas de postings dos termos da pergunta, então o custo
+cresce com o tamanho da pergunta e não com o número de itens do FAQ.
+
+- Tokens sem acentos e em minúsculas, sem stopwords e com redução simples
+  de sufixos (plural, -ção, -mente...)
+- Pergunta e palavras-chave pesam mais que a resposta
+- Recarga automática quando knowledge_base/faq_serena.txt muda
+
+Author: Serena SDR System
+Version: 1.0.0
+Created: 2026-10-17
+"""
+
+import os
+import re
+import math
+import time
+import heapq
+import logging
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Any, Optional, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Stopwords do português (já sem acentos)
+STOPWORDS = frozenset("""
+a ao aos as com como da das de do dos e ela ele em entre era essa esse esta este eu foi
+ha isso isto ja la lhe mais mas me meu minha muito na nao nas nem no nos nossa nosso
+num numa o os ou para pela pelas pelo pelos por qual quais quando que quem se sem ser
+seu sua suas seus so sao sobre tambem te tem ter tu tua um uma umas uns vai voce voces
+vou eh ai aqui ate estou esta estao sera oi ola bom boa dia tarde noite gostaria queria
+saber poderia pode posso
+""".split())
+
+# Sufixos reduzidos, do mais longo para o mais curto: (sufixo, substituição)
+SUFFIX_RULES = (
+    ("amentos", ""), ("amento", ""), ("imentos", ""), ("imento", ""),
+    ("acoes", ""), ("acao", ""), ("icoes", ""), ("icao", ""),
+    ("mente", ""), ("coes", "c"), ("cao", "c"),
+    ("ados", ""), ("adas", ""), ("ado", ""), ("ada", ""),
+    ("idos", ""), ("idas", ""), ("ido", ""), ("ida", ""),
+    ("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"),
+    ("res", "r"), ("zes", "z"), ("ar", ""), ("er", ""), ("ir", ""), ("s", ""),
+)
+
+# Tamanho mínimo do radical após a redução
+MIN_STEM_LENGTH = 4
+
+# Peso de cada campo na frequência dos termos
+FIELD_WEIGHTS = (("pergunta", 2), ("palavras_chave", 2), ("categoria", 1), ("resposta", 1))
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def fold_text(text: str) -> str:
+    """
+    Remove acentos e converte para minúsculas.
+    
+    Args:
+        text: Texto original
+    
+    Returns:
+        str: Texto normalizado (ex.: "Instalação" -> "instalacao")
+    """
+    folded = unicodedata.normalize("NFKD", text or "")
+    return "".join(char for char in folded if not unicodedata.combining(char)).lower()
+
+
+def stem(token: str) -> str:
+    """Reduz o token ao radical aplicando a primeira regra de sufixo que couber."""
+    for suffix, replacement in SUFFIX_RULES:
+        if token.endswith(suffix) and len(token) - len(suffix) + len(replacement) >= MIN_STEM_LENGTH:
+            return token[:-len(suffix)] + replacement
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Converte um texto nos termos indexados.
+    
+    Args:
+        text: Texto original
+    
+    Returns:
+        List: Radicais sem acentos, sem stopwords e sem tokens de uma letra
+    """
+    return [
+        stem(token)
+        for token in TOKEN_PATTERN.findall(fold_text(text))
+        if len(token) > 1 and token not in STOPWORDS
+    ]
+
+
+def parse_faq_text(content: str) -> List[Dict[str, Any]]:
+    """
+    Lê o arquivo de FAQ nos dois formatos aceitos.
+    
+    - Estruturado: linhas ID:, Categoria:, Pergunta:, Resposta:, Palavras-chave:
+    - Simples: linhas P: / R:, com a resposta podendo continuar nas linhas seguintes
+    
+    Args:
+        content: Conteúdo do arquivo
+    
+    Returns:
+        List: Itens com pergunta, resposta e, quando presentes, id, categoria e palavras_chave
+    """
+    items = []
+    current: Dict[str, Any] = {}
+    last_field = None
+    
+    def flush():
+        if current.get("pergunta") and current.get("resposta"):
+            items.append(dict(current))
+        current.clear()
+    
+    for raw_line in content.split("\n"):
+        line = raw_line.strip()
+        if not line:
+            continue
+        
+        label, _, value = line.partition(":")
+        label = label.strip().lower()
+        value = value.strip()
+        
+        if label == "id":
+            flush()
+            current["id"] = int(value) if value.isdigit() else value
+            last_field = None
+        elif label in ("p", "pergunta"):
+            # No formato simples, cada pergunta inicia um novo item
+            if current.get("pergunta"):
+                flush()
+            current["pergunta"] = value
+            last_field = "pergunta"
+        elif label in ("r", "resposta"):
+            current["resposta"] = value
+            last_field = "resposta"
+        elif label == "categoria":
+            current["categoria"] = value
+            last_field = None
+        elif label == "palavras-chave":
+            current["palavras_chave"] = [keyword.strip() for keyword in value.split(",") if keyword.strip()]
+            last_field = None
+        elif last_field == "resposta":
+            current["resposta"] = f"{current['resposta']} {line}".strip()
+    
+    flush()
+    return items
+
+
+class FAQEngine:
+    """Índice invertido BM25 sobre os itens do FAQ, com recarga do arquivo."""
+    
+    def __init__(self, path: str = None, default_items: List[Dict[str, Any]] = None,
+                 k1: float = 1.5, b: float = 0.75, reload_check_seconds: float = 2.0):
+        """
+        Inicializa o motor e constrói o índice.
+        
+        Args:
+            path: Arquivo do FAQ (recarregado quando muda)
+            default_items: Itens usados quando o arquivo não existe ou está vazio
+            k1: Saturação da frequência dos termos (BM25)
+            b: Normalização pelo tamanho do item (BM25)
+            reload_check_seconds: Intervalo mínimo entre verificações do arquivo
+        """
+        self.path = path
+        self.default_items = list(default_items or [])
+        self.k1 = k1
+        self.b = b
+        self.reload_check_seconds = reload_check_seconds
+        self.source = "padrao"
+        self.searches = 0
+        self.reloads = 0
+        # (itens, postings termo -> [(item, tf)], idf, tamanhos, tamanho médio); trocado inteiro na recarga
+        self._index: Tuple = ([], {}, {}, [], 0.0)
+        self._file_signature = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        
+        self._reload(force=True)
+    
+    @property
+    def items(self) -> List[Dict[str, Any]]:
+        """Itens indexados."""
+        return self._index[0]
+    
+    def _read_file(self) -> Optional[List[Dict[str, Any]]]:
+        """Lê o arquivo do FAQ (None se ausente, ilegível ou vazio)."""
+        if not self.path:
+            return None
+        try:
+            with open(self.path, "r", encoding="utf-8") as faq_file:
+                items = parse_faq_text(faq_file.read())
+            return items or None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Erro ao carregar FAQ do arquivo: {e}")
+            return None
+    
+    def _signature(self) -> Optional[Tuple[int, int]]:
+        """Assinatura (mtime, tamanho) do arquivo do FAQ."""
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except (OSError, TypeError):
+            return None
+    
+    def build(self, items: List[Dict[str, Any]]):
+        """
+        Constrói o índice invertido e substitui o atual.
+        
+        Args:
+            items: Itens do FAQ (pergunta, resposta, palavras_chave, categoria)
+        """
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = []
+        for position, item in enumerate(items):
+            counts = Counter()
+            for field, weight in FIELD_WEIGHTS:
+                value = item.get(field) or ""
+                if isinstance(value, list):
+                    value = " ".join(value)
+                for term in tokenize(value):
+                    counts[term] += weight
+            for term, frequency in counts.items():
+                postings.setdefault(term, []).append((position, frequency))
+            lengths.append(sum(counts.values()))
+        
+        total = len(items)
+        idf = {
+            term: math.log(1 + (total - len(entries) + 0.5) / (len(entries) + 0.5))
+            for term, entries in postings.items()
+        }
+        average_length = sum(lengths) / total if total else 0.0
+        self._index = (list(items), postings, idf, lengths, average_length)
+    
+    def _reload(self, force: bool = False):
+        """Recarrega o arquivo se ele mudou desde a última leitura."""
+        with self._lock:
+            signature = self._signature()
+            if not force and signature == self._file_signature:
+                return
+            
+            items = self._read_file()
+            self.source = "arquivo" if items else "padrao"
+            self.build(items or self.default_items)
+            self._file_signature = signature
+            if not force:
+                self.reloads += 1
+            logger.info(f"FAQ indexado com {len(self.items)} itens ({self.source})")
+    
+    def _maybe_reload(self):
+        """Verifica o arquivo no máximo a cada reload_check_seconds."""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.reload_check_seconds
+        self._reload()
+    
+    def search(self, query: str, top_k: int = 3, min_score: float = 0.0) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        Busca os itens mais relevantes para a pergunta.
+        
+        Args:
+            query: Pergunta do usuário
+            top_k: Número máximo de resultados
+            min_score: Pontuação BM25 mínima
+        
+        Returns:
+            List: Pares (item, pontuação) em ordem decrescente de pontuação
+        """
+        self._maybe_reload()
+        items, postings, idf, lengths, average_length = self._index
+        self.searches += 1
+        
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            entries = postings.get(term)
+            if not entries:
+                continue
+            term_idf = idf[term]
+            for position, frequency in entries:
+                norm = self.k1 * (1 - self.b + self.b * lengths[position] / average_length)
+                scores[position] = scores.get(position, 0.0) + term_idf * frequency * (self.k1 + 1) / (frequency + norm)
+        
+        best = heapq.nlargest(top_k, scores.items(), key=lambda entry: entry[1])
+        return [(dict(items[position]), score) for position, score in best if score > min_score]
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retorna os dados do índice.
+        
+        Returns:
+            Dict: Itens, termos, origem, buscas e recargas
+        """
+        return {
+            "items": len(self._index[0]),
+            "terms": len(self._index[1]),
+            "source": self.source,
+            "searches": self.searches,
+            "reloads": self.reloads
+        }
+
+
+# Instância global do motor
+_faq_engine: Optional[FAQEngine] = None
+_faq_engine_lock = threading.Lock()
+
+
+def get_faq_engine() -> FAQEngine:
+    """Retorna o motor de FAQ compartilhado pelo processo."""
+    global _faq_engine
+    with _faq_engine_lock:
+        if _faq_engine is None:
+            from .faq_data import DEFAULT_FAQ_STRUCTURE
+            
+            _faq_engine = FAQEngine(
+                path=os.getenv('FAQ_PATH', 'knowledge_base/faq_serena.txt'),
+                default_items=DEFAULT_FAQ_STRUCTURE,
+                reload_check_seconds=float(os.getenv('FAQ_RELOAD_CHECK_SECONDS', '2'))
+            )
+    return _faq_engine
@@ -0,0 +1,213 @@
+# =============================================================================
+# SERENA SDR - FAQ ROUTER
+# =============================================================================
+
+"""
+FAQ Router Module
+
+Atalho que responde perguntas frequentes sem executar o agente.
+
+Cada mensagem de texto passa primeiro por regras locais e pela busca BM25 do
+FAQ. Só perguntas curtas, sem dados do lead, cujo melhor item do FAQ é
+claramente superior aos demais, são respondidas diretamente; todo o resto
+segue para o loop de function calling do modelo.
+
+Critérios de confiança (todos obrigatórios):
+- pontuação BM25 mínima
+- margem sobre o segundo colocado
+- cobertura: fração dos termos da pergunta presentes no item
+
+Opcionalmente, quando o BM25 não decide, a busca semântica (embeddings) é
+consultada com um limiar mais alto que o da ferramenta.
+
+Author: Serena SDR System
+Version: 1.0.0
+Created: 2026-10-17
+"""
+
+import os
+import re
+import logging
+import threading
+from typing import Dict, Any, Optional
+
+from .faq_engine import FAQEngine, get_faq_engine, fold_text, tokenize, TOKEN_PATTERN
+from .faq_semantic import get_semantic_faq
+
+logger = logging.getLogger(__name__)
+
+# Termos do lead normalizados para o vocabulário do FAQ
+QUERY_SYNONYMS = {
+    "placa": "painel", "placas": "painel", "modulo": "painel", "modulos": "painel",
+    "concessionaria": "distribuidora", "investir": "investimento", "custa": "custo",
+    "gratis": "gratuito", "indicar": "indicacao"
+}
+
+# Mensagens que precisam do agente: dados do lead, intenção de contratar ou atendimento humano
+AGENT_ONLY_PATTERN = re.compile(
+    r"\d|@|r\$|\b(cpf|cnpj|contrat\w*|cadastr\w*|assin\w*|plano\w*|proposta|simula\w*|"
+    r"atendente|humano|pessoa|reclama\w*|cancel\w*)\b"
+)
+
+# Palavras que iniciam perguntas em português (já sem acentos)
+QUESTION_STARTERS = frozenset((
+    "como", "qual", "quais", "quanto", "quantos", "quando", "onde", "porque", "por",
+    "preciso", "precisa", "posso", "pode", "vou", "vai", "tem", "tenho", "muda", "e",
+    "existe", "funciona", "aceita", "aceitam", "voces", "em"
+))
+
+
+class FAQRouter:
+    """Decide se uma mensagem é respondida pelo FAQ ou segue para o agente."""
+    
+    def __init__(self, engine: FAQEngine, min_score: float = 3.0, min_margin: float = 1.5,
+                 min_coverage: float = 0.75, max_words: int = 20, semantic_threshold: float = None):
+        """
+        Inicializa o roteador.
+        
+        Args:
+            engine: Motor de FAQ (BM25)
+            min_score: Pontuação BM25 mínima do melhor item
+            min_margin: Razão mínima entre o melhor e o segundo item
+            min_coverage: Fração mínima dos termos da pergunta presentes no item
+            max_words: Mensagens mais longas seguem para o agente
+            semantic_threshold: Similaridade mínima da busca semântica
+                (None desativa a consulta semântica)
+        """
+        self.engine = engine
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.min_coverage = min_coverage
+        self.max_words = max_words
+        self.semantic_threshold = semantic_threshold
+        self.checked = 0
+        self.answered = 0
+        self.semantic_answered = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def normalize_query(text: str) -> str:
+        """Remove acentos e troca sinônimos do lead pelos termos do FAQ."""
+        return " ".join(QUERY_SYNONYMS.get(token, token) for token in TOKEN_PATTERN.findall(fold_text(text)))
+    
+    def _eligible(self, text: str, message_type: str) -> bool:
+        """Regras locais: apenas perguntas de texto curtas e sem dados do lead."""
+        if message_type != "text" or not text or not text.strip():
+            return False
+        
+        folded = fold_text(text)
+        words = TOKEN_PATTERN.findall(folded)
+        if not words or len(words) > self.max_words or AGENT_ONLY_PATTERN.search(folded):
+            return False
+        
+        return "?" in text or words[0] in QUESTION_STARTERS
+    
+    def _bm25_match(self, query: str) -> Optional[Dict[str, Any]]:
+        """Melhor item do BM25 se ele atender aos critérios de confiança."""
+        results = self.engine.search(query, top_k=2)
+        if not results:
+            return None
+        
+        item, score = results[0]
+        runner_up = results[1][1] if len(results) > 1 else 0.0
+        if score < self.min_score or (runner_up and score / runner_up < self.min_margin):
+            return None
+        
+        query_terms = set(tokenize(query))
+        item_terms = set(tokenize(" ".join([
+            item.get("pergunta", ""), item.get("resposta", ""), " ".join(item.get("palavras_chave") or [])
+        ])))
+        coverage = len(query_terms & item_terms) / len(query_terms) if query_terms else 0.0
+        if coverage < self.min_coverage:
+            return None
+        
+        return {"item": item, "score": round(score, 4), "method": "bm25"}
+    
+    def _semantic_match(self, text: str) -> Optional[Dict[str, Any]]:
+        """Melhor item da busca semântica acima do limiar do atalho."""
+        semantic_faq = get_semantic_faq()
+        if not semantic_faq.available:
+            return None
+        try:
+            results = semantic_faq.search(text, top_k=1, threshold=self.semantic_threshold)
+        except Exception as e:
+            logger.warning(f"Busca semântica indisponível no atalho do FAQ: {str(e)}")
+            return None
+        if not results:
+            return None
+        item, score = results[0]
+        return {"item": item, "score": round(score, 4), "method": "semantic"}
+    
+    def route(self, user_message: str, message_type: str = "text") -> Optional[Dict[str, Any]]:
+        """
+        Tenta responder a mensagem pelo FAQ.
+        
+        Args:
+            user_message: Texto enviado pelo lead
+            message_type: Tipo da mensagem
+        
+        Returns:
+            Dict: response, pergunta_original, score e method; None quando a
+                mensagem deve seguir para o agente
+        """
+        with self._lock:
+            self.checked += 1
+        
+        if not self._eligible(user_message, message_type):
+            return None
+        
+        match = self._bm25_match(self.normalize_query(user_message))
+        if match is None and self.semantic_threshold is not None:
+            match = self._semantic_match(user_message)
+        if match is None:
+            return None
+        
+        with self._lock:
+            self.answered += 1
+            if match["method"] == "semantic":
+                self.semantic_answered += 1
+        
+        logger.info(f"Pergunta respondida pelo FAQ ({match['method']}, {match['score']}): {match['item']['pergunta']}")
+        return {
+            "response": match["item"]["resposta"],
+            "pergunta_original": match["item"]["pergunta"],
+            "score": match["score"],
+            "method": match["method"]
+        }
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retorna os contadores do atalho.
+        
+        Returns:
+            Dict: Mensagens verificadas, respondidas pelo FAQ e taxa de atalho
+        """
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "answered": self.answered,
+                "semantic_answered": self.semantic_answered,
+                "answer_rate": round(self.answered / self.checked, 4) if self.checked else 0.0
+            }
+
+
+# Instância global do roteador
+_faq_router: Optional[FAQRouter] = None
+_faq_router_lock = threading.Lock()
+
+
+def get_faq_router() -> FAQRouter:
+    """Retorna o roteador de FAQ compartilhado pelo processo."""
+    global _faq_router
+    with _faq_router_lock:
+        if _faq_router is None:
+            semantic_threshold = os.getenv('FAQ_FAST_PATH_SEMANTIC_THRESHOLD')
+            _faq_router = FAQRouter(
+                get_faq_engine(),
+                min_score=float(os.getenv('FAQ_FAST_PATH_MIN_SCORE', '3.0')),
+                min_margin=float(os.getenv('FAQ_FAST_PATH_MIN_MARGIN', '1.5')),
+                min_coverage=float(os.getenv('FAQ_FAST_PATH_MIN_COVERAGE', '0.75')),
+                max_words=int(os.getenv('FAQ_FAST_PATH_MAX_WORDS', '20')),
+                semantic_threshold=float(semantic_threshold) if semantic_threshold else None
+            )
+    return _faq_router
@@ -0,0 +1,286 @@
+# =============================================================================
+# SERENA SDR - FAQ SEMANTIC
+# =============================================================================
+
+"""
+FAQ Semantic Module
+
+Busca semântica no FAQ da Serena com embeddings e FAISS.
+
+Complementa a busca BM25 do faq_engine: perguntas reformuladas ("tenho que
+colocar placa no telhado?") encontram o item certo mesmo sem palavras em
+comum, sem chamada ao modelo de chat.
+
+- Embeddings dos itens calculados uma única vez, em lotes
+- Persistidos em disco: índice FAISS + arquivo de vetores (.npy) lido com
+  memory-map; os nomes levam a impressão digital do FAQ e do modelo, então
+  uma alteração no FAQ gera um novo índice e reinícios reaproveitam o atual
+- Consultas: um embedding da pergunta (com cache LRU) e busca top-k por
+  similaridade de cosseno com limiar configurável
+
+Author: Serena SDR System
+Version: 1.0.0
+Created: 2026-10-17
+"""
+
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple
+
+try:
+    import faiss
+    import numpy as np
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+from .faq_engine import FAQEngine, get_faq_engine
+
+logger = logging.getLogger(__name__)
+
+# Máximo de embeddings de perguntas mantidos em memória
+QUERY_CACHE_SIZE = 512
+
+
+def entry_text(item: Dict[str, Any]) -> str:
+    """Texto de um item do FAQ usado no embedding."""
+    return f"{item.get('pergunta', '')}\n{item.get('resposta', '')}"
+
+
+class SemanticFAQ:
+    """Busca por similaridade de embeddings sobre os itens do FAQ."""
+    
+    def __init__(self, engine: FAQEngine, index_dir: str, model: str = "text-embedding-3-small",
+                 threshold: float = 0.75, batch_size: int = 64, client=None):
+        """
+        Inicializa a busca semântica (o índice é carregado/construído no primeiro uso).
+        
+        Args:
+            engine: Motor de FAQ que fornece os itens (acompanha a recarga do arquivo)
+            index_dir: Diretório do índice FAISS e dos vetores
+            model: Modelo de embeddings da OpenAI
+            threshold: Similaridade de cosseno mínima para aceitar um item
+            batch_size: Itens por requisição de embeddings na construção
+            client: Cliente OpenAI (padrão: criado com OPENAI_API_KEY)
+        """
+        self.engine = engine
+        self.index_dir = index_dir
+        self.model = model
+        self.threshold = threshold
+        self.batch_size = batch_size
+        self._client = client
+        self.searches = 0
+        self.hits = 0
+        self.embedding_calls = 0
+        self.builds = 0
+        # (itens, índice FAISS) trocados juntos quando o FAQ muda
+        self._loaded: Tuple[Optional[List[Dict[str, Any]]], Any] = (None, None)
+        self._vectors = None
+        self._query_cache: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Separado do lock dos contadores: a construção faz chamadas de rede
+        self._build_lock = threading.Lock()
+    
+    @property
+    def available(self) -> bool:
+        """Se faiss/numpy estão instalados."""
+        return FAISS_AVAILABLE
+    
+    def _get_client(self):
+        """Cria o cliente OpenAI sob demanda."""
+        if self._client is None:
+            import openai
+            
+            api_key = os.getenv('OPENAI_API_KEY')
+            if not api_key:
+                raise ValueError("OPENAI_API_KEY não encontrado")
+            self._client = openai.OpenAI(api_key=api_key)
+        return self._client
+    
+    def _embed(self, texts: List[str]) -> "np.ndarray":
+        """
+        Calcula embeddings normalizados (produto interno = cosseno).
+        
+        Args:
+            texts: Textos de um lote
+        
+        Returns:
+            np.ndarray: Matriz float32 (len(texts) x dimensão)
+        """
+        response = self._get_client().embeddings.create(model=self.model, input=texts)
+        with self._lock:
+            self.embedding_calls += 1
+        vectors = np.array([row.embedding for row in response.data], dtype="float32")
+        faiss.normalize_L2(vectors)
+        return vectors
+    
+    def _paths(self, items: List[Dict[str, Any]]) -> Tuple[str, str]:
+        """Caminhos do índice e dos vetores para o conteúdo atual do FAQ."""
+        digest = hashlib.sha256(self.model.encode("utf-8"))
+        for item in items:
+            digest.update(entry_text(item).encode("utf-8"))
+            digest.update(b"\0")
+        fingerprint = digest.hexdigest()[:16]
+        base = os.path.join(self.index_dir, f"faq_{fingerprint}")
+        return f"{base}.faiss", f"{base}.npy"
+    
+    @staticmethod
+    def _atomic_write(path: str, write):
+        """Grava via arquivo temporário + rename para não deixar arquivo parcial."""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    def _build(self, items: List[Dict[str, Any]], index_path: str, vectors_path: str):
+        """Calcula os embeddings em lotes e persiste índice e vetores."""
+        batches = [
+            self._embed([entry_text(item) for item in items[start:start + self.batch_size]])
+            for start in range(0, len(items), self.batch_size)
+        ]
+        vectors = np.vstack(batches)
+        
+        index = faiss.IndexFlatIP(vectors.shape[1])
+        index.add(vectors)
+        
+        os.makedirs(self.index_dir, exist_ok=True)
+        
+        def save_vectors(tmp_path: str):
+            # Arquivo aberto explicitamente: np.save acrescentaria .npy ao nome temporário
+            with open(tmp_path, "wb") as vectors_file:
+                np.save(vectors_file, vectors)
+        
+        self._atomic_write(vectors_path, save_vectors)
+        self._atomic_write(index_path, lambda tmp: faiss.write_index(index, tmp))
+        with self._lock:
+            self.builds += 1
+        logger.info(f"Índice semântico do FAQ construído: {len(items)} itens, dimensão {vectors.shape[1]}")
+    
+    def _ensure_index(self) -> Tuple[List[Dict[str, Any]], Any]:
+        """
+        Carrega (ou constrói) o índice para os itens atuais do motor de FAQ.
+        
+        Returns:
+            Tuple: (itens, índice FAISS) consistentes entre si
+        """
+        items = self.engine.items
+        if items is self._loaded[0]:
+            return self._loaded
+        
+        with self._build_lock:
+            if items is self._loaded[0]:
+                return self._loaded
+            if not items:
+                self._loaded = (items, None)
+                return self._loaded
+            
+            index_path, vectors_path = self._paths(items)
+            if not os.path.exists(vectors_path):
+                self._build(items, index_path, vectors_path)
+            
+            # Os vetores ficam no disco (memory-map); o índice é recriado a partir deles se faltar
+            self._vectors = np.load(vectors_path, mmap_mode="r")
+            if os.path.exists(index_path):
+                index = faiss.read_index(index_path)
+            else:
+                index = faiss.IndexFlatIP(self._vectors.shape[1])
+                index.add(np.ascontiguousarray(self._vectors))
+            self._loaded = (items, index)
+            return self._loaded
+    
+    def _query_vector(self, query: str) -> "np.ndarray":
+        """Embedding da pergunta, reaproveitado para perguntas repetidas."""
+        key = " ".join(query.lower().split())
+        with self._lock:
+            cached = self._query_cache.get(key)
+            if cached is not None:
+                self._query_cache.move_to_end(key)
+                return cached
+        
+        vector = self._embed([query])
+        with self._lock:
+            self._query_cache[key] = vector
+            while len(self._query_cache) > QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+        return vector
+    
+    def search(self, query: str, top_k: int = 3, threshold: float = None) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        Busca os itens semanticamente mais próximos da pergunta.
+        
+        Args:
+            query: Pergunta do usuário
+            top_k: Número máximo de resultados
+            threshold: Similaridade mínima (padrão: threshold da instância)
+        
+        Returns:
+            List: Pares (item, similaridade de cosseno) em ordem decrescente
+        """
+        if not FAISS_AVAILABLE:
+            raise RuntimeError("faiss-cpu/numpy não estão instalados")
+        
+        items, index = self._ensure_index()
+        if not items:
+            return []
+        minimum = self.threshold if threshold is None else threshold
+        
+        scores, positions = index.search(self._query_vector(query), min(top_k, len(items)))
+        results = [
+            (dict(items[position]), float(score))
+            for score, position in zip(scores[0], positions[0])
+            if position >= 0 and score >= minimum
+        ]
+        
+        with self._lock:
+            self.searches += 1
+            if results:
+                self.hits += 1
+        return results
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retorna os contadores da busca semântica.
+        
+        Returns:
+            Dict: Disponibilidade, itens indexados, buscas, acertos e chamadas de embedding
+        """
+        with self._lock:
+            return {
+                "available": FAISS_AVAILABLE,
+                "model": self.model,
+                "items": len(self._loaded[0] or []),
+                "threshold": self.threshold,
+                "searches": self.searches,
+                "hits": self.hits,
+                "embedding_calls": self.embedding_calls,
+                "builds": self.builds
+            }
+
+
+# Instância global da busca semântica
+_semantic_faq: Optional[SemanticFAQ] = None
+_semantic_faq_lock = threading.Lock()
+
+
+def get_semantic_faq() -> SemanticFAQ:
+    """Retorna a busca semântica do FAQ compartilhada pelo processo."""
+    global _semantic_faq
+    with _semantic_faq_lock:
+        if _semantic_faq is None:
+            _semantic_faq = SemanticFAQ(
+                get_faq_engine(),
+                index_dir=os.getenv('FAQ_INDEX_DIR', os.path.join(tempfile.gettempdir(), 'serena_faq_index')),
+                model=os.getenv('FAQ_EMBEDDING_MODEL', 'text-embedding-3-small'),
+                threshold=float(os.getenv('FAQ_SEMANTIC_THRESHOLD', '0.75')),
+                batch_size=int(os.getenv('FAQ_EMBEDDING_BATCH_SIZE', '64'))
+            )
+    return _semantic_faq
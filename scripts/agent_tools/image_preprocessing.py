@@ -0,0 +1,367 @@
+# =============================================================================
+# SERENA SDR - IMAGE PREPROCESSING
+# =============================================================================
+
+"""
+Image Preprocessing Module
+
+Prepara fotos de faturas antes da chamada ao modelo de visão:
+
+- Corrige a orientação (EXIF)
+- Recorta o documento e corrige a perspectiva (OpenCV), ou apenas corrige a
+  inclinação quando o contorno da folha não é encontrado
+- Reduz a imagem à resolução que o modelo efetivamente usa
+- Codifica em JPEG e gera a data URL (base64) com o nível de `detail`
+
+Registra, por imagem, os bytes e os tokens de imagem economizados. Opcionalmente
+mantém o documento já endireitado, em tons de cinza e em resolução maior, para
+o OCR local (Tesseract).
+
+Author: Serena SDR System
+Version: 1.0.0
+Created: 2026-10-17
+"""
+
+import io
+import math
+import base64
+import logging
+import threading
+from dataclasses import dataclass, asdict, field
+from typing import Dict, Any, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+try:
+    import cv2
+    import numpy as np
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Regras de dimensionamento e custo de imagens do modelo de visão (detail=high):
+# a imagem é ajustada a 2048x2048, depois o menor lado é reduzido a 768 e o
+# custo é 85 tokens + 170 por bloco de 512x512. Em detail=low o custo é fixo.
+MAX_LONG_SIDE = 2048
+MAX_SHORT_SIDE = 768
+TILE_SIZE = 512
+BASE_TOKENS = 85
+TILE_TOKENS = 170
+
+# Área mínima (fração da imagem) para aceitar um contorno como a folha da fatura
+MIN_DOCUMENT_AREA = 0.3
+MAX_DESKEW_ANGLE = 15.0
+
+EXIF_ORIENTATION = 0x0112
+
+# Maior lado da cópia do documento mantida para o OCR local
+DOCUMENT_MAX_SIDE = 2480
+
+
+def vision_target_size(width: int, height: int, detail: str = "high") -> Tuple[int, int]:
+    """
+    Dimensões para as quais o modelo reduz a imagem antes de processá-la.
+    
+    Args:
+        width: Largura original
+        height: Altura original
+        detail: Nível de detalhe (high, low ou auto)
+    
+    Returns:
+        Tuple: (largura, altura)
+    """
+    if detail == "low":
+        scale = min(1.0, TILE_SIZE / max(width, height))
+        return max(1, round(width * scale)), max(1, round(height * scale))
+    
+    scale = min(1.0, MAX_LONG_SIDE / max(width, height))
+    width, height = width * scale, height * scale
+    
+    scale = min(1.0, MAX_SHORT_SIDE / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def estimate_image_tokens(width: int, height: int, detail: str = "high") -> int:
+    """
+    Estima os tokens de entrada cobrados por uma imagem.
+    
+    Args:
+        width: Largura da imagem enviada
+        height: Altura da imagem enviada
+        detail: Nível de detalhe (high, low ou auto)
+    
+    Returns:
+        int: Tokens estimados
+    """
+    if detail == "low":
+        return BASE_TOKENS
+    
+    width, height = vision_target_size(width, height, detail)
+    return BASE_TOKENS + TILE_TOKENS * math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+
+
+@dataclass
+class PreparedImage:
+    """Imagem pronta para o modelo de visão e as métricas do preprocessamento."""
+    
+    data_url: str
+    detail: str
+    original_bytes: int
+    processed_bytes: int
+    original_size: Tuple[int, int]
+    processed_size: Tuple[int, int]
+    original_tokens: int
+    processed_tokens: int
+    steps: List[str] = field(default_factory=list)
+    # PNG em tons de cinza do documento antes da redução (OCR local)
+    document: Optional[bytes] = field(default=None, repr=False)
+    
+    @property
+    def bytes_saved(self) -> int:
+        """Bytes economizados em relação à imagem original."""
+        return self.original_bytes - self.processed_bytes
+    
+    @property
+    def tokens_saved(self) -> int:
+        """Tokens de imagem economizados em relação à imagem original."""
+        return self.original_tokens - self.processed_tokens
+    
+    def summary(self) -> Dict[str, Any]:
+        """Métricas do preprocessamento (sem a data URL)."""
+        summary = asdict(self)
+        summary.pop("data_url")
+        summary.pop("document")
+        summary["bytes_saved"] = self.bytes_saved
+        summary["tokens_saved"] = self.tokens_saved
+        return summary
+
+
+class ImagePreprocessor:
+    """Preprocessamento local de fotos de faturas antes do OCR por visão."""
+    
+    def __init__(self, detail: str = "high", jpeg_quality: int = 85, crop_document: bool = True,
+                 keep_document: bool = False):
+        """
+        Inicializa o preprocessador.
+        
+        Args:
+            detail: Nível de detalhe enviado ao modelo (high, low ou auto)
+            jpeg_quality: Qualidade do JPEG gerado
+            crop_document: Recortar/endireitar o documento com OpenCV
+            keep_document: Manter a cópia do documento para o OCR local
+        """
+        self.detail = detail
+        self.jpeg_quality = jpeg_quality
+        self.crop_document = crop_document and CV2_AVAILABLE
+        self.keep_document = keep_document
+        self.images = 0
+        self.bytes_saved = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+    
+    def prepare(self, data: bytes) -> PreparedImage:
+        """
+        Preprocessa a imagem e gera a data URL para o modelo.
+        
+        Em caso de erro a imagem original é enviada sem alterações.
+        
+        Args:
+            data: Bytes da imagem original
+        
+        Returns:
+            PreparedImage: Data URL, detail e métricas
+        """
+        try:
+            image = Image.open(io.BytesIO(data))
+            image.load()
+        except Exception as e:
+            logger.warning(f"Imagem não pôde ser decodificada, enviando original: {str(e)}")
+            return self._passthrough(data)
+        
+        original_size = image.size
+        steps = []
+        
+        try:
+            if image.getexif().get(EXIF_ORIENTATION, 1) != 1:
+                image = ImageOps.exif_transpose(image)
+                steps.append("exif_transpose")
+            image = image.convert("RGB")
+            
+            if self.crop_document:
+                image, step = self._crop_or_deskew(image)
+                if step:
+                    steps.append(step)
+            
+            document = self._document_copy(image) if self.keep_document else None
+            
+            target_size = vision_target_size(*image.size, self.detail)
+            if target_size != image.size:
+                image = image.resize(target_size, Image.LANCZOS)
+                steps.append("resize")
+            
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=self.jpeg_quality, optimize=True)
+            processed = buffer.getvalue()
+        
+        except Exception as e:
+            logger.warning(f"Erro no preprocessamento da imagem, enviando original: {str(e)}")
+            return self._passthrough(data, original_size)
+        
+        # Se o resultado ficou maior (imagem já pequena e comprimida), manter o original
+        if len(processed) >= len(data) and not steps:
+            passthrough = self._passthrough(data, original_size)
+            passthrough.document = document
+            return passthrough
+        
+        prepared = PreparedImage(
+            data_url=f"data:image/jpeg;base64,{base64.b64encode(processed).decode('ascii')}",
+            detail=self.detail,
+            original_bytes=len(data),
+            processed_bytes=len(processed),
+            original_size=original_size,
+            processed_size=image.size,
+            original_tokens=estimate_image_tokens(*original_size, self.detail),
+            processed_tokens=estimate_image_tokens(*image.size, self.detail),
+            steps=steps,
+            document=document
+        )
+        self._record(prepared)
+        return prepared
+    
+    @staticmethod
+    def _document_copy(image: Image.Image) -> bytes:
+        """Cópia em tons de cinza (PNG) do documento endireitado, limitada a DOCUMENT_MAX_SIDE."""
+        document = image.convert("L")
+        scale = DOCUMENT_MAX_SIDE / max(document.size)
+        if scale < 1:
+            document = document.resize(
+                (max(1, round(document.width * scale)), max(1, round(document.height * scale))),
+                Image.LANCZOS
+            )
+        buffer = io.BytesIO()
+        document.save(buffer, format="PNG")
+        return buffer.getvalue()
+    
+    def _passthrough(self, data: bytes, size: Tuple[int, int] = (0, 0)) -> PreparedImage:
+        """Imagem original como data URL (sem preprocessamento)."""
+        mime_type = "image/png" if data[:8] == b"\x89PNG\r\n\x1a\n" else "image/jpeg"
+        tokens = estimate_image_tokens(*size, self.detail) if all(size) else 0
+        return PreparedImage(
+            data_url=f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}",
+            detail=self.detail,
+            original_bytes=len(data),
+            processed_bytes=len(data),
+            original_size=size,
+            processed_size=size,
+            original_tokens=tokens,
+            processed_tokens=tokens
+        )
+    
+    def _record(self, prepared: PreparedImage):
+        """Acumula e registra a economia de bytes e tokens da imagem."""
+        with self._lock:
+            self.images += 1
+            self.bytes_saved += prepared.bytes_saved
+            self.tokens_saved += prepared.tokens_saved
+        
+        logger.info(
+            f"Imagem preprocessada ({', '.join(prepared.steps) or 'sem alterações'}): "
+            f"{prepared.original_size} -> {prepared.processed_size}, "
+            f"{prepared.bytes_saved} bytes e {prepared.tokens_saved} tokens economizados"
+        )
+    
+    def _crop_or_deskew(self, image: Image.Image) -> Tuple[Image.Image, str]:
+        """
+        Recorta o documento pelo maior contorno quadrilátero (corrigindo a
+        perspectiva) ou, se não houver, corrige apenas a inclinação do texto.
+        
+        Args:
+            image: Imagem RGB
+        
+        Returns:
+            Tuple: (imagem resultante, etapa aplicada ou "")
+        """
+        array = np.array(image)
+        gray = cv2.cvtColor(array, cv2.COLOR_RGB2GRAY)
+        
+        # Detecção em escala reduzida: mais rápida e menos sensível a ruído
+        scale = min(1.0, 1000 / max(gray.shape))
+        small = cv2.resize(gray, None, fx=scale, fy=scale) if scale < 1.0 else gray
+        
+        edges = cv2.Canny(cv2.GaussianBlur(small, (5, 5), 0), 50, 150)
+        edges = cv2.dilate(edges, np.ones((3, 3), np.uint8), iterations=2)
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        
+        min_area = MIN_DOCUMENT_AREA * small.shape[0] * small.shape[1]
+        for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:5]:
+            if cv2.contourArea(contour) < min_area:
+                break
+            approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+            if len(approx) == 4:
+                corners = approx.reshape(4, 2).astype("float32") / scale
+                return Image.fromarray(self._four_point_transform(array, corners)), "crop_document"
+        
+        angle = self._skew_angle(small)
+        if angle and abs(angle) <= MAX_DESKEW_ANGLE:
+            return image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=(255, 255, 255)), "deskew"
+        
+        return image, ""
+    
+    @staticmethod
+    def _four_point_transform(array, corners):
+        """Corrige a perspectiva do quadrilátero para um retângulo."""
+        sums = corners.sum(axis=1)
+        diffs = np.diff(corners, axis=1).ravel()
+        top_left, bottom_right = corners[np.argmin(sums)], corners[np.argmax(sums)]
+        top_right, bottom_left = corners[np.argmin(diffs)], corners[np.argmax(diffs)]
+        ordered = np.array([top_left, top_right, bottom_right, bottom_left], dtype="float32")
+        
+        width = int(max(np.linalg.norm(bottom_right - bottom_left), np.linalg.norm(top_right - top_left)))
+        height = int(max(np.linalg.norm(top_right - bottom_right), np.linalg.norm(top_left - bottom_left)))
+        destination = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype="float32")
+        
+        matrix = cv2.getPerspectiveTransform(ordered, destination)
+        return cv2.warpPerspective(array, matrix, (width, height))
+    
+    @staticmethod
+    def _skew_angle(gray) -> float:
+        """Ângulo (graus, anti-horário) que endireita as linhas de texto."""
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        coords = np.column_stack(np.where(binary > 0))
+        if len(coords) < 100:
+            return 0.0
+        
+        # A convenção do ângulo do minAreaRect muda entre versões do OpenCV:
+        # normaliza para (-45, 45] e decide o sentido pela nitidez das linhas
+        angle = cv2.minAreaRect(coords[:, ::-1].astype("float32"))[-1] % 90
+        if angle > 45:
+            angle -= 90
+        if abs(angle) < 0.5:
+            return 0.0
+        
+        height, width = binary.shape
+        
+        def line_sharpness(candidate: float) -> float:
+            matrix = cv2.getRotationMatrix2D((width / 2, height / 2), candidate, 1.0)
+            rotated = cv2.warpAffine(binary, matrix, (width, height))
+            return float(np.var(rotated.sum(axis=1)))
+        
+        return round(max((angle, -angle), key=line_sharpness), 2)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retorna a economia acumulada do preprocessamento.
+        
+        Returns:
+            Dict: Imagens processadas, bytes e tokens economizados
+        """
+        with self._lock:
+            return {
+                "images": self.images,
+                "bytes_saved": self.bytes_saved,
+                "tokens_saved": self.tokens_saved,
+                "detail": self.detail,
+                "crop_document": self.crop_document
+            }
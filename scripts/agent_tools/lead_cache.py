@@ -0,0 +1,245 @@
+# =============================================================================
+# SERENA SDR - LEAD CACHE
+# =============================================================================
+
+"""
+Lead Cache Module
+
+Cache de leads por telefone usado pelas ferramentas do Supabase. Evita que a
+mesma linha de `leads` seja consultada várias vezes durante o processamento
+de uma única mensagem (webhook, agente e function calling).
+
+- Backend em memória: LRU com TTL, compartilhado pelo processo
+- Backend Redis (opcional): compartilhado entre réplicas do webhook
+
+As escritas em `leads` feitas pelas ferramentas atualizam o cache
+(write-through); as que não retornam a linha completa invalidam a entrada.
+
+O cliente Redis é síncrono: no código assíncrono use get_async/set_async/
+invalidate_async, que levam as chamadas ao Redis para uma thread e não
+bloqueiam o event loop.
+
+Author: Serena SDR System
+Version: 1.0.0
+Created: 2026-10-17
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_phone_key(phone_number: str) -> str:
+    """
+    Normaliza o telefone para a chave do cache (apenas dígitos, com DDI 55).
+    
+    Args:
+        phone_number: Número de telefone em qualquer formato
+    
+    Returns:
+        str: Telefone normalizado (ex.: 5581999887766)
+    """
+    digits = re.sub(r'\D', '', phone_number or '')
+    if digits and not digits.startswith('55'):
+        digits = '55' + digits
+    return digits
+
+
+class LeadCache:
+    """Cache de leads por telefone com TTL, LRU e backend Redis opcional."""
+    
+    def __init__(self, ttl_seconds: int = 300, max_size: int = 1000, redis_url: str = None,
+                 key_prefix: str = "serena:lead:"):
+        """
+        Inicializa o cache.
+        
+        Args:
+            ttl_seconds: Tempo de vida de cada entrada em segundos
+            max_size: Máximo de leads mantidos em memória
+            redis_url: URL do Redis (opcional, compartilha o cache entre réplicas)
+            key_prefix: Prefixo das chaves no Redis
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.key_prefix = key_prefix
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        
+        if redis_url:
+            try:
+                import redis
+                
+                self._redis = redis.Redis.from_url(redis_url, socket_timeout=1, decode_responses=True)
+                self._redis.ping()
+                logger.info("Cache de leads usando Redis")
+            except Exception as e:
+                logger.warning(f"Redis indisponível para o cache de leads, usando memória: {str(e)}")
+                self._redis = None
+    
+    @property
+    def backend(self) -> str:
+        """Nome do backend em uso."""
+        return "redis" if self._redis is not None else "memory"
+    
+    def _count(self, hit: bool):
+        """Atualiza os contadores de acerto/erro."""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+    
+    def get(self, phone_number: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca um lead no cache.
+        
+        Args:
+            phone_number: Número de telefone do lead
+        
+        Returns:
+            Dict: Dados do lead ou None se ausente/expirado
+        """
+        key = normalize_phone_key(phone_number)
+        if not key:
+            return None
+        
+        if self._redis is not None:
+            try:
+                value = self._redis.get(self.key_prefix + key)
+                self._count(value is not None)
+                return json.loads(value) if value is not None else None
+            except Exception as e:
+                logger.warning(f"Erro ao ler cache de leads no Redis: {str(e)}")
+                self._count(False)
+                return None
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[1])
+    
+    def set(self, phone_number: str, lead: Dict[str, Any]):
+        """
+        Grava (ou substitui) um lead no cache.
+        
+        Args:
+            phone_number: Número de telefone do lead
+            lead: Linha completa da tabela leads
+        """
+        key = normalize_phone_key(phone_number)
+        if not key or not lead:
+            return
+        
+        if self._redis is not None:
+            try:
+                self._redis.setex(self.key_prefix + key, self.ttl_seconds, json.dumps(lead, default=str))
+            except Exception as e:
+                logger.warning(f"Erro ao gravar cache de leads no Redis: {str(e)}")
+            return
+        
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, dict(lead))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, phone_number: str):
+        """
+        Remove um lead do cache.
+        
+        Args:
+            phone_number: Número de telefone do lead
+        """
+        key = normalize_phone_key(phone_number)
+        
+        if self._redis is not None:
+            try:
+                self._redis.delete(self.key_prefix + key)
+            except Exception as e:
+                logger.warning(f"Erro ao invalidar cache de leads no Redis: {str(e)}")
+            return
+        
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    async def get_async(self, phone_number: str) -> Optional[Dict[str, Any]]:
+        """Versão assíncrona de get (Redis consultado fora do event loop)."""
+        if self._redis is None:
+            return self.get(phone_number)
+        return await asyncio.to_thread(self.get, phone_number)
+    
+    async def set_async(self, phone_number: str, lead: Dict[str, Any]):
+        """Versão assíncrona de set (Redis gravado fora do event loop)."""
+        if self._redis is None:
+            self.set(phone_number, lead)
+            return
+        await asyncio.to_thread(self.set, phone_number, lead)
+    
+    async def invalidate_async(self, phone_number: str):
+        """Versão assíncrona de invalidate (Redis acessado fora do event loop)."""
+        if self._redis is None:
+            self.invalidate(phone_number)
+            return
+        await asyncio.to_thread(self.invalidate, phone_number)
+    
+    def clear(self):
+        """Esvazia o cache em memória e zera os contadores."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retorna os contadores do cache.
+        
+        Returns:
+            Dict: hits, misses, hit_rate, size e backend
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "backend": self.backend,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds
+            }
+
+
+# Instância global do cache
+_lead_cache: Optional[LeadCache] = None
+_lead_cache_lock = threading.Lock()
+
+
+def get_lead_cache() -> LeadCache:
+    """Retorna o cache de leads compartilhado pelo processo."""
+    global _lead_cache
+    with _lead_cache_lock:
+        if _lead_cache is None:
+            _lead_cache = LeadCache(
+                ttl_seconds=int(os.getenv('LEAD_CACHE_TTL_SECONDS', '300')),
+                max_size=int(os.getenv('LEAD_CACHE_MAX_SIZE', '1000')),
+                redis_url=os.getenv('LEAD_CACHE_REDIS_URL')
+            )
+    return _lead_cache
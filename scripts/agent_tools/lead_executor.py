@@ -0,0 +1,326 @@
+# =============================================================================
+# SERENA SDR - LEAD EXECUTOR
+# =============================================================================
+
+"""
+Lead Executor Module
+
+Execução serial por lead com agrupamento de mensagens em rajada.
+
+Mensagens de um mesmo telefone são processadas uma turma por vez e na ordem
+de chegada; leads diferentes continuam em paralelo. Mensagens que chegam
+dentro da janela de debounce são combinadas em um único turno do agente,
+então uma rajada de textos gera uma só execução do modelo.
+
+submit() apenas aceita a mensagem e retorna: o worker da fila fica livre
+para outros leads enquanto o turno espera o debounce ou os turnos
+anteriores. O executor conclui cada mensagem: o callback on_success só é
+chamado depois que o turno que incluiu a mensagem termina (até lá ela
+continua pendente na fila e volta em caso de queda do processo); uma falha
+real do turno (exceção ou timeout do turno) é informada pelo callback
+on_failure, e as mensagens seguintes do mesmo lead voltam para a fila atrás
+da retentativa.
+
+Entre réplicas do serviço, um lock no Redis (opcional) garante que o mesmo
+lead não seja processado em dois processos ao mesmo tempo; a validade do
+lock é renovada enquanto o turno roda.
+
+Author: Serena SDR System
+Version: 1.0.0
+Created: 2026-10-17
+"""
+
+import time
+import uuid
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, List, Callable, Awaitable
+
+logger = logging.getLogger(__name__)
+
+# Libera o lock apenas se ele ainda pertence a quem o adquiriu
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Renova a validade do lock apenas se ele ainda pertence a quem o adquiriu
+REFRESH_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+@dataclass
+class _PendingMessage:
+    """Mensagem aceita e os callbacks de quem a entregou."""
+    
+    payload: Dict[str, Any]
+    on_success: Optional[Callable[[], Awaitable[None]]] = None
+    on_failure: Optional[Callable[[Exception], Awaitable[bool]]] = None
+    on_requeue: Optional[Callable[[], Awaitable[None]]] = None
+
+
+@dataclass
+class _LeadState:
+    """Mensagens aguardando processamento de um lead."""
+    
+    pending: List[_PendingMessage] = field(default_factory=list)
+    last_arrival: float = 0.0
+    task: Optional[asyncio.Task] = None
+
+
+class LeadSerialExecutor:
+    """Executor serial por chave (telefone) com debounce e agrupamento."""
+    
+    def __init__(self, handler: Callable[[Dict[str, Any]], Awaitable[None]],
+                 key: Callable[[Dict[str, Any]], str],
+                 merge: Callable[[List[Dict[str, Any]]], Dict[str, Any]],
+                 can_merge: Callable[[List[Dict[str, Any]], Dict[str, Any]], bool] = None,
+                 debounce: float = 1.5, max_wait: float = 4.0, redis_url: str = None,
+                 turn_timeout: float = 180.0, lock_ttl: float = 30.0):
+        """
+        Inicializa o executor.
+        
+        Args:
+            handler: Corrotina que processa um turno (payload já combinado)
+            key: Extrai a chave de serialização do payload (telefone)
+            merge: Combina os payloads de uma rajada em um único payload
+            can_merge: Decide se o próximo payload entra na turma atual
+                (ex.: no máximo uma mídia por turno); padrão: sempre
+            debounce: Silêncio (s) que encerra a janela de agrupamento
+            max_wait: Espera máxima (s) desde a primeira mensagem da turma
+            redis_url: URL do Redis para o lock entre réplicas (opcional)
+            turn_timeout: Tempo máximo (s) de um turno; também limita a espera
+                pelo lock de outra réplica
+            lock_ttl: Validade (s) do lock entre réplicas, renovada a cada
+                terço enquanto o turno roda
+        """
+        self.handler = handler
+        self.key = key
+        self.merge = merge
+        self.can_merge = can_merge or (lambda batch, payload: True)
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.redis_url = redis_url
+        self.turn_timeout = turn_timeout
+        self.lock_ttl = lock_ttl
+        self.messages = 0
+        self.turns = 0
+        self.coalesced = 0
+        self.failures = 0
+        self._states: Dict[str, _LeadState] = {}
+        self._redis = None
+        self._release_lock = None
+        self._refresh_lock = None
+    
+    async def start(self):
+        """Conecta ao Redis do lock entre réplicas (se configurado)."""
+        if not self.redis_url:
+            return
+        try:
+            import redis.asyncio as redis_asyncio
+            self._redis = redis_asyncio.from_url(self.redis_url, decode_responses=True)
+            await self._redis.ping()
+            self._release_lock = self._redis.register_script(RELEASE_LOCK_SCRIPT)
+            self._refresh_lock = self._redis.register_script(REFRESH_LOCK_SCRIPT)
+            logger.info("Executor por lead usando lock no Redis")
+        except Exception as e:
+            logger.warning(f"Redis indisponível para o lock por lead, serializando só no processo: {str(e)}")
+            self._redis = None
+    
+    async def submit(self, payload: Dict[str, Any],
+                     on_success: Callable[[], Awaitable[None]] = None,
+                     on_failure: Callable[[Exception], Awaitable[bool]] = None,
+                     on_requeue: Callable[[], Awaitable[None]] = None):
+        """
+        Aceita o payload no lead correspondente (retorna sem esperar o turno).
+        
+        Args:
+            payload: Mensagem recebida
+            on_success: Chamado quando o turno que incluiu o payload termina
+                (confirma a mensagem na fila)
+            on_failure: Chamado com a exceção se o turno que incluiu o payload
+                falhar; retorna True se a mensagem será tentada de novo
+            on_requeue: Devolve a mensagem à fila sem contar tentativa (mensagens
+                seguintes a uma falha e pendências no encerramento)
+        """
+        lead_key = self.key(payload)
+        state = self._states.get(lead_key)
+        if state is None:
+            state = self._states[lead_key] = _LeadState()
+        
+        state.pending.append(_PendingMessage(payload, on_success, on_failure, on_requeue))
+        state.last_arrival = time.monotonic()
+        self.messages += 1
+        
+        if state.task is None:
+            state.task = asyncio.create_task(self._drain(lead_key, state))
+    
+    async def _wait_quiet(self, state: _LeadState):
+        """Espera a rajada terminar: debounce de silêncio, limitado a max_wait."""
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            remaining = min(state.last_arrival + self.debounce, deadline) - time.monotonic()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(remaining)
+    
+    def _take_batch(self, state: _LeadState) -> List[_PendingMessage]:
+        """Retira do início da fila do lead as mensagens do próximo turno."""
+        batch = [state.pending.pop(0)]
+        while state.pending and self.can_merge([entry.payload for entry in batch], state.pending[0].payload):
+            batch.append(state.pending.pop(0))
+        return batch
+    
+    async def _report_success(self, lead_key: str, batch: List[_PendingMessage]):
+        """Confirma as mensagens de um turno concluído."""
+        for entry in batch:
+            if entry.on_success is None:
+                continue
+            try:
+                await entry.on_success()
+            except Exception as callback_error:
+                logger.error(f"Erro ao confirmar mensagem de {lead_key}: {str(callback_error)}")
+    
+    async def _report_failure(self, lead_key: str, state: _LeadState, batch: List[_PendingMessage], error: Exception):
+        """Informa a falha do turno e devolve as mensagens seguintes do lead para trás da retentativa."""
+        retrying = False
+        for entry in batch:
+            if entry.on_failure is None:
+                continue
+            try:
+                retrying = await entry.on_failure(error) or retrying
+            except Exception as callback_error:
+                logger.error(f"Erro ao registrar falha do turno de {lead_key}: {str(callback_error)}")
+        
+        if retrying:
+            displaced, state.pending = state.pending, []
+            await self._requeue(lead_key, displaced)
+    
+    async def _requeue(self, lead_key: str, entries: List[_PendingMessage]):
+        """Devolve mensagens ainda não processadas à fila, na ordem."""
+        for entry in entries:
+            if entry.on_requeue is None:
+                continue
+            try:
+                await entry.on_requeue()
+            except Exception as callback_error:
+                logger.error(f"Erro ao devolver mensagem de {lead_key} à fila: {str(callback_error)}")
+    
+    async def _drain(self, lead_key: str, state: _LeadState):
+        """Processa os turnos de um lead, um por vez, até esvaziar a fila dele."""
+        batch: List[_PendingMessage] = []
+        try:
+            while state.pending:
+                await self._wait_quiet(state)
+                batch = self._take_batch(state)
+                payloads = [entry.payload for entry in batch]
+                
+                if len(payloads) > 1:
+                    self.coalesced += len(payloads) - 1
+                    logger.info(f"{len(payloads)} mensagens de {lead_key} agrupadas em um turno")
+                
+                try:
+                    async with self._lead_lock(lead_key):
+                        await asyncio.wait_for(
+                            self.handler(payloads[0] if len(payloads) == 1 else self.merge(payloads)),
+                            timeout=self.turn_timeout
+                        )
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.failures += 1
+                    failed, batch = batch, []
+                    await self._report_failure(lead_key, state, failed, e)
+                else:
+                    done, batch = batch, []
+                    await self._report_success(lead_key, done)
+                finally:
+                    self.turns += 1
+                batch = []
+        except asyncio.CancelledError:
+            # Encerramento: o turno interrompido conta como falha; o resto volta à fila
+            await self._report_failure(lead_key, state, batch, RuntimeError("Executor por lead encerrado"))
+            raise
+        finally:
+            # Sem await entre a verificação e a remoção: nenhum submit pode se perder
+            pending, state.pending = state.pending, []
+            state.task = None
+            self._states.pop(lead_key, None)
+            if pending:
+                await self._requeue(lead_key, pending)
+    
+    @asynccontextmanager
+    async def _lead_lock(self, lead_key: str):
+        """Lock do lead entre réplicas (no-op sem Redis)."""
+        if self._redis is None:
+            yield
+            return
+        
+        lock_key = f"serena:lead_lock:{lead_key}"
+        token = uuid.uuid4().hex
+        ttl_ms = int(self.lock_ttl * 1000)
+        delay = 0.05
+        deadline = time.monotonic() + self.turn_timeout
+        while not await self._redis.set(lock_key, token, nx=True, px=ttl_ms):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Lead {lead_key} ocupado em outra réplica")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+        
+        async def keep_alive():
+            while True:
+                await asyncio.sleep(self.lock_ttl / 3)
+                try:
+                    if not await self._refresh_lock(keys=[lock_key], args=[token, ttl_ms]):
+                        logger.warning(f"Lock do lead {lead_key} perdido durante o turno")
+                        return
+                except Exception as e:
+                    logger.warning(f"Erro ao renovar lock do lead {lead_key}: {str(e)}")
+        
+        refresher = asyncio.create_task(keep_alive())
+        try:
+            yield
+        finally:
+            refresher.cancel()
+            try:
+                await self._release_lock(keys=[lock_key], args=[token])
+            except Exception as e:
+                logger.warning(f"Erro ao liberar lock do lead {lead_key}: {str(e)}")
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retorna os contadores do executor.
+        
+        Returns:
+            Dict: Mensagens, turnos executados, mensagens agrupadas (turnos do
+                agente economizados) e leads ativos
+        """
+        return {
+            "messages": self.messages,
+            "turns": self.turns,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "active_leads": len(self._states),
+            "debounce": self.debounce,
+            "lock_backend": "redis" if self._redis is not None else "process"
+        }
+    
+    async def close(self):
+        """Cancela os turnos em andamento, devolve as pendências à fila e fecha o Redis."""
+        tasks = [state.task for state in list(self._states.values()) if state.task is not None]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if self._redis is not None:
+            close = getattr(self._redis, "aclose", None) or self._redis.close
+            await close()
+            self._redis = None
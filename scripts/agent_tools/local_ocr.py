@@ -0,0 +1,419 @@
+# =============================================================================
+# SERENA SDR - LOCAL OCR
+# =============================================================================
+
+"""
+Local OCR Module
+
+Caminho rápido de leitura de faturas com Tesseract, sem chamada ao modelo de visão.
+
+O Tesseract roda em um pool de processos (é CPU-bound e não deve ocupar as
+threads do agente nem o event loop) sobre o documento já endireitado pelo
+preprocessamento, com o timeout repassado ao Tesseract para que o processo
+filho seja encerrado se a leitura travar. Do texto reconhecido são extraídos
+valor total, vencimento, consumo em kWh e distribuidora; o resultado só é
+aceito quando a confiança atinge o mínimo configurado, caso contrário a
+imagem segue para o modelo de visão.
+
+Author: Serena SDR System
+Version: 1.0.0
+Created: 2026-10-17
+"""
+
+import io
+import os
+import re
+import logging
+import threading
+import unicodedata
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date
+from typing import Dict, Any, Optional, List, Tuple
+
+try:
+    import pytesseract
+    TESSERACT_AVAILABLE = True
+except ImportError:
+    TESSERACT_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Distribuidoras reconhecidas no texto (já sem acentos e em maiúsculas)
+DISTRIBUIDORAS: List[Tuple[str, str]] = [
+    ("CELPE", r"\bCELPE\b|NEOENERGIA\s+PERNAMBUCO"),
+    ("COELBA", r"\bCOELBA\b|NEOENERGIA\s+BAHIA"),
+    ("COSERN", r"\bCOSERN\b|NEOENERGIA\s+RIO\s+GRANDE\s+DO\s+NORTE"),
+    ("ELEKTRO", r"\bELEKTRO\b"),
+    ("NEOENERGIA BRASILIA", r"NEOENERGIA\s+BRASILIA"),
+    ("ENEL CE", r"\bENEL\b.{0,40}\bCEARA\b|\bCOELCE\b"),
+    ("ENEL RJ", r"\bENEL\b.{0,40}\bRIO\b|\bAMPLA\b"),
+    ("ENEL SP", r"\bENEL\b.{0,40}\bSAO\s+PAULO\b|\bELETROPAULO\b"),
+    ("ENEL", r"\bENEL\b"),
+    ("CEMIG", r"\bCEMIG\b"),
+    ("CPFL", r"\bCPFL\b"),
+    ("LIGHT", r"\bLIGHT\s+(?:SERVICOS|S\.?A)\b|\bLIGHT\b"),
+    ("COPEL", r"\bCOPEL\b"),
+    ("CELESC", r"\bCELESC\b"),
+    ("EDP", r"\bEDP\b"),
+    ("RGE", r"\bRGE\b"),
+    ("CEEE EQUATORIAL", r"\bCEEE\b"),
+    ("EQUATORIAL", r"\bEQUATORIAL\b"),
+    ("ENERGISA", r"\bENERGISA\b"),
+    ("AMAZONAS ENERGIA", r"AMAZONAS\s+ENERGIA"),
+]
+
+# Rótulos que antecedem o valor a pagar, o vencimento e o consumo
+TOTAL_LABELS = r"TOTAL\s+A\s+PAGAR|VALOR\s+A\s+PAGAR|VALOR\s+TOTAL|TOTAL\s+DA\s+(?:FATURA|CONTA)|VALOR\s+DO\s+DOCUMENTO|VALOR\s+COBRADO"
+DUE_DATE_LABELS = r"VENCIMENTO|VENCE\s+EM|PAGAR\s+ATE"
+CONSUMPTION_LABELS = r"CONSUMO|ENERGIA\s+(?:ATIVA|ELETRICA)|KWH\s+FATURADO"
+
+MONEY_PATTERN = re.compile(r"(?:R\$\s*)?(\d{1,3}(?:[.\s]\d{3})*,\d{2})\b")
+DATE_PATTERN = re.compile(r"\b(\d{1,2})[/.-](\d{1,2})[/.-](\d{2,4})\b")
+KWH_PATTERN = re.compile(r"(\d{1,3}(?:\.\d{3})+|\d+)(?:,\d+)?\s*KWH\b")
+
+# Linhas seguintes ao rótulo em que o valor ainda é procurado (layout em colunas)
+LABEL_LOOKAHEAD = 2
+
+# Peso de cada campo na confiança (valor total é obrigatório)
+FIELD_WEIGHTS = {
+    "valor_total": 50,
+    "distribuidora": 20,
+    "data_vencimento": 15,
+    "consumo_kwh": 15
+}
+
+# Faixas plausíveis para uma fatura residencial/comercial
+MAX_BILL_VALUE = 100000.0
+MAX_CONSUMPTION_KWH = 200000.0
+
+
+def normalize_text(text: str) -> str:
+    """Texto em maiúsculas e sem acentos, para casar os padrões."""
+    folded = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in folded if not unicodedata.combining(c)).upper()
+
+
+def _parse_money(value: str) -> Optional[float]:
+    """Converte '1.234,56' em 1234.56."""
+    try:
+        return float(value.replace(" ", "").replace(".", "").replace(",", "."))
+    except ValueError:
+        return None
+
+
+def _parse_date(day: str, month: str, year: str) -> Optional[str]:
+    """Data DD/MM/AAAA válida no formato YYYY-MM-DD."""
+    if len(year) == 2:
+        year = "20" + year
+    try:
+        return date(int(year), int(month), int(day)).isoformat()
+    except ValueError:
+        return None
+
+
+def _labeled_lines(lines: List[str], labels: str) -> List[str]:
+    """Trechos a partir de cada rótulo, incluindo as linhas seguintes."""
+    pattern = re.compile(labels)
+    windows = []
+    for index, line in enumerate(lines):
+        match = pattern.search(line)
+        if match:
+            windows.append(" ".join([line[match.end():]] + lines[index + 1:index + 1 + LABEL_LOOKAHEAD]))
+    return windows
+
+
+def parse_bill_text(text: str) -> Dict[str, Any]:
+    """
+    Extrai os campos da fatura do texto reconhecido pelo OCR.
+    
+    Os valores só são aceitos quando aparecem junto ao rótulo correspondente
+    (ex.: "TOTAL A PAGAR"), para não confundir o total com outros valores da conta.
+    
+    Args:
+        text: Texto reconhecido
+    
+    Returns:
+        Dict: valor_total, data_vencimento, consumo_kwh, distribuidora e
+            fields_found (campos encontrados)
+    """
+    normalized = normalize_text(text)
+    lines = [line.strip() for line in normalized.splitlines() if line.strip()]
+    
+    valor_total = None
+    for window in _labeled_lines(lines, TOTAL_LABELS):
+        values = [_parse_money(match) for match in MONEY_PATTERN.findall(window)]
+        values = [value for value in values if value and 0 < value <= MAX_BILL_VALUE]
+        if values:
+            valor_total = values[0]
+            break
+    
+    data_vencimento = None
+    for window in _labeled_lines(lines, DUE_DATE_LABELS):
+        for match in DATE_PATTERN.findall(window):
+            data_vencimento = _parse_date(*match)
+            if data_vencimento:
+                break
+        if data_vencimento:
+            break
+    
+    consumo_kwh = None
+    for window in _labeled_lines(lines, CONSUMPTION_LABELS) + [normalized]:
+        match = KWH_PATTERN.search(window)
+        if match:
+            value = float(match.group(1).replace(".", ""))
+            if 0 < value <= MAX_CONSUMPTION_KWH:
+                consumo_kwh = value
+                break
+    
+    distribuidora = None
+    for name, pattern in DISTRIBUIDORAS:
+        if re.search(pattern, normalized):
+            distribuidora = name
+            break
+    
+    parsed = {
+        "valor_total": valor_total,
+        "data_vencimento": data_vencimento,
+        "consumo_kwh": consumo_kwh,
+        "distribuidora": distribuidora
+    }
+    parsed["fields_found"] = [name for name in FIELD_WEIGHTS if parsed[name]]
+    return parsed
+
+
+def _run_tesseract(image_bytes: bytes, lang: str, config: str, timeout: float = 0) -> Tuple[str, float]:
+    """
+    Executa o Tesseract (no processo do pool).
+    
+    Args:
+        image_bytes: Imagem do documento
+        lang: Idiomas do Tesseract
+        config: Parâmetros adicionais do Tesseract
+        timeout: Tempo máximo (s) do executável; o pytesseract encerra o
+            processo ao estourar (0 = sem limite)
+    
+    Returns:
+        Tuple: Texto reconhecido (uma linha por linha do documento) e a
+            confiança média das palavras (0-100)
+    """
+    from PIL import Image
+    
+    image = Image.open(io.BytesIO(image_bytes))
+    data = pytesseract.image_to_data(image, lang=lang, config=config, timeout=timeout,
+                                     output_type=pytesseract.Output.DICT)
+    
+    lines: Dict[Tuple[int, int, int], List[str]] = {}
+    confidences = []
+    for index, word in enumerate(data["text"]):
+        word = word.strip()
+        if not word:
+            continue
+        key = (data["block_num"][index], data["par_num"][index], data["line_num"][index])
+        lines.setdefault(key, []).append(word)
+        confidence = float(data["conf"][index])
+        if confidence >= 0:
+            confidences.append(confidence)
+    
+    text = "\n".join(" ".join(words) for _, words in sorted(lines.items()))
+    return text, (sum(confidences) / len(confidences) if confidences else 0.0)
+
+
+class LocalOCR:
+    """Leitura de faturas com Tesseract em pool de processos."""
+    
+    def __init__(self, max_workers: int = 2, timeout: float = 15.0, min_confidence: float = 70.0,
+                 lang: str = "por", config: str = "--oem 1 --psm 6"):
+        """
+        Inicializa o OCR local.
+        
+        Args:
+            max_workers: Processos do pool
+            timeout: Tempo máximo (s) de OCR por imagem antes de recorrer ao modelo
+            min_confidence: Confiança mínima (0-100) para dispensar o modelo de visão
+            lang: Idiomas do Tesseract
+            config: Parâmetros adicionais do Tesseract
+        """
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.min_confidence = min_confidence
+        self.lang = lang
+        self.config = config
+        self.available = TESSERACT_AVAILABLE and self._check_binary()
+        self.accepted = 0
+        self.escalated = 0
+        self.failures = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _check_binary() -> bool:
+        """Verifica se o executável do Tesseract está instalado."""
+        try:
+            pytesseract.get_tesseract_version()
+            return True
+        except Exception as e:
+            logger.warning(f"Tesseract indisponível, OCR local desativado: {str(e)}")
+            return False
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Pool de processos criado sob demanda (spawn: o processo pai tem threads)."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+    
+    def _reset_executor(self):
+        """Descarta um pool quebrado ou com processo travado; o próximo uso cria outro."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    @staticmethod
+    def confidence(parsed: Dict[str, Any], ocr_confidence: float) -> float:
+        """
+        Confiança da extração (0-100): peso dos campos encontrados × confiança do OCR.
+        
+        Args:
+            parsed: Resultado de parse_bill_text
+            ocr_confidence: Confiança média das palavras (0-100)
+        
+        Returns:
+            float: Confiança da extração
+        """
+        if not parsed.get("valor_total"):
+            return 0.0
+        field_score = sum(FIELD_WEIGHTS[name] for name in parsed.get("fields_found", []))
+        return round(field_score * min(1.0, max(0.0, ocr_confidence) / 100), 1)
+    
+    def extract(self, image_bytes: bytes) -> Optional[Dict[str, Any]]:
+        """
+        Lê a fatura localmente.
+        
+        Args:
+            image_bytes: Imagem do documento (de preferência já endireitada)
+        
+        Returns:
+            Dict: Campos extraídos, texto e confiança, ou None quando a leitura
+                não atinge a confiança mínima (a imagem deve ir ao modelo de visão)
+        """
+        if not self.available or not image_bytes:
+            return None
+        
+        try:
+            future = self._get_executor().submit(_run_tesseract, image_bytes, self.lang, self.config, self.timeout)
+            text, ocr_confidence = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            logger.warning(f"OCR local excedeu {self.timeout}s, usando o modelo de visão")
+            if not future.cancel():
+                # Já estava rodando: as próximas leituras vão para um pool novo em vez
+                # de esperar atrás do processo ocupado (encerrado pelo timeout do Tesseract)
+                self._reset_executor()
+            with self._lock:
+                self.failures += 1
+            return None
+        except BrokenProcessPool as e:
+            logger.error(f"Pool do OCR local quebrado: {str(e)}")
+            self._reset_executor()
+            with self._lock:
+                self.failures += 1
+            return None
+        except Exception as e:
+            logger.warning(f"Erro no OCR local: {str(e)}")
+            with self._lock:
+                self.failures += 1
+            return None
+        
+        return self.evaluate(text, ocr_confidence)
+    
+    def evaluate(self, text: str, ocr_confidence: float = 100.0) -> Optional[Dict[str, Any]]:
+        """
+        Extrai os campos de um texto de fatura e decide se a leitura basta.
+        
+        Também usado para a camada de texto de PDFs (confiança de OCR 100).
+        
+        Args:
+            text: Texto da fatura
+            ocr_confidence: Confiança média do reconhecimento (0-100)
+        
+        Returns:
+            Dict: Campos extraídos, texto e confiança, ou None abaixo da confiança mínima
+        """
+        parsed = parse_bill_text(text)
+        confidence = self.confidence(parsed, ocr_confidence)
+        
+        # Sem distribuidora reconhecida não há como afirmar que é uma fatura de energia
+        accepted = confidence >= self.min_confidence and parsed["distribuidora"] is not None
+        with self._lock:
+            if accepted:
+                self.accepted += 1
+            else:
+                self.escalated += 1
+        
+        logger.info(
+            f"Leitura local: campos {parsed['fields_found']}, confiança {confidence} "
+            f"(OCR {ocr_confidence:.0f}) -> {'aceito' if accepted else 'modelo'}"
+        )
+        if not accepted:
+            return None
+        
+        return {**parsed, "confianca": confidence, "ocr_confidence": round(ocr_confidence, 1), "text": text}
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retorna os contadores do OCR local.
+        
+        Returns:
+            Dict: Disponibilidade, leituras aceitas, escaladas ao modelo e falhas
+        """
+        with self._lock:
+            total = self.accepted + self.escalated + self.failures
+            return {
+                "available": self.available,
+                "accepted": self.accepted,
+                "escalated": self.escalated,
+                "failures": self.failures,
+                "accept_rate": round(self.accepted / total, 4) if total else 0.0,
+                "min_confidence": self.min_confidence
+            }
+    
+    def close(self):
+        """Encerra o pool de processos."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+# Instância global do OCR local
+_local_ocr: Optional[LocalOCR] = None
+_local_ocr_lock = threading.Lock()
+
+
+def get_local_ocr() -> LocalOCR:
+    """Retorna o OCR local compartilhado pelo processo."""
+    global _local_ocr
+    with _local_ocr_lock:
+        if _local_ocr is None:
+            _local_ocr = LocalOCR(
+                max_workers=int(os.getenv('LOCAL_OCR_WORKERS', str(min(2, os.cpu_count() or 1)))),
+                timeout=float(os.getenv('LOCAL_OCR_TIMEOUT', '15')),
+                min_confidence=float(os.getenv('LOCAL_OCR_MIN_CONFIDENCE', '70')),
+                lang=os.getenv('LOCAL_OCR_LANG', 'por'),
+                config=os.getenv('LOCAL_OCR_CONFIG', '--oem 1 --psm 6')
+            )
+    return _local_ocr
+
+
+def close_local_ocr():
+    """Encerra o pool do OCR local (shutdown da aplicação)."""
+    global _local_ocr
+    with _local_ocr_lock:
+        if _local_ocr is not None:
+            _local_ocr.close()
+            _local_ocr = None
@@ -16,11 +16,14 @@ Created: 2025-01-30
 
 import os
 import json
-import requests
 import logging
 from typing import Dict, Any, List, Optional
 from langchain.tools import tool
 
+import httpx
+
+from .mcp_transport import get_transport, MCPTransportError
+
 # Configurar logging
 logger = logging.getLogger(__name__)
 
@@ -40,55 +43,32 @@ class MCPSerenaClient:
     
     def _make_mcp_request(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
         """Faz requisição JSON-RPC para o MCP Server."""
-        payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "tools/call",
-            "params": {
-                "name": tool_name,
-                "arguments": arguments
-            }
-        }
-        
-        headers = {
-            "Content-Type": "application/json"
+        params = {
+            "name": tool_name,
+            "arguments": arguments
         }
         
-        for attempt in range(self.max_retries):
-            try:
-                logger.info(f"Fazendo requisição MCP Serena: {tool_name} (tentativa {attempt + 1})")
-                response = requests.post(
-                    self.mcp_endpoint,
-                    json=payload,
-                    headers=headers,
-                    timeout=self.timeout
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if "result" in result:
-                        return result["result"]
-                    elif "error" in result:
-                        raise Exception(f"Erro MCP: {result['error']}")
-                    else:
-                        return result
-                else:
-                    logger.error(f"Erro HTTP {response.status_code}: {response.text}")
-                    if attempt == self.max_retries - 1:
-                        raise Exception(f"Erro HTTP {response.status_code}: {response.text}")
-                        
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Erro de conexão (tentativa {attempt + 1}): {str(e)}")
-                if attempt == self.max_retries - 1:
-                    raise Exception(f"Falha na conexão com MCP Serena: {str(e)}")
-                    
-        raise Exception("Máximo de tentativas excedido")
+        try:
+            logger.info(f"Fazendo requisição MCP Serena: {tool_name}")
+            return get_transport().request(
+                self.base_url,
+                "tools/call",
+                params,
+                timeout=self.timeout,
+                max_retries=self.max_retries
+            )
+            
+        except MCPTransportError as e:
+            raise Exception(str(e))
+        except httpx.HTTPStatusError as e:
+            raise Exception(f"Erro HTTP {e.response.status_code}: {e.response.text}")
+        except httpx.HTTPError as e:
+            raise Exception(f"Falha na conexão com MCP Serena: {str(e)}")
     
     def check_health(self) -> Dict[str, Any]:
         """Verifica a saúde do MCP Server."""
         try:
-            health_url = f"{self.base_url.rstrip('/')}/health"
-            response = requests.get(health_url, timeout=10)
+            response = get_transport().get(self.base_url, "/health", timeout=10)
             if response.status_code == 200:
                 return {"status": "online", "data": response.json()}
             else:
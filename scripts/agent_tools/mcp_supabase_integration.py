@@ -16,11 +16,14 @@ Created: 2025-01-07
 
 import os
 import json
-import requests
 import logging
 from typing import Dict, Any, List, Optional
 from langchain.tools import tool
 
+import httpx
+
+from .mcp_transport import get_transport, MCPTransportError
+
 # Configurar logging
 logger = logging.getLogger(__name__)
 
@@ -34,34 +37,18 @@ class MCPSupabaseClient:
     def __init__(self, base_url: str = None):
         self.base_url = base_url or MCP_SERVER_URL
         self.mcp_endpoint = f"{self.base_url.rstrip('/')}/mcp"
-        self.session = requests.Session()
-        self.session.headers.update({
-            'Content-Type': 'application/json',
-            'User-Agent': 'Serena-SDR-Agent/1.0'
-        })
+        # Conexões vêm do pool compartilhado por host (mcp_transport)
+        self.transport = get_transport()
     
     def _make_mcp_call(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
         """Faz uma chamada JSON-RPC para o MCP Server."""
-        payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": method,
-            "params": params
-        }
-        
         try:
-            response = self.session.post(self.mcp_endpoint, json=payload, timeout=30)
-            response.raise_for_status()
-            
-            result = response.json()
-            
-            if "error" in result:
-                logger.error(f"MCP Error: {result['error']}")
-                raise Exception(f"MCP Error: {result['error']['message']}")
-            
-            return result.get("result", {})
+            return self.transport.request(self.base_url, method, params, timeout=30, max_retries=1)
             
-        except requests.exceptions.RequestException as e:
+        except MCPTransportError as e:
+            logger.error(str(e))
+            raise Exception(str(e))
+        except httpx.HTTPError as e:
             logger.error(f"MCP Request failed: {str(e)}")
             raise Exception(f"MCP Server não disponível: {str(e)}")
         except json.JSONDecodeError as e:
@@ -86,8 +73,7 @@ class MCPSupabaseClient:
     def check_health(self) -> Dict[str, Any]:
         """Verifica saúde do MCP Server."""
         try:
-            health_url = f"{self.base_url.rstrip('/')}/health"
-            response = self.session.get(health_url, timeout=10)
+            response = self.transport.get(self.base_url, "/health", timeout=10)
             response.raise_for_status()
             return {"status": "online", "details": response.json()}
         except Exception as e:
@@ -0,0 +1,691 @@
+# =============================================================================
+# SERENA SDR - MCP TRANSPORT
+# =============================================================================
+
+"""
+MCP Transport Module
+
+Este módulo concentra o transporte JSON-RPC usado pelas ferramentas MCP.
+Mantém um pool de conexões keep-alive por host de MCP Server, compartilhado
+por todas as ferramentas do processo, em duas versões:
+
+- MCPTransport: cliente síncrono (httpx.Client), usado pelo agente
+- AsyncMCPTransport: cliente assíncrono (httpx.AsyncClient), usado pelo webhook
+
+HTTP/2 é habilitado quando o pacote opcional `h2` está instalado.
+
+Chamadas independentes podem ser agrupadas em um único lote JSON-RPC
+(MCPBatch), correlacionando as respostas pelo id único de cada requisição.
+
+Author: Serena SDR System
+Version: 1.1.0
+Created: 2026-10-17
+"""
+
+import os
+import time
+import asyncio
+import logging
+import itertools
+import threading
+import importlib.util
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, List, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 depende do pacote opcional h2 (httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+DEFAULT_HEADERS = {
+    "Content-Type": "application/json",
+    "User-Agent": "Serena-SDR-MCP-Client/1.0.0"
+}
+
+
+# Ids JSON-RPC únicos no processo (next() em itertools.count é atômico)
+_request_ids = itertools.count(1)
+
+
+class MCPTransportError(Exception):
+    """Erro retornado por um MCP Server (campo "error" do JSON-RPC)."""
+
+
+class MCPBatchNotSupportedError(MCPTransportError):
+    """O MCP Server não aceita requisições JSON-RPC em lote."""
+
+
+def next_request_id() -> int:
+    """Retorna um novo id de requisição JSON-RPC."""
+    return next(_request_ids)
+
+
+def build_jsonrpc_payload(method: str, params: Dict[str, Any] = None, request_id: int = None) -> Dict[str, Any]:
+    """
+    Monta o payload JSON-RPC 2.0 de uma chamada MCP.
+    
+    Args:
+        method: Método MCP (tools/call, tools/list, etc.)
+        params: Parâmetros da requisição
+        request_id: Identificador da requisição (gerado se omitido)
+    
+    Returns:
+        Dict: Payload JSON-RPC
+    """
+    if request_id is None:
+        request_id = next_request_id()
+    
+    payload = {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "method": method
+    }
+    
+    if params is not None:
+        payload["params"] = params
+    
+    return payload
+
+
+def parse_jsonrpc_response(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extrai o campo "result" de uma resposta JSON-RPC.
+    
+    Args:
+        result: Resposta JSON-RPC decodificada
+    
+    Returns:
+        Dict: Conteúdo de "result"
+    """
+    if "error" in result:
+        raise MCPTransportError(f"MCP Error: {result['error']}")
+    
+    return result.get("result", {})
+
+
+def parse_jsonrpc_batch_response(payloads: List[Dict[str, Any]], responses: Any) -> List[Any]:
+    """
+    Correlaciona as respostas de um lote JSON-RPC com as requisições pelo id.
+    
+    Args:
+        payloads: Requisições enviadas no lote
+        responses: Resposta decodificada do servidor
+    
+    Returns:
+        List: Um item por requisição, na ordem de envio. Chamadas com erro
+        retornam a instância de MCPTransportError em vez de levantá-la.
+    """
+    if not isinstance(responses, list):
+        # Servidores sem suporte a lote respondem com um único objeto de erro
+        raise MCPBatchNotSupportedError(f"Lote JSON-RPC não suportado: {responses}")
+    
+    by_id = {response.get("id"): response for response in responses if isinstance(response, dict)}
+    results = []
+    
+    for payload in payloads:
+        response = by_id.get(payload["id"])
+        if response is None:
+            results.append(MCPTransportError(f"Resposta ausente para a requisição {payload['id']}"))
+        elif "error" in response:
+            results.append(MCPTransportError(f"MCP Error: {response['error']}"))
+        else:
+            results.append(response.get("result", {}))
+    
+    return results
+
+
+def host_key(base_url: str) -> str:
+    """
+    Normaliza a URL de um MCP Server para a chave do pool (scheme://host:porta).
+    
+    Args:
+        base_url: URL base do MCP Server
+    
+    Returns:
+        str: Chave do host
+    """
+    parts = urlsplit(base_url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+@dataclass
+class HostPoolMetrics:
+    """Métricas de uso do pool de um host MCP."""
+    
+    host: str
+    requests: int = 0
+    errors: int = 0
+    retries: int = 0
+    in_flight: int = 0
+    total_time: float = 0.0
+    batches: int = 0
+    batched_calls: int = 0
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Converte as métricas para dicionário."""
+        return {
+            "host": self.host,
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "in_flight": self.in_flight,
+            "batches": self.batches,
+            "batched_calls": self.batched_calls,
+            "avg_latency_ms": round(self.total_time / self.requests * 1000, 2) if self.requests else 0.0
+        }
+
+
+def _pool_connection_stats(client) -> Dict[str, int]:
+    """Lê o estado do pool de conexões do cliente httpx (vazio se indisponível)."""
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None)
+    if connections is None:
+        return {}
+    
+    return {
+        "open_connections": len(connections),
+        "idle_connections": sum(1 for connection in connections if connection.is_idle())
+    }
+
+
+class _BaseMCPTransport:
+    """Configuração de pool e métricas comuns aos transportes MCP."""
+    
+    def __init__(self, max_connections: int = 100, max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 30.0, http2: bool = True):
+        """
+        Inicializa o transporte.
+        
+        Args:
+            max_connections: Máximo de conexões simultâneas por host
+            max_keepalive_connections: Máximo de conexões ociosas mantidas abertas por host
+            keepalive_expiry: Tempo (s) que uma conexão ociosa fica no pool
+            http2: Usar HTTP/2 quando disponível
+        """
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self._clients: Dict[str, Any] = {}
+        self._metrics: Dict[str, HostPoolMetrics] = {}
+        self._batch_unsupported = set()
+        self._lock = threading.Lock()
+    
+    def _start(self, host: str):
+        """Registra o início de uma requisição para o host."""
+        with self._lock:
+            metrics = self._metrics.setdefault(host, HostPoolMetrics(host=host))
+            metrics.in_flight += 1
+    
+    def _finish(self, host: str, elapsed: float, failed: bool, will_retry: bool):
+        """Registra o término de uma requisição para o host."""
+        with self._lock:
+            metrics = self._metrics[host]
+            metrics.in_flight -= 1
+            metrics.requests += 1
+            metrics.total_time += elapsed
+            if failed:
+                metrics.errors += 1
+            if will_retry:
+                metrics.retries += 1
+    
+    def _count_batch(self, host: str, size: int):
+        """Registra o envio de um lote de chamadas para o host."""
+        with self._lock:
+            metrics = self._metrics.setdefault(host, HostPoolMetrics(host=host))
+            metrics.batches += 1
+            metrics.batched_calls += size
+    
+    def _mark_batch_unsupported(self, host: str, error: Exception):
+        """Desativa o envio em lote para um host que não o suporta."""
+        logger.warning(f"Host {host} não suporta lote JSON-RPC, enviando chamadas individualmente: {str(error)}")
+        with self._lock:
+            self._batch_unsupported.add(host)
+    
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Retorna as métricas de pool por host.
+        
+        Returns:
+            Dict: Métricas indexadas pela chave do host
+        """
+        with self._lock:
+            result = {host: metrics.to_dict() for host, metrics in self._metrics.items()}
+            clients = dict(self._clients)
+        
+        for host, client in clients.items():
+            result.setdefault(host, HostPoolMetrics(host=host).to_dict())
+            result[host].update(_pool_connection_stats(client))
+            result[host]["http2"] = self.http2
+        
+        return result
+
+
+class MCPTransport(_BaseMCPTransport):
+    """Transporte síncrono com pool de conexões por host MCP."""
+    
+    def _get_client(self, host: str) -> httpx.Client:
+        """Retorna o cliente do host, criando-o se necessário."""
+        with self._lock:
+            client = self._clients.get(host)
+            if client is None or client.is_closed:
+                client = httpx.Client(
+                    limits=self.limits,
+                    http2=self.http2,
+                    headers=DEFAULT_HEADERS
+                )
+                self._clients[host] = client
+        
+        return client
+    
+    def request(self, base_url: str, method: str, params: Dict[str, Any] = None,
+                timeout: float = 30, max_retries: int = 3) -> Dict[str, Any]:
+        """
+        Faz requisição JSON-RPC para um MCP Server.
+        
+        Args:
+            base_url: URL base do MCP Server
+            method: Método MCP (tools/call)
+            params: Parâmetros da requisição
+            timeout: Timeout em segundos
+            max_retries: Número máximo de tentativas
+        
+        Returns:
+            Dict: Campo "result" da resposta
+        """
+        host = host_key(base_url)
+        payload = build_jsonrpc_payload(method, params)
+        url = f"{base_url.rstrip('/')}/mcp"
+        
+        for attempt in range(max_retries):
+            self._start(host)
+            started = time.perf_counter()
+            try:
+                response = self._get_client(host).post(url, json=payload, timeout=timeout)
+                response.raise_for_status()
+                result = parse_jsonrpc_response(response.json())
+                self._finish(host, time.perf_counter() - started, failed=False, will_retry=False)
+                return result
+            
+            except Exception as e:
+                last_attempt = attempt == max_retries - 1
+                self._finish(host, time.perf_counter() - started, failed=True, will_retry=not last_attempt)
+                logger.error(f"Tentativa {attempt + 1} falhou: {str(e)}")
+                if last_attempt:
+                    raise
+    
+    def batch(self, base_url: str, calls: List[Tuple[str, Optional[Dict[str, Any]]]],
+              timeout: float = 30, max_retries: int = 3) -> List[Any]:
+        """
+        Envia várias chamadas JSON-RPC independentes em uma única requisição.
+        
+        O servidor pode executar as chamadas em qualquer ordem; use apenas
+        para operações que não dependem umas das outras.
+        
+        Args:
+            base_url: URL base do MCP Server
+            calls: Lista de (método, parâmetros)
+            timeout: Timeout em segundos
+            max_retries: Número máximo de tentativas
+        
+        Returns:
+            List: Resultado de cada chamada, na ordem de envio (erros por
+            chamada retornam como instâncias de MCPTransportError)
+        """
+        if not calls:
+            return []
+        
+        host = host_key(base_url)
+        if host in self._batch_unsupported:
+            return [self._request_or_error(base_url, method, params, timeout, max_retries) for method, params in calls]
+        
+        payloads = [build_jsonrpc_payload(method, params) for method, params in calls]
+        url = f"{base_url.rstrip('/')}/mcp"
+        self._count_batch(host, len(payloads))
+        
+        for attempt in range(max_retries):
+            self._start(host)
+            started = time.perf_counter()
+            try:
+                response = self._get_client(host).post(url, json=payloads, timeout=timeout)
+                if response.status_code == 400:
+                    raise MCPBatchNotSupportedError(f"HTTP 400: {response.text}")
+                response.raise_for_status()
+                results = parse_jsonrpc_batch_response(payloads, response.json())
+                self._finish(host, time.perf_counter() - started, failed=False, will_retry=False)
+                return results
+            
+            except MCPBatchNotSupportedError as e:
+                self._finish(host, time.perf_counter() - started, failed=True, will_retry=False)
+                self._mark_batch_unsupported(host, e)
+                return [self._request_or_error(base_url, method, params, timeout, max_retries) for method, params in calls]
+            
+            except Exception as e:
+                last_attempt = attempt == max_retries - 1
+                self._finish(host, time.perf_counter() - started, failed=True, will_retry=not last_attempt)
+                logger.error(f"Tentativa {attempt + 1} do lote falhou: {str(e)}")
+                if last_attempt:
+                    raise
+    
+    def _request_or_error(self, base_url: str, method: str, params: Optional[Dict[str, Any]],
+                          timeout: float, max_retries: int) -> Any:
+        """Executa uma chamada individual, devolvendo o erro em vez de levantá-lo."""
+        try:
+            return self.request(base_url, method, params, timeout=timeout, max_retries=max_retries)
+        except Exception as e:
+            return e if isinstance(e, MCPTransportError) else MCPTransportError(str(e))
+    
+    def get(self, base_url: str, path: str, timeout: float = 10) -> httpx.Response:
+        """
+        Faz uma requisição GET simples (health check) reaproveitando o pool.
+        
+        Args:
+            base_url: URL base do MCP Server
+            path: Caminho (ex.: /health)
+            timeout: Timeout em segundos
+        
+        Returns:
+            httpx.Response: Resposta HTTP
+        """
+        host = host_key(base_url)
+        return self._get_client(host).get(f"{base_url.rstrip('/')}{path}", timeout=timeout)
+    
+    def close(self):
+        """Fecha todos os clientes e libera as conexões dos pools."""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        
+        for client in clients:
+            client.close()
+
+
+class AsyncMCPTransport(_BaseMCPTransport):
+    """Transporte assíncrono com pool de conexões por host MCP."""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Fechamentos de clientes de loops anteriores em andamento
+        self._closing: set = set()
+    
+    def _get_client(self, host: str) -> httpx.AsyncClient:
+        """Retorna o cliente do host no event loop atual, criando-o se necessário."""
+        loop = asyncio.get_running_loop()
+        stale: List[httpx.AsyncClient] = []
+        previous_loop = None
+        
+        with self._lock:
+            # httpx.AsyncClient fica preso ao loop em que foi criado
+            if self._loop is not loop:
+                stale = list(self._clients.values())
+                self._clients.clear()
+                previous_loop, self._loop = self._loop, loop
+            
+            client = self._clients.get(host)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(
+                    limits=self.limits,
+                    http2=self.http2,
+                    headers=DEFAULT_HEADERS
+                )
+                self._clients[host] = client
+        
+        if stale:
+            self._close_stale_clients(stale, previous_loop)
+        return client
+    
+    def _close_stale_clients(self, clients: List[httpx.AsyncClient],
+                             previous_loop: Optional[asyncio.AbstractEventLoop]):
+        """
+        Fecha os clientes criados em outro event loop.
+        
+        Com o loop anterior ainda ativo, o fechamento roda nele (onde as
+        conexões foram abertas); caso contrário roda no loop atual.
+        
+        Args:
+            clients: Clientes do loop anterior
+            previous_loop: Loop em que os clientes foram criados
+        """
+        coro = self._aclose_clients(clients)
+        if previous_loop is not None and previous_loop.is_running() and not previous_loop.is_closed():
+            asyncio.run_coroutine_threadsafe(coro, previous_loop)
+            return
+        
+        task = asyncio.get_running_loop().create_task(coro)
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+    
+    @staticmethod
+    async def _aclose_clients(clients: List[httpx.AsyncClient]):
+        """Fecha os clientes, registrando (sem propagar) falhas de fechamento."""
+        for client in clients:
+            if client.is_closed:
+                continue
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Erro ao fechar cliente MCP de outro event loop: {str(e)}")
+    
+    async def request(self, base_url: str, method: str, params: Dict[str, Any] = None,
+                      timeout: float = 30, max_retries: int = 3) -> Dict[str, Any]:
+        """
+        Faz requisição JSON-RPC assíncrona para um MCP Server.
+        
+        Args:
+            base_url: URL base do MCP Server
+            method: Método MCP (tools/call)
+            params: Parâmetros da requisição
+            timeout: Timeout em segundos
+            max_retries: Número máximo de tentativas
+        
+        Returns:
+            Dict: Campo "result" da resposta
+        """
+        host = host_key(base_url)
+        payload = build_jsonrpc_payload(method, params)
+        url = f"{base_url.rstrip('/')}/mcp"
+        
+        for attempt in range(max_retries):
+            self._start(host)
+            started = time.perf_counter()
+            try:
+                response = await self._get_client(host).post(url, json=payload, timeout=timeout)
+                response.raise_for_status()
+                result = parse_jsonrpc_response(response.json())
+                self._finish(host, time.perf_counter() - started, failed=False, will_retry=False)
+                return result
+            
+            except Exception as e:
+                last_attempt = attempt == max_retries - 1
+                self._finish(host, time.perf_counter() - started, failed=True, will_retry=not last_attempt)
+                logger.error(f"Tentativa {attempt + 1} falhou: {str(e)}")
+                if last_attempt:
+                    raise
+    
+    async def batch(self, base_url: str, calls: List[Tuple[str, Optional[Dict[str, Any]]]],
+                    timeout: float = 30, max_retries: int = 3) -> List[Any]:
+        """
+        Envia várias chamadas JSON-RPC independentes em uma única requisição.
+        
+        O servidor pode executar as chamadas em qualquer ordem; use apenas
+        para operações que não dependem umas das outras.
+        
+        Args:
+            base_url: URL base do MCP Server
+            calls: Lista de (método, parâmetros)
+            timeout: Timeout em segundos
+            max_retries: Número máximo de tentativas
+        
+        Returns:
+            List: Resultado de cada chamada, na ordem de envio (erros por
+            chamada retornam como instâncias de MCPTransportError)
+        """
+        if not calls:
+            return []
+        
+        host = host_key(base_url)
+        if host in self._batch_unsupported:
+            return [await self._request_or_error(base_url, method, params, timeout, max_retries) for method, params in calls]
+        
+        payloads = [build_jsonrpc_payload(method, params) for method, params in calls]
+        url = f"{base_url.rstrip('/')}/mcp"
+        self._count_batch(host, len(payloads))
+        
+        for attempt in range(max_retries):
+            self._start(host)
+            started = time.perf_counter()
+            try:
+                response = await self._get_client(host).post(url, json=payloads, timeout=timeout)
+                if response.status_code == 400:
+                    raise MCPBatchNotSupportedError(f"HTTP 400: {response.text}")
+                response.raise_for_status()
+                results = parse_jsonrpc_batch_response(payloads, response.json())
+                self._finish(host, time.perf_counter() - started, failed=False, will_retry=False)
+                return results
+            
+            except MCPBatchNotSupportedError as e:
+                self._finish(host, time.perf_counter() - started, failed=True, will_retry=False)
+                self._mark_batch_unsupported(host, e)
+                return [await self._request_or_error(base_url, method, params, timeout, max_retries) for method, params in calls]
+            
+            except Exception as e:
+                last_attempt = attempt == max_retries - 1
+                self._finish(host, time.perf_counter() - started, failed=True, will_retry=not last_attempt)
+                logger.error(f"Tentativa {attempt + 1} do lote falhou: {str(e)}")
+                if last_attempt:
+                    raise
+    
+    async def _request_or_error(self, base_url: str, method: str, params: Optional[Dict[str, Any]],
+                                timeout: float, max_retries: int) -> Any:
+        """Executa uma chamada individual, devolvendo o erro em vez de levantá-lo."""
+        try:
+            return await self.request(base_url, method, params, timeout=timeout, max_retries=max_retries)
+        except Exception as e:
+            return e if isinstance(e, MCPTransportError) else MCPTransportError(str(e))
+    
+    async def aclose(self):
+        """Fecha todos os clientes e libera as conexões dos pools."""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+            self._loop = None
+        
+        for client in clients:
+            if not client.is_closed:
+                await client.aclose()
+
+
+class MCPBatch:
+    """
+    Fila de chamadas MCP enviadas juntas em um único lote JSON-RPC.
+    
+    Exemplo:
+        batch = MCPBatch(url)
+        lead_idx = batch.add("tools/call", {...})
+        results = batch.execute()
+        lead = results[lead_idx]
+    """
+    
+    def __init__(self, base_url: str, timeout: float = 30, max_retries: int = 3):
+        """
+        Inicializa o lote.
+        
+        Args:
+            base_url: URL base do MCP Server
+            timeout: Timeout em segundos
+            max_retries: Número máximo de tentativas
+        """
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.calls: List[Tuple[str, Optional[Dict[str, Any]]]] = []
+    
+    def __len__(self) -> int:
+        return len(self.calls)
+    
+    def add(self, method: str, params: Dict[str, Any] = None) -> int:
+        """
+        Enfileira uma chamada no lote.
+        
+        Args:
+            method: Método MCP (tools/call)
+            params: Parâmetros da requisição
+        
+        Returns:
+            int: Posição do resultado na lista retornada por execute()
+        """
+        self.calls.append((method, params))
+        return len(self.calls) - 1
+    
+    def execute(self) -> List[Any]:
+        """Envia o lote pelo transporte síncrono compartilhado."""
+        return get_transport().batch(self.base_url, self.calls, timeout=self.timeout, max_retries=self.max_retries)
+    
+    async def execute_async(self) -> List[Any]:
+        """Envia o lote pelo transporte assíncrono compartilhado."""
+        return await get_async_transport().batch(self.base_url, self.calls, timeout=self.timeout, max_retries=self.max_retries)
+
+
+def _transport_settings() -> Dict[str, Any]:
+    """Lê a configuração dos pools a partir das variáveis de ambiente."""
+    return {
+        "max_connections": int(os.getenv('MCP_MAX_CONNECTIONS', '100')),
+        "max_keepalive_connections": int(os.getenv('MCP_MAX_KEEPALIVE_CONNECTIONS', '20')),
+        "keepalive_expiry": float(os.getenv('MCP_KEEPALIVE_EXPIRY', '30')),
+        "http2": os.getenv('MCP_HTTP2', 'true').lower() == 'true'
+    }
+
+
+# Instâncias globais dos transportes
+_transport: Optional[MCPTransport] = None
+_async_transport: Optional[AsyncMCPTransport] = None
+_singleton_lock = threading.Lock()
+
+
+def get_transport() -> MCPTransport:
+    """Retorna o transporte síncrono compartilhado pelo processo."""
+    global _transport
+    with _singleton_lock:
+        if _transport is None:
+            _transport = MCPTransport(**_transport_settings())
+    return _transport
+
+
+def get_async_transport() -> AsyncMCPTransport:
+    """Retorna o transporte assíncrono compartilhado pelo processo."""
+    global _async_transport
+    with _singleton_lock:
+        if _async_transport is None:
+            _async_transport = AsyncMCPTransport(**_transport_settings())
+    return _async_transport
+
+
+def get_pool_metrics() -> Dict[str, Any]:
+    """
+    Retorna as métricas de pool por host dos transportes já criados.
+    
+    Returns:
+        Dict: Métricas dos transportes síncrono e assíncrono
+    """
+    return {
+        "sync": _transport.metrics() if _transport is not None else {},
+        "async": _async_transport.metrics() if _async_transport is not None else {}
+    }
+
+
+def close_transport():
+    """Fecha o transporte síncrono compartilhado."""
+    if _transport is not None:
+        _transport.close()
+
+
+async def close_async_transport():
+    """Fecha o transporte assíncrono compartilhado (shutdown da aplicação)."""
+    if _async_transport is not None:
+        await _async_transport.aclose()
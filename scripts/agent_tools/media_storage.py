@@ -0,0 +1,352 @@
+# =============================================================================
+# SERENA SDR - MEDIA STORAGE
+# =============================================================================
+
+"""
+Media Storage Module
+
+Download de mídias recebidas pelo WhatsApp e armazenamento no Supabase Storage.
+
+- Resolve a URL da mídia pelo media_id (Graph API da Meta)
+- Baixa em streaming, com limite de tamanho, calculando o SHA-256 durante o download
+- Downloads a partir de URLs (ex.: informadas pelo modelo) só de hosts
+  permitidos: mídias do WhatsApp e o Supabase Storage do projeto
+- Armazena no Storage com caminho endereçado pelo conteúdo: a mesma fatura
+  reenviada não é enviada de novo, apenas recebe uma nova URL assinada
+
+Author: Serena SDR System
+Version: 1.0.0
+Created: 2026-10-17
+"""
+
+import os
+import hashlib
+import logging
+import mimetypes
+import threading
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Tamanho de cada bloco lido do download
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Tamanho máximo padrão de uma mídia
+DEFAULT_MAX_BYTES = 20 * 1024 * 1024
+
+# Hosts das mídias do WhatsApp (nomes iniciados por "." valem para subdomínios)
+WHATSAPP_MEDIA_HOSTS = ("lookaside.fbsbx.com", ".fbcdn.net", ".whatsapp.net")
+
+
+class MediaTooLarge(Exception):
+    """A mídia excede o tamanho máximo aceito."""
+
+
+class MediaHostNotAllowed(Exception):
+    """A URL não aponta para um host de mídia permitido."""
+
+
+@dataclass
+class DownloadedMedia:
+    """Mídia baixada e seu hash de conteúdo."""
+    
+    data: bytes
+    sha256: str
+    mime_type: str
+    
+    @property
+    def size(self) -> int:
+        """Tamanho em bytes."""
+        return len(self.data)
+
+
+def allowed_media_hosts() -> Tuple[str, ...]:
+    """
+    Hosts de onde mídias podem ser baixadas por URL.
+    
+    Returns:
+        Tuple: Hosts do WhatsApp, o host de SUPABASE_URL e os extras de
+            MEDIA_ALLOWED_HOSTS (separados por vírgula)
+    """
+    hosts = list(WHATSAPP_MEDIA_HOSTS)
+    supabase_host = urlparse(os.getenv('SUPABASE_URL', '')).hostname
+    if supabase_host:
+        hosts.append(supabase_host)
+    hosts.extend(host.strip().lower() for host in os.getenv('MEDIA_ALLOWED_HOSTS', '').split(",") if host.strip())
+    return tuple(hosts)
+
+
+def is_allowed_media_url(url: str) -> bool:
+    """
+    Verifica se a URL é https e aponta para um host de mídia permitido.
+    
+    Args:
+        url: URL a baixar
+    
+    Returns:
+        bool: True se o download é permitido
+    """
+    parsed = urlparse(url or "")
+    host = (parsed.hostname or "").lower()
+    if parsed.scheme != "https" or not host:
+        return False
+    return any(
+        host.endswith(allowed) if allowed.startswith(".") else host == allowed
+        for allowed in allowed_media_hosts()
+    )
+
+
+def download_limited(session, url: str, max_bytes: int = DEFAULT_MAX_BYTES, timeout: int = 30,
+                     mime_type: str = None, allow_redirects: bool = True) -> DownloadedMedia:
+    """
+    Baixa em streaming, calculando o SHA-256 a cada bloco.
+    
+    A memória fica limitada a max_bytes: o download é interrompido assim
+    que o limite é ultrapassado, mesmo sem Content-Length.
+    
+    Args:
+        session: Sessão requests (ou o próprio módulo requests)
+        url: URL da mídia
+        max_bytes: Tamanho máximo aceito
+        timeout: Timeout da requisição em segundos
+        mime_type: Tipo informado nos metadados
+        allow_redirects: Seguir redirecionamentos (desative para URLs externas,
+            validadas pelo host)
+    
+    Returns:
+        DownloadedMedia: Bytes, hash e tipo da mídia
+    """
+    digest = hashlib.sha256()
+    buffer = bytearray()
+    
+    with session.get(url, stream=True, timeout=timeout, allow_redirects=allow_redirects) as response:
+        response.raise_for_status()
+        
+        content_length = int(response.headers.get("Content-Length") or 0)
+        if content_length > max_bytes:
+            raise MediaTooLarge(f"Mídia com {content_length} bytes excede o limite de {max_bytes}")
+        
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            if len(buffer) + len(chunk) > max_bytes:
+                raise MediaTooLarge(f"Mídia excede o limite de {max_bytes} bytes")
+            digest.update(chunk)
+            buffer.extend(chunk)
+        
+        mime_type = mime_type or response.headers.get("Content-Type", "application/octet-stream")
+    
+    return DownloadedMedia(data=bytes(buffer), sha256=digest.hexdigest(), mime_type=mime_type.split(";")[0])
+
+
+class WhatsAppMediaClient:
+    """Cliente da Graph API para mídias recebidas."""
+    
+    def __init__(self, access_token: str, api_version: str = "v23.0", timeout: int = 30,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Inicializa o cliente.
+        
+        Args:
+            access_token: Token da API do WhatsApp Business
+            api_version: Versão da Graph API
+            timeout: Timeout das requisições em segundos
+            max_bytes: Tamanho máximo aceito por mídia
+        """
+        self.base_url = f"https://graph.facebook.com/{api_version}"
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {access_token}"
+    
+    def resolve(self, media_id: str) -> Dict[str, Any]:
+        """
+        Obtém a URL temporária e os metadados de uma mídia.
+        
+        Args:
+            media_id: ID da mídia recebido no webhook
+        
+        Returns:
+            Dict: url, mime_type, sha256 e file_size
+        """
+        response = self.session.get(f"{self.base_url}/{media_id}", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+    
+    def download(self, url: str, mime_type: str = None) -> DownloadedMedia:
+        """
+        Baixa a mídia em streaming, com limite de tamanho (download_limited).
+        
+        Args:
+            url: URL temporária devolvida por resolve()
+            mime_type: Tipo informado nos metadados
+        
+        Returns:
+            DownloadedMedia: Bytes, hash e tipo da mídia
+        """
+        return download_limited(self.session, url, max_bytes=self.max_bytes, timeout=self.timeout, mime_type=mime_type)
+
+
+class SupabaseStorage:
+    """Cliente mínimo da API REST do Supabase Storage."""
+    
+    def __init__(self, url: str, key: str, bucket: str = "energy-bills", signed_url_ttl: int = 3600,
+                 timeout: int = 30):
+        """
+        Inicializa o cliente.
+        
+        Args:
+            url: URL do projeto Supabase
+            key: Chave de serviço do Supabase
+            bucket: Bucket das faturas
+            signed_url_ttl: Validade das URLs assinadas em segundos
+            timeout: Timeout das requisições em segundos
+        """
+        self.storage_url = f"{url.rstrip('/')}/storage/v1"
+        self.bucket = bucket
+        self.signed_url_ttl = signed_url_ttl
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {key}", "apikey": key})
+        self.uploads = 0
+        self.reused = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def content_path(sha256: str, mime_type: str = None) -> str:
+        """
+        Caminho endereçado pelo conteúdo.
+        
+        Args:
+            sha256: Hash do conteúdo
+            mime_type: Tipo da mídia (define a extensão)
+        
+        Returns:
+            str: Caminho do objeto no bucket
+        """
+        extension = mimetypes.guess_extension(mime_type or "") or ""
+        return f"bills/{sha256[:2]}/{sha256}{extension}"
+    
+    def signed_url(self, path: str, expires_in: int = None) -> Optional[str]:
+        """
+        Gera a URL assinada de um objeto.
+        
+        Args:
+            path: Caminho do objeto no bucket
+            expires_in: Validade em segundos (padrão: signed_url_ttl)
+        
+        Returns:
+            str: URL assinada ou None se o objeto não existe
+        """
+        response = self.session.post(
+            f"{self.storage_url}/object/sign/{self.bucket}/{path}",
+            json={"expiresIn": expires_in or self.signed_url_ttl},
+            timeout=self.timeout
+        )
+        if response.status_code in (400, 404):
+            return None
+        response.raise_for_status()
+        return f"{self.storage_url}{response.json()['signedURL']}"
+    
+    def upload(self, path: str, data: bytes, content_type: str):
+        """
+        Envia um objeto ao bucket (sem sobrescrever).
+        
+        Args:
+            path: Caminho do objeto no bucket
+            data: Conteúdo
+            content_type: Tipo do conteúdo
+        """
+        response = self.session.post(
+            f"{self.storage_url}/object/{self.bucket}/{path}",
+            data=data,
+            headers={"Content-Type": content_type, "x-upsert": "false"},
+            timeout=self.timeout
+        )
+        # 409: outro processo enviou o mesmo conteúdo nesse meio-tempo
+        if response.status_code != 409:
+            response.raise_for_status()
+    
+    def store(self, data: bytes, sha256: str, mime_type: str) -> Dict[str, Any]:
+        """
+        Armazena a mídia apenas se o hash ainda não existe no bucket.
+        
+        A verificação usa a própria geração da URL assinada: se ela funciona,
+        o objeto já existe e o upload é dispensado.
+        
+        Args:
+            data: Conteúdo
+            sha256: Hash do conteúdo
+            mime_type: Tipo da mídia
+        
+        Returns:
+            Dict: path, signed_url e uploaded (se houve upload)
+        """
+        path = self.content_path(sha256, mime_type)
+        
+        signed_url = self.signed_url(path)
+        uploaded = signed_url is None
+        if uploaded:
+            self.upload(path, data, mime_type)
+            signed_url = self.signed_url(path)
+        
+        with self._lock:
+            if uploaded:
+                self.uploads += 1
+            else:
+                self.reused += 1
+        
+        logger.info(f"Mídia {'enviada ao' if uploaded else 'já existente no'} Storage: {path}")
+        return {"path": path, "signed_url": signed_url, "uploaded": uploaded}
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retorna os contadores de armazenamento.
+        
+        Returns:
+            Dict: Uploads realizados e mídias reaproveitadas
+        """
+        with self._lock:
+            return {"uploads": self.uploads, "reused": self.reused, "bucket": self.bucket}
+
+
+# Instâncias globais
+_media_client: Optional[WhatsAppMediaClient] = None
+_media_storage: Optional[SupabaseStorage] = None
+_media_lock = threading.Lock()
+
+
+def get_whatsapp_media_client() -> WhatsAppMediaClient:
+    """Retorna o cliente de mídias do WhatsApp compartilhado pelo processo."""
+    global _media_client
+    with _media_lock:
+        if _media_client is None:
+            access_token = os.getenv('WHATSAPP_API_TOKEN')
+            if not access_token:
+                raise ValueError("WHATSAPP_API_TOKEN não encontrado")
+            _media_client = WhatsAppMediaClient(
+                access_token,
+                api_version=os.getenv('WHATSAPP_GRAPH_API_VERSION', 'v23.0'),
+                max_bytes=int(os.getenv('MEDIA_MAX_MB', '20')) * 1024 * 1024
+            )
+    return _media_client
+
+
+def get_media_storage() -> Optional[SupabaseStorage]:
+    """Retorna o cliente do Storage (None se o Supabase não está configurado)."""
+    global _media_storage
+    with _media_lock:
+        if _media_storage is None:
+            url = os.getenv('SUPABASE_URL')
+            key = os.getenv('SUPABASE_SERVICE_ROLE_KEY') or os.getenv('SUPABASE_KEY')
+            if not url or not key:
+                return None
+            _media_storage = SupabaseStorage(
+                url,
+                key,
+                bucket=os.getenv('SUPABASE_BUCKET_NAME', 'energy-bills'),
+                signed_url_ttl=int(os.getenv('SUPABASE_SIGNED_URL_TTL', '3600'))
+            )
+    return _media_storage
@@ -0,0 +1,173 @@
+# =============================================================================
+# SERENA SDR - MESSAGE DEDUP
+# =============================================================================
+
+"""
+Message Dedup Module
+
+Deduplicação de webhooks pelo ID da mensagem do WhatsApp (wamid).
+
+A Meta reentrega o mesmo webhook quando não recebe a confirmação a tempo;
+sem deduplicação, cada reentrega gera outra execução do agente e outra
+resposta ao lead. O ID é verificado antes de a mensagem entrar na fila.
+
+- LRU em memória com TTL: responde sem I/O às reentregas no mesmo processo
+- Redis (opcional): SET NX com TTL, compartilhado entre réplicas do webhook
+
+Author: Serena SDR System
+Version: 1.0.0
+Created: 2026-10-17
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MessageDeduplicator:
+    """Registro de IDs de mensagens já recebidas (LRU + Redis opcional)."""
+    
+    def __init__(self, ttl_seconds: int = 86400, max_size: int = 10000, redis_url: str = None,
+                 key_prefix: str = "serena:wamid:"):
+        """
+        Inicializa o deduplicador.
+        
+        Args:
+            ttl_seconds: Tempo (s) durante o qual uma reentrega é reconhecida
+            max_size: Máximo de IDs mantidos em memória
+            redis_url: URL do Redis (opcional, compartilha os IDs entre réplicas)
+            key_prefix: Prefixo das chaves no Redis
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.key_prefix = key_prefix
+        self.checked = 0
+        self.duplicates = 0
+        # wamid -> instante de expiração, do mais antigo para o mais recente
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._redis = None
+        
+        if redis_url:
+            try:
+                import redis.asyncio as redis_asyncio
+                self._redis = redis_asyncio.from_url(redis_url, socket_timeout=1, decode_responses=True)
+                logger.info("Deduplicação de mensagens usando Redis")
+            except Exception as e:
+                logger.warning(f"Redis indisponível para a deduplicação, usando memória: {str(e)}")
+                self._redis = None
+    
+    @property
+    def backend(self) -> str:
+        """Backend compartilhado em uso."""
+        return "redis" if self._redis is not None else "memory"
+    
+    def _remember(self, message_id: str) -> bool:
+        """
+        Registra o ID na LRU.
+        
+        Returns:
+            bool: True se o ID já estava registrado (e não expirado)
+        """
+        now = time.time()
+        expires_at = self._seen.get(message_id)
+        if expires_at is not None and expires_at > now:
+            self._seen.move_to_end(message_id)
+            return True
+        
+        self._seen[message_id] = now + self.ttl_seconds
+        self._seen.move_to_end(message_id)
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+        return False
+    
+    async def is_duplicate(self, message_id: str) -> bool:
+        """
+        Verifica e registra o ID de uma mensagem recebida.
+        
+        A LRU é consultada e atualizada sem await, então duas entregas
+        simultâneas no mesmo processo não passam juntas.
+        
+        Args:
+            message_id: wamid da mensagem
+        
+        Returns:
+            bool: True se a mensagem já foi recebida
+        """
+        self.checked += 1
+        duplicate = self._remember(message_id)
+        
+        if not duplicate and self._redis is not None:
+            try:
+                created = await self._redis.set(self.key_prefix + message_id, "1", nx=True, ex=self.ttl_seconds)
+                duplicate = not created
+            except Exception as e:
+                # Sem Redis, vale apenas a LRU do processo
+                logger.warning(f"Erro ao consultar deduplicação no Redis: {str(e)}")
+        
+        if duplicate:
+            self.duplicates += 1
+            logger.info(f"Webhook duplicado ignorado: {message_id}")
+        return duplicate
+    
+    async def forget(self, message_id: str):
+        """
+        Remove um ID registrado (a mensagem não chegou a ser enfileirada).
+        
+        Sem isso, a reentrega da Meta seria descartada como duplicada e a
+        mensagem se perderia.
+        
+        Args:
+            message_id: wamid da mensagem
+        """
+        self._seen.pop(message_id, None)
+        if self._redis is not None:
+            try:
+                await self._redis.delete(self.key_prefix + message_id)
+            except Exception as e:
+                logger.warning(f"Erro ao remover deduplicação no Redis: {str(e)}")
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retorna os contadores da deduplicação.
+        
+        Returns:
+            Dict: Backend, mensagens verificadas, duplicadas e taxa de duplicação
+        """
+        return {
+            "backend": self.backend,
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "duplicate_rate": round(self.duplicates / self.checked, 4) if self.checked else 0.0,
+            "size": len(self._seen),
+            "ttl_seconds": self.ttl_seconds
+        }
+    
+    async def close(self):
+        """Fecha a conexão com o Redis."""
+        if self._redis is not None:
+            close = getattr(self._redis, "aclose", None) or self._redis.close
+            await close()
+            self._redis = None
+
+
+# Instância global do deduplicador
+_message_dedup: Optional[MessageDeduplicator] = None
+_message_dedup_lock = threading.Lock()
+
+
+def get_message_deduplicator() -> MessageDeduplicator:
+    """Retorna o deduplicador de mensagens compartilhado pelo processo."""
+    global _message_dedup
+    with _message_dedup_lock:
+        if _message_dedup is None:
+            _message_dedup = MessageDeduplicator(
+                ttl_seconds=int(os.getenv('MESSAGE_DEDUP_TTL_SECONDS', '86400')),
+                max_size=int(os.getenv('MESSAGE_DEDUP_MAX_SIZE', '10000')),
+                redis_url=os.getenv('MESSAGE_DEDUP_REDIS_URL') or os.getenv('REDIS_URL')
+            )
+    return _message_dedup
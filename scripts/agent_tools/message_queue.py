@@ -0,0 +1,727 @@
+# =============================================================================
+# SERENA SDR - MESSAGE QUEUE
+# =============================================================================
+
+"""
+Message Queue Module
+
+Fila durável entre o recebimento do webhook e o processamento pelo agente.
+
+O webhook apenas grava a mensagem na fila (Redis Streams) e responde à Meta;
+um pool de workers com tamanho fixo consome a fila, o que limita as chamadas
+simultâneas ao modelo quando a OpenAI fica lenta.
+
+- Consumer group: cada mensagem é entregue a um único worker, mesmo com
+  várias réplicas do serviço
+- Timeout de visibilidade: mensagens de um worker que morreu voltam à fila
+  (XAUTOCLAIM) depois de ficarem pendentes por tempo demais; mensagens ainda
+  em processamento neste processo têm a pendência renovada periodicamente
+- A entrada só é confirmada (ACK) quando o processamento termina, não quando
+  o handler a aceita
+- Retentativas com backoff em um sorted set (score = instante liberado),
+  movidas para o stream quando vencem; nenhum worker fica parado esperando
+- Ordem por lead: enquanto um lead tem retentativa agendada, as mensagens
+  seguintes dele são agendadas logo atrás dela
+- Dead-letter queue após o limite de tentativas
+- Sem Redis configurado, usa uma fila em memória (não durável)
+
+Author: Serena SDR System
+Version: 1.0.0
+Created: 2026-10-17
+"""
+
+import os
+import json
+import time
+import heapq
+import socket
+import asyncio
+import logging
+import itertools
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, List, Tuple, Callable, Awaitable
+
+logger = logging.getLogger(__name__)
+
+# Intervalo máximo entre retentativas
+MAX_RETRY_BACKOFF = 60.0
+
+# Folga entre entradas agendadas do mesmo lead (mantém a ordem no sorted set)
+ORDER_STEP = 0.001
+
+# Agenda uma entrada no sorted set de retentativas. Com chave de ordem, a
+# entrada fica depois da última já agendada do mesmo lead e o lead passa a
+# ser "retido" até que todas sejam liberadas. ARGV[4] = 1 agenda somente se
+# o lead já estiver retido (mensagem nova de um lead com retentativa pendente).
+SCHEDULE_SCRIPT = """
+local score = tonumber(ARGV[2])
+if ARGV[3] ~= '' then
+    local held = tonumber(redis.call('hget', KEYS[2], ARGV[3]) or '0')
+    if held == 0 and ARGV[4] == '1' then
+        return 0
+    end
+    if held > 0 then
+        local last = tonumber(redis.call('hget', KEYS[3], ARGV[3]) or '0')
+        if last >= score then
+            score = last + tonumber(ARGV[5])
+        end
+    end
+    redis.call('hincrby', KEYS[2], ARGV[3], 1)
+    redis.call('hset', KEYS[3], ARGV[3], tostring(score))
+elseif ARGV[4] == '1' then
+    return 0
+end
+redis.call('zadd', KEYS[1], score, ARGV[1])
+return 1
+"""
+
+# Move as entradas vencidas do sorted set para o stream, em ordem de score
+PROMOTE_SCRIPT = """
+local due = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, member in ipairs(due) do
+    local entry = cjson.decode(member)
+    redis.call('zrem', KEYS[1], member)
+    redis.call('xadd', KEYS[4], 'MAXLEN', '~', ARGV[3], '*',
+        'payload', entry.payload, 'attempts', entry.attempts, 'enqueued_at', ARGV[1])
+    if entry.key ~= '' and redis.call('hincrby', KEYS[2], entry.key, -1) <= 0 then
+        redis.call('hdel', KEYS[2], entry.key)
+        redis.call('hdel', KEYS[3], entry.key)
+    end
+end
+return #due
+"""
+
+
+@dataclass
+class QueuedMessage:
+    """Mensagem retirada da fila."""
+    
+    id: str
+    payload: Dict[str, Any]
+    attempts: int = 0
+
+
+class InMemoryQueue:
+    """Fila em memória com a mesma interface da fila Redis (não durável)."""
+    
+    backend = "memory"
+    
+    def __init__(self, max_attempts: int = 5, retry_backoff: float = 2.0):
+        """
+        Inicializa a fila.
+        
+        Args:
+            max_attempts: Tentativas antes de mover a mensagem para a dead-letter queue
+            retry_backoff: Espera base (s) entre tentativas, dobrada a cada falha
+        """
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.enqueued = 0
+        self.acked = 0
+        self.retried = 0
+        self.deferred = 0
+        self.dead_lettered = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._next_id = 0
+        self._dead_letters: deque = deque(maxlen=1000)
+        # (liberar em, sequência, payload, tentativas, chave de ordem)
+        self._delayed: List[Tuple[float, int, Dict[str, Any], int, str]] = []
+        self._sequence = itertools.count()
+        # chave de ordem -> [entradas agendadas, score da última]
+        self._held: Dict[str, List[float]] = {}
+    
+    async def start(self):
+        """Cria a fila no event loop atual."""
+        self._queue = asyncio.Queue()
+        logger.warning("Fila de mensagens em memória: mensagens pendentes se perdem em um restart")
+    
+    async def enqueue(self, payload: Dict[str, Any], attempts: int = 0) -> str:
+        """Adiciona uma mensagem à fila."""
+        self._next_id += 1
+        message_id = str(self._next_id)
+        self._queue.put_nowait(QueuedMessage(message_id, payload, attempts))
+        if attempts == 0:
+            self.enqueued += 1
+        return message_id
+    
+    async def _schedule(self, message: QueuedMessage, attempts: int, not_before: float,
+                        key: Optional[str], only_if_held: bool = False) -> bool:
+        """Agenda a mensagem para depois de not_before (e das já agendadas do mesmo lead)."""
+        held = self._held.get(key) if key else None
+        if held is None and only_if_held:
+            return False
+        if held is not None:
+            not_before = max(not_before, held[1] + ORDER_STEP)
+            held[0] += 1
+            held[1] = not_before
+        elif key:
+            self._held[key] = [1, not_before]
+        heapq.heappush(self._delayed, (not_before, next(self._sequence), message.payload, attempts, key or ""))
+        return True
+    
+    async def defer(self, message: QueuedMessage, key: str) -> bool:
+        """
+        Agenda a mensagem atrás da retentativa pendente do mesmo lead, se houver.
+        
+        Args:
+            message: Mensagem recém-retirada da fila
+            key: Chave de ordem (telefone)
+        
+        Returns:
+            bool: True se a mensagem foi agendada (e removida da fila)
+        """
+        deferred = await self._schedule(message, message.attempts, 0.0, key, only_if_held=True)
+        if deferred:
+            self.deferred += 1
+        return deferred
+    
+    async def requeue(self, message: QueuedMessage, key: str = None):
+        """Devolve a mensagem sem contar tentativa (respeitando a ordem do lead)."""
+        await self._schedule(message, message.attempts, time.time(), key)
+    
+    async def promote(self, limit: int = 100) -> int:
+        """
+        Move para a fila as retentativas cujo instante já chegou.
+        
+        Returns:
+            int: Mensagens liberadas
+        """
+        now = time.time()
+        promoted = 0
+        while self._delayed and self._delayed[0][0] <= now and promoted < limit:
+            _, _, payload, attempts, key = heapq.heappop(self._delayed)
+            await self.enqueue(payload, attempts)
+            promoted += 1
+            held = self._held.get(key)
+            if held is not None:
+                held[0] -= 1
+                if held[0] <= 0:
+                    del self._held[key]
+        return promoted
+    
+    async def claim(self, consumer: str, count: int = 1, block_ms: int = 5000) -> List[QueuedMessage]:
+        """Retira até `count` mensagens, esperando até block_ms pela primeira."""
+        try:
+            message = await asyncio.wait_for(self._queue.get(), timeout=block_ms / 1000)
+        except asyncio.TimeoutError:
+            return []
+        messages = [message]
+        while len(messages) < count and not self._queue.empty():
+            messages.append(self._queue.get_nowait())
+        return messages
+    
+    async def reclaim(self, consumer: str, count: int = 10) -> List[QueuedMessage]:
+        """Sem entregas pendentes entre processos: nada a recuperar."""
+        return []
+    
+    async def touch(self, consumer: str, messages: List[QueuedMessage]):
+        """Sem timeout de visibilidade: nada a renovar."""
+    
+    async def ack(self, message: QueuedMessage):
+        """Confirma o processamento."""
+        self.acked += 1
+    
+    def _backoff(self, attempts: int) -> float:
+        """Espera antes da próxima tentativa (exponencial, limitada)."""
+        return min(MAX_RETRY_BACKOFF, self.retry_backoff * 2 ** (attempts - 1))
+    
+    async def fail(self, message: QueuedMessage, error: str, key: str = None) -> bool:
+        """
+        Registra a falha: agenda a retentativa com backoff ou move para a dead-letter queue.
+        
+        Args:
+            message: Mensagem que falhou
+            error: Descrição do erro
+            key: Chave de ordem (telefone); as mensagens seguintes do lead
+                esperam atrás da retentativa
+        
+        Returns:
+            bool: True se a mensagem foi para a dead-letter queue
+        """
+        attempts = message.attempts + 1
+        if attempts >= self.max_attempts:
+            self._dead_letters.append({"payload": message.payload, "attempts": attempts, "error": error})
+            self.dead_lettered += 1
+            return True
+        
+        await self._schedule(message, attempts, time.time() + self._backoff(attempts), key)
+        self.retried += 1
+        return False
+    
+    async def stats(self) -> Dict[str, Any]:
+        """Retorna os contadores da fila."""
+        return {
+            "backend": self.backend,
+            "length": self._queue.qsize() if self._queue else 0,
+            "delayed": len(self._delayed),
+            "dead_letter_length": len(self._dead_letters),
+            "enqueued": self.enqueued,
+            "acked": self.acked,
+            "retried": self.retried,
+            "deferred": self.deferred,
+            "dead_lettered": self.dead_lettered
+        }
+    
+    async def close(self):
+        """Nada a liberar."""
+
+
+class RedisStreamQueue(InMemoryQueue):
+    """Fila durável em Redis Streams com consumer group."""
+    
+    backend = "redis"
+    
+    def __init__(self, redis_url: str, stream: str = "serena:inbound", group: str = "sdr-workers",
+                 max_attempts: int = 5, retry_backoff: float = 2.0, visibility_timeout: float = 300.0,
+                 max_length: int = 100000):
+        """
+        Inicializa a fila.
+        
+        Args:
+            redis_url: URL do Redis
+            stream: Nome do stream das mensagens
+            group: Consumer group dos workers
+            max_attempts: Tentativas antes da dead-letter queue
+            retry_backoff: Espera base (s) entre tentativas, dobrada a cada falha
+            visibility_timeout: Tempo (s) que uma mensagem pode ficar pendente
+                antes de ser entregue a outro worker
+            max_length: Tamanho máximo aproximado do stream
+        """
+        super().__init__(max_attempts=max_attempts, retry_backoff=retry_backoff)
+        self.redis_url = redis_url
+        self.stream = stream
+        self.dead_letter_stream = f"{stream}:dlq"
+        self.delayed_key = f"{stream}:delayed"
+        self.held_key = f"{stream}:held"
+        self.held_until_key = f"{stream}:held_until"
+        self.group = group
+        self.visibility_timeout = visibility_timeout
+        self.max_length = max_length
+        self.reclaimed = 0
+        self._redis = None
+        self._schedule_script = None
+        self._promote_script = None
+    
+    async def start(self):
+        """Conecta ao Redis e cria o consumer group (se ainda não existe)."""
+        import redis.asyncio as redis_asyncio
+        from redis.exceptions import ResponseError
+        
+        self._redis = redis_asyncio.from_url(self.redis_url, decode_responses=True)
+        self._schedule_script = self._redis.register_script(SCHEDULE_SCRIPT)
+        self._promote_script = self._redis.register_script(PROMOTE_SCRIPT)
+        try:
+            await self._redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        logger.info(f"Fila de mensagens no Redis: stream {self.stream}, grupo {self.group}")
+    
+    @staticmethod
+    def _parse(message_id: str, fields: Dict[str, str]) -> QueuedMessage:
+        """Converte uma entrada do stream em QueuedMessage."""
+        return QueuedMessage(
+            id=message_id,
+            payload=json.loads(fields["payload"]),
+            attempts=int(fields.get("attempts", 0))
+        )
+    
+    async def enqueue(self, payload: Dict[str, Any], attempts: int = 0) -> str:
+        """Adiciona uma mensagem ao stream (XADD)."""
+        message_id = await self._redis.xadd(
+            self.stream,
+            {
+                "payload": json.dumps(payload, default=str),
+                "attempts": attempts,
+                "enqueued_at": time.time()
+            },
+            maxlen=self.max_length,
+            approximate=True
+        )
+        if attempts == 0:
+            self.enqueued += 1
+        return message_id
+    
+    async def claim(self, consumer: str, count: int = 1, block_ms: int = 5000) -> List[QueuedMessage]:
+        """Lê mensagens novas para o consumidor (XREADGROUP)."""
+        response = await self._redis.xreadgroup(self.group, consumer, {self.stream: ">"}, count=count, block=block_ms)
+        return [
+            self._parse(message_id, fields)
+            for _, entries in response or []
+            for message_id, fields in entries
+            if fields
+        ]
+    
+    async def reclaim(self, consumer: str, count: int = 10) -> List[QueuedMessage]:
+        """
+        Assume mensagens pendentes há mais que o timeout de visibilidade (XAUTOCLAIM).
+        
+        Cada reentrega conta como tentativa, para que uma mensagem que
+        derruba o worker acabe na dead-letter queue.
+        
+        Args:
+            consumer: Consumidor que assume as mensagens
+            count: Máximo de mensagens
+        
+        Returns:
+            List: Mensagens recuperadas
+        """
+        response = await self._redis.xautoclaim(
+            self.stream,
+            self.group,
+            consumer,
+            min_idle_time=int(self.visibility_timeout * 1000),
+            start_id="0-0",
+            count=count
+        )
+        
+        messages = []
+        for message_id, fields in response[1]:
+            if not fields:
+                # Entrada removida do stream (MAXLEN) enquanto pendente
+                await self._redis.xack(self.stream, self.group, message_id)
+                continue
+            message = self._parse(message_id, fields)
+            pending = await self._redis.xpending_range(self.stream, self.group, message_id, message_id, 1)
+            if pending:
+                message.attempts += max(0, pending[0]["times_delivered"] - 1)
+            messages.append(message)
+        
+        if messages:
+            self.reclaimed += len(messages)
+            logger.warning(f"{len(messages)} mensagens recuperadas após o timeout de visibilidade")
+        return messages
+    
+    async def touch(self, consumer: str, messages: List[QueuedMessage]):
+        """
+        Renova a pendência de mensagens ainda em processamento (XCLAIM JUSTID).
+        
+        Zera o tempo ocioso sem contar nova entrega, para que o XAUTOCLAIM de
+        outra réplica não reentregue uma mensagem que este processo ainda vai
+        concluir.
+        
+        Args:
+            consumer: Consumidor que mantém as mensagens
+            messages: Mensagens aceitas e ainda não confirmadas
+        """
+        if not messages:
+            return
+        await self._redis.xclaim(
+            self.stream,
+            self.group,
+            consumer,
+            min_idle_time=0,
+            message_ids=[message.id for message in messages],
+            justid=True
+        )
+    
+    async def _remove(self, message: QueuedMessage):
+        """Confirma e remove a entrada do stream (no-op se já removida)."""
+        await self._redis.xack(self.stream, self.group, message.id)
+        await self._redis.xdel(self.stream, message.id)
+    
+    async def ack(self, message: QueuedMessage):
+        """Confirma o processamento e remove a entrada do stream."""
+        await self._remove(message)
+        self.acked += 1
+    
+    async def _schedule(self, message: QueuedMessage, attempts: int, not_before: float,
+                        key: Optional[str], only_if_held: bool = False) -> bool:
+        """Agenda a mensagem no sorted set (script atômico, ordem por lead)."""
+        member = json.dumps({
+            "id": message.id,
+            "key": key or "",
+            "attempts": attempts,
+            "payload": json.dumps(message.payload, default=str)
+        })
+        scheduled = await self._schedule_script(
+            keys=[self.delayed_key, self.held_key, self.held_until_key],
+            args=[member, not_before, key or "", 1 if only_if_held else 0, ORDER_STEP]
+        )
+        return bool(scheduled)
+    
+    async def defer(self, message: QueuedMessage, key: str) -> bool:
+        """Agenda a mensagem atrás da retentativa pendente do mesmo lead, se houver."""
+        deferred = await super().defer(message, key)
+        if deferred:
+            await self._remove(message)
+        return deferred
+    
+    async def requeue(self, message: QueuedMessage, key: str = None):
+        """Devolve a mensagem sem contar tentativa (respeitando a ordem do lead)."""
+        await self._schedule(message, message.attempts, time.time(), key)
+        await self._remove(message)
+    
+    async def promote(self, limit: int = 100) -> int:
+        """Move para o stream as retentativas vencidas (seguro com várias réplicas)."""
+        return int(await self._promote_script(
+            keys=[self.delayed_key, self.held_key, self.held_until_key, self.stream],
+            args=[time.time(), limit, self.max_length]
+        ))
+    
+    async def fail(self, message: QueuedMessage, error: str, key: str = None) -> bool:
+        """
+        Registra a falha: agenda a retentativa com backoff ou move para a dead-letter queue.
+        
+        A retentativa é gravada antes do ACK da original, então uma queda
+        entre os dois passos no máximo duplica a tentativa.
+        
+        Args:
+            message: Mensagem que falhou
+            error: Descrição do erro
+            key: Chave de ordem (telefone)
+        
+        Returns:
+            bool: True se a mensagem foi para a dead-letter queue
+        """
+        attempts = message.attempts + 1
+        dead_letter = attempts >= self.max_attempts
+        
+        if dead_letter:
+            await self._redis.xadd(
+                self.dead_letter_stream,
+                {
+                    "payload": json.dumps(message.payload, default=str),
+                    "attempts": attempts,
+                    "error": error[:1000],
+                    "failed_at": time.time()
+                },
+                maxlen=self.max_length,
+                approximate=True
+            )
+            self.dead_lettered += 1
+        else:
+            await self._schedule(message, attempts, time.time() + self._backoff(attempts), key)
+            self.retried += 1
+        
+        await self._remove(message)
+        return dead_letter
+    
+    async def stats(self) -> Dict[str, Any]:
+        """Retorna tamanho do stream, pendências e contadores."""
+        pending = await self._redis.xpending(self.stream, self.group)
+        return {
+            "backend": self.backend,
+            "length": await self._redis.xlen(self.stream),
+            "pending": pending.get("pending", 0) if pending else 0,
+            "delayed": await self._redis.zcard(self.delayed_key),
+            "dead_letter_length": await self._redis.xlen(self.dead_letter_stream),
+            "enqueued": self.enqueued,
+            "acked": self.acked,
+            "retried": self.retried,
+            "deferred": self.deferred,
+            "reclaimed": self.reclaimed,
+            "dead_lettered": self.dead_lettered
+        }
+    
+    async def close(self):
+        """Fecha a conexão com o Redis."""
+        if self._redis is not None:
+            close = getattr(self._redis, "aclose", None) or self._redis.close
+            await close()
+            self._redis = None
+
+
+class QueueWorkerPool:
+    """Pool de workers assíncronos que consome a fila de mensagens."""
+    
+    def __init__(self, queue: InMemoryQueue, handler: Callable[..., Awaitable[None]],
+                 concurrency: int = 4, handler_timeout: float = 30.0,
+                 on_dead_letter: Callable[[Dict[str, Any], str], Awaitable[None]] = None,
+                 key: Callable[[Dict[str, Any]], str] = None):
+        """
+        Inicializa o pool.
+        
+        O handler recebe o payload e os callbacks on_success(), on_failure(erro)
+        e on_requeue(). Quando ele retorna, a mensagem foi aceita; o
+        processamento pode continuar depois disso (ex.: executor por lead) e
+        a entrada fica pendente na fila até que quem o conclui chame
+        on_success (ACK) ou on_failure (retentativa ou dead-letter queue).
+        
+        Args:
+            queue: Fila consumida
+            handler: Corrotina que aceita o payload (exceção = falha)
+            concurrency: Número de workers
+            handler_timeout: Tempo máximo (s) para o handler aceitar a mensagem
+            on_dead_letter: Corrotina chamada quando a mensagem esgota as tentativas
+            key: Chave de ordem do payload (telefone); mensagens de um lead com
+                retentativa agendada esperam atrás dela
+        """
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.handler_timeout = handler_timeout
+        self.on_dead_letter = on_dead_letter
+        self.key = key
+        self.consumer_prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self.busy = 0
+        # Mensagens aceitas pelo handler e ainda não confirmadas
+        self._inflight: Dict[str, QueuedMessage] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+    
+    async def start(self):
+        """Inicia os workers, o liberador de retentativas e o recuperador de pendências."""
+        self._stopping.clear()
+        self._tasks = [
+            asyncio.create_task(self._worker(f"{self.consumer_prefix}-{index}"))
+            for index in range(self.concurrency)
+        ]
+        self._tasks.append(asyncio.create_task(self._promoter()))
+        self._tasks.append(asyncio.create_task(self._reclaimer(f"{self.consumer_prefix}-reclaimer")))
+        logger.info(f"Pool de workers da fila iniciado com {self.concurrency} workers")
+    
+    async def stop(self, timeout: float = 30.0):
+        """Para de consumir e aguarda as mensagens em processamento (até timeout)."""
+        self._stopping.set()
+        done, pending = await asyncio.wait(self._tasks, timeout=timeout) if self._tasks else (set(), set())
+        for task in pending:
+            task.cancel()
+        self._tasks = []
+    
+    async def _worker(self, consumer: str):
+        """Loop de um worker: lê, entrega ao handler e confirma."""
+        while not self._stopping.is_set():
+            try:
+                messages = await self.queue.claim(consumer, count=1, block_ms=2000)
+            except Exception as e:
+                logger.error(f"Erro ao ler a fila de mensagens: {str(e)}")
+                await asyncio.sleep(1)
+                continue
+            
+            for message in messages:
+                await self._handle(message)
+    
+    async def _promoter(self, interval: float = 1.0):
+        """Libera periodicamente as retentativas cujo backoff terminou."""
+        while not self._stopping.is_set():
+            try:
+                await self.queue.promote()
+            except Exception as e:
+                logger.error(f"Erro ao liberar retentativas agendadas: {str(e)}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def _reclaimer(self, consumer: str):
+        """Recupera periodicamente mensagens de workers que pararam no meio."""
+        interval = max(5.0, getattr(self.queue, "visibility_timeout", 60.0) / 2)
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=interval)
+                break
+            except asyncio.TimeoutError:
+                pass
+            
+            try:
+                # Renova antes de recuperar: o que ainda está em processamento não volta
+                await self.queue.touch(consumer, list(self._inflight.values()))
+                for message in await self.queue.reclaim(consumer):
+                    await self._handle(message)
+            except Exception as e:
+                logger.error(f"Erro ao recuperar mensagens pendentes: {str(e)}")
+    
+    async def _handle(self, message: QueuedMessage):
+        """Entrega a mensagem ao handler; a confirmação vem pelo callback on_success."""
+        key = self.key(message.payload) if self.key else None
+        if message.id in self._inflight:
+            return
+        self.busy += 1
+        try:
+            if message.attempts >= self.queue.max_attempts:
+                raise RuntimeError(f"Limite de {self.queue.max_attempts} tentativas atingido")
+            
+            # Lead com retentativa agendada: esta mensagem vai para trás dela
+            if key and await self.queue.defer(message, key):
+                return
+            
+            self._inflight[message.id] = message
+            await asyncio.wait_for(
+                self.handler(
+                    message.payload,
+                    on_success=lambda: self._ack(message),
+                    on_failure=lambda error: self._fail(message, f"{type(error).__name__}: {str(error)}", key),
+                    on_requeue=lambda: self._requeue(message, key)
+                ),
+                timeout=self.handler_timeout
+            )
+        
+        except Exception as e:
+            await self._fail(message, f"{type(e).__name__}: {str(e)}", key)
+        
+        finally:
+            self.busy -= 1
+    
+    async def _ack(self, message: QueuedMessage):
+        """Confirma a mensagem cujo processamento terminou."""
+        self._inflight.pop(message.id, None)
+        await self.queue.ack(message)
+    
+    async def _requeue(self, message: QueuedMessage, key: str = None):
+        """Devolve à fila uma mensagem aceita e ainda não processada."""
+        self._inflight.pop(message.id, None)
+        await self.queue.requeue(message, key)
+    
+    async def _fail(self, message: QueuedMessage, error: str, key: str = None) -> bool:
+        """
+        Agenda a retentativa ou move a mensagem para a dead-letter queue.
+        
+        Returns:
+            bool: True se a mensagem será tentada de novo
+        """
+        self._inflight.pop(message.id, None)
+        logger.error(f"Falha ao processar mensagem {message.id} (tentativa {message.attempts + 1}): {error}")
+        try:
+            dead_letter = await self.queue.fail(message, error, key)
+        except Exception as queue_error:
+            logger.error(f"Erro ao reagendar mensagem {message.id}: {str(queue_error)}")
+            return False
+        
+        if dead_letter:
+            logger.error(f"Mensagem {message.id} movida para a dead-letter queue")
+            if self.on_dead_letter:
+                try:
+                    await self.on_dead_letter(message.payload, error)
+                except Exception as callback_error:
+                    logger.error(f"Erro no tratamento da dead-letter: {str(callback_error)}")
+        return not dead_letter
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retorna o estado do pool.
+        
+        Returns:
+            Dict: Workers configurados, entregando mensagens e mensagens
+                aceitas aguardando confirmação
+        """
+        return {"workers": self.concurrency, "busy": self.busy, "inflight": len(self._inflight)}
+
+
+# Instância global da fila
+_message_queue: Optional[InMemoryQueue] = None
+_message_queue_lock = threading.Lock()
+
+
+def get_message_queue() -> InMemoryQueue:
+    """Retorna a fila de mensagens do processo (Redis se configurado)."""
+    global _message_queue
+    with _message_queue_lock:
+        if _message_queue is None:
+            redis_url = os.getenv('MESSAGE_QUEUE_REDIS_URL') or os.getenv('REDIS_URL')
+            max_attempts = int(os.getenv('MESSAGE_QUEUE_MAX_ATTEMPTS', '5'))
+            retry_backoff = float(os.getenv('MESSAGE_QUEUE_RETRY_BACKOFF', '2'))
+            if redis_url:
+                _message_queue = RedisStreamQueue(
+                    redis_url,
+                    stream=os.getenv('MESSAGE_QUEUE_STREAM', 'serena:inbound'),
+                    group=os.getenv('MESSAGE_QUEUE_GROUP', 'sdr-workers'),
+                    max_attempts=max_attempts,
+                    retry_backoff=retry_backoff,
+                    visibility_timeout=float(os.getenv('MESSAGE_QUEUE_VISIBILITY_TIMEOUT', '300'))
+                )
+            else:
+                _message_queue = InMemoryQueue(max_attempts=max_attempts, retry_backoff=retry_backoff)
+    return _message_queue
@@ -0,0 +1,252 @@
+# =============================================================================
+# SERENA SDR - OCR CACHE
+# =============================================================================
+
+"""
+OCR Cache Module
+
+Cache de resultados de OCR/classificação de imagens endereçado pelo conteúdo.
+
+A chave é o SHA-256 dos bytes da imagem (não a URL): a mesma foto de fatura
+reenviada pelo lead, ou processada mais de uma vez pelo agente, devolve a
+extração anterior sem nova chamada ao modelo de visão.
+
+- Armazenamento em disco local (um arquivo JSON por entrada)
+- TTL por entrada
+- Limite de entradas e de bytes com despejo LRU
+
+Author: Serena SDR System
+Version: 1.0.0
+Created: 2026-10-17
+"""
+
+import os
+import json
+import time
+import base64
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+import requests
+
+from .media_storage import DEFAULT_MAX_BYTES, MediaHostNotAllowed, MediaTooLarge, download_limited, is_allowed_media_url
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(data: bytes) -> str:
+    """
+    Calcula o hash de conteúdo usado como chave do cache.
+    
+    Args:
+        data: Bytes da imagem
+    
+    Returns:
+        str: SHA-256 em hexadecimal
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def fetch_image_bytes(image_url: str, timeout: int = 30, max_bytes: int = DEFAULT_MAX_BYTES) -> bytes:
+    """
+    Obtém os bytes de uma imagem a partir de URL https ou data URL (base64).
+    
+    A URL pode vir do modelo: só hosts de mídia permitidos (WhatsApp e
+    Supabase Storage) são baixados, em streaming e com limite de tamanho.
+    
+    Args:
+        image_url: URL da imagem
+        timeout: Timeout do download em segundos
+        max_bytes: Tamanho máximo aceito
+    
+    Returns:
+        bytes: Conteúdo da imagem
+    """
+    if image_url.startswith("data:"):
+        encoded = image_url.split(",", 1)[1]
+        if len(encoded) * 3 // 4 > max_bytes:
+            raise MediaTooLarge(f"Imagem excede o limite de {max_bytes} bytes")
+        return base64.b64decode(encoded)
+    
+    if not is_allowed_media_url(image_url):
+        raise MediaHostNotAllowed("URL fora dos hosts de mídia permitidos")
+    
+    # Sem redirecionamentos: o host validado é o host baixado
+    return download_limited(requests, image_url, max_bytes=max_bytes, timeout=timeout, allow_redirects=False).data
+
+
+class OCRCache:
+    """Cache em disco de resultados de OCR com TTL e despejo LRU."""
+    
+    def __init__(self, directory: str, ttl_seconds: int = 2592000, max_entries: int = 5000,
+                 max_bytes: int = 200 * 1024 * 1024):
+        """
+        Inicializa o cache.
+        
+        Args:
+            directory: Diretório dos arquivos do cache
+            ttl_seconds: Tempo de vida de cada entrada em segundos
+            max_entries: Máximo de entradas mantidas
+            max_bytes: Tamanho máximo total dos arquivos
+        """
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # chave -> tamanho do arquivo, do menos para o mais recentemente usado
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+    
+    def _path(self, key: str) -> str:
+        """Caminho do arquivo de uma chave."""
+        return os.path.join(self.directory, f"{key}.json")
+    
+    def _load_index(self):
+        """Reconstrói o índice LRU a partir dos arquivos existentes (ordem por último acesso)."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, name[:-5], stat.st_size))
+        
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+        
+        self._evict()
+    
+    def _remove(self, key: str):
+        """Remove uma entrada do índice e do disco (chamar com o lock)."""
+        self._total_bytes -= self._index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+    
+    def _evict(self):
+        """Despeja as entradas menos usadas até respeitar os limites (chamar com o lock)."""
+        while self._index and (len(self._index) > self.max_entries or self._total_bytes > self.max_bytes):
+            key = next(iter(self._index))
+            self._remove(key)
+            self.evictions += 1
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca um resultado no cache.
+        
+        Args:
+            key: Chave (hash de conteúdo, opcionalmente com namespace)
+        
+        Returns:
+            Dict: Resultado armazenado ou None se ausente/expirado
+        """
+        with self._lock:
+            if key not in self._index:
+                # Entrada gravada por outro processo que compartilha o diretório
+                try:
+                    self._index[key] = os.path.getsize(self._path(key))
+                    self._total_bytes += self._index[key]
+                except OSError:
+                    self.misses += 1
+                    return None
+            
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                self._remove(key)
+                self.misses += 1
+                return None
+            
+            if entry.get("created_at", 0) + self.ttl_seconds < time.time():
+                self._remove(key)
+                self.misses += 1
+                return None
+            
+            # Marca como usado recentemente (também no disco, para o próximo _load_index)
+            self._index.move_to_end(key)
+            try:
+                os.utime(self._path(key))
+            except OSError:
+                pass
+            
+            self.hits += 1
+            return entry.get("value")
+    
+    def set(self, key: str, value: Dict[str, Any]):
+        """
+        Grava um resultado no cache (escrita atômica).
+        
+        Args:
+            key: Chave (hash de conteúdo, opcionalmente com namespace)
+            value: Resultado serializável em JSON
+        """
+        data = json.dumps({"created_at": time.time(), "value": value}, ensure_ascii=False, default=str)
+        
+        with self._lock:
+            try:
+                fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp_path, self._path(key))
+            except OSError as e:
+                logger.warning(f"Erro ao gravar cache de OCR: {str(e)}")
+                return
+            
+            self._total_bytes -= self._index.pop(key, 0)
+            self._index[key] = len(data.encode("utf-8"))
+            self._total_bytes += self._index[key]
+            self._evict()
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retorna os contadores do cache.
+        
+        Returns:
+            Dict: hits, misses, hit_rate, entradas, bytes e despejos
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+                "evictions": self.evictions,
+                "ttl_seconds": self.ttl_seconds
+            }
+
+
+# Instância global do cache
+_ocr_cache: Optional[OCRCache] = None
+_ocr_cache_lock = threading.Lock()
+
+
+def get_ocr_cache() -> OCRCache:
+    """Retorna o cache de OCR compartilhado pelo processo."""
+    global _ocr_cache
+    with _ocr_cache_lock:
+        if _ocr_cache is None:
+            _ocr_cache = OCRCache(
+                directory=os.getenv('OCR_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'serena_ocr_cache')),
+                ttl_seconds=int(os.getenv('OCR_CACHE_TTL_SECONDS', '2592000')),
+                max_entries=int(os.getenv('OCR_CACHE_MAX_ENTRIES', '5000')),
+                max_bytes=int(os.getenv('OCR_CACHE_MAX_MB', '200')) * 1024 * 1024
+            )
+    return _ocr_cache
@@ -22,8 +22,65 @@ from typing import Dict, Any, Optional, List
 from datetime import datetime
 import openai
 
+from .ocr_cache import get_ocr_cache, content_hash, fetch_image_bytes
+from .image_preprocessing import ImagePreprocessor
+from .local_ocr import get_local_ocr
+from .pdf_processing import get_pdf_extractor, is_pdf
+from .media_storage import get_whatsapp_media_client, get_media_storage
+
 logger = logging.getLogger(__name__)
 
+# Versão do prompt de análise: faz parte da chave do cache, então mudar o
+# prompt invalida os resultados anteriores
+IMAGE_ANALYSIS_PROMPT_VERSION = "v4"
+
+# Limite do texto de PDF enviado ao modelo quando a leitura local não basta
+PDF_TEXT_MAX_CHARS = 12000
+
+# Classificação + extração completa em uma única chamada de visão. Para
+# imagens que não são fatura o modelo devolve "dados": null (saída curta).
+IMAGE_ANALYSIS_PROMPT = """
+Você é um especialista em análise de faturas de energia elétrica.
+
+Primeiro classifique a imagem:
+- "energy_bill": Fatura de energia elétrica
+- "other_document": Outro tipo de documento
+- "not_document": Não é um documento (foto pessoal, etc.)
+
+Responda APENAS com um JSON no formato:
+
+{
+    "classification": "energy_bill|other_document|not_document",
+    "confidence": "confiança da classificação (0 a 1)",
+    "reasoning": "explicação curta da classificação",
+    "dados": null
+}
+
+Somente se a classificação for "energy_bill", substitua null em "dados" por:
+
+{
+    "valor_total": "valor total da fatura (número)",
+    "data_vencimento": "data de vencimento (YYYY-MM-DD)",
+    "consumo_kwh": "consumo em kWh (número)",
+    "distribuidora": "nome da distribuidora de energia",
+    "numero_cliente": "número do cliente/instalação",
+    "endereco": "endereço da instalação",
+    "periodo_faturamento": "período de faturamento (mês/ano)",
+    "valor_energia": "valor da energia (sem impostos)",
+    "valor_impostos": "valor dos impostos",
+    "valor_iluminacao": "valor da iluminação pública (se houver)",
+    "valor_outros": "outros valores",
+    "confianca": "nível de confiança da extração (0-100)"
+}
+
+IMPORTANTE:
+- Extraia apenas valores numéricos para campos de valor (sem R$, vírgulas, etc.)
+- Use formato YYYY-MM-DD para datas
+- Se algum campo não for encontrado, use null
+- Confiança da extração deve ser um número entre 0 e 100
+- Retorne APENAS o JSON, sem texto adicional
+"""
+
 
 class OCRTools:
     """Ferramentas para processamento OCR de faturas de energia."""
@@ -35,106 +92,96 @@ class OCRTools:
             raise ValueError("OPENAI_API_KEY não encontrado")
         
         openai.api_key = self.openai_api_key
+        self.client = openai.OpenAI(api_key=self.openai_api_key)
+        self.vision_model = os.getenv('OPENAI_VISION_MODEL', 'gpt-4o')
         
         # Configurar timeout e retries
         self.timeout = 60
         self.max_retries = 3
+        self.max_image_bytes = int(os.getenv('MEDIA_MAX_MB', '20')) * 1024 * 1024
+        
+        # Cache de resultados por conteúdo da imagem
+        self.cache = get_ocr_cache()
+        
+        # OCR local (Tesseract) antes do modelo de visão; as regras de leitura
+        # também valem para a camada de texto de PDFs
+        self.local_ocr = get_local_ocr()
+        self.tesseract_enabled = (
+            os.getenv('LOCAL_OCR_ENABLED', 'true').lower() == 'true' and self.local_ocr.available
+        )
+        
+        # Faturas em PDF (camada de texto ou páginas rasterizadas)
+        self.pdf_extractor = get_pdf_extractor()
+        
+        # Preprocessamento local (recorte, orientação, redução) antes da visão
+        self.preprocessor = ImagePreprocessor(
+            detail=os.getenv('OCR_IMAGE_DETAIL', 'high'),
+            jpeg_quality=int(os.getenv('OCR_IMAGE_JPEG_QUALITY', '85')),
+            keep_document=self.tesseract_enabled
+        )
     
-    def process_energy_bill_image(self, image_url: str) -> Dict[str, Any]:
+    def _download_image(self, image_url: str) -> Optional[bytes]:
         """
-        Processa imagem de fatura de energia via OpenAI Vision.
+        Baixa a imagem uma única vez (usada para a chave do cache e o preprocessamento).
         
         Args:
-            image_url: URL da imagem da fatura
+            image_url: URL da imagem
             
         Returns:
-            Dict: Dados extraídos da fatura
+            bytes: Conteúdo da imagem ou None se o download falhar
         """
         try:
-            # Prompt específico para faturas de energia
-            system_prompt = """
-            Você é um especialista em análise de faturas de energia elétrica.
-            
-            Analise a imagem da fatura e extraia as seguintes informações em formato JSON:
-            
-            {
-                "valor_total": "valor total da fatura (número)",
-                "data_vencimento": "data de vencimento (YYYY-MM-DD)",
-                "consumo_kwh": "consumo em kWh (número)",
-                "distribuidora": "nome da distribuidora de energia",
-                "numero_cliente": "número do cliente/instalação",
-                "endereco": "endereço da instalação",
-                "periodo_faturamento": "período de faturamento (mês/ano)",
-                "valor_energia": "valor da energia (sem impostos)",
-                "valor_impostos": "valor dos impostos",
-                "valor_iluminacao": "valor da iluminação pública (se houver)",
-                "valor_outros": "outros valores",
-                "confianca": "nível de confiança da extração (0-100)"
-            }
+            return fetch_image_bytes(image_url, timeout=self.timeout, max_bytes=self.max_image_bytes)
+        except Exception as e:
+            logger.warning(f"Imagem não pôde ser baixada, enviando URL ao modelo: {str(e)}")
+            return None
+    
+    def _analysis_cache_key(self, digest: str) -> str:
+        """Chave do cache da análise combinada para um hash de conteúdo."""
+        return f"image_analysis_{IMAGE_ANALYSIS_PROMPT_VERSION}-{digest}"
+    
+    def analyze_image(self, image_url: str, image_bytes: bytes = None) -> Dict[str, Any]:
+        """
+        Classifica a imagem e, se for fatura de energia, extrai os dados completos.
+        
+        Uma única chamada ao modelo de visão faz as duas etapas; imagens que
+        não são fatura retornam logo após a classificação, sem extração.
+        Antes dela, o OCR local (Tesseract) tenta ler a fatura: se a leitura
+        atinge a confiança mínima, o modelo de visão não é chamado. PDFs são
+        detectados pelo conteúdo e seguem o caminho de documentos.
+        
+        Args:
+            image_url: URL da imagem ou do PDF
+            image_bytes: Conteúdo já baixado (dispensa o download da URL)
             
-            IMPORTANTE:
-            - Extraia apenas valores numéricos para campos de valor (sem R$, vírgulas, etc.)
-            - Use formato YYYY-MM-DD para datas
-            - Se algum campo não for encontrado, use null
-            - Confiança deve ser um número entre 0 e 100
-            - Retorne APENAS o JSON, sem texto adicional
-            """
-            
-            # Chamar OpenAI Vision API
-            response = openai.ChatCompletion.create(
-                model="gpt-4-vision-preview",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "Analise esta fatura de energia e extraia os dados solicitados:"
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": image_url
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=1000,
-                temperature=0.1
-            )
+        Returns:
+            Dict: Classificação (classification, is_energy_bill, ...) e,
+                para faturas, os dados extraídos
+        """
+        try:
+            if image_bytes is None:
+                image_bytes = self._download_image(image_url)
             
-            # Extrair resposta
-            content = response.choices[0].message.content.strip()
+            # A mesma imagem (mesmo conteúdo) não é enviada de novo ao modelo
+            cache_key = None
+            if image_bytes:
+                cache_key = self._analysis_cache_key(content_hash(image_bytes))
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    logger.info("Análise da imagem obtida do cache de OCR")
+                    return {**cached, "cached": True}
+            
+            if is_pdf(image_bytes):
+                result = self._analyze_pdf(image_bytes)
+            else:
+                result = self._analyze_picture(image_url, image_bytes)
+            
+            # Apenas análises completas vão para o cache (o fallback, sem classificação, não)
+            if cache_key and result.get("success") and "classification" in result:
+                self.cache.set(cache_key, result)
+            
+            return result
             
-            # Tentar parsear JSON
-            try:
-                extracted_data = json.loads(content)
-                
-                # Validar e limpar dados
-                cleaned_data = self._clean_extracted_data(extracted_data)
-                
-                return {
-                    "success": True,
-                    "dados_extraidos": cleaned_data,
-                    "valor_conta": cleaned_data.get("valor_total", 0),
-                    "data_vencimento": cleaned_data.get("data_vencimento"),
-                    "consumo_kwh": cleaned_data.get("consumo_kwh", 0),
-                    "distribuidora": cleaned_data.get("distribuidora"),
-                    "confianca": cleaned_data.get("confianca", 0)
-                }
-                
-            except json.JSONDecodeError as e:
-                logger.error(f"Erro ao parsear JSON da resposta: {str(e)}")
-                logger.error(f"Conteúdo recebido: {content}")
-                
-                # Fallback: tentar extrair informações básicas
-                return self._fallback_extraction(content, image_url)
-                
         except Exception as e:
             logger.error(f"Erro ao processar imagem: {str(e)}")
             return {
@@ -145,6 +192,233 @@ class OCRTools:
                 "confianca": 0
             }
     
+    def _analyze_picture(self, image_url: str, image_bytes: Optional[bytes]) -> Dict[str, Any]:
+        """
+        Analisa uma foto: OCR local quando possível, senão o modelo de visão.
+        
+        Args:
+            image_url: URL da imagem (usada quando o download falhou)
+            image_bytes: Conteúdo da imagem ou None
+            
+        Returns:
+            Dict: Resultado da análise
+        """
+        # Imagem preprocessada enviada como data URL; sem download, a URL original
+        image_content = {"url": image_url}
+        preprocessing = None
+        if image_bytes:
+            prepared = self.preprocessor.prepare(image_bytes)
+            image_content = {"url": prepared.data_url, "detail": prepared.detail}
+            preprocessing = prepared.summary()
+            
+            # Caminho rápido: faturas legíveis pelo Tesseract não vão ao modelo
+            if self.tesseract_enabled:
+                local = self.local_ocr.extract(prepared.document or image_bytes)
+                if local:
+                    result = self._local_result(local, source="tesseract")
+                    result["preprocessing"] = preprocessing
+                    return result
+        
+        result = self._vision_analysis(
+            [{"type": "image_url", "image_url": image_content}],
+            "Classifique esta imagem e, se for uma fatura de energia, extraia os dados solicitados:"
+        )
+        if preprocessing and result.get("success"):
+            result["preprocessing"] = preprocessing
+        return result
+    
+    def _analyze_pdf(self, pdf_bytes: bytes) -> Dict[str, Any]:
+        """
+        Analisa uma fatura em PDF, do caminho mais barato ao mais caro.
+        
+        1. Camada de texto (pdftotext), lida pelas mesmas regras do OCR local
+        2. Texto presente mas incompleto: o modelo recebe o texto, não imagens
+        3. PDF só imagem: páginas rasterizadas (limitadas) passam pelo
+           Tesseract e, se preciso, pelo modelo de visão
+        
+        Args:
+            pdf_bytes: Conteúdo do PDF
+            
+        Returns:
+            Dict: Resultado da análise
+        """
+        text = self.pdf_extractor.extract_text(pdf_bytes)
+        if text:
+            local = self.local_ocr.evaluate(text)
+            if local:
+                logger.info(f"Fatura lida da camada de texto do PDF (confiança: {local['confianca']})")
+                return self._local_result(local, source="pdf_text")
+            
+            return self._vision_analysis(
+                [{"type": "text", "text": text[:PDF_TEXT_MAX_CHARS]}],
+                "Classifique este documento (texto extraído de um PDF) e, se for uma fatura de energia, extraia os dados solicitados:",
+                source="pdf_text_model"
+            )
+        
+        pages = [self.preprocessor.prepare(page) for page in self.pdf_extractor.rasterize(pdf_bytes)]
+        if not pages:
+            raise ValueError("PDF sem páginas para processar")
+        
+        if self.tesseract_enabled:
+            for page in pages:
+                local = self.local_ocr.extract(page.document) if page.document else None
+                if local:
+                    return self._local_result(local, source="tesseract")
+        
+        return self._vision_analysis(
+            [{"type": "image_url", "image_url": {"url": page.data_url, "detail": page.detail}} for page in pages],
+            "Classifique este documento (páginas de um PDF) e, se for uma fatura de energia, extraia os dados solicitados:"
+        )
+    
+    def _vision_analysis(self, parts: List[Dict[str, Any]], instruction: str,
+                         source: str = "vision") -> Dict[str, Any]:
+        """
+        Classificação e extração em uma única chamada ao modelo.
+        
+        Args:
+            parts: Partes da mensagem (imagens ou texto do documento)
+            instruction: Instrução enviada antes do conteúdo
+            source: Origem registrada no resultado
+            
+        Returns:
+            Dict: Resultado da análise (ou da extração de fallback)
+        """
+        response = self.client.chat.completions.create(
+            model=self.vision_model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": IMAGE_ANALYSIS_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": [{"type": "text", "text": instruction}] + parts
+                }
+            ],
+            max_tokens=1000,
+            temperature=0.1,
+            response_format={"type": "json_object"}
+        )
+        
+        # Extrair resposta
+        content = response.choices[0].message.content.strip()
+        
+        # Tentar parsear JSON
+        try:
+            analysis = json.loads(content)
+            
+        except json.JSONDecodeError as e:
+            logger.error(f"Erro ao parsear JSON da resposta: {str(e)}")
+            logger.error(f"Conteúdo recebido: {content}")
+            
+            # Fallback: tentar extrair informações básicas
+            return self._fallback_extraction(content, "")
+        
+        result = self._analysis_result(analysis)
+        result["source"] = source
+        
+        logger.info(f"Imagem analisada: {result['classification']} (confiança: {result['classification_confidence']})")
+        return result
+    
+    def _analysis_result(self, analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Converte a resposta do modelo no resultado da análise.
+        
+        Args:
+            analysis: JSON retornado pelo modelo
+            
+        Returns:
+            Dict: Classificação e dados extraídos (limpos) da fatura
+        """
+        classification = analysis.get("classification") or "other_document"
+        
+        try:
+            classification_confidence = min(1.0, max(0.0, float(analysis.get("confidence") or 0)))
+        except (TypeError, ValueError):
+            classification_confidence = 0.0
+        
+        result = {
+            "success": True,
+            "classification": classification,
+            "classification_confidence": classification_confidence,
+            "is_energy_bill": classification == "energy_bill",
+            "reasoning": analysis.get("reasoning", "")
+        }
+        
+        # Não é fatura: nada a extrair
+        if not result["is_energy_bill"] or not isinstance(analysis.get("dados"), dict):
+            result.update({
+                "dados_extraidos": {},
+                "valor_conta": 0,
+                "data_vencimento": None,
+                "consumo_kwh": 0,
+                "distribuidora": None,
+                "confianca": 0
+            })
+            return result
+        
+        # Validar e limpar dados
+        cleaned_data = self._clean_extracted_data(analysis["dados"])
+        
+        result.update({
+            "dados_extraidos": cleaned_data,
+            "valor_conta": cleaned_data.get("valor_total", 0),
+            "data_vencimento": cleaned_data.get("data_vencimento"),
+            "consumo_kwh": cleaned_data.get("consumo_kwh", 0),
+            "distribuidora": cleaned_data.get("distribuidora"),
+            "confianca": cleaned_data.get("confianca", 0)
+        })
+        return result
+    
+    def _local_result(self, local: Dict[str, Any], source: str) -> Dict[str, Any]:
+        """
+        Converte a leitura local no mesmo formato da análise por visão.
+        
+        Args:
+            local: Resultado de LocalOCR.extract/evaluate
+            source: Origem do texto (tesseract ou pdf_text)
+            
+        Returns:
+            Dict: Classificação (fatura) e dados extraídos
+        """
+        cleaned_data = self._clean_extracted_data({
+            "valor_total": local["valor_total"],
+            "data_vencimento": local["data_vencimento"],
+            "consumo_kwh": local["consumo_kwh"],
+            "distribuidora": local["distribuidora"],
+            "confianca": local["confianca"]
+        })
+        
+        return {
+            "success": True,
+            "source": source,
+            "classification": "energy_bill",
+            "classification_confidence": round(local["confianca"] / 100, 2),
+            "is_energy_bill": True,
+            "reasoning": f"Fatura {local['distribuidora']} lida localmente (campos: {', '.join(local['fields_found'])})",
+            "dados_extraidos": cleaned_data,
+            "valor_conta": cleaned_data.get("valor_total", 0),
+            "data_vencimento": cleaned_data.get("data_vencimento"),
+            "consumo_kwh": cleaned_data.get("consumo_kwh", 0),
+            "distribuidora": cleaned_data.get("distribuidora"),
+            "confianca": cleaned_data.get("confianca", 0)
+        }
+    
+    def process_energy_bill_image(self, image_url: str) -> Dict[str, Any]:
+        """
+        Processa imagem de fatura de energia via OpenAI Vision.
+        
+        Usa a mesma análise combinada (e o mesmo cache) de analyze_image, então
+        uma imagem já classificada não gera uma segunda chamada ao modelo.
+        
+        Args:
+            image_url: URL da imagem da fatura
+            
+        Returns:
+            Dict: Dados extraídos da fatura (e a classificação da imagem)
+        """
+        return self.analyze_image(image_url)
+    
     def _clean_extracted_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Limpa e valida dados extraídos.
@@ -197,15 +471,18 @@ class OCRTools:
             cleaned["data_vencimento"] = None
         
         # Outros campos
-        cleaned["distribuidora"] = data.get("distribuidora", "").strip()
-        cleaned["numero_cliente"] = data.get("numero_cliente", "").strip()
-        cleaned["endereco"] = data.get("endereco", "").strip()
-        cleaned["periodo_faturamento"] = data.get("periodo_faturamento", "").strip()
-        cleaned["valor_energia"] = data.get("valor_energia", 0)
-        cleaned["valor_impostos"] = data.get("valor_impostos", 0)
-        cleaned["valor_iluminacao"] = data.get("valor_iluminacao", 0)
-        cleaned["valor_outros"] = data.get("valor_outros", 0)
-        cleaned["confianca"] = min(100, max(0, data.get("confianca", 0)))
+        cleaned["distribuidora"] = str(data.get("distribuidora") or "").strip()
+        cleaned["numero_cliente"] = str(data.get("numero_cliente") or "").strip()
+        cleaned["endereco"] = str(data.get("endereco") or "").strip()
+        cleaned["periodo_faturamento"] = str(data.get("periodo_faturamento") or "").strip()
+        cleaned["valor_energia"] = data.get("valor_energia") or 0
+        cleaned["valor_impostos"] = data.get("valor_impostos") or 0
+        cleaned["valor_iluminacao"] = data.get("valor_iluminacao") or 0
+        cleaned["valor_outros"] = data.get("valor_outros") or 0
+        try:
+            cleaned["confianca"] = min(100, max(0, float(data.get("confianca") or 0)))
+        except (TypeError, ValueError):
+            cleaned["confianca"] = 0
         
         return cleaned
     
@@ -438,34 +715,53 @@ class OCRTools:
                 "endereco_completo": ""
             }
     
-    def process_whatsapp_media(self, media_id: str, whatsapp_mcp_url: str) -> Dict[str, Any]:
+    def process_whatsapp_media(self, media_id: str, phone_number: str = None) -> Dict[str, Any]:
         """
-        Processa mídia recebida via WhatsApp.
+        Processa mídia recebida via WhatsApp (foto ou PDF da fatura).
+        
+        Resolve a URL da mídia, baixa em streaming calculando o hash, envia ao
+        Storage só se o hash é novo e entrega os bytes já baixados ao OCR.
         
         Args:
             media_id: ID da mídia no WhatsApp
-            whatsapp_mcp_url: URL do MCP do WhatsApp
+            phone_number: Telefone do lead (apenas para log)
             
         Returns:
-            Dict: Resultado do processamento
+            Dict: Resultado da análise, com media_sha256, media_url e media_uploaded
         """
         try:
-            # Primeiro, obter URL da mídia via WhatsApp MCP
-            # (Esta funcionalidade depende da implementação do WhatsApp MCP)
-            
-            # Por enquanto, assumir que a URL já foi fornecida
-            # Em uma implementação completa, seria necessário:
-            # 1. Chamar WhatsApp MCP para obter URL da mídia
-            # 2. Fazer download da imagem
-            # 3. Fazer upload para um storage público
-            # 4. Processar com OCR
-            
-            return {
-                "success": False,
-                "error": "Funcionalidade de processamento de mídia WhatsApp não implementada",
-                "dados_extraidos": {},
-                "valor_conta": 0
-            }
+            media_client = get_whatsapp_media_client()
+            media_info = media_client.resolve(media_id)
+            
+            # O hash informado pela Meta é o mesmo do cache: fatura já analisada
+            # dispensa até o download
+            if media_info.get("sha256"):
+                cached = self.cache.get(self._analysis_cache_key(media_info["sha256"]))
+                if cached is not None:
+                    logger.info(f"Mídia {media_id} já analisada (cache por hash)")
+                    return {**cached, "cached": True, "media_id": media_id, "media_sha256": media_info["sha256"]}
+            
+            media = media_client.download(media_info["url"], media_info.get("mime_type"))
+            logger.info(f"Mídia {media_id} baixada de {phone_number or 'lead'}: {media.size} bytes, {media.mime_type}")
+            
+            # O Storage guarda a fatura para consulta posterior; uma falha nele não impede o OCR
+            stored = {}
+            storage = get_media_storage()
+            if storage:
+                try:
+                    stored = storage.store(media.data, media.sha256, media.mime_type)
+                except Exception as e:
+                    logger.warning(f"Erro ao armazenar mídia {media_id} no Storage: {str(e)}")
+            
+            result = self.analyze_image(stored.get("signed_url") or "", image_bytes=media.data)
+            result.update({
+                "media_id": media_id,
+                "media_sha256": media.sha256,
+                "media_mime_type": media.mime_type,
+                "media_url": stored.get("signed_url"),
+                "media_uploaded": stored.get("uploaded", False)
+            })
+            return result
             
         except Exception as e:
             logger.error(f"Erro ao processar mídia WhatsApp: {str(e)}")
@@ -474,4 +770,4 @@ class OCRTools:
                 "error": str(e),
                 "dados_extraidos": {},
                 "valor_conta": 0
-            } 
\ No newline at end of file
+            }
@@ -0,0 +1,179 @@
+# =============================================================================
+# SERENA SDR - PDF PROCESSING
+# =============================================================================
+
+"""
+PDF Processing Module
+
+Leitura de faturas enviadas como documento PDF.
+
+- Extrai a camada de texto com pdftotext (poppler), sem custo de OCR
+- Só quando não há texto, rasteriza as páginas com pdf2image, uma por vez,
+  com limite de páginas e de DPI para manter a memória sob controle
+
+Author: Serena SDR System
+Version: 1.0.0
+Created: 2026-10-17
+"""
+
+import io
+import os
+import logging
+import subprocess
+import threading
+from typing import Dict, Any, Optional, List
+
+try:
+    from pdf2image import convert_from_bytes, pdfinfo_from_bytes
+    PDF2IMAGE_AVAILABLE = True
+except ImportError:
+    PDF2IMAGE_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Mínimo de caracteres úteis para considerar que o PDF tem camada de texto
+MIN_TEXT_LAYER_CHARS = 80
+
+# Teto de resolução: uma página A4 a 300 DPI já ocupa ~25 MB descomprimida em RGB
+MAX_DPI = 300
+
+
+def is_pdf(data: Optional[bytes]) -> bool:
+    """Verifica a assinatura %PDF- (o cabeçalho pode vir após alguns bytes)."""
+    return bool(data) and b"%PDF-" in data[:1024]
+
+
+class PDFExtractor:
+    """Extração de texto e rasterização limitada de PDFs de faturas."""
+    
+    def __init__(self, max_pages: int = 2, dpi: int = 200, max_bytes: int = 10 * 1024 * 1024,
+                 timeout: int = 30):
+        """
+        Inicializa o extrator.
+        
+        Args:
+            max_pages: Páginas lidas/rasterizadas (os dados da fatura ficam no início)
+            dpi: Resolução da rasterização (limitada a MAX_DPI)
+            max_bytes: Tamanho máximo aceito do PDF
+            timeout: Tempo máximo (s) de cada chamada ao poppler
+        """
+        self.max_pages = max_pages
+        self.dpi = min(dpi, MAX_DPI)
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.documents = 0
+        self.text_layer = 0
+        self.rasterized_pages = 0
+        self._lock = threading.Lock()
+    
+    def _check_size(self, data: bytes):
+        """Rejeita PDFs acima do limite configurado."""
+        if len(data) > self.max_bytes:
+            raise ValueError(f"PDF com {len(data)} bytes excede o limite de {self.max_bytes}")
+    
+    def extract_text(self, data: bytes) -> str:
+        """
+        Extrai a camada de texto das primeiras páginas.
+        
+        Args:
+            data: Bytes do PDF
+        
+        Returns:
+            str: Texto (vazio quando o PDF é só imagem ou a extração falha)
+        """
+        self._check_size(data)
+        with self._lock:
+            self.documents += 1
+        
+        try:
+            completed = subprocess.run(
+                ["pdftotext", "-layout", "-f", "1", "-l", str(self.max_pages), "-", "-"],
+                input=data,
+                capture_output=True,
+                timeout=self.timeout,
+                check=True
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning(f"Camada de texto do PDF não pôde ser extraída: {str(e)}")
+            return ""
+        
+        text = completed.stdout.decode("utf-8", errors="ignore")
+        if len("".join(text.split())) < MIN_TEXT_LAYER_CHARS:
+            return ""
+        
+        with self._lock:
+            self.text_layer += 1
+        return text
+    
+    def rasterize(self, data: bytes) -> List[bytes]:
+        """
+        Rasteriza as primeiras páginas em PNG, uma página por vez.
+        
+        Args:
+            data: Bytes do PDF
+        
+        Returns:
+            List: PNG de cada página (no máximo max_pages)
+        """
+        if not PDF2IMAGE_AVAILABLE:
+            raise RuntimeError("pdf2image não está instalado")
+        
+        self._check_size(data)
+        page_count = int(pdfinfo_from_bytes(data, timeout=self.timeout).get("Pages", 1))
+        
+        pages = []
+        for page_number in range(1, min(page_count, self.max_pages) + 1):
+            images = convert_from_bytes(
+                data,
+                dpi=self.dpi,
+                first_page=page_number,
+                last_page=page_number,
+                grayscale=True,
+                thread_count=1,
+                timeout=self.timeout
+            )
+            for image in images:
+                buffer = io.BytesIO()
+                image.save(buffer, format="PNG")
+                pages.append(buffer.getvalue())
+                image.close()
+        
+        with self._lock:
+            self.rasterized_pages += len(pages)
+        logger.info(f"PDF rasterizado: {len(pages)} de {page_count} páginas a {self.dpi} DPI")
+        return pages
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retorna os contadores de PDFs processados.
+        
+        Returns:
+            Dict: Documentos, PDFs com camada de texto e páginas rasterizadas
+        """
+        with self._lock:
+            return {
+                "documents": self.documents,
+                "text_layer": self.text_layer,
+                "rasterized_pages": self.rasterized_pages,
+                "max_pages": self.max_pages,
+                "dpi": self.dpi
+            }
+
+
+# Instância global do extrator
+_pdf_extractor: Optional[PDFExtractor] = None
+_pdf_extractor_lock = threading.Lock()
+
+
+def get_pdf_extractor() -> PDFExtractor:
+    """Retorna o extrator de PDF compartilhado pelo processo."""
+    global _pdf_extractor
+    with _pdf_extractor_lock:
+        if _pdf_extractor is None:
+            _pdf_extractor = PDFExtractor(
+                max_pages=int(os.getenv('PDF_MAX_PAGES', '2')),
+                dpi=int(os.getenv('PDF_DPI', '200')),
+                max_bytes=int(os.getenv('PDF_MAX_MB', '10')) * 1024 * 1024,
+                timeout=int(os.getenv('PDF_TIMEOUT', '30'))
+            )
+    return _pdf_extractor
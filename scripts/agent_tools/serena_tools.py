@@ -14,16 +14,309 @@ Created: 2025-01-17
 """
 
 import os
+import copy
 import json
 import logging
-import requests
-from typing import Dict, Any, Optional, List
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, List, Callable
 from datetime import datetime
 from langchain_core.tools import tool
 
+from .mcp_transport import get_transport, get_async_transport
+from .coverage_cache import get_coverage_cache, coverage_key, plans_key, normalize_state, parse_locations
+from .coverage_index import get_coverage_index
+
 logger = logging.getLogger(__name__)
 
 
+# =============================================================================
+# FERRAMENTAS DO MCP (argumentos e respostas compartilhados pelas versões sync/async)
+# =============================================================================
+
+@dataclass(frozen=True)
+class MCPTool:
+    """Ferramenta do MCP: nome, formatação da resposta e resposta de erro."""
+    
+    name: str
+    shape: Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]
+    error_message: str
+    fallback: Dict[str, Any]
+    
+    def failure(self, error: Exception) -> Dict[str, Any]:
+        """Registra o erro e monta a resposta de falha da ferramenta."""
+        logger.error(f"{self.error_message}: {str(error)}")
+        return {"success": False, "error": str(error), **copy.deepcopy(self.fallback)}
+
+
+def _areas_arguments(cidade: str = None, estado: str = None, codigo_ibge: str = None) -> Dict[str, Any]:
+    """Argumentos de consultar_areas_operacao_gd."""
+    arguments = {}
+    if cidade:
+        arguments["cidade"] = cidade.strip()
+    if estado:
+        arguments["estado"] = normalize_state(estado)
+    if codigo_ibge:
+        arguments["codigo_ibge"] = codigo_ibge
+    return arguments
+
+
+def _plans_arguments(cidade: str = None, estado: str = None, id_distribuidora: str = None) -> Dict[str, Any]:
+    """Argumentos de obter_planos_gd (id_distribuidora ou cidade+estado)."""
+    if id_distribuidora:
+        return {"id_distribuidora": id_distribuidora}
+    if cidade and estado:
+        return {"cidade": cidade.strip(), "estado": normalize_state(estado)}
+    raise ValueError("Deve fornecer id_distribuidora ou cidade+estado")
+
+
+def _qualification_arguments(cidade: str, estado: str, tipo_pessoa: str, valor_conta: float) -> Dict[str, Any]:
+    """Argumentos de validar_qualificacao_lead."""
+    return {
+        "cidade": cidade,
+        "estado": estado,
+        "tipo_pessoa": tipo_pessoa,
+        "valor_conta": valor_conta
+    }
+
+
+# Campos obrigatórios no cadastro de lead
+REQUIRED_LEAD_FIELDS = (
+    "fullName", "personType", "emailAddress", "mobilePhone",
+    "utilityBillHolder", "utilityBillingValue", "identificationNumber"
+)
+
+
+def _create_lead_arguments(dados_lead: Dict[str, Any]) -> Dict[str, Any]:
+    """Argumentos de cadastrar_lead (valida os campos obrigatórios)."""
+    for field in REQUIRED_LEAD_FIELDS:
+        if field not in dados_lead:
+            raise ValueError(f"Campo obrigatório ausente: {field}")
+    return {"dados_lead": dados_lead}
+
+
+def _contract_arguments(id_lead: str, plano: Dict[str, Any] = None,
+                        representantes_legais: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Argumentos de criar_contrato."""
+    arguments = {"id_lead": id_lead}
+    if plano:
+        arguments["plano"] = plano
+    if representantes_legais:
+        arguments["representantes_legais"] = representantes_legais
+    return arguments
+
+
+def _search_leads_arguments(filtros: str = None, pagina: int = 1, limite: int = 10) -> Dict[str, Any]:
+    """Argumentos de buscar_leads."""
+    arguments = {"pagina": pagina, "limite": limite}
+    if filtros:
+        arguments["filtros"] = filtros
+    return arguments
+
+
+def _list_response(key: str) -> Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]:
+    """Formata respostas cuja lista vem em "result" (áreas, planos)."""
+    def shape(result: Dict[str, Any], arguments: Dict[str, Any]) -> Dict[str, Any]:
+        items = result.get("result", [])
+        return {"success": True, key: items, "count": len(items)}
+    return shape
+
+
+def _qualification_response(result: Dict[str, Any], arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """Formata a resposta de validar_qualificacao_lead."""
+    qualification_result = result.get("result", {})
+    return {
+        "success": True,
+        "qualificado": qualification_result.get("qualification", False),
+        "produto": qualification_result.get("product", "Geração Distribuída"),
+        "detalhes": qualification_result
+    }
+
+
+def _bill_response(result: Dict[str, Any], arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """Formata a resposta de process_energy_bill_image."""
+    dados = result.get("result", {})
+    return {
+        "success": True,
+        "dados_extraidos": dados,
+        "valor_conta": dados.get("valor", 0),
+        "data_vencimento": dados.get("vencimento"),
+        "consumo_kwh": dados.get("consumo")
+    }
+
+
+def _search_leads_response(result: Dict[str, Any], arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """Formata a resposta paginada de buscar_leads."""
+    return {
+        "success": True,
+        "leads": result.get("result", {}).get("leads", []),
+        "total": result.get("result", {}).get("total", 0),
+        "pagina": arguments["pagina"],
+        "limite": arguments["limite"]
+    }
+
+
+AREAS_TOOL = MCPTool(
+    name="consultar_areas_operacao_gd",
+    shape=_list_response("areas"),
+    error_message="Erro ao consultar áreas de operação",
+    fallback={"areas": [], "count": 0}
+)
+
+PLANS_TOOL = MCPTool(
+    name="obter_planos_gd",
+    shape=_list_response("planos"),
+    error_message="Erro ao obter planos GD",
+    fallback={"planos": [], "count": 0}
+)
+
+QUALIFICATION_TOOL = MCPTool(
+    name="validar_qualificacao_lead",
+    shape=_qualification_response,
+    error_message="Erro ao validar qualificação",
+    fallback={"qualificado": False, "produto": "Geração Distribuída"}
+)
+
+CREATE_LEAD_TOOL = MCPTool(
+    name="cadastrar_lead",
+    shape=lambda result, arguments: {
+        "success": True,
+        "lead_id": result.get("lead_id"),
+        "message": "Lead cadastrado com sucesso"
+    },
+    error_message="Erro ao cadastrar lead",
+    fallback={}
+)
+
+GET_LEAD_TOOL = MCPTool(
+    name="buscar_lead_por_id",
+    shape=lambda result, arguments: {"success": True, "lead": result.get("result", {})},
+    error_message="Erro ao buscar lead",
+    fallback={"lead": {}}
+)
+
+UPDATE_LEAD_TOOL = MCPTool(
+    name="atualizar_lead",
+    shape=lambda result, arguments: {"success": True, "message": "Lead atualizado com sucesso"},
+    error_message="Erro ao atualizar lead",
+    fallback={}
+)
+
+CONTRACT_TOOL = MCPTool(
+    name="criar_contrato",
+    shape=lambda result, arguments: {
+        "success": True,
+        "contrato_id": result.get("contrato_id"),
+        "message": "Contrato criado com sucesso"
+    },
+    error_message="Erro ao criar contrato",
+    fallback={}
+)
+
+BILL_TOOL = MCPTool(
+    name="process_energy_bill_image",
+    shape=_bill_response,
+    error_message="Erro ao processar fatura",
+    fallback={"dados_extraidos": {}, "valor_conta": 0}
+)
+
+SEARCH_LEADS_TOOL = MCPTool(
+    name="buscar_leads",
+    shape=_search_leads_response,
+    error_message="Erro ao buscar leads",
+    fallback={"leads": [], "total": 0}
+)
+
+CREDENTIALS_TOOL = MCPTool(
+    name="atualizar_credenciais_distribuidora",
+    shape=lambda result, arguments: {"success": True, "message": "Credenciais atualizadas com sucesso"},
+    error_message="Erro ao atualizar credenciais",
+    fallback={}
+)
+
+
+def _has_coverage(areas_result: Dict[str, Any]) -> bool:
+    """Se a consulta de áreas encontrou cobertura de GD."""
+    return bool(areas_result["success"]) and areas_result["count"] > 0
+
+
+def _lead_plans_response(cidade: str, estado: str, areas_result: Dict[str, Any] = None,
+                         planos_result: Dict[str, Any] = None, error: str = None) -> Dict[str, Any]:
+    """
+    Monta a resposta de get_energy_plans_for_lead.
+    
+    Args:
+        cidade: Cidade do lead
+        estado: Estado do lead
+        areas_result: Resposta de consultar_areas_operacao_gd
+        planos_result: Resposta de obter_planos_gd (None sem cobertura)
+        error: Erro que interrompeu a consulta
+        
+    Returns:
+        Dict: Planos disponíveis para o lead
+    """
+    if error is None and planos_result is None:
+        error = "Área não possui cobertura para GD"
+    if error is not None:
+        return {"success": False, "error": error, "planos": []}
+    return {
+        "success": True,
+        "areas_cobertura": areas_result["areas"],
+        "planos": planos_result["planos"],
+        "cidade": cidade,
+        "estado": estado
+    }
+
+
+def _location_plans_response(cidade: str, estado: str, areas_result: Dict[str, Any] = None,
+                             planos_result: Dict[str, Any] = None, error: str = None) -> Dict[str, Any]:
+    """
+    Monta a resposta de buscar_planos_de_energia_por_localizacao.
+    
+    Args:
+        cidade: Nome da cidade
+        estado: Sigla do estado
+        areas_result: Resposta de consultar_areas_operacao_gd
+        planos_result: Resposta de obter_planos_gd (None sem cobertura)
+        error: Erro que interrompeu a consulta
+        
+    Returns:
+        Dict: Lista de planos disponíveis para a localização
+    """
+    if error is None and planos_result is None:
+        error = "Área não possui cobertura para Geração Distribuída"
+    if error is not None:
+        return {"success": False, "error": error, "planos": [], "cidade": cidade, "estado": estado}
+    return {
+        "success": True,
+        "areas_cobertura": areas_result["areas"],
+        "planos": planos_result["planos"],
+        "cidade": cidade,
+        "estado": estado,
+        "total_planos": planos_result["count"]
+    }
+
+
+def _bill_analysis_response(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Converte a resposta de processar_fatura_energia na de analisar_conta_de_energia_de_imagem."""
+    if result["success"]:
+        return {
+            "success": True,
+            "valor_conta": result["valor_conta"],
+            "data_vencimento": result["data_vencimento"],
+            "consumo_kwh": result["consumo_kwh"],
+            "dados_extraidos": result["dados_extraidos"],
+            "message": "Conta de energia analisada com sucesso"
+        }
+    return {
+        "success": False,
+        "error": result["error"],
+        "valor_conta": 0,
+        "data_vencimento": None,
+        "consumo_kwh": 0,
+        "dados_extraidos": {}
+    }
+
+
 class SerenaTools:
     """Ferramentas para interação com API Serena via MCP."""
     
@@ -36,6 +329,12 @@ class SerenaTools:
         # Configurar timeout e retries
         self.timeout = 30
         self.max_retries = 3
+        
+        # Cobertura e planos mudam raramente: cache compartilhado por todas as instâncias
+        self.coverage_cache = get_coverage_cache()
+        
+        # Áreas de operação indexadas localmente para qualificar sem chamar o MCP
+        self.coverage_index = get_coverage_index()
     
     def _make_mcp_request(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -48,39 +347,76 @@ class SerenaTools:
         Returns:
             Dict: Resposta do MCP Server
         """
-        payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": method,
-            "params": params
-        }
+        return get_transport().request(
+            self.mcp_url,
+            method,
+            params,
+            timeout=self.timeout,
+            max_retries=self.max_retries
+        )
+    
+    async def _make_mcp_request_async(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Faz requisição assíncrona para o MCP Server da Serena.
         
-        for attempt in range(self.max_retries):
-            try:
-                response = requests.post(
-                    f"{self.mcp_url}/mcp",
-                    json=payload,
-                    headers={"Content-Type": "application/json"},
-                    timeout=self.timeout
-                )
-                response.raise_for_status()
-                
-                result = response.json()
-                if "error" in result:
-                    raise Exception(f"MCP Error: {result['error']}")
-                
-                return result.get("result", {})
-                
-            except Exception as e:
-                logger.error(f"Tentativa {attempt + 1} falhou: {str(e)}")
-                if attempt == self.max_retries - 1:
-                    raise
-                continue
+        Args:
+            method: Método MCP (tools/call)
+            params: Parâmetros da requisição
+            
+        Returns:
+            Dict: Resposta do MCP Server
+        """
+        return await get_async_transport().request(
+            self.mcp_url,
+            method,
+            params,
+            timeout=self.timeout,
+            max_retries=self.max_retries
+        )
+    
+    def _call_tool(self, tool: MCPTool, build_arguments: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Executa uma ferramenta do MCP e formata a resposta.
+        
+        Args:
+            tool: Especificação da ferramenta
+            build_arguments: Monta (e valida) os argumentos da chamada
+            
+        Returns:
+            Dict: Resposta formatada ou resposta de erro da ferramenta
+        """
+        try:
+            arguments = build_arguments()
+            result = self._make_mcp_request("tools/call", {"name": tool.name, "arguments": arguments})
+            return tool.shape(result, arguments)
+        except Exception as e:
+            return tool.failure(e)
+    
+    async def _call_tool_async(self, tool: MCPTool, build_arguments: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Executa uma ferramenta do MCP de forma assíncrona (mesmo contrato de _call_tool).
+        
+        Args:
+            tool: Especificação da ferramenta
+            build_arguments: Monta (e valida) os argumentos da chamada
+            
+        Returns:
+            Dict: Resposta formatada ou resposta de erro da ferramenta
+        """
+        try:
+            arguments = build_arguments()
+            result = await self._make_mcp_request_async("tools/call", {"name": tool.name, "arguments": arguments})
+            return tool.shape(result, arguments)
+        except Exception as e:
+            return tool.failure(e)
     
     def consultar_areas_operacao_gd(self, cidade: str = None, estado: str = None, codigo_ibge: str = None) -> Dict[str, Any]:
         """
         Consulta áreas onde o serviço de Geração Distribuída está disponível.
         
+        A resposta vem do cache de cobertura (chave cidade/UF normalizada ou
+        IBGE) e só é consultada no MCP na ausência ou expiração da entrada.
+        
         Args:
             cidade: Nome da cidade (opcional)
             estado: Sigla do estado (opcional)
@@ -89,39 +425,22 @@ class SerenaTools:
         Returns:
             Dict: Lista de áreas de operação disponíveis
         """
-        try:
-            arguments = {}
-            if cidade:
-                arguments["cidade"] = cidade
-            if estado:
-                arguments["estado"] = estado
-            if codigo_ibge:
-                arguments["codigo_ibge"] = codigo_ibge
-            
-            result = self._make_mcp_request("tools/call", {
-                "name": "consultar_areas_operacao_gd",
-                "arguments": arguments
-            })
-            
-            return {
-                "success": True,
-                "areas": result.get("result", []),
-                "count": len(result.get("result", []))
-            }
-            
-        except Exception as e:
-            logger.error(f"Erro ao consultar áreas de operação: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e),
-                "areas": [],
-                "count": 0
-            }
+        return self.coverage_cache.get_or_load(
+            coverage_key(cidade, estado, codigo_ibge),
+            lambda: self._consultar_areas_operacao_gd(cidade, estado, codigo_ibge)
+        )
+    
+    def _consultar_areas_operacao_gd(self, cidade: str = None, estado: str = None, codigo_ibge: str = None) -> Dict[str, Any]:
+        """Consulta remota das áreas de operação (sem cache)."""
+        return self._call_tool(AREAS_TOOL, lambda: _areas_arguments(cidade, estado, codigo_ibge))
     
     def obter_planos_gd(self, cidade: str = None, estado: str = None, id_distribuidora: str = None) -> Dict[str, Any]:
         """
         Obtém planos de Geração Distribuída disponíveis para uma localidade.
         
+        A resposta vem do cache de cobertura (chave id_distribuidora ou
+        cidade/UF normalizada).
+        
         Args:
             cidade: Nome da cidade (opcional)
             estado: Sigla do estado (opcional)
@@ -130,79 +449,76 @@ class SerenaTools:
         Returns:
             Dict: Lista de planos disponíveis
         """
-        try:
-            arguments = {}
-            if id_distribuidora:
-                arguments["id_distribuidora"] = id_distribuidora
-            elif cidade and estado:
-                arguments["cidade"] = cidade
-                arguments["estado"] = estado
-            else:
-                raise ValueError("Deve fornecer id_distribuidora ou cidade+estado")
-            
-            result = self._make_mcp_request("tools/call", {
-                "name": "obter_planos_gd",
-                "arguments": arguments
-            })
-            
-            return {
-                "success": True,
-                "planos": result.get("result", []),
-                "count": len(result.get("result", []))
-            }
-            
-        except Exception as e:
-            logger.error(f"Erro ao obter planos GD: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e),
-                "planos": [],
-                "count": 0
+        return self.coverage_cache.get_or_load(
+            plans_key(cidade, estado, id_distribuidora),
+            lambda: self._obter_planos_gd(cidade, estado, id_distribuidora)
+        )
+    
+    def _obter_planos_gd(self, cidade: str = None, estado: str = None, id_distribuidora: str = None) -> Dict[str, Any]:
+        """Consulta remota dos planos de GD (sem cache)."""
+        return self._call_tool(PLANS_TOOL, lambda: _plans_arguments(cidade, estado, id_distribuidora))
+    
+    def start_coverage_index_sync(self, interval_seconds: int = None):
+        """
+        Inicia a sincronização periódica do índice local de cobertura.
+        
+        Args:
+            interval_seconds: Intervalo entre sincronizações (padrão: COVERAGE_INDEX_SYNC_SECONDS)
+        """
+        self.coverage_index.start(
+            self._consultar_areas_operacao_gd,
+            interval_seconds or int(os.getenv('COVERAGE_INDEX_SYNC_SECONDS', '21600'))
+        )
+    
+    def _local_qualification(self, cidade: str, estado: str, tipo_pessoa: str, valor_conta: float) -> Optional[Dict[str, Any]]:
+        """
+        Decide a qualificação pelo índice local, no mesmo formato da resposta do MCP.
+        
+        Returns:
+            Dict: Resultado da validação; None quando o índice não pode decidir
+        """
+        decision = self.coverage_index.qualify(cidade, estado, tipo_pessoa, valor_conta)
+        if decision is None:
+            return None
+        return {
+            "success": True,
+            "qualificado": decision["qualificado"],
+            "produto": "Geração Distribuída",
+            "detalhes": {
+                "qualification": decision["qualificado"],
+                "product": "Geração Distribuída",
+                "motivo": decision["motivo"],
+                "areas": decision["areas"],
+                "origem": "indice_local"
             }
+        }
     
-    def validar_qualificacao_lead(self, cidade: str, estado: str, tipo_pessoa: str, valor_conta: float) -> Dict[str, Any]:
+    def validar_qualificacao_lead(self, cidade: str, estado: str, tipo_pessoa: str, valor_conta: float,
+                                  autoritativo: bool = False) -> Dict[str, Any]:
         """
         Valida se um lead está qualificado para produtos de energia solar.
         
+        A decisão é tomada pelo índice local de cobertura quando ele está
+        sincronizado; o MCP é consultado quando o índice não pode decidir ou
+        quando a confirmação oficial é pedida (autoritativo=True).
+        
         Args:
             cidade: Cidade do lead
             estado: Estado do lead
             tipo_pessoa: "natural" ou "juridical"
             valor_conta: Valor da conta de energia
+            autoritativo: Consultar sempre o MCP (ex.: antes do contrato)
             
         Returns:
             Dict: Resultado da validação
         """
-        try:
-            arguments = {
-                "cidade": cidade,
-                "estado": estado,
-                "tipo_pessoa": tipo_pessoa,
-                "valor_conta": valor_conta
-            }
-            
-            result = self._make_mcp_request("tools/call", {
-                "name": "validar_qualificacao_lead",
-                "arguments": arguments
-            })
-            
-            qualification_result = result.get("result", {})
-            
-            return {
-                "success": True,
-                "qualificado": qualification_result.get("qualification", False),
-                "produto": qualification_result.get("product", "Geração Distribuída"),
-                "detalhes": qualification_result
-            }
-            
-        except Exception as e:
-            logger.error(f"Erro ao validar qualificação: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e),
-                "qualificado": False,
-                "produto": "Geração Distribuída"
-            }
+        local = None if autoritativo else self._local_qualification(cidade, estado, tipo_pessoa, valor_conta)
+        if local is not None:
+            return local
+        return self._call_tool(
+            QUALIFICATION_TOOL,
+            lambda: _qualification_arguments(cidade, estado, tipo_pessoa, valor_conta)
+        )
     
     def cadastrar_lead(self, dados_lead: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -214,34 +530,7 @@ class SerenaTools:
         Returns:
             Dict: Resultado do cadastro
         """
-        try:
-            # Validar dados obrigatórios
-            required_fields = [
-                "fullName", "personType", "emailAddress", "mobilePhone",
-                "utilityBillHolder", "utilityBillingValue", "identificationNumber"
-            ]
-            
-            for field in required_fields:
-                if field not in dados_lead:
-                    raise ValueError(f"Campo obrigatório ausente: {field}")
-            
-            result = self._make_mcp_request("tools/call", {
-                "name": "cadastrar_lead",
-                "arguments": {"dados_lead": dados_lead}
-            })
-            
-            return {
-                "success": True,
-                "lead_id": result.get("lead_id"),
-                "message": "Lead cadastrado com sucesso"
-            }
-            
-        except Exception as e:
-            logger.error(f"Erro ao cadastrar lead: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e)
-            }
+        return self._call_tool(CREATE_LEAD_TOOL, lambda: _create_lead_arguments(dados_lead))
     
     def buscar_lead_por_id(self, id_lead: str) -> Dict[str, Any]:
         """
@@ -253,24 +542,7 @@ class SerenaTools:
         Returns:
             Dict: Informações completas do lead
         """
-        try:
-            result = self._make_mcp_request("tools/call", {
-                "name": "buscar_lead_por_id",
-                "arguments": {"id_lead": id_lead}
-            })
-            
-            return {
-                "success": True,
-                "lead": result.get("result", {})
-            }
-            
-        except Exception as e:
-            logger.error(f"Erro ao buscar lead: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e),
-                "lead": {}
-            }
+        return self._call_tool(GET_LEAD_TOOL, lambda: {"id_lead": id_lead})
     
     def atualizar_lead(self, id_lead: str, dados_atualizacao: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -283,26 +555,10 @@ class SerenaTools:
         Returns:
             Dict: Confirmação da atualização
         """
-        try:
-            result = self._make_mcp_request("tools/call", {
-                "name": "atualizar_lead",
-                "arguments": {
-                    "id_lead": id_lead,
-                    "dados_atualizacao": dados_atualizacao
-                }
-            })
-            
-            return {
-                "success": True,
-                "message": "Lead atualizado com sucesso"
-            }
-            
-        except Exception as e:
-            logger.error(f"Erro ao atualizar lead: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e)
-            }
+        return self._call_tool(
+            UPDATE_LEAD_TOOL,
+            lambda: {"id_lead": id_lead, "dados_atualizacao": dados_atualizacao}
+        )
     
     def criar_contrato(self, id_lead: str, plano: Dict[str, Any] = None, representantes_legais: List[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
@@ -316,31 +572,10 @@ class SerenaTools:
         Returns:
             Dict: ID do contrato criado e status
         """
-        try:
-            arguments = {"id_lead": id_lead}
-            
-            if plano:
-                arguments["plano"] = plano
-            if representantes_legais:
-                arguments["representantes_legais"] = representantes_legais
-            
-            result = self._make_mcp_request("tools/call", {
-                "name": "criar_contrato",
-                "arguments": arguments
-            })
-            
-            return {
-                "success": True,
-                "contrato_id": result.get("contrato_id"),
-                "message": "Contrato criado com sucesso"
-            }
-            
-        except Exception as e:
-            logger.error(f"Erro ao criar contrato: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e)
-            }
+        return self._call_tool(
+            CONTRACT_TOOL,
+            lambda: _contract_arguments(id_lead, plano, representantes_legais)
+        )
     
     def processar_fatura_energia(self, image_url: str) -> Dict[str, Any]:
         """
@@ -352,28 +587,7 @@ class SerenaTools:
         Returns:
             Dict: Dados extraídos da fatura
         """
-        try:
-            result = self._make_mcp_request("tools/call", {
-                "name": "process_energy_bill_image",
-                "arguments": {"image_url": image_url}
-            })
-            
-            return {
-                "success": True,
-                "dados_extraidos": result.get("result", {}),
-                "valor_conta": result.get("result", {}).get("valor", 0),
-                "data_vencimento": result.get("result", {}).get("vencimento"),
-                "consumo_kwh": result.get("result", {}).get("consumo")
-            }
-            
-        except Exception as e:
-            logger.error(f"Erro ao processar fatura: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e),
-                "dados_extraidos": {},
-                "valor_conta": 0
-            }
+        return self._call_tool(BILL_TOOL, lambda: {"image_url": image_url})
     
     def buscar_leads(self, filtros: str = None, pagina: int = 1, limite: int = 10) -> Dict[str, Any]:
         """
@@ -387,36 +601,7 @@ class SerenaTools:
         Returns:
             Dict: Lista paginada de leads
         """
-        try:
-            arguments = {
-                "pagina": pagina,
-                "limite": limite
-            }
-            
-            if filtros:
-                arguments["filtros"] = filtros
-            
-            result = self._make_mcp_request("tools/call", {
-                "name": "buscar_leads",
-                "arguments": arguments
-            })
-            
-            return {
-                "success": True,
-                "leads": result.get("result", {}).get("leads", []),
-                "total": result.get("result", {}).get("total", 0),
-                "pagina": pagina,
-                "limite": limite
-            }
-            
-        except Exception as e:
-            logger.error(f"Erro ao buscar leads: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e),
-                "leads": [],
-                "total": 0
-            }
+        return self._call_tool(SEARCH_LEADS_TOOL, lambda: _search_leads_arguments(filtros, pagina, limite))
     
     def atualizar_credenciais_distribuidora(self, id_lead: str, login: str, senha: str) -> Dict[str, Any]:
         """
@@ -430,27 +615,33 @@ class SerenaTools:
         Returns:
             Dict: Confirmação da atualização
         """
-        try:
-            result = self._make_mcp_request("tools/call", {
-                "name": "atualizar_credenciais_distribuidora",
-                "arguments": {
-                    "id_lead": id_lead,
-                    "login": login,
-                    "senha": senha
-                }
-            })
-            
-            return {
-                "success": True,
-                "message": "Credenciais atualizadas com sucesso"
-            }
+        return self._call_tool(
+            CREDENTIALS_TOOL,
+            lambda: {"id_lead": id_lead, "login": login, "senha": senha}
+        )
+    
+    def warm_coverage_cache(self, locations: List[tuple] = None) -> int:
+        """
+        Aquece o cache de cobertura com as localidades mais frequentes.
+        
+        Args:
+            locations: Pares (cidade, estado); padrão: COVERAGE_WARM_LOCATIONS
+                ("Cidade/UF" separados por vírgula)
             
-        except Exception as e:
-            logger.error(f"Erro ao atualizar credenciais: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e)
-            }
+        Returns:
+            int: Localidades com cobertura e planos carregados
+        """
+        if locations is None:
+            locations = parse_locations(os.getenv('COVERAGE_WARM_LOCATIONS', 'Recife/PE,São Paulo/SP'))
+        
+        warmed = 0
+        for cidade, estado in locations:
+            result = self.buscar_planos_de_energia_por_localizacao(cidade, estado)
+            if result.get("success"):
+                warmed += 1
+        
+        logger.info(f"Cache de cobertura aquecido: {warmed} de {len(locations)} localidades")
+        return warmed
     
     def get_energy_plans_for_lead(self, lead_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -462,45 +653,17 @@ class SerenaTools:
         Returns:
             Dict: Planos disponíveis para o lead
         """
+        cidade, estado = lead_data.get('city', ''), lead_data.get('state', '')
+        if not cidade or not estado:
+            return _lead_plans_response(cidade, estado, error="Cidade e estado são obrigatórios")
+        
         try:
-            cidade = lead_data.get('city', '')
-            estado = lead_data.get('state', '')
-            
-            if not cidade or not estado:
-                return {
-                    "success": False,
-                    "error": "Cidade e estado são obrigatórios",
-                    "planos": []
-                }
-            
-            # Primeiro verificar se a área tem cobertura
             areas_result = self.consultar_areas_operacao_gd(cidade=cidade, estado=estado)
-            
-            if not areas_result["success"] or areas_result["count"] == 0:
-                return {
-                    "success": False,
-                    "error": "Área não possui cobertura para GD",
-                    "planos": []
-                }
-            
-            # Obter planos disponíveis
-            planos_result = self.obter_planos_gd(cidade=cidade, estado=estado)
-            
-            return {
-                "success": True,
-                "areas_cobertura": areas_result["areas"],
-                "planos": planos_result["planos"],
-                "cidade": cidade,
-                "estado": estado
-            }
-            
+            planos_result = self.obter_planos_gd(cidade=cidade, estado=estado) if _has_coverage(areas_result) else None
+            return _lead_plans_response(cidade, estado, areas_result, planos_result)
         except Exception as e:
             logger.error(f"Erro ao obter planos para lead: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e),
-                "planos": []
-            }
+            return _lead_plans_response(cidade, estado, error=str(e))
     
     def buscar_planos_de_energia_por_localizacao(self, cidade: str, estado: str) -> Dict[str, Any]:
         """
@@ -514,39 +677,12 @@ class SerenaTools:
             Dict: Lista de planos disponíveis para a localização
         """
         try:
-            # Primeiro verificar se a área tem cobertura
             areas_result = self.consultar_areas_operacao_gd(cidade=cidade, estado=estado)
-            
-            if not areas_result["success"] or areas_result["count"] == 0:
-                return {
-                    "success": False,
-                    "error": "Área não possui cobertura para Geração Distribuída",
-                    "planos": [],
-                    "cidade": cidade,
-                    "estado": estado
-                }
-            
-            # Obter planos disponíveis
-            planos_result = self.obter_planos_gd(cidade=cidade, estado=estado)
-            
-            return {
-                "success": True,
-                "areas_cobertura": areas_result["areas"],
-                "planos": planos_result["planos"],
-                "cidade": cidade,
-                "estado": estado,
-                "total_planos": planos_result["count"]
-            }
-            
+            planos_result = self.obter_planos_gd(cidade=cidade, estado=estado) if _has_coverage(areas_result) else None
+            return _location_plans_response(cidade, estado, areas_result, planos_result)
         except Exception as e:
             logger.error(f"Erro ao buscar planos por localização: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e),
-                "planos": [],
-                "cidade": cidade,
-                "estado": estado
-            }
+            return _location_plans_response(cidade, estado, error=str(e))
     
     def analisar_conta_de_energia_de_imagem(self, image_url: str) -> Dict[str, Any]:
         """
@@ -558,40 +694,111 @@ class SerenaTools:
         Returns:
             Dict: Dados extraídos da conta de energia
         """
+        # processar_fatura_energia já converte falhas do MCP em resposta de erro
+        return _bill_analysis_response(self.processar_fatura_energia(image_url))
+    
+    
+    # =========================================================================
+    # FERRAMENTAS ASSÍNCRONAS
+    # =========================================================================
+    
+    async def consultar_areas_operacao_gd_async(self, cidade: str = None, estado: str = None, codigo_ibge: str = None) -> Dict[str, Any]:
+        """Consulta áreas de operação de Geração Distribuída (versão async, com cache)."""
+        return await self.coverage_cache.get_or_load_async(
+            coverage_key(cidade, estado, codigo_ibge),
+            lambda: self._consultar_areas_operacao_gd_async(cidade, estado, codigo_ibge)
+        )
+    
+    async def _consultar_areas_operacao_gd_async(self, cidade: str = None, estado: str = None, codigo_ibge: str = None) -> Dict[str, Any]:
+        """Consulta remota assíncrona das áreas de operação (sem cache)."""
+        return await self._call_tool_async(AREAS_TOOL, lambda: _areas_arguments(cidade, estado, codigo_ibge))
+    
+    async def obter_planos_gd_async(self, cidade: str = None, estado: str = None, id_distribuidora: str = None) -> Dict[str, Any]:
+        """Obtém planos de Geração Distribuída para uma localidade (versão async, com cache)."""
+        return await self.coverage_cache.get_or_load_async(
+            plans_key(cidade, estado, id_distribuidora),
+            lambda: self._obter_planos_gd_async(cidade, estado, id_distribuidora)
+        )
+    
+    async def _obter_planos_gd_async(self, cidade: str = None, estado: str = None, id_distribuidora: str = None) -> Dict[str, Any]:
+        """Consulta remota assíncrona dos planos de GD (sem cache)."""
+        return await self._call_tool_async(PLANS_TOOL, lambda: _plans_arguments(cidade, estado, id_distribuidora))
+    
+    async def validar_qualificacao_lead_async(self, cidade: str, estado: str, tipo_pessoa: str, valor_conta: float,
+                                              autoritativo: bool = False) -> Dict[str, Any]:
+        """Valida se um lead está qualificado para energia solar (versão async, índice local primeiro)."""
+        local = None if autoritativo else self._local_qualification(cidade, estado, tipo_pessoa, valor_conta)
+        if local is not None:
+            return local
+        return await self._call_tool_async(
+            QUALIFICATION_TOOL,
+            lambda: _qualification_arguments(cidade, estado, tipo_pessoa, valor_conta)
+        )
+    
+    async def cadastrar_lead_async(self, dados_lead: Dict[str, Any]) -> Dict[str, Any]:
+        """Cadastra um novo lead na base de dados da Serena (versão async)."""
+        return await self._call_tool_async(CREATE_LEAD_TOOL, lambda: _create_lead_arguments(dados_lead))
+    
+    async def buscar_lead_por_id_async(self, id_lead: str) -> Dict[str, Any]:
+        """Busca informações detalhadas de um lead específico (versão async)."""
+        return await self._call_tool_async(GET_LEAD_TOOL, lambda: {"id_lead": id_lead})
+    
+    async def atualizar_lead_async(self, id_lead: str, dados_atualizacao: Dict[str, Any]) -> Dict[str, Any]:
+        """Atualiza informações de um lead existente (versão async)."""
+        return await self._call_tool_async(
+            UPDATE_LEAD_TOOL,
+            lambda: {"id_lead": id_lead, "dados_atualizacao": dados_atualizacao}
+        )
+    
+    async def criar_contrato_async(self, id_lead: str, plano: Dict[str, Any] = None, representantes_legais: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Cria um contrato de geração distribuída para um lead (versão async)."""
+        return await self._call_tool_async(
+            CONTRACT_TOOL,
+            lambda: _contract_arguments(id_lead, plano, representantes_legais)
+        )
+    
+    async def processar_fatura_energia_async(self, image_url: str) -> Dict[str, Any]:
+        """Processa imagem de fatura de energia via OCR (versão async)."""
+        return await self._call_tool_async(BILL_TOOL, lambda: {"image_url": image_url})
+    
+    async def buscar_leads_async(self, filtros: str = None, pagina: int = 1, limite: int = 10) -> Dict[str, Any]:
+        """Busca leads com filtros e paginação (versão async)."""
+        return await self._call_tool_async(SEARCH_LEADS_TOOL, lambda: _search_leads_arguments(filtros, pagina, limite))
+    
+    async def atualizar_credenciais_distribuidora_async(self, id_lead: str, login: str, senha: str) -> Dict[str, Any]:
+        """Atualiza credenciais de acesso à distribuidora de energia (versão async)."""
+        return await self._call_tool_async(
+            CREDENTIALS_TOOL,
+            lambda: {"id_lead": id_lead, "login": login, "senha": senha}
+        )
+    
+    async def get_energy_plans_for_lead_async(self, lead_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Obtém planos de energia apropriados para um lead específico (versão async)."""
+        cidade, estado = lead_data.get('city', ''), lead_data.get('state', '')
+        if not cidade or not estado:
+            return _lead_plans_response(cidade, estado, error="Cidade e estado são obrigatórios")
+        
         try:
-            # Usar o método existente processar_fatura_energia
-            result = self.processar_fatura_energia(image_url)
-            
-            if result["success"]:
-                return {
-                    "success": True,
-                    "valor_conta": result["valor_conta"],
-                    "data_vencimento": result["data_vencimento"],
-                    "consumo_kwh": result["consumo_kwh"],
-                    "dados_extraidos": result["dados_extraidos"],
-                    "message": "Conta de energia analisada com sucesso"
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": result["error"],
-                    "valor_conta": 0,
-                    "data_vencimento": None,
-                    "consumo_kwh": 0,
-                    "dados_extraidos": {}
-                }
-                
+            areas_result = await self.consultar_areas_operacao_gd_async(cidade=cidade, estado=estado)
+            planos_result = await self.obter_planos_gd_async(cidade=cidade, estado=estado) if _has_coverage(areas_result) else None
+            return _lead_plans_response(cidade, estado, areas_result, planos_result)
         except Exception as e:
-            logger.error(f"Erro ao analisar conta de energia: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e),
-                "valor_conta": 0,
-                "data_vencimento": None,
-                "consumo_kwh": 0,
-                "dados_extraidos": {}
-            }
-
+            logger.error(f"Erro ao obter planos para lead: {str(e)}")
+            return _lead_plans_response(cidade, estado, error=str(e))
+    
+    async def buscar_planos_de_energia_por_localizacao_async(self, cidade: str, estado: str) -> Dict[str, Any]:
+        """Busca planos de energia disponíveis para uma localização (versão async)."""
+        try:
+            areas_result = await self.consultar_areas_operacao_gd_async(cidade=cidade, estado=estado)
+            planos_result = await self.obter_planos_gd_async(cidade=cidade, estado=estado) if _has_coverage(areas_result) else None
+            return _location_plans_response(cidade, estado, areas_result, planos_result)
+        except Exception as e:
+            logger.error(f"Erro ao buscar planos por localização: {str(e)}")
+            return _location_plans_response(cidade, estado, error=str(e))
+    
+    async def analisar_conta_de_energia_de_imagem_async(self, image_url: str) -> Dict[str, Any]:
+        """Analisa uma imagem de conta de energia (versão async)."""
+        return _bill_analysis_response(await self.processar_fatura_energia_async(image_url))
 
 # =============================================================================
 # FUNÇÕES WRAPPER PARA COMPATIBILIDADE COM AGENT_ORCHESTRATOR
@@ -18,18 +18,26 @@ import psycopg2
 import base64
 import hashlib
 import uuid
+import mimetypes
 from datetime import datetime
 from typing import Dict, Any, Optional, List
 from pathlib import Path
 from langchain_core.tools import tool
 
+from .db_pool import get_db_pool
+from .media_storage import get_media_storage
+from .lead_cache import get_lead_cache
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def get_db_connection():
     """
-    Obtém conexão com o banco de dados PostgreSQL/Supabase.
+    Obtém uma conexão avulsa com o banco de dados PostgreSQL/Supabase.
+    
+    As ferramentas deste módulo usam o pool compartilhado (get_db_pool);
+    esta função é mantida para scripts que precisam de uma conexão própria.
     
     Returns:
         psycopg2.connection: Conexão com o banco
@@ -50,9 +58,6 @@ def salvar_ou_atualizar_lead_silvia(lead_data: Dict[str, Any]) -> Dict[str, Any]
     try:
         logger.info(f"Salvando/atualizando lead: {lead_data.get('phone_number', 'N/A')}")
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         # Query de upsert
         upsert_query = """
             INSERT INTO leads (
@@ -77,23 +82,24 @@ def salvar_ou_atualizar_lead_silvia(lead_data: Dict[str, Any]) -> Dict[str, Any]
         }
         
         # Executa o upsert
-        cur.execute(
-            upsert_query,
-            (
-                lead_data.get("phone_number"),
-                lead_data.get("name", "Lead WhatsApp"),
-                float(lead_data.get("invoice_amount", 0)),
-                lead_data.get("client_type", "casa"),
-                lead_data.get("city", "N/A"),
-                lead_data.get("state", "N/A"),
-                json.dumps(additional_data)
+        with get_db_pool().connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                upsert_query,
+                (
+                    lead_data.get("phone_number"),
+                    lead_data.get("name", "Lead WhatsApp"),
+                    float(lead_data.get("invoice_amount", 0)),
+                    lead_data.get("client_type", "casa"),
+                    lead_data.get("city", "N/A"),
+                    lead_data.get("state", "N/A"),
+                    json.dumps(additional_data)
+                )
             )
-        )
+            
+            result = cur.fetchone()
         
-        result = cur.fetchone()
-        conn.commit()
-        cur.close()
-        conn.close()
+        # O upsert não retorna a linha completa: o cache de leads é invalidado
+        get_lead_cache().invalidate(result[1])
         
         logger.info(f"Lead salvo/atualizado com sucesso: ID={result[0]}")
         
@@ -123,9 +129,6 @@ def consultar_dados_lead(phone: str) -> Dict[str, Any]:
     try:
         logger.info(f"Consultando lead: {phone}")
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         # Normaliza o número de telefone
         import re
         digits_only = re.sub(r'\D', '', phone)
@@ -139,42 +142,41 @@ def consultar_dados_lead(phone: str) -> Dict[str, Any]:
             possible_formats.extend([digits_only, '55' + digits_only])
         
         # Busca o lead
-        for phone_format in possible_formats:
-            cur.execute("""
-                SELECT id, name, phone_number, city, state, 
-                       invoice_amount, client_type, created_at, updated_at
-                FROM leads 
-                WHERE phone_number = %s
-                ORDER BY created_at DESC
-                LIMIT 1
-            """, (phone_format,))
-            
-            result = cur.fetchone()
-            if result:
-                cur.close()
-                conn.close()
-                
-                lead_data = {
-                    "id": result[0],
-                    "name": result[1],
-                    "phone_number": result[2],
-                    "city": result[3],
-                    "state": result[4],
-                    "invoice_amount": float(result[5]) if result[5] else 0,
-                    "client_type": result[6],
-                    "created_at": result[7].isoformat() if result[7] else None,
-                    "updated_at": result[8].isoformat() if result[8] else None
-                }
+        result = None
+        with get_db_pool().connection() as conn, conn.cursor() as cur:
+            for phone_format in possible_formats:
+                cur.execute("""
+                    SELECT id, name, phone_number, city, state, 
+                           invoice_amount, client_type, created_at, updated_at
+                    FROM leads 
+                    WHERE phone_number = %s
+                    ORDER BY created_at DESC
+                    LIMIT 1
+                """, (phone_format,))
                 
-                logger.info(f"Lead encontrado: ID={lead_data['id']}")
-                return {
-                    "success": True,
-                    "lead": lead_data,
-                    "found": True
-                }
+                result = cur.fetchone()
+                if result:
+                    break
         
-        cur.close()
-        conn.close()
+        if result:
+            lead_data = {
+                "id": result[0],
+                "name": result[1],
+                "phone_number": result[2],
+                "city": result[3],
+                "state": result[4],
+                "invoice_amount": float(result[5]) if result[5] else 0,
+                "client_type": result[6],
+                "created_at": result[7].isoformat() if result[7] else None,
+                "updated_at": result[8].isoformat() if result[8] else None
+            }
+            
+            logger.info(f"Lead encontrado: ID={lead_data['id']}")
+            return {
+                "success": True,
+                "lead": lead_data,
+                "found": True
+            }
         
         logger.info(f"Lead não encontrado: {phone}")
         return {
@@ -194,7 +196,12 @@ def consultar_dados_lead(phone: str) -> Dict[str, Any]:
 @tool
 def upload_energy_bill_image(image_path: str, lead_id: int, phone_number: str) -> str:
     """
-    Faz upload de uma imagem de conta de energia para o Supabase.
+    Faz upload de uma imagem de conta de energia para o Supabase Storage.
+    
+    O caminho no bucket é derivado do SHA-256 do conteúdo; se a mesma imagem
+    já foi enviada, o upload é dispensado. Cada envio ganha sua própria linha
+    em energy_bill_images (image_id único), apontando para o caminho no bucket
+    em storage_path.
     
     Args:
         image_path (str): Caminho local da imagem
@@ -202,47 +209,47 @@ def upload_energy_bill_image(image_path: str, lead_id: int, phone_number: str) -
         phone_number (str): Número de telefone
         
     Returns:
-        str: ID da imagem no storage
+        str: Caminho da imagem no storage (aceito por generate_signed_url)
     """
     try:
         logger.info(f"Fazendo upload de imagem para lead {lead_id}")
         
-        # Gera ID único para a imagem
-        image_id = f"energy_bill_{lead_id}_{uuid.uuid4().hex[:8]}"
+        storage = get_media_storage()
+        if not storage:
+            raise ValueError("SUPABASE_URL/SUPABASE_KEY não configurados para o Storage")
         
         # Lê o arquivo
         with open(image_path, 'rb') as f:
             image_data = f.read()
         
-        # Calcula hash para verificação
-        image_hash = hashlib.md5(image_data).hexdigest()
-        
-        # Salva metadados no banco
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Insere na tabela de imagens
-        cur.execute("""
-            INSERT INTO energy_bill_images (
-                image_id, lead_id, phone_number, file_size, 
-                file_hash, upload_date, status
-            ) VALUES (%s, %s, %s, %s, %s, NOW(), 'uploaded')
-            RETURNING image_id;
-        """, (
-            image_id,
-            lead_id,
-            phone_number,
-            len(image_data),
-            image_hash
-        ))
-        
-        result = cur.fetchone()
-        conn.commit()
-        cur.close()
-        conn.close()
-        
-        logger.info(f"Imagem salva com ID: {image_id}")
-        return image_id
+        # Hash do conteúdo: define o caminho no bucket e evita uploads repetidos
+        image_hash = hashlib.sha256(image_data).hexdigest()
+        mime_type = mimetypes.guess_type(image_path)[0] or "image/jpeg"
+        stored = storage.store(image_data, image_hash, mime_type)
+        
+        # O caminho é compartilhado por envios do mesmo conteúdo (inclusive de
+        # outros leads); o ID da linha é único por envio
+        image_id = f"energy_bill_{lead_id}_{uuid.uuid4().hex[:8]}"
+        
+        # Salva metadados no banco (tabela de imagens)
+        with get_db_pool().connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO energy_bill_images (
+                    image_id, lead_id, phone_number, file_size, 
+                    file_hash, storage_path, upload_date, status
+                ) VALUES (%s, %s, %s, %s, %s, %s, NOW(), 'uploaded')
+                RETURNING image_id;
+            """, (
+                image_id,
+                lead_id,
+                phone_number,
+                len(image_data),
+                image_hash,
+                stored["path"]
+            ))
+        
+        logger.info(f"Imagem salva com ID: {image_id} ({stored['path']})")
+        return stored["path"]
         
     except Exception as e:
         logger.error(f"Erro no upload da imagem: {e}")
@@ -251,24 +258,25 @@ def upload_energy_bill_image(image_path: str, lead_id: int, phone_number: str) -
 @tool
 def generate_signed_url(blob_path: str) -> str:
     """
-    Gera URL assinada para acesso à imagem.
+    Gera URL assinada (temporária) para acesso à imagem no Supabase Storage.
     
     Args:
         blob_path (str): Caminho do blob no storage
         
     Returns:
-        str: URL assinada
+        str: URL assinada (vazia se o objeto não existe)
     """
     try:
         logger.info(f"Gerando URL assinada para: {blob_path}")
         
-        # Para implementação básica, retorna uma URL mock
-        # Em produção, isso seria integrado com o Supabase Storage
-        base_url = os.getenv("SUPABASE_STORAGE_URL", "https://storage.supabase.co")
-        bucket_name = os.getenv("SUPABASE_BUCKET_NAME", "energy-bills")
+        storage = get_media_storage()
+        if not storage:
+            raise ValueError("SUPABASE_URL/SUPABASE_KEY não configurados para o Storage")
         
-        # URL mock - em produção seria uma URL assinada real
-        signed_url = f"{base_url}/{bucket_name}/{blob_path}"
+        signed_url = storage.signed_url(blob_path)
+        if not signed_url:
+            logger.warning(f"Objeto não encontrado no Storage: {blob_path}")
+            return ""
         
         logger.info(f"URL assinada gerada: {signed_url[:50]}...")
         return signed_url
@@ -292,26 +300,20 @@ def save_image_metadata(lead_id: str, metadata: Dict[str, Any]) -> bool:
     try:
         logger.info(f"Salvando metadados de imagem para lead {lead_id}")
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         # Insere metadados
-        cur.execute("""
-            INSERT INTO image_metadata (
-                lead_id, image_id, file_size_kb, mime_type,
-                upload_date, metadata
-            ) VALUES (%s, %s, %s, %s, NOW(), %s)
-        """, (
-            lead_id,
-            metadata.get("image_id"),
-            metadata.get("file_size_kb", 0),
-            metadata.get("mime_type", "image/jpeg"),
-            json.dumps(metadata)
-        ))
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_db_pool().connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO image_metadata (
+                    lead_id, image_id, file_size_kb, mime_type,
+                    upload_date, metadata
+                ) VALUES (%s, %s, %s, %s, NOW(), %s)
+            """, (
+                lead_id,
+                metadata.get("image_id"),
+                metadata.get("file_size_kb", 0),
+                metadata.get("mime_type", "image/jpeg"),
+                json.dumps(metadata)
+            ))
         
         logger.info("Metadados salvos com sucesso")
         return True
@@ -335,29 +337,28 @@ def atualizar_status_lead(lead_id: int, status: str, dados_adicionais: Dict[str,
     try:
         logger.info(f"Atualizando status do lead {lead_id} para: {status}")
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         # Atualiza o status
-        cur.execute("""
-            UPDATE leads 
-            SET status = %s, 
-                additional_data = CASE 
-                    WHEN additional_data IS NULL THEN %s
-                    ELSE additional_data || %s
-                END,
-                updated_at = NOW()
-            WHERE id = %s
-        """, (
-            status,
-            json.dumps(dados_adicionais or {}),
-            json.dumps(dados_adicionais or {}),
-            lead_id
-        ))
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_db_pool().connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                UPDATE leads 
+                SET status = %s, 
+                    additional_data = CASE 
+                        WHEN additional_data IS NULL THEN %s
+                        ELSE additional_data || %s
+                    END,
+                    updated_at = NOW()
+                WHERE id = %s
+                RETURNING phone_number
+            """, (
+                status,
+                json.dumps(dados_adicionais or {}),
+                json.dumps(dados_adicionais or {}),
+                lead_id
+            ))
+            row = cur.fetchone()
+        
+        if row:
+            get_lead_cache().invalidate(row[0])
         
         logger.info(f"Status atualizado com sucesso")
         return True
@@ -380,21 +381,17 @@ def buscar_leads_por_status(status: str, limit: int = 10) -> List[Dict[str, Any]
     try:
         logger.info(f"Buscando leads com status: {status}")
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute("""
-            SELECT id, name, phone_number, city, state, 
-                   invoice_amount, client_type, created_at, status
-            FROM leads 
-            WHERE status = %s
-            ORDER BY created_at DESC
-            LIMIT %s
-        """, (status, limit))
-        
-        results = cur.fetchall()
-        cur.close()
-        conn.close()
+        with get_db_pool().connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT id, name, phone_number, city, state, 
+                       invoice_amount, client_type, created_at, status
+                FROM leads 
+                WHERE status = %s
+                ORDER BY created_at DESC
+                LIMIT %s
+            """, (status, limit))
+            
+            results = cur.fetchall()
         
         leads = []
         for result in results:
@@ -427,39 +424,35 @@ def obter_estatisticas_leads() -> Dict[str, Any]:
     try:
         logger.info("Obtendo estatísticas dos leads")
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Total de leads
-        cur.execute("SELECT COUNT(*) FROM leads")
-        total_leads = cur.fetchone()[0]
-        
-        # Leads por status
-        cur.execute("""
-            SELECT status, COUNT(*) 
-            FROM leads 
-            GROUP BY status
-        """)
-        leads_por_status = dict(cur.fetchall())
-        
-        # Leads por tipo de cliente
-        cur.execute("""
-            SELECT client_type, COUNT(*) 
-            FROM leads 
-            GROUP BY client_type
-        """)
-        leads_por_tipo = dict(cur.fetchall())
-        
-        # Leads dos últimos 30 dias
-        cur.execute("""
-            SELECT COUNT(*) 
-            FROM leads 
-            WHERE created_at >= NOW() - INTERVAL '30 days'
-        """)
-        leads_30_dias = cur.fetchone()[0]
-        
-        cur.close()
-        conn.close()
+        # Uma única conexão emprestada para as quatro consultas
+        with get_db_pool().connection() as conn, conn.cursor() as cur:
+            # Total de leads
+            cur.execute("SELECT COUNT(*) FROM leads")
+            total_leads = cur.fetchone()[0]
+            
+            # Leads por status
+            cur.execute("""
+                SELECT status, COUNT(*) 
+                FROM leads 
+                GROUP BY status
+            """)
+            leads_por_status = dict(cur.fetchall())
+            
+            # Leads por tipo de cliente
+            cur.execute("""
+                SELECT client_type, COUNT(*) 
+                FROM leads 
+                GROUP BY client_type
+            """)
+            leads_por_tipo = dict(cur.fetchall())
+            
+            # Leads dos últimos 30 dias
+            cur.execute("""
+                SELECT COUNT(*) 
+                FROM leads 
+                WHERE created_at >= NOW() - INTERVAL '30 days'
+            """)
+            leads_30_dias = cur.fetchone()[0]
         
         stats = {
             "total_leads": total_leads,
@@ -0,0 +1,420 @@
+# =============================================================================
+# SERENA SDR - SUPABASE QUERIES
+# =============================================================================
+
+"""
+Supabase Queries Module
+
+Camada de SQL parametrizado usada pelas ferramentas do Supabase.
+
+Todas as queries são templates estáveis com parâmetros nomeados
+(`%(nome)s`). Elas podem ser executadas de duas formas:
+
+- Via MCP Server: o `execute_sql` do Supabase MCP recebe apenas texto, então
+  os valores são convertidos em literais com escape centralizado em
+  render_query (nunca por concatenação manual em cada ferramenta).
+- Direto no Postgres (psycopg2), com conexões emprestadas do pool
+  compartilhado (db_pool): as queries quentes (busca de lead, inserção de
+  mensagem, atualização da última mensagem) usam prepared statements no
+  servidor (PREPARE/EXECUTE), preparados uma vez por conexão do pool.
+
+Author: Serena SDR System
+Version: 1.0.0
+Created: 2026-10-17
+"""
+
+import os
+import re
+import json
+import math
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Any, Optional, Set, Tuple
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from .db_pool import DatabasePool, get_db_pool
+
+logger = logging.getLogger(__name__)
+
+PARAM_PATTERN = re.compile(r"%\((\w+)\)s")
+
+
+@dataclass(frozen=True)
+class SQLQuery:
+    """Template de query com parâmetros nomeados no formato %(nome)s."""
+    
+    name: str
+    text: str
+    prepared: bool = False
+    
+    @property
+    def param_names(self) -> Tuple[str, ...]:
+        """Nomes dos parâmetros na ordem da primeira ocorrência."""
+        names = []
+        for name in PARAM_PATTERN.findall(self.text):
+            if name not in names:
+                names.append(name)
+        return tuple(names)
+    
+    def positional_text(self) -> str:
+        """Texto da query com parâmetros posicionais ($1, $2...) para PREPARE."""
+        positions = {name: index + 1 for index, name in enumerate(self.param_names)}
+        return PARAM_PATTERN.sub(lambda match: f"${positions[match.group(1)]}", self.text)
+
+
+def quote_literal(value: Any) -> str:
+    """
+    Converte um valor Python em literal SQL com escape.
+    
+    Args:
+        value: Valor a converter
+    
+    Returns:
+        str: Literal SQL
+    """
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, int):
+        return str(int(value))
+    if isinstance(value, (float, Decimal)):
+        if isinstance(value, float) and not math.isfinite(value):
+            raise ValueError(f"Valor numérico inválido: {value}")
+        return str(value)
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False, default=str)
+    elif isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    
+    text = str(value)
+    if "\x00" in text:
+        raise ValueError("Texto com caractere nulo não é permitido")
+    
+    return "'" + text.replace("'", "''") + "'"
+
+
+def render_query(query: SQLQuery, params: Dict[str, Any] = None) -> str:
+    """
+    Gera o texto final da query para envio ao MCP Server.
+    
+    Args:
+        query: Template da query
+        params: Valores dos parâmetros
+    
+    Returns:
+        str: Query com literais escapados
+    """
+    params = params or {}
+    missing = [name for name in query.param_names if name not in params]
+    if missing:
+        raise ValueError(f"Parâmetros ausentes para {query.name}: {missing}")
+    
+    return PARAM_PATTERN.sub(lambda match: quote_literal(params[match.group(1)]), query.text)
+
+
+def _adapt_param(value: Any) -> Any:
+    """Adapta valores para o psycopg2 (dict/list viram JSON)."""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+
+# =============================================================================
+# TEMPLATES
+# =============================================================================
+
+LEAD_BY_PHONE = SQLQuery(
+    name="lead_by_phone",
+    prepared=True,
+    text="""
+            SELECT * FROM leads
+            WHERE phone_number = %(phone_number)s
+            ORDER BY created_at DESC
+            LIMIT 1
+            """
+)
+
+# Upsert em uma única instrução: campos não informados (NULL) mantêm o valor
+# atual no UPDATE e recebem o padrão no INSERT. `xmax = 0` só é verdadeiro
+# para a linha recém-inserida, indicando se o lead foi criado ou atualizado.
+# invoice_amount vem do modelo muitas vezes como texto ("350.00"): o cast
+# explícito evita que o literal seja resolvido contra o tipo do padrão (0).
+UPSERT_LEAD = SQLQuery(
+    name="upsert_lead",
+    text="""
+            INSERT INTO leads (
+                phone_number, name, city, state, invoice_amount,
+                client_type, qualification_status, conversation_state, additional_data
+            ) VALUES (
+                %(phone_number)s,
+                COALESCE(%(name)s, ''),
+                COALESCE(%(city)s, ''),
+                COALESCE(%(state)s, ''),
+                COALESCE(%(invoice_amount)s::numeric, 0),
+                COALESCE(%(client_type)s, 'RESIDENTIAL'),
+                COALESCE(%(qualification_status)s, 'NEW'),
+                COALESCE(%(conversation_state)s, 'INITIAL'),
+                COALESCE(%(additional_data)s::jsonb, '{}'::jsonb)
+            )
+            ON CONFLICT (phone_number) DO UPDATE SET
+                name = COALESCE(%(name)s, leads.name),
+                city = COALESCE(%(city)s, leads.city),
+                state = COALESCE(%(state)s, leads.state),
+                invoice_amount = COALESCE(%(invoice_amount)s::numeric, leads.invoice_amount),
+                client_type = COALESCE(%(client_type)s, leads.client_type),
+                qualification_status = COALESCE(%(qualification_status)s, leads.qualification_status),
+                conversation_state = COALESCE(%(conversation_state)s, leads.conversation_state),
+                additional_data = COALESCE(%(additional_data)s::jsonb, leads.additional_data),
+                updated_at = CURRENT_TIMESTAMP
+            RETURNING *, (xmax = 0) AS inserted
+            """
+)
+
+UPDATE_CONVERSATION_STATE = SQLQuery(
+    name="update_conversation_state",
+    text="""
+            UPDATE leads
+            SET
+                conversation_state = %(state)s,
+                additional_data = additional_data || %(additional_data)s::jsonb,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE phone_number = %(phone_number)s
+            RETURNING *
+            """
+)
+
+INSERT_ENERGY_BILL = SQLQuery(
+    name="insert_energy_bill",
+    text="""
+            INSERT INTO energy_bills (lead_id, phone, image_path, extracted_data)
+            VALUES (%(lead_id)s, %(phone)s, %(image_path)s, %(extracted_data)s)
+            RETURNING *
+            """
+)
+
+INSERT_SDR_LOG = SQLQuery(
+    name="insert_sdr_log",
+    text="""
+            INSERT INTO sdr_logs (lead_id, task_name, success, message, additional_data)
+            VALUES (%(lead_id)s, %(task_name)s, %(success)s, %(message)s, %(additional_data)s::jsonb)
+            RETURNING *
+            """
+)
+
+# Histórico de mensagens (mais recentes primeiro) usado no contexto do agente
+CONVERSATION_HISTORY = SQLQuery(
+    name="conversation_history",
+    text="""
+            SELECT id, message_direction, message_content, message_type, created_at
+            FROM lead_messages
+            WHERE phone_number = %(phone_number)s
+            ORDER BY created_at DESC, id DESC
+            LIMIT %(limit)s
+            """
+)
+
+# Resumo incremental da conversa, guardado em additional_data. Só avança:
+# um resumo mais antigo (summary_until_id menor) não sobrescreve um mais novo.
+UPDATE_CONVERSATION_SUMMARY = SQLQuery(
+    name="update_conversation_summary",
+    text="""
+            UPDATE leads
+            SET additional_data = COALESCE(additional_data, '{}'::jsonb) || jsonb_build_object(
+                    'conversation_summary', %(summary)s::text,
+                    'summary_until_id', %(summary_until_id)s::bigint
+                ),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE phone_number = %(phone_number)s
+              AND COALESCE((additional_data->>'summary_until_id')::bigint, 0) < %(summary_until_id)s
+            RETURNING *
+            """
+)
+
+UPDATE_QUALIFICATION = SQLQuery(
+    name="update_qualification",
+    text="""
+            UPDATE leads
+            SET qualification_status = %(qualification_status)s,
+                invoice_amount = COALESCE(%(invoice_amount)s::numeric, invoice_amount),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE phone_number = %(phone_number)s
+            RETURNING *
+            """
+)
+
+# Idempotente pelo ID da mensagem do WhatsApp: uma retentativa da fila não
+# duplica a mensagem do usuário no histórico (respostas do bot não têm ID)
+INSERT_MESSAGE = SQLQuery(
+    name="insert_message",
+    prepared=True,
+    text="""
+            INSERT INTO lead_messages
+            (phone_number, message_direction, message_content, message_type, media_id, whatsapp_message_id)
+            VALUES (
+                %(phone_number)s,
+                %(direction)s,
+                %(content)s,
+                %(message_type)s,
+                %(media_id)s,
+                %(whatsapp_message_id)s
+            )
+            ON CONFLICT (whatsapp_message_id) WHERE whatsapp_message_id IS NOT NULL DO NOTHING
+            RETURNING id
+            """
+)
+
+UPDATE_LAST_MESSAGE = SQLQuery(
+    name="update_last_message",
+    prepared=True,
+    text="""
+            UPDATE leads
+            SET last_message_at = NOW(),
+                total_messages = COALESCE(total_messages, 0) + 1,
+                updated_at = NOW()
+            WHERE phone_number = %(phone_number)s
+            RETURNING *
+            """
+)
+
+# Query de métricas de conversação (sem parâmetros)
+CONVERSATION_METRICS = SQLQuery(
+    name="conversation_metrics",
+    text="""
+            SELECT
+                COUNT(DISTINCT phone_number) as total_leads,
+                COUNT(*) as total_messages,
+                COUNT(CASE WHEN message_direction = 'user' THEN 1 END) as user_messages,
+                COUNT(CASE WHEN message_direction = 'bot' THEN 1 END) as bot_messages,
+                COUNT(CASE WHEN created_at > NOW() - INTERVAL '24 hours' THEN 1 END) as messages_24h
+            FROM lead_messages
+            """
+)
+
+# Criação da tabela de logs do SDR
+CREATE_SDR_LOGS = SQLQuery(
+    name="create_sdr_logs",
+    text="""
+            CREATE TABLE IF NOT EXISTS sdr_logs (
+                id SERIAL PRIMARY KEY,
+                lead_id VARCHAR(255),
+                task_name VARCHAR(255),
+                success BOOLEAN,
+                message TEXT,
+                additional_data JSONB DEFAULT '{}',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+)
+
+
+# =============================================================================
+# EXECUÇÃO DIRETA (PSYCOPG2)
+# =============================================================================
+
+class PostgresQueryExecutor:
+    """Executa os templates direto no Postgres, com prepared statements nas queries quentes."""
+    
+    def __init__(self, pool: DatabasePool, use_prepared: bool = True):
+        """
+        Inicializa o executor.
+        
+        Args:
+            pool: Pool de conexões compartilhado (define o statement_timeout)
+            use_prepared: Usar PREPARE/EXECUTE nas queries marcadas como prepared
+                (desative atrás de poolers em modo transação, como o PgBouncer)
+        """
+        self.pool = pool
+        self.use_prepared = use_prepared
+        # Prepared statements por conexão do pool: (id da conexão, PID do backend)
+        # identifica a sessão mesmo se uma conexão descartada tiver o id reaproveitado
+        self._prepared: Dict[Tuple[int, int], Set[str]] = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _session_key(conn) -> Tuple[int, int]:
+        """Identifica a sessão do servidor por trás da conexão emprestada."""
+        return id(conn), conn.get_backend_pid()
+    
+    def _prepare(self, conn, cursor, query: SQLQuery):
+        """Prepara a query no servidor uma vez por conexão do pool."""
+        key = self._session_key(conn)
+        with self._lock:
+            if query.name in self._prepared.get(key, ()):
+                return
+        
+        cursor.execute(f"PREPARE {query.name} AS {query.positional_text()}")
+        with self._lock:
+            self._prepared.setdefault(key, set()).add(query.name)
+    
+    def _forget(self, conn):
+        """Esquece os prepared statements de uma conexão descartada pelo pool."""
+        with self._lock:
+            self._prepared.pop(self._session_key(conn), None)
+    
+    def _run(self, conn, query: SQLQuery, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Executa a query em uma conexão emprestada do pool."""
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                if query.prepared and self.use_prepared:
+                    self._prepare(conn, cursor, query)
+                    placeholders = ", ".join(["%s"] * len(query.param_names))
+                    values = [params[name] for name in query.param_names]
+                    statement = f"EXECUTE {query.name} ({placeholders})" if placeholders else f"EXECUTE {query.name}"
+                    cursor.execute(statement, values)
+                else:
+                    cursor.execute(query.text, params or None)
+                
+                rows = [dict(row) for row in cursor.fetchall()] if cursor.description else []
+            
+            return {"rows": rows}
+        
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # Conexão perdida: o pool a descarta junto com os prepared statements
+            self._forget(conn)
+            raise
+    
+    def execute(self, query: SQLQuery, params: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Executa a query e retorna as linhas no mesmo formato do MCP Server.
+        
+        Args:
+            query: Template da query
+            params: Valores dos parâmetros
+        
+        Returns:
+            Dict: {"rows": [...]}
+        """
+        params = {name: _adapt_param(value) for name, value in (params or {}).items()}
+        return self.pool.run(self._run, query, params)
+
+
+# Instância global do executor direto
+_executor: Optional[PostgresQueryExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_direct_executor() -> Optional[PostgresQueryExecutor]:
+    """
+    Retorna o executor direto se SUPABASE_SQL_BACKEND=postgres.
+    
+    Returns:
+        PostgresQueryExecutor ou None (usar o MCP Server)
+    """
+    global _executor
+    
+    if os.getenv('SUPABASE_SQL_BACKEND', 'mcp').lower() != 'postgres':
+        return None
+    
+    with _executor_lock:
+        if _executor is None:
+            _executor = PostgresQueryExecutor(
+                get_db_pool(),
+                use_prepared=os.getenv('SUPABASE_DB_PREPARED_STATEMENTS', 'true').lower() == 'true'
+            )
+    return _executor
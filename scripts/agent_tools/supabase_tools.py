@@ -8,6 +8,21 @@ Supabase Tools Module
 Este módulo contém todas as ferramentas para interação com o Supabase MCP Server.
 Responsável por gerenciamento de leads, logs e persistência de dados.
 
+Cada ferramenta possui uma variante assíncrona (sufixo `_async`) que usa o
+transporte MCP compartilhado e não bloqueia o event loop do webhook.
+
+As queries são templates parametrizados (supabase_queries), executados via
+MCP Server ou, com SUPABASE_SQL_BACKEND=postgres, direto no Postgres com
+prepared statements nas queries quentes.
+
+Leads lidos ou gravados passam pelo cache de leads (lead_cache), evitando
+consultas repetidas ao mesmo telefone durante o processamento de uma mensagem.
+
+As operações independentes feitas a cada mensagem recebida (buscar lead e
+histórico; registrar resposta e atualizar a última mensagem) são agrupadas em
+lotes JSON-RPC para reduzir o número de round trips ao MCP Server. O registro
+da mensagem recebida roda depois das leituras, fora do lote.
+
 Author: Serena-Coder AI Agent
 Version: 1.0.0
 Created: 2025-01-17
@@ -15,13 +30,22 @@ Created: 2025-01-17
 
 import os
 import json
+import asyncio
 import logging
-import requests
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime
 
-logger = logging.getLogger(__name__)
+from .mcp_transport import get_transport, get_async_transport, MCPBatch
+from .lead_cache import get_lead_cache
+from .supabase_queries import (
+    SQLQuery, render_query, get_direct_executor,
+    LEAD_BY_PHONE, UPSERT_LEAD, UPDATE_CONVERSATION_STATE,
+    INSERT_ENERGY_BILL, INSERT_SDR_LOG, CONVERSATION_HISTORY, UPDATE_QUALIFICATION,
+    INSERT_MESSAGE, UPDATE_LAST_MESSAGE, CONVERSATION_METRICS, CREATE_SDR_LOGS,
+    UPDATE_CONVERSATION_SUMMARY
+)
 
+logger = logging.getLogger(__name__)
 
 class SupabaseTools:
     """Ferramentas para interação com Supabase via MCP."""
@@ -35,6 +59,15 @@ class SupabaseTools:
         # Configurar timeout e retries
         self.timeout = 30
         self.max_retries = 3
+        
+        # A tabela sdr_logs só precisa ser garantida uma vez por instância
+        self._sdr_logs_table_ready = False
+        
+        # Cache de leads compartilhado pelo processo (write-through)
+        self.lead_cache = get_lead_cache()
+        
+        # Execução direta no Postgres (None = via MCP Server)
+        self.db = get_direct_executor()
     
     def _make_mcp_request(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -43,38 +76,216 @@ class SupabaseTools:
         Args:
             method: Método MCP (tools/call)
             params: Parâmetros da requisição
-            
+        
+        Returns:
+            Dict: Resposta do MCP Server
+        """
+        return get_transport().request(
+            self.mcp_url,
+            method,
+            params,
+            timeout=self.timeout,
+            max_retries=self.max_retries
+        )
+    
+    async def _make_mcp_request_async(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Faz requisição assíncrona para o MCP Server do Supabase.
+        
+        Args:
+            method: Método MCP (tools/call)
+            params: Parâmetros da requisição
+        
         Returns:
             Dict: Resposta do MCP Server
         """
-        payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": method,
-            "params": params
+        return await get_async_transport().request(
+            self.mcp_url,
+            method,
+            params,
+            timeout=self.timeout,
+            max_retries=self.max_retries
+        )
+    
+    def _sql_call(self, query: SQLQuery, params: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Parâmetros de uma chamada execute_sql."""
+        return {
+            "name": "execute_sql",
+            "arguments": {"query": render_query(query, params)}
         }
+    
+    def _execute_sql(self, query: SQLQuery, params: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Executa um template de query (direto no Postgres ou via MCP).
+        
+        Args:
+            query: Template da query
+            params: Valores dos parâmetros
+        
+        Returns:
+            Dict: Resultado no formato {"rows": [...]}
+        """
+        if self.db is not None:
+            return self.db.execute(query, params)
+        
+        return self._make_mcp_request("tools/call", self._sql_call(query, params))
+    
+    async def _execute_sql_async(self, query: SQLQuery, params: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Executa um template de query (versão async).
+        
+        Args:
+            query: Template da query
+            params: Valores dos parâmetros
+        
+        Returns:
+            Dict: Resultado no formato {"rows": [...]}
+        """
+        if self.db is not None:
+            return await asyncio.to_thread(self.db.execute, query, params)
+        
+        return await self._make_mcp_request_async("tools/call", self._sql_call(query, params))
+    
+    def _execute_many(self, calls: List[Tuple[SQLQuery, Dict[str, Any]]]) -> List[Any]:
+        """
+        Executa várias queries independentes (lote MCP ou sequência na conexão direta).
+        
+        Args:
+            calls: Lista de (template, parâmetros)
+        
+        Returns:
+            List: Resultado de cada query na ordem (erros retornam como exceções)
+        """
+        if self.db is not None:
+            results = []
+            for query, params in calls:
+                try:
+                    results.append(self.db.execute(query, params))
+                except Exception as e:
+                    results.append(e)
+            return results
+        
+        batch = self.new_batch()
+        for query, params in calls:
+            batch.add("tools/call", self._sql_call(query, params))
+        return batch.execute()
+    
+    async def _execute_many_async(self, calls: List[Tuple[SQLQuery, Dict[str, Any]]]) -> List[Any]:
+        """
+        Executa várias queries independentes (versão async).
+        
+        Args:
+            calls: Lista de (template, parâmetros)
+        
+        Returns:
+            List: Resultado de cada query na ordem (erros retornam como exceções)
+        """
+        if self.db is not None:
+            return await asyncio.to_thread(self._execute_many, calls)
+        
+        batch = self.new_batch()
+        for query, params in calls:
+            batch.add("tools/call", self._sql_call(query, params))
+        return await batch.execute_async()
+    
+    def new_batch(self) -> MCPBatch:
+        """
+        Cria um lote de chamadas para o MCP Server do Supabase.
         
-        for attempt in range(self.max_retries):
-            try:
-                response = requests.post(
-                    f"{self.mcp_url}/mcp",
-                    json=payload,
-                    headers={"Content-Type": "application/json"},
-                    timeout=self.timeout
-                )
-                response.raise_for_status()
-                
-                result = response.json()
-                if "error" in result:
-                    raise Exception(f"MCP Error: {result['error']}")
-                
-                return result.get("result", {})
-                
-            except Exception as e:
-                logger.error(f"Tentativa {attempt + 1} falhou: {str(e)}")
-                if attempt == self.max_retries - 1:
-                    raise
-                continue
+        Returns:
+            MCPBatch: Lote vazio (use add() e execute()/execute_async())
+        """
+        return MCPBatch(self.mcp_url, timeout=self.timeout, max_retries=self.max_retries)
+    
+    # =========================================================================
+    # CONSTRUÇÃO DE QUERIES
+    # =========================================================================
+    
+    def _lead_by_phone_query(self, phone_number: str) -> Tuple[SQLQuery, Dict[str, Any]]:
+        """Query de busca de lead por telefone."""
+        return LEAD_BY_PHONE, {"phone_number": phone_number}
+    
+    def _upsert_lead_query(self, lead_data: Dict[str, Any]) -> Tuple[SQLQuery, Dict[str, Any]]:
+        """Query de upsert do lead (campos ausentes preservam o valor atual)."""
+        return UPSERT_LEAD, {
+            "phone_number": lead_data.get('phone_number'),
+            "name": lead_data.get('name'),
+            "city": lead_data.get('city'),
+            "state": lead_data.get('state'),
+            "invoice_amount": lead_data.get('invoice_amount'),
+            "client_type": lead_data.get('client_type'),
+            "qualification_status": lead_data.get('qualification_status'),
+            "conversation_state": lead_data.get('conversation_state'),
+            "additional_data": lead_data.get('additional_data')
+        }
+    
+    def _conversation_state_query(self, phone_number: str, state: str, additional_data: Dict[str, Any] = None) -> Tuple[SQLQuery, Dict[str, Any]]:
+        """Query de atualização do estado da conversa."""
+        return UPDATE_CONVERSATION_STATE, {
+            "phone_number": phone_number,
+            "state": state,
+            "additional_data": additional_data or {}
+        }
+    
+    def _energy_bill_query(self, lead_id: int, phone: str, image_path: str, extracted_data: str) -> Tuple[SQLQuery, Dict[str, Any]]:
+        """Query de inserção de conta de energia."""
+        return INSERT_ENERGY_BILL, {
+            "lead_id": lead_id,
+            "phone": phone,
+            "image_path": image_path,
+            "extracted_data": extracted_data
+        }
+    
+    def _sdr_log_query(self, lead_id: str, task_name: str, success: bool, message: str, additional_data: Dict[str, Any] = None) -> Tuple[SQLQuery, Dict[str, Any]]:
+        """Query de inserção de log do SDR."""
+        return INSERT_SDR_LOG, {
+            "lead_id": lead_id,
+            "task_name": task_name,
+            "success": success,
+            "message": message,
+            "additional_data": additional_data or {}
+        }
+    
+    def _conversation_history_query(self, phone_number: str, limit: int) -> Tuple[SQLQuery, Dict[str, Any]]:
+        """Query de histórico de conversas."""
+        return CONVERSATION_HISTORY, {"phone_number": phone_number, "limit": int(limit)}
+    
+    def _conversation_summary_query(self, phone_number: str, summary: str, summary_until_id: int) -> Tuple[SQLQuery, Dict[str, Any]]:
+        """Query de atualização do resumo incremental da conversa."""
+        return UPDATE_CONVERSATION_SUMMARY, {
+            "phone_number": phone_number,
+            "summary": summary,
+            "summary_until_id": int(summary_until_id)
+        }
+    
+    def _qualification_query(self, phone_number: str, qualification_status: str, invoice_amount: float = None) -> Tuple[SQLQuery, Dict[str, Any]]:
+        """Query de atualização da qualificação (invoice_amount opcional)."""
+        return UPDATE_QUALIFICATION, {
+            "phone_number": phone_number,
+            "qualification_status": qualification_status,
+            "invoice_amount": invoice_amount
+        }
+    
+    def _record_message_query(self, phone_number: str, direction: str, content: str,
+                              message_type: str = 'text', media_id: str = None,
+                              whatsapp_message_id: str = None) -> Tuple[SQLQuery, Dict[str, Any]]:
+        """Query de inserção de mensagem no histórico (idempotente pelo ID do WhatsApp)."""
+        return INSERT_MESSAGE, {
+            "phone_number": phone_number,
+            "direction": direction,
+            "content": content or '',
+            "message_type": message_type,
+            "media_id": media_id or None,
+            "whatsapp_message_id": whatsapp_message_id or None
+        }
+    
+    def _last_message_query(self, phone_number: str) -> Tuple[SQLQuery, Dict[str, Any]]:
+        """Query de atualização da última mensagem."""
+        return UPDATE_LAST_MESSAGE, {"phone_number": phone_number}
+    
+    # =========================================================================
+    # FERRAMENTAS SÍNCRONAS
+    # =========================================================================
     
     def get_lead_by_phone(self, phone_number: str) -> Optional[Dict[str, Any]]:
         """
@@ -82,28 +293,23 @@ class SupabaseTools:
         
         Args:
             phone_number: Número de telefone do lead
-            
+        
         Returns:
             Dict: Dados do lead ou None se não encontrado
         """
+        cached_lead = self.lead_cache.get(phone_number)
+        if cached_lead is not None:
+            return cached_lead
+        
         try:
-            query = f"""
-            SELECT * FROM leads 
-            WHERE phone_number = '{phone_number}'
-            ORDER BY created_at DESC 
-            LIMIT 1
-            """
-            
-            result = self._make_mcp_request("tools/call", {
-                "name": "execute_sql",
-                "arguments": {"query": query}
-            })
+            result = self._execute_sql(*self._lead_by_phone_query(phone_number))
             
             if result and "rows" in result and len(result["rows"]) > 0:
+                self.lead_cache.set(phone_number, result["rows"][0])
                 return result["rows"][0]
             
             return None
-            
+        
         except Exception as e:
             logger.error(f"Erro ao buscar lead por telefone: {str(e)}")
             return None
@@ -114,7 +320,7 @@ class SupabaseTools:
         
         Args:
             lead_data: Dados do lead
-            
+        
         Returns:
             Dict: Resultado da operação
         """
@@ -123,59 +329,21 @@ class SupabaseTools:
             if not phone_number:
                 raise ValueError("phone_number é obrigatório")
             
-            # Verificar se lead já existe
-            existing_lead = self.get_lead_by_phone(phone_number)
-            
-            if existing_lead:
-                # Atualizar lead existente
-                query = f"""
-                UPDATE leads 
-                SET 
-                    name = '{lead_data.get('name', existing_lead.get('name', ''))}',
-                    city = '{lead_data.get('city', existing_lead.get('city', ''))}',
-                    state = '{lead_data.get('state', existing_lead.get('state', ''))}',
-                    invoice_amount = {lead_data.get('invoice_amount', existing_lead.get('invoice_amount', 0))},
-                    client_type = '{lead_data.get('client_type', existing_lead.get('client_type', 'RESIDENTIAL'))}',
-                    qualification_status = '{lead_data.get('qualification_status', existing_lead.get('qualification_status', 'NEW'))}',
-                    conversation_state = '{lead_data.get('conversation_state', existing_lead.get('conversation_state', 'INITIAL'))}',
-                    additional_data = '{json.dumps(lead_data.get('additional_data', {}))}'::jsonb,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE phone_number = '{phone_number}'
-                RETURNING *
-                """
-            else:
-                # Criar novo lead
-                query = f"""
-                INSERT INTO leads (
-                    phone_number, name, city, state, invoice_amount, 
-                    client_type, qualification_status, conversation_state, additional_data
-                ) VALUES (
-                    '{phone_number}',
-                    '{lead_data.get('name', '')}',
-                    '{lead_data.get('city', '')}',
-                    '{lead_data.get('state', '')}',
-                    {lead_data.get('invoice_amount', 0)},
-                    '{lead_data.get('client_type', 'RESIDENTIAL')}',
-                    '{lead_data.get('qualification_status', 'NEW')}',
-                    '{lead_data.get('conversation_state', 'INITIAL')}',
-                    '{json.dumps(lead_data.get('additional_data', {}))}'::jsonb
-                ) RETURNING *
-                """
-            
-            result = self._make_mcp_request("tools/call", {
-                "name": "execute_sql",
-                "arguments": {"query": query}
-            })
+            # Upsert em uma única instrução (sem consulta prévia)
+            result = self._execute_sql(*self._upsert_lead_query(lead_data))
             
             if result and "rows" in result and len(result["rows"]) > 0:
+                lead = result["rows"][0]
+                inserted = lead.pop("inserted", False)
+                self.lead_cache.set(phone_number, lead)
                 return {
                     "success": True,
-                    "lead": result["rows"][0],
-                    "action": "updated" if existing_lead else "created"
+                    "lead": lead,
+                    "action": "created" if inserted else "updated"
                 }
             
             return {"success": False, "error": "Falha ao salvar lead"}
-            
+        
         except Exception as e:
             logger.error(f"Erro ao criar/atualizar lead: {str(e)}")
             return {"success": False, "error": str(e)}
@@ -188,37 +356,22 @@ class SupabaseTools:
             phone_number: Número do telefone
             state: Novo estado da conversa
             additional_data: Dados adicionais para atualizar
-            
+        
         Returns:
             Dict: Resultado da atualização
         """
         try:
-            # Preparar dados adicionais
-            additional_json = json.dumps(additional_data or {})
-            
-            query = f"""
-            UPDATE leads 
-            SET 
-                conversation_state = '{state}',
-                additional_data = additional_data || '{additional_json}'::jsonb,
-                updated_at = CURRENT_TIMESTAMP
-            WHERE phone_number = '{phone_number}'
-            RETURNING *
-            """
-            
-            result = self._make_mcp_request("tools/call", {
-                "name": "execute_sql",
-                "arguments": {"query": query}
-            })
+            result = self._execute_sql(*self._conversation_state_query(phone_number, state, additional_data))
             
             if result and "rows" in result and len(result["rows"]) > 0:
+                self.lead_cache.set(phone_number, result["rows"][0])
                 return {
                     "success": True,
                     "lead": result["rows"][0]
                 }
             
             return {"success": False, "error": "Lead não encontrado"}
-            
+        
         except Exception as e:
             logger.error(f"Erro ao atualizar estado da conversa: {str(e)}")
             return {"success": False, "error": str(e)}
@@ -232,21 +385,12 @@ class SupabaseTools:
             phone: Número do telefone
             image_path: Caminho da imagem
             extracted_data: Dados extraídos da imagem
-            
+        
         Returns:
             Dict: Resultado da operação
         """
         try:
-            query = f"""
-            INSERT INTO energy_bills (lead_id, phone, image_path, extracted_data)
-            VALUES ({lead_id}, '{phone}', '{image_path}', '{extracted_data}')
-            RETURNING *
-            """
-            
-            result = self._make_mcp_request("tools/call", {
-                "name": "execute_sql",
-                "arguments": {"query": query}
-            })
+            result = self._execute_sql(*self._energy_bill_query(lead_id, phone, image_path, extracted_data))
             
             if result and "rows" in result and len(result["rows"]) > 0:
                 return {
@@ -255,7 +399,7 @@ class SupabaseTools:
                 }
             
             return {"success": False, "error": "Falha ao salvar conta de energia"}
-            
+        
         except Exception as e:
             logger.error(f"Erro ao salvar conta de energia: {str(e)}")
             return {"success": False, "error": str(e)}
@@ -270,41 +414,18 @@ class SupabaseTools:
             success: Se a tarefa foi bem-sucedida
             message: Mensagem de log
             additional_data: Dados adicionais
-            
+        
         Returns:
             Dict: Resultado da operação
         """
         try:
-            # Criar tabela de logs se não existir
-            create_table_query = """
-            CREATE TABLE IF NOT EXISTS sdr_logs (
-                id SERIAL PRIMARY KEY,
-                lead_id VARCHAR(255),
-                task_name VARCHAR(255),
-                success BOOLEAN,
-                message TEXT,
-                additional_data JSONB DEFAULT '{}',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """
-            
-            self._make_mcp_request("tools/call", {
-                "name": "execute_sql",
-                "arguments": {"query": create_table_query}
-            })
+            # Criar tabela de logs se não existir (uma vez por instância)
+            if not self._sdr_logs_table_ready:
+                self._execute_sql(CREATE_SDR_LOGS)
+                self._sdr_logs_table_ready = True
             
             # Inserir log
-            additional_json = json.dumps(additional_data or {})
-            insert_query = f"""
-            INSERT INTO sdr_logs (lead_id, task_name, success, message, additional_data)
-            VALUES ('{lead_id}', '{task_name}', {success}, '{message}', '{additional_json}'::jsonb)
-            RETURNING *
-            """
-            
-            result = self._make_mcp_request("tools/call", {
-                "name": "execute_sql",
-                "arguments": {"query": insert_query}
-            })
+            result = self._execute_sql(*self._sdr_log_query(lead_id, task_name, success, message, additional_data))
             
             if result and "rows" in result and len(result["rows"]) > 0:
                 return {
@@ -313,7 +434,7 @@ class SupabaseTools:
                 }
             
             return {"success": False, "error": "Falha ao salvar log"}
-            
+        
         except Exception as e:
             logger.error(f"Erro ao salvar log SDR: {str(e)}")
             return {"success": False, "error": str(e)}
@@ -325,32 +446,50 @@ class SupabaseTools:
         Args:
             phone_number: Número do telefone
             limit: Limite de registros
-            
+        
         Returns:
             List: Histórico de conversas
         """
         try:
-            query = f"""
-            SELECT * FROM sdr_logs 
-            WHERE lead_id = '{phone_number}'
-            ORDER BY created_at DESC 
-            LIMIT {limit}
-            """
-            
-            result = self._make_mcp_request("tools/call", {
-                "name": "execute_sql",
-                "arguments": {"query": query}
-            })
+            result = self._execute_sql(*self._conversation_history_query(phone_number, limit))
             
             if result and "rows" in result:
                 return result["rows"]
             
             return []
-            
+        
         except Exception as e:
             logger.error(f"Erro ao buscar histórico: {str(e)}")
             return []
     
+    def update_conversation_summary(self, phone_number: str, summary: str, summary_until_id: int) -> Dict[str, Any]:
+        """
+        Grava o resumo incremental da conversa no lead (additional_data).
+        
+        Args:
+            phone_number: Número do telefone
+            summary: Resumo das mensagens que saíram da janela do agente
+            summary_until_id: ID da última mensagem (lead_messages) incluída no resumo
+        
+        Returns:
+            Dict: Resultado da atualização
+        """
+        try:
+            result = self._execute_sql(*self._conversation_summary_query(phone_number, summary, summary_until_id))
+            
+            if result and "rows" in result and len(result["rows"]) > 0:
+                self.lead_cache.set(phone_number, result["rows"][0])
+                return {
+                    "success": True,
+                    "lead": result["rows"][0]
+                }
+            
+            return {"success": False, "error": "Lead não encontrado ou resumo mais recente já gravado"}
+        
+        except Exception as e:
+            logger.error(f"Erro ao atualizar resumo da conversa: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
     def update_lead_qualification(self, phone_number: str, qualification_status: str, invoice_amount: float = None) -> Dict[str, Any]:
         """
         Atualiza qualificação do lead.
@@ -359,45 +498,28 @@ class SupabaseTools:
             phone_number: Número do telefone
             qualification_status: Status da qualificação
             invoice_amount: Valor da conta (opcional)
-            
+        
         Returns:
             Dict: Resultado da atualização
         """
         try:
-            # Construir query dinamicamente
-            update_fields = [f"qualification_status = '{qualification_status}'"]
-            
-            if invoice_amount is not None:
-                update_fields.append(f"invoice_amount = {invoice_amount}")
-            
-            update_fields.append("updated_at = CURRENT_TIMESTAMP")
-            
-            query = f"""
-            UPDATE leads 
-            SET {', '.join(update_fields)}
-            WHERE phone_number = '{phone_number}'
-            RETURNING *
-            """
-            
-            result = self._make_mcp_request("tools/call", {
-                "name": "execute_sql",
-                "arguments": {"query": query}
-            })
+            result = self._execute_sql(*self._qualification_query(phone_number, qualification_status, invoice_amount))
             
             if result and "rows" in result and len(result["rows"]) > 0:
+                self.lead_cache.set(phone_number, result["rows"][0])
                 return {
                     "success": True,
                     "lead": result["rows"][0]
                 }
             
             return {"success": False, "error": "Lead não encontrado"}
-            
+        
         except Exception as e:
             logger.error(f"Erro ao atualizar qualificação: {str(e)}")
             return {"success": False, "error": str(e)}
     
-    async def record_message(self, phone_number: str, direction: str, content: str, 
-                           message_type: str = 'text', media_id: str = None) -> bool:
+    def record_message(self, phone_number: str, direction: str, content: str,
+                       message_type: str = 'text', media_id: str = None) -> bool:
         """
         Registra mensagem no histórico de conversa.
         
@@ -407,129 +529,516 @@ class SupabaseTools:
             content: Conteúdo da mensagem
             message_type: Tipo da mensagem
             media_id: ID da mídia se houver
-            
+        
         Returns:
             bool: True se registrou com sucesso
         """
         try:
             logger.debug(f"Registrando mensagem: {phone_number} ({direction})")
             
-            # Escapar conteúdo
-            safe_content = content.replace("'", "''") if content else ''
-            
-            query = f"""
-            INSERT INTO lead_messages 
-            (phone_number, message_direction, message_content, message_type, media_id) 
-            VALUES (
-                '{phone_number}',
-                '{direction}',
-                '{safe_content}',
-                '{message_type}',
-                {f"'{media_id}'" if media_id else 'NULL'}
-            ) RETURNING id
-            """
-            
-            result = self._make_mcp_request("tools/call", {
-                "name": "execute_sql",
-                "arguments": {"query": query}
-            })
+            result = self._execute_sql(*self._record_message_query(phone_number, direction, content, message_type, media_id))
             
             return bool(result and "rows" in result)
-            
+        
         except Exception as e:
             logger.error(f"Erro ao registrar mensagem: {str(e)}")
             return False
     
-    async def update_lead_last_message(self, phone_number: str) -> bool:
+    def update_lead_last_message(self, phone_number: str) -> bool:
         """
         Atualiza timestamp da última mensagem.
         
         Args:
             phone_number: Número do telefone
-            
+        
         Returns:
             bool: True se atualizou
         """
         try:
-            query = f"""
-            UPDATE leads 
-            SET last_message_at = NOW(), 
-                total_messages = COALESCE(total_messages, 0) + 1,
-                updated_at = NOW()
-            WHERE phone_number = '{phone_number}'
-            RETURNING id
-            """
-            
-            result = self._make_mcp_request("tools/call", {
-                "name": "execute_sql",
-                "arguments": {"query": query}
-            })
+            result = self._execute_sql(*self._last_message_query(phone_number))
             
-            return bool(result and "rows" in result)
+            if result and result.get("rows"):
+                self.lead_cache.set(phone_number, result["rows"][0])
             
+            return bool(result and "rows" in result)
+        
         except Exception as e:
             logger.error(f"Erro ao atualizar última mensagem: {str(e)}")
             return False
     
-    async def get_lead_by_phone(self, phone_number: str) -> Optional[Dict[str, Any]]:
+    def get_conversation_metrics(self) -> Dict[str, Any]:
         """
-        Busca lead pelo telefone (versão async).
+        Busca métricas de conversação.
+        
+        Returns:
+            Dict com métricas
+        """
+        try:
+            result = self._execute_sql(CONVERSATION_METRICS)
+            
+            return result["rows"][0] if result and "rows" in result else {}
+        
+        except Exception as e:
+            logger.error(f"Erro ao buscar métricas: {str(e)}")
+            return {}
+    
+    # =========================================================================
+    # OPERAÇÕES EM LOTE
+    # =========================================================================
+    
+    def _message_context_calls(self, phone_number: str, history_limit: int = 10,
+                               cached_lead: Optional[Dict[str, Any]] = None):
+        """
+        Monta as leituras de entrada (histórico e lead), independentes entre si.
+        
+        O registro da mensagem fica fora do lote: a ordem de execução dentro
+        dele não é garantida e o histórico poderia ou não incluir a mensagem
+        recém-inserida.
+        """
+        calls = [self._conversation_history_query(phone_number, history_limit)]
+        indexes = {"history": 0}
+        
+        # Lead em cache dispensa a consulta
+        if cached_lead is None:
+            indexes["lead"] = len(calls)
+            calls.append(self._lead_by_phone_query(phone_number))
+        
+        return calls, indexes
+    
+    def _message_context_result(self, results: List[Any], indexes: Dict[str, int],
+                                cached_lead: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Converte as respostas das queries de entrada (quem chama grava o lead no cache)."""
+        for name, index in indexes.items():
+            if isinstance(results[index], Exception):
+                logger.error(f"Erro no lote de contexto ({name}): {str(results[index])}")
+        
+        message = results[indexes["message"]]
+        history = results[indexes["history"]]
+        lead = cached_lead
+        
+        if "lead" in indexes:
+            lead_result = results[indexes["lead"]]
+            if not isinstance(lead_result, Exception) and lead_result and lead_result.get("rows"):
+                lead = lead_result["rows"][0]
+        
+        return {
+            "message_recorded": not isinstance(message, Exception) and bool(message and "rows" in message),
+            "lead": lead,
+            "history": history["rows"] if not isinstance(history, Exception) and history and "rows" in history else []
+        }
+    
+    def _bot_reply_calls(self, phone_number: str, content: str):
+        """Monta as queries de saída: registrar resposta e atualizar última mensagem."""
+        calls = [
+            self._record_message_query(phone_number, 'bot', content),
+            self._last_message_query(phone_number)
+        ]
+        return calls, {"message": 0, "last_message": 1}
+    
+    def _bot_reply_result(self, results: List[Any], indexes: Dict[str, int]) -> Tuple[Dict[str, bool], Optional[Dict[str, Any]]]:
+        """Converte as respostas das queries de saída (status e lead atualizado, para o cache)."""
+        status = {}
+        for name, index in indexes.items():
+            result = results[index]
+            if isinstance(result, Exception):
+                logger.error(f"Erro no lote de resposta ({name}): {str(result)}")
+            status[name] = not isinstance(result, Exception) and bool(result and "rows" in result)
+        
+        last_message = results[indexes["last_message"]]
+        lead = last_message["rows"][0] if status["last_message"] and last_message["rows"] else None
+        
+        return {
+            "message_recorded": status["message"],
+            "last_message_updated": status["last_message"]
+        }, lead
+    
+    def load_message_context(self, phone_number: str, content: str, message_type: str = 'text',
+                             media_id: str = None, history_limit: int = 10,
+                             whatsapp_message_id: str = None) -> Dict[str, Any]:
+        """
+        Carrega lead e histórico em um único lote e depois registra a mensagem recebida.
+        
+        O histórico retornado não inclui a mensagem atual.
         
         Args:
             phone_number: Número do telefone
+            content: Conteúdo da mensagem do usuário
+            message_type: Tipo da mensagem
+            media_id: ID da mídia se houver
+            history_limit: Limite de registros do histórico
+            whatsapp_message_id: ID da mensagem no WhatsApp (registro idempotente)
+        
+        Returns:
+            Dict: message_recorded, lead (ou None) e history
+        """
+        try:
+            cached_lead = self.lead_cache.get(phone_number)
+            calls, indexes = self._message_context_calls(phone_number, history_limit, cached_lead)
+            results = self._execute_many(calls)
+            
+            # Histórico lido antes do registro: não contém a mensagem atual
+            indexes["message"] = len(results)
+            results += self._execute_many([
+                self._record_message_query(phone_number, 'user', content, message_type, media_id, whatsapp_message_id)
+            ])
             
+            context = self._message_context_result(results, indexes, cached_lead)
+            if cached_lead is None and context["lead"] is not None:
+                self.lead_cache.set(phone_number, context["lead"])
+            return context
+        
+        except Exception as e:
+            logger.error(f"Erro ao carregar contexto da mensagem: {str(e)}")
+            return {"message_recorded": False, "lead": None, "history": []}
+    
+    def record_bot_reply(self, phone_number: str, content: str) -> Dict[str, bool]:
+        """
+        Registra a resposta do bot e atualiza a última mensagem em um único lote.
+        
+        Args:
+            phone_number: Número do telefone
+            content: Conteúdo da resposta
+        
+        Returns:
+            Dict: message_recorded e last_message_updated
+        """
+        try:
+            calls, indexes = self._bot_reply_calls(phone_number, content)
+            status, lead = self._bot_reply_result(self._execute_many(calls), indexes)
+            if lead is not None:
+                self.lead_cache.set(phone_number, lead)
+            return status
+        
+        except Exception as e:
+            logger.error(f"Erro ao registrar resposta do bot: {str(e)}")
+            return {"message_recorded": False, "last_message_updated": False}
+    
+    # =========================================================================
+    # FERRAMENTAS ASSÍNCRONAS
+    # =========================================================================
+    
+    async def get_lead_by_phone_async(self, phone_number: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca lead pelo telefone (versão async).
+        
+        Args:
+            phone_number: Número do telefone
+        
         Returns:
             Dict com dados do lead ou None
         """
+        cached_lead = await self.lead_cache.get_async(phone_number)
+        if cached_lead is not None:
+            return cached_lead
+        
         try:
-            query = f"SELECT * FROM leads WHERE phone_number = '{phone_number}' LIMIT 1"
-            
-            result = self._make_mcp_request("tools/call", {
-                "name": "execute_sql", 
-                "arguments": {"query": query}
-            })
+            result = await self._execute_sql_async(*self._lead_by_phone_query(phone_number))
             
             if result and "rows" in result and len(result["rows"]) > 0:
+                await self.lead_cache.set_async(phone_number, result["rows"][0])
                 return result["rows"][0]
             
             return None
-            
+        
         except Exception as e:
             logger.error(f"Erro ao buscar lead: {str(e)}")
             return None
     
-    async def create_or_update_lead(self, lead_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def create_or_update_lead_async(self, lead_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Cria ou atualiza lead (versão async).
+        
+        Args:
+            lead_data: Dados do lead
+        
+        Returns:
+            Dict: Resultado da operação
         """
-        # Chamar método síncrono existente
-        return self.create_or_update_lead(lead_data)
+        try:
+            phone_number = lead_data.get('phone_number')
+            if not phone_number:
+                raise ValueError("phone_number é obrigatório")
+            
+            # Upsert em uma única instrução (sem consulta prévia)
+            result = await self._execute_sql_async(*self._upsert_lead_query(lead_data))
+            
+            if result and "rows" in result and len(result["rows"]) > 0:
+                lead = result["rows"][0]
+                inserted = lead.pop("inserted", False)
+                await self.lead_cache.set_async(phone_number, lead)
+                return {
+                    "success": True,
+                    "lead": lead,
+                    "action": "created" if inserted else "updated"
+                }
+            
+            return {"success": False, "error": "Falha ao salvar lead"}
+        
+        except Exception as e:
+            logger.error(f"Erro ao criar/atualizar lead: {str(e)}")
+            return {"success": False, "error": str(e)}
     
-    async def get_conversation_metrics(self) -> Dict[str, Any]:
+    async def update_lead_conversation_state_async(self, phone_number: str, state: str, additional_data: Dict[str, Any] = None) -> Dict[str, Any]:
         """
-        Busca métricas de conversação.
+        Atualiza estado da conversa do lead (versão async).
+        
+        Args:
+            phone_number: Número do telefone
+            state: Novo estado da conversa
+            additional_data: Dados adicionais para atualizar
+        
+        Returns:
+            Dict: Resultado da atualização
+        """
+        try:
+            result = await self._execute_sql_async(*self._conversation_state_query(phone_number, state, additional_data))
+            
+            if result and "rows" in result and len(result["rows"]) > 0:
+                await self.lead_cache.set_async(phone_number, result["rows"][0])
+                return {
+                    "success": True,
+                    "lead": result["rows"][0]
+                }
+            
+            return {"success": False, "error": "Lead não encontrado"}
+        
+        except Exception as e:
+            logger.error(f"Erro ao atualizar estado da conversa: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
+    async def save_energy_bill_async(self, lead_id: int, phone: str, image_path: str, extracted_data: str) -> Dict[str, Any]:
+        """
+        Salva dados de conta de energia processada (versão async).
+        
+        Args:
+            lead_id: ID do lead
+            phone: Número do telefone
+            image_path: Caminho da imagem
+            extracted_data: Dados extraídos da imagem
+        
+        Returns:
+            Dict: Resultado da operação
+        """
+        try:
+            result = await self._execute_sql_async(*self._energy_bill_query(lead_id, phone, image_path, extracted_data))
+            
+            if result and "rows" in result and len(result["rows"]) > 0:
+                return {
+                    "success": True,
+                    "energy_bill": result["rows"][0]
+                }
+            
+            return {"success": False, "error": "Falha ao salvar conta de energia"}
+        
+        except Exception as e:
+            logger.error(f"Erro ao salvar conta de energia: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
+    async def log_sdr_activity_async(self, lead_id: str, task_name: str, success: bool, message: str, additional_data: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Registra atividade do SDR no log (versão async).
+        
+        Args:
+            lead_id: ID do lead
+            task_name: Nome da tarefa
+            success: Se a tarefa foi bem-sucedida
+            message: Mensagem de log
+            additional_data: Dados adicionais
+        
+        Returns:
+            Dict: Resultado da operação
+        """
+        try:
+            if not self._sdr_logs_table_ready:
+                await self._execute_sql_async(CREATE_SDR_LOGS)
+                self._sdr_logs_table_ready = True
+            
+            result = await self._execute_sql_async(*self._sdr_log_query(lead_id, task_name, success, message, additional_data))
+            
+            if result and "rows" in result and len(result["rows"]) > 0:
+                return {
+                    "success": True,
+                    "log_entry": result["rows"][0]
+                }
+            
+            return {"success": False, "error": "Falha ao salvar log"}
+        
+        except Exception as e:
+            logger.error(f"Erro ao salvar log SDR: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
+    async def get_lead_conversation_history_async(self, phone_number: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Busca histórico de conversas do lead (versão async).
+        
+        Args:
+            phone_number: Número do telefone
+            limit: Limite de registros
+        
+        Returns:
+            List: Histórico de conversas
+        """
+        try:
+            result = await self._execute_sql_async(*self._conversation_history_query(phone_number, limit))
+            
+            if result and "rows" in result:
+                return result["rows"]
+            
+            return []
+        
+        except Exception as e:
+            logger.error(f"Erro ao buscar histórico: {str(e)}")
+            return []
+    
+    async def update_lead_qualification_async(self, phone_number: str, qualification_status: str, invoice_amount: float = None) -> Dict[str, Any]:
+        """
+        Atualiza qualificação do lead (versão async).
+        
+        Args:
+            phone_number: Número do telefone
+            qualification_status: Status da qualificação
+            invoice_amount: Valor da conta (opcional)
+        
+        Returns:
+            Dict: Resultado da atualização
+        """
+        try:
+            result = await self._execute_sql_async(*self._qualification_query(phone_number, qualification_status, invoice_amount))
+            
+            if result and "rows" in result and len(result["rows"]) > 0:
+                await self.lead_cache.set_async(phone_number, result["rows"][0])
+                return {
+                    "success": True,
+                    "lead": result["rows"][0]
+                }
+            
+            return {"success": False, "error": "Lead não encontrado"}
+        
+        except Exception as e:
+            logger.error(f"Erro ao atualizar qualificação: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
+    async def record_message_async(self, phone_number: str, direction: str, content: str,
+                                   message_type: str = 'text', media_id: str = None) -> bool:
+        """
+        Registra mensagem no histórico de conversa (versão async).
+        
+        Args:
+            phone_number: Número do telefone
+            direction: 'user' ou 'bot'
+            content: Conteúdo da mensagem
+            message_type: Tipo da mensagem
+            media_id: ID da mídia se houver
+        
+        Returns:
+            bool: True se registrou com sucesso
+        """
+        try:
+            logger.debug(f"Registrando mensagem: {phone_number} ({direction})")
+            
+            result = await self._execute_sql_async(*self._record_message_query(phone_number, direction, content, message_type, media_id))
+            
+            return bool(result and "rows" in result)
+        
+        except Exception as e:
+            logger.error(f"Erro ao registrar mensagem: {str(e)}")
+            return False
+    
+    async def update_lead_last_message_async(self, phone_number: str) -> bool:
+        """
+        Atualiza timestamp da última mensagem (versão async).
+        
+        Args:
+            phone_number: Número do telefone
+        
+        Returns:
+            bool: True se atualizou
+        """
+        try:
+            result = await self._execute_sql_async(*self._last_message_query(phone_number))
+            
+            if result and result.get("rows"):
+                await self.lead_cache.set_async(phone_number, result["rows"][0])
+            
+            return bool(result and "rows" in result)
+        
+        except Exception as e:
+            logger.error(f"Erro ao atualizar última mensagem: {str(e)}")
+            return False
+    
+    async def get_conversation_metrics_async(self) -> Dict[str, Any]:
+        """
+        Busca métricas de conversação (versão async).
         
         Returns:
             Dict com métricas
         """
         try:
-            query = """
-            SELECT 
-                COUNT(DISTINCT phone_number) as total_leads,
-                COUNT(*) as total_messages,
-                COUNT(CASE WHEN message_direction = 'user' THEN 1 END) as user_messages,
-                COUNT(CASE WHEN message_direction = 'bot' THEN 1 END) as bot_messages,
-                COUNT(CASE WHEN created_at > NOW() - INTERVAL '24 hours' THEN 1 END) as messages_24h
-            FROM lead_messages
-            """
-            
-            result = self._make_mcp_request("tools/call", {
-                "name": "execute_sql",
-                "arguments": {"query": query}
-            })
+            result = await self._execute_sql_async(CONVERSATION_METRICS)
             
             return result["rows"][0] if result and "rows" in result else {}
-            
+        
         except Exception as e:
             logger.error(f"Erro ao buscar métricas: {str(e)}")
-            return {} 
\ No newline at end of file
+            return {}
+    
+    async def load_message_context_async(self, phone_number: str, content: str, message_type: str = 'text',
+                                         media_id: str = None, history_limit: int = 10,
+                                         whatsapp_message_id: str = None) -> Dict[str, Any]:
+        """
+        Carrega lead e histórico em um único lote e depois registra a mensagem recebida (versão async).
+        
+        O histórico retornado não inclui a mensagem atual.
+        
+        Args:
+            phone_number: Número do telefone
+            content: Conteúdo da mensagem do usuário
+            message_type: Tipo da mensagem
+            media_id: ID da mídia se houver
+            history_limit: Limite de registros do histórico
+            whatsapp_message_id: ID da mensagem no WhatsApp (registro idempotente)
+        
+        Returns:
+            Dict: message_recorded, lead (ou None) e history
+        """
+        try:
+            cached_lead = await self.lead_cache.get_async(phone_number)
+            calls, indexes = self._message_context_calls(phone_number, history_limit, cached_lead)
+            results = await self._execute_many_async(calls)
+            
+            # Histórico lido antes do registro: não contém a mensagem atual
+            indexes["message"] = len(results)
+            results += await self._execute_many_async([
+                self._record_message_query(phone_number, 'user', content, message_type, media_id, whatsapp_message_id)
+            ])
+            
+            context = self._message_context_result(results, indexes, cached_lead)
+            if cached_lead is None and context["lead"] is not None:
+                await self.lead_cache.set_async(phone_number, context["lead"])
+            return context
+        
+        except Exception as e:
+            logger.error(f"Erro ao carregar contexto da mensagem: {str(e)}")
+            return {"message_recorded": False, "lead": None, "history": []}
+    
+    async def record_bot_reply_async(self, phone_number: str, content: str) -> Dict[str, bool]:
+        """
+        Registra a resposta do bot e atualiza a última mensagem em um único lote (versão async).
+        
+        Args:
+            phone_number: Número do telefone
+            content: Conteúdo da resposta
+        
+        Returns:
+            Dict: message_recorded e last_message_updated
+        """
+        try:
+            calls, indexes = self._bot_reply_calls(phone_number, content)
+            status, lead = self._bot_reply_result(await self._execute_many_async(calls), indexes)
+            if lead is not None:
+                await self.lead_cache.set_async(phone_number, lead)
+            return status
+        
+        except Exception as e:
+            logger.error(f"Erro ao registrar resposta do bot: {str(e)}")
+            return {"message_recorded": False, "last_message_updated": False}
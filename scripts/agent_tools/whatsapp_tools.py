@@ -16,10 +16,11 @@ Created: 2025-01-17
 import os
 import json
 import logging
-import requests
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 
+from .mcp_transport import get_transport, get_async_transport
+
 logger = logging.getLogger(__name__)
 
 
@@ -47,34 +48,38 @@ class WhatsAppTools:
         Returns:
             Dict: Resposta do MCP Server
         """
-        payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": method,
-            "params": params
-        }
-        
-        for attempt in range(self.max_retries):
-            try:
-                response = requests.post(
-                    f"{self.mcp_url}/mcp",
-                    json=payload,
-                    headers={"Content-Type": "application/json"},
-                    timeout=self.timeout
-                )
-                response.raise_for_status()
-                
-                result = response.json()
-                if "error" in result:
-                    raise Exception(f"MCP Error: {result['error']}")
-                
-                return result.get("result", {})
-                
-            except Exception as e:
-                logger.error(f"Tentativa {attempt + 1} falhou: {str(e)}")
-                if attempt == self.max_retries - 1:
-                    raise
-                continue
+        return get_transport().request(
+            self.mcp_url,
+            method,
+            params,
+            timeout=self.timeout,
+            max_retries=self.max_retries
+        )
+    
+    async def _make_mcp_request_async(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Faz requisição assíncrona para o MCP Server do WhatsApp.
+        
+        Args:
+            method: Método MCP (tools/call)
+            params: Parâmetros da requisição
+            
+        Returns:
+            Dict: Resposta do MCP Server
+        """
+        return await get_async_transport().request(
+            self.mcp_url,
+            method,
+            params,
+            timeout=self.timeout,
+            max_retries=self.max_retries
+        )
+    
+    def _format_phone_number(self, to: str) -> str:
+        """Garante o código do país (55) no número de destino."""
+        if not to.startswith('55'):
+            to = f"55{to.replace('+', '').replace('-', '').replace(' ', '')}"
+        return to
     
     def send_text_message(self, to: str, message: str) -> Dict[str, Any]:
         """
@@ -89,8 +94,7 @@ class WhatsAppTools:
         """
         try:
             # Validar formato do número
-            if not to.startswith('55'):
-                to = f"55{to.replace('+', '').replace('-', '').replace(' ', '')}"
+            to = self._format_phone_number(to)
             
             result = self._make_mcp_request("tools/call", {
                 "name": "sendTextMessage",
@@ -128,8 +132,7 @@ class WhatsAppTools:
         """
         try:
             # Validar formato do número
-            if not to.startswith('55'):
-                to = f"55{to.replace('+', '').replace('-', '').replace(' ', '')}"
+            to = self._format_phone_number(to)
             
             arguments = {
                 "to": to,
@@ -172,8 +175,7 @@ class WhatsAppTools:
         """
         try:
             # Validar formato do número
-            if not to.startswith('55'):
-                to = f"55{to.replace('+', '').replace('-', '').replace(' ', '')}"
+            to = self._format_phone_number(to)
             
             arguments = {
                 "to": to,
@@ -231,20 +233,48 @@ class WhatsAppTools:
                 "error": str(e)
             }
     
-    def send_welcome_message(self, to: str, lead_name: str = None) -> Dict[str, Any]:
+    def send_typing_indicator(self, message_id: str) -> Dict[str, Any]:
         """
-        Envia mensagem de boas-vindas personalizada.
+        Marca a mensagem recebida como lida e exibe "digitando..." para o lead.
+        
+        O indicador some quando a resposta é enviada (ou após ~25s). Servidores
+        MCP que não suportam `typingIndicator` apenas marcam a mensagem como lida.
         
         Args:
-            to: Número de telefone
-            lead_name: Nome do lead (opcional)
+            message_id: ID (wamid) da mensagem recebida
             
         Returns:
-            Dict: Resultado do envio
+            Dict: Resultado da operação
         """
         try:
-            if lead_name:
-                message = f"""👋 Olá {lead_name}! 
+            result = self._make_mcp_request("tools/call", {
+                "name": "markMessageAsRead",
+                "arguments": {
+                    "messageId": message_id,
+                    "typingIndicator": {"type": "text"}
+                }
+            })
+            
+            return {
+                "success": True,
+                "response": result
+            }
+            
+        except Exception as e:
+            logger.error(f"Erro ao enviar indicador de digitação: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    # =========================================================================
+    # TEXTOS DAS MENSAGENS
+    # =========================================================================
+    
+    def _welcome_message_text(self, lead_name: str = None) -> str:
+        """Monta o texto da mensagem de boas-vindas personalizada."""
+        if lead_name:
+            message = f"""👋 Olá {lead_name}! 
 
 Sou a Sílvia, sua consultora virtual da Serena Energia! 🌞
 
@@ -253,8 +283,8 @@ Estou aqui para te ajudar a economizar até 95% na sua conta de luz com energia
 Para começarmos, você poderia me enviar uma foto da sua última conta de energia? 📸
 
 Assim posso te mostrar exatamente quanto você pode economizar! 💰"""
-            else:
-                message = """👋 Olá! 
+        else:
+            message = """👋 Olá! 
 
 Sou a Sílvia, sua consultora virtual da Serena Energia! 🌞
 
@@ -263,6 +293,136 @@ Estou aqui para te ajudar a economizar até 95% na sua conta de luz com energia
 Para começarmos, você poderia me enviar uma foto da sua última conta de energia? 📸
 
 Assim posso te mostrar exatamente quanto você pode economizar! 💰"""
+        
+        return message
+    
+    def _qualification_message_text(self, lead_name: str, city: str, invoice_amount: float) -> str:
+        """Monta o texto da mensagem de qualificação com planos disponíveis."""
+        message = f"""🎉 Perfeito, {lead_name}!
+
+Analisei sua conta de R$ {invoice_amount:.2f} e você está QUALIFICADO para nossa solução de energia solar! ✅
+
+Em {city}, temos planos especiais que podem reduzir sua conta em até 95%! 🌞
+
+Gostaria que eu te apresente os planos disponíveis para sua região?
+
+Responda "SIM" que te mostro as opções! 💚"""
+        
+        return message
+    
+    def _plans_message_text(self, lead_name: str, plans: List[Dict[str, Any]]) -> str:
+        """Monta o texto da mensagem com planos disponíveis."""
+        if not plans:
+            message = f"""Desculpe, {lead_name}! 😔
+
+No momento não temos planos disponíveis para sua região.
+
+Mas não se preocupe! Vou te manter informado quando chegarmos por aí! 🌞
+
+Obrigada pelo interesse! 💚"""
+        else:
+            message = f"""📋 Aqui estão os planos disponíveis para você, {lead_name}:
+
+"""
+            
+            for i, plan in enumerate(plans[:3], 1):  # Limitar a 3 planos
+                plan_name = plan.get('name', 'Plano')
+                discount = plan.get('discount', '0')
+                fidelity = plan.get('fidelityMonths', 0)
+                
+                discount_percent = float(discount) * 100 if discount else 0
+                
+                message += f"""🔸 {i}. {plan_name}
+   💰 Desconto: {discount_percent:.0f}%
+   📅 Fidelidade: {fidelity} meses
+
+"""
+            
+            message += """Qual plano te interessou mais?
+
+Responda com o número do plano (1, 2 ou 3) que te ajudo com os próximos passos! 🚀"""
+        
+        return message
+    
+    def _follow_up_message_text(self, lead_name: str, city: str) -> str:
+        """Monta o texto da mensagem de follow-up após 2 horas sem resposta."""
+        message = f"""Oi {lead_name}! 😊
+
+Só passando para lembrar que temos uma proposta especial de energia solar para você em {city}.
+
+Quer economizar até 95% na sua conta de luz? 💰
+
+Responda aqui que te ajudo! 🌞
+
+Ou se preferir, pode me enviar sua conta de energia que faço uma análise personalizada! 📸"""
+        
+        return message
+    
+    def _contract_message_text(self, lead_name: str, plan_name: str) -> str:
+        """Monta o texto da mensagem de confirmação de contrato."""
+        message = f"""🎉 Parabéns, {lead_name}!
+
+Você escolheu o {plan_name}! Excelente escolha! 🌞
+
+Agora vou criar seu contrato e em breve nossa equipe entrará em contato para finalizar os detalhes.
+
+Você receberá um email com todos os documentos e próximos passos! 📧
+
+Obrigada por escolher a Serena Energia! 💚
+
+Em breve você estará economizando muito na sua conta de luz! 💰"""
+        
+        return message
+    
+    def _error_message_text(self) -> str:
+        """Monta o texto da mensagem de erro/fallback."""
+        message = """Desculpe, tivemos um problema técnico momentâneo! 😔
+
+Mas não se preocupe, vou resolver rapidinho e retorno em breve! ⚡
+
+Obrigada pela compreensão! 💚
+
+Sílvia - Serena Energia 🌞"""
+        
+        return message
+    
+    def _bill_analysis_message_text(self, lead_name: str, invoice_amount: float, savings_percentage: float) -> str:
+        """Monta o texto da mensagem com análise da conta de energia."""
+        estimated_savings = invoice_amount * (savings_percentage / 100)
+        new_bill = invoice_amount - estimated_savings
+        
+        message = f"""📊 Análise da sua conta, {lead_name}:
+
+💰 Conta atual: R$ {invoice_amount:.2f}
+🌞 Com energia solar: R$ {new_bill:.2f}
+💸 Economia mensal: R$ {estimated_savings:.2f}
+📈 Economia anual: R$ {estimated_savings * 12:.2f}
+
+Isso representa uma economia de {savings_percentage:.0f}% na sua conta! 🎉
+
+Gostaria de conhecer os planos disponíveis para você?
+
+Responda "SIM" que te mostro as opções! 💚"""
+        
+        return message
+    
+    # =========================================================================
+    # MENSAGENS PRONTAS
+    # =========================================================================
+    
+    def send_welcome_message(self, to: str, lead_name: str = None) -> Dict[str, Any]:
+        """
+        Envia mensagem de boas-vindas personalizada.
+        
+        Args:
+            to: Número de telefone
+            lead_name: Nome do lead (opcional)
+            
+        Returns:
+            Dict: Resultado do envio
+        """
+        try:
+            message = self._welcome_message_text(lead_name)
             
             return self.send_text_message(to, message)
             
@@ -287,15 +447,7 @@ Assim posso te mostrar exatamente quanto você pode economizar! 💰"""
             Dict: Resultado do envio
         """
         try:
-            message = f"""🎉 Perfeito, {lead_name}!
-
-Analisei sua conta de R$ {invoice_amount:.2f} e você está QUALIFICADO para nossa solução de energia solar! ✅
-
-Em {city}, temos planos especiais que podem reduzir sua conta em até 95%! 🌞
-
-Gostaria que eu te apresente os planos disponíveis para sua região?
-
-Responda "SIM" que te mostro as opções! 💚"""
+            message = self._qualification_message_text(lead_name, city, invoice_amount)
             
             return self.send_text_message(to, message)
             
@@ -319,35 +471,7 @@ Responda "SIM" que te mostro as opções! 💚"""
             Dict: Resultado do envio
         """
         try:
-            if not plans:
-                message = f"""Desculpe, {lead_name}! 😔
-
-No momento não temos planos disponíveis para sua região.
-
-Mas não se preocupe! Vou te manter informado quando chegarmos por aí! 🌞
-
-Obrigada pelo interesse! 💚"""
-            else:
-                message = f"""📋 Aqui estão os planos disponíveis para você, {lead_name}:
-
-"""
-                
-                for i, plan in enumerate(plans[:3], 1):  # Limitar a 3 planos
-                    plan_name = plan.get('name', 'Plano')
-                    discount = plan.get('discount', '0')
-                    fidelity = plan.get('fidelityMonths', 0)
-                    
-                    discount_percent = float(discount) * 100 if discount else 0
-                    
-                    message += f"""🔸 {i}. {plan_name}
-   💰 Desconto: {discount_percent:.0f}%
-   📅 Fidelidade: {fidelity} meses
-
-"""
-                
-                message += """Qual plano te interessou mais?
-
-Responda com o número do plano (1, 2 ou 3) que te ajudo com os próximos passos! 🚀"""
+            message = self._plans_message_text(lead_name, plans)
             
             return self.send_text_message(to, message)
             
@@ -371,15 +495,7 @@ Responda com o número do plano (1, 2 ou 3) que te ajudo com os próximos passos
             Dict: Resultado do envio
         """
         try:
-            message = f"""Oi {lead_name}! 😊
-
-Só passando para lembrar que temos uma proposta especial de energia solar para você em {city}.
-
-Quer economizar até 95% na sua conta de luz? 💰
-
-Responda aqui que te ajudo! 🌞
-
-Ou se preferir, pode me enviar sua conta de energia que faço uma análise personalizada! 📸"""
+            message = self._follow_up_message_text(lead_name, city)
             
             return self.send_text_message(to, message)
             
@@ -403,17 +519,7 @@ Ou se preferir, pode me enviar sua conta de energia que faço uma análise perso
             Dict: Resultado do envio
         """
         try:
-            message = f"""🎉 Parabéns, {lead_name}!
-
-Você escolheu o {plan_name}! Excelente escolha! 🌞
-
-Agora vou criar seu contrato e em breve nossa equipe entrará em contato para finalizar os detalhes.
-
-Você receberá um email com todos os documentos e próximos passos! 📧
-
-Obrigada por escolher a Serena Energia! 💚
-
-Em breve você estará economizando muito na sua conta de luz! 💰"""
+            message = self._contract_message_text(lead_name, plan_name)
             
             return self.send_text_message(to, message)
             
@@ -435,13 +541,7 @@ Em breve você estará economizando muito na sua conta de luz! 💰"""
             Dict: Resultado do envio
         """
         try:
-            message = """Desculpe, tivemos um problema técnico momentâneo! 😔
-
-Mas não se preocupe, vou resolver rapidinho e retorno em breve! ⚡
-
-Obrigada pela compreensão! 💚
-
-Sílvia - Serena Energia 🌞"""
+            message = self._error_message_text()
             
             return self.send_text_message(to, message)
             
@@ -466,21 +566,7 @@ Sílvia - Serena Energia 🌞"""
             Dict: Resultado do envio
         """
         try:
-            estimated_savings = invoice_amount * (savings_percentage / 100)
-            new_bill = invoice_amount - estimated_savings
-            
-            message = f"""📊 Análise da sua conta, {lead_name}:
-
-💰 Conta atual: R$ {invoice_amount:.2f}
-🌞 Com energia solar: R$ {new_bill:.2f}
-💸 Economia mensal: R$ {estimated_savings:.2f}
-📈 Economia anual: R$ {estimated_savings * 12:.2f}
-
-Isso representa uma economia de {savings_percentage:.0f}% na sua conta! 🎉
-
-Gostaria de conhecer os planos disponíveis para você?
-
-Responda "SIM" que te mostro as opções! 💚"""
+            message = self._bill_analysis_message_text(lead_name, invoice_amount, savings_percentage)
             
             return self.send_text_message(to, message)
             
@@ -489,4 +575,240 @@ Responda "SIM" que te mostro as opções! 💚"""
             return {
                 "success": False,
                 "error": str(e)
-            } 
\ No newline at end of file
+            }
+    
+    # =========================================================================
+    # FERRAMENTAS ASSÍNCRONAS
+    # =========================================================================
+    
+    async def send_text_message_async(self, to: str, message: str) -> Dict[str, Any]:
+        """
+        Envia mensagem de texto via WhatsApp (versão async).
+        
+        Args:
+            to: Número de telefone no formato internacional (ex: "5511999999999")
+            message: Conteúdo da mensagem de texto
+        
+        Returns:
+            Dict: Resultado do envio
+        """
+        try:
+            result = await self._make_mcp_request_async("tools/call", {
+                "name": "sendTextMessage",
+                "arguments": {
+                    "to": self._format_phone_number(to),
+                    "message": message
+                }
+            })
+            
+            return {
+                "success": True,
+                "message_id": result.get("content", [{}])[0].get("text", ""),
+                "response": result
+            }
+        
+        except Exception as e:
+            logger.error(f"Erro ao enviar mensagem de texto: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    async def send_template_message_async(self, to: str, template_name: str, language: str = "pt_BR", components: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Envia mensagem usando template aprovado pelo WhatsApp (versão async).
+        
+        Args:
+            to: Número de telefone no formato internacional
+            template_name: Nome do template aprovado
+            language: Código do idioma (ex: "pt_BR", "en_US")
+            components: Componentes do template (parâmetros dinâmicos)
+        
+        Returns:
+            Dict: Resultado do envio
+        """
+        try:
+            arguments = {
+                "to": self._format_phone_number(to),
+                "templateName": template_name,
+                "language": language
+            }
+            
+            if components:
+                arguments["components"] = components
+            
+            result = await self._make_mcp_request_async("tools/call", {
+                "name": "sendTemplateMessage",
+                "arguments": arguments
+            })
+            
+            return {
+                "success": True,
+                "message_id": result.get("content", [{}])[0].get("text", ""),
+                "response": result
+            }
+        
+        except Exception as e:
+            logger.error(f"Erro ao enviar template: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    async def send_image_message_async(self, to: str, image_url: str, caption: str = None) -> Dict[str, Any]:
+        """
+        Envia imagem com legenda via WhatsApp (versão async).
+        
+        Args:
+            to: Número de telefone no formato internacional
+            image_url: URL pública da imagem
+            caption: Legenda da imagem (opcional)
+        
+        Returns:
+            Dict: Resultado do envio
+        """
+        try:
+            arguments = {
+                "to": self._format_phone_number(to),
+                "imageUrl": image_url
+            }
+            
+            if caption:
+                arguments["caption"] = caption
+            
+            result = await self._make_mcp_request_async("tools/call", {
+                "name": "sendImageMessage",
+                "arguments": arguments
+            })
+            
+            return {
+                "success": True,
+                "message_id": result.get("content", [{}])[0].get("text", ""),
+                "response": result
+            }
+        
+        except Exception as e:
+            logger.error(f"Erro ao enviar imagem: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    async def mark_message_as_read_async(self, message_id: str) -> Dict[str, Any]:
+        """
+        Marca uma mensagem como lida no WhatsApp (versão async).
+        
+        Args:
+            message_id: ID da mensagem a ser marcada como lida
+        
+        Returns:
+            Dict: Resultado da operação
+        """
+        try:
+            result = await self._make_mcp_request_async("tools/call", {
+                "name": "markMessageAsRead",
+                "arguments": {
+                    "messageId": message_id
+                }
+            })
+            
+            return {
+                "success": True,
+                "response": result
+            }
+        
+        except Exception as e:
+            logger.error(f"Erro ao marcar mensagem como lida: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    async def send_typing_indicator_async(self, message_id: str) -> Dict[str, Any]:
+        """
+        Marca a mensagem recebida como lida e exibe "digitando..." (versão async).
+        
+        Args:
+            message_id: ID (wamid) da mensagem recebida
+        
+        Returns:
+            Dict: Resultado da operação
+        """
+        try:
+            result = await self._make_mcp_request_async("tools/call", {
+                "name": "markMessageAsRead",
+                "arguments": {
+                    "messageId": message_id,
+                    "typingIndicator": {"type": "text"}
+                }
+            })
+            
+            return {
+                "success": True,
+                "response": result
+            }
+        
+        except Exception as e:
+            logger.error(f"Erro ao enviar indicador de digitação: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    async def send_welcome_message_async(self, to: str, lead_name: str = None) -> Dict[str, Any]:
+        """Envia mensagem de boas-vindas personalizada (versão async)."""
+        try:
+            return await self.send_text_message_async(to, self._welcome_message_text(lead_name))
+        except Exception as e:
+            logger.error(f"Erro ao enviar mensagem de boas-vindas: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
+    async def send_qualification_message_async(self, to: str, lead_name: str, city: str, invoice_amount: float) -> Dict[str, Any]:
+        """Envia mensagem de qualificação com planos disponíveis (versão async)."""
+        try:
+            message = self._qualification_message_text(lead_name, city, invoice_amount)
+            return await self.send_text_message_async(to, message)
+        except Exception as e:
+            logger.error(f"Erro ao enviar mensagem de qualificação: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
+    async def send_plans_message_async(self, to: str, lead_name: str, plans: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Envia mensagem com planos disponíveis (versão async)."""
+        try:
+            return await self.send_text_message_async(to, self._plans_message_text(lead_name, plans))
+        except Exception as e:
+            logger.error(f"Erro ao enviar mensagem de planos: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
+    async def send_follow_up_message_async(self, to: str, lead_name: str, city: str) -> Dict[str, Any]:
+        """Envia mensagem de follow-up após 2 horas sem resposta (versão async)."""
+        try:
+            return await self.send_text_message_async(to, self._follow_up_message_text(lead_name, city))
+        except Exception as e:
+            logger.error(f"Erro ao enviar follow-up: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
+    async def send_contract_message_async(self, to: str, lead_name: str, plan_name: str) -> Dict[str, Any]:
+        """Envia mensagem de confirmação de contrato (versão async)."""
+        try:
+            return await self.send_text_message_async(to, self._contract_message_text(lead_name, plan_name))
+        except Exception as e:
+            logger.error(f"Erro ao enviar mensagem de contrato: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
+    async def send_error_message_async(self, to: str) -> Dict[str, Any]:
+        """Envia mensagem de erro/fallback (versão async)."""
+        try:
+            return await self.send_text_message_async(to, self._error_message_text())
+        except Exception as e:
+            logger.error(f"Erro ao enviar mensagem de erro: {str(e)}")
+            return {"success": False, "error": str(e)}
+    
+    async def send_bill_analysis_message_async(self, to: str, lead_name: str, invoice_amount: float, savings_percentage: float) -> Dict[str, Any]:
+        """Envia mensagem com análise da conta de energia (versão async)."""
+        try:
+            message = self._bill_analysis_message_text(lead_name, invoice_amount, savings_percentage)
+            return await self.send_text_message_async(to, message)
+        except Exception as e:
+            logger.error(f"Erro ao enviar análise da conta: {str(e)}")
+            return {"success": False, "error": str(e)}
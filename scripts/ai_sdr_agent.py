@@ -14,48 +14,186 @@ Created: 2025-01-17
 """
 
 import os
+import re
 import json
 import time
+import types
+import threading
 import openai
-from typing import Dict, Any, Optional, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Callable
 from datetime import datetime
 
 # Importar utilitários
 from utils.config import get_config, is_qualified_lead
 from utils.logger import get_agent_logger, log_ai_conversation, log_lead_created, log_lead_qualified
 from utils.mcp_client import call_mcp_tool, get_mcp_client
+from utils.context_builder import ContextBuilder, TOOL_RESULT_MAX_TOKENS
 
 # Importar ferramentas
 from agent_tools.supabase_tools import SupabaseTools
 from agent_tools.serena_tools import SerenaTools
 from agent_tools.whatsapp_tools import WhatsAppTools
 from agent_tools.ocr_tools import OCRTools
+from agent_tools.faq_router import get_faq_router
 
 logger = get_agent_logger()
 
+# Resposta ao lead quando o function calling falha (detalhes só no log)
+TECHNICAL_ERROR_MESSAGE = "Desculpe, tive um problema técnico agora. Pode repetir sua mensagem em alguns instantes?"
+
+
+class ResponseChunker:
+    """
+    Divide o texto recebido em streaming em mensagens de WhatsApp.
+    
+    Emite um trecho a cada parágrafo completo ou, quando o buffer passa de
+    `min_chars`, no último fim de frase. Trechos maiores que `max_chars` são
+    quebrados no último espaço.
+    """
+    
+    SENTENCE_END = re.compile(r'[.!?…](?=\s)')
+    
+    def __init__(self, min_chars: int = 60, max_chars: int = 1000):
+        """
+        Inicializa o divisor.
+        
+        Args:
+            min_chars: Tamanho mínimo para quebrar em fim de frase
+            max_chars: Tamanho máximo de uma mensagem
+        """
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._buffer = ""
+    
+    def feed(self, text: str) -> List[str]:
+        """
+        Adiciona texto ao buffer.
+        
+        Args:
+            text: Delta recebido do modelo
+            
+        Returns:
+            List: Trechos completos prontos para envio
+        """
+        self._buffer += text
+        chunks = []
+        
+        while True:
+            cut = self._next_cut()
+            if cut is None:
+                break
+            chunk, self._buffer = self._buffer[:cut].strip(), self._buffer[cut:]
+            if chunk:
+                chunks.append(chunk)
+        
+        return chunks
+    
+    def flush(self) -> List[str]:
+        """
+        Esvazia o buffer ao final do streaming.
+        
+        Returns:
+            List: Trecho restante (se houver)
+        """
+        chunk, self._buffer = self._buffer.strip(), ""
+        return [chunk] if chunk else []
+    
+    def _next_cut(self) -> Optional[int]:
+        """Posição de corte do próximo trecho completo, se houver."""
+        paragraph = self._buffer.find("\n\n")
+        if paragraph != -1:
+            return paragraph + 2
+        
+        if len(self._buffer) >= self.min_chars:
+            sentence_ends = [match.end() for match in self.SENTENCE_END.finditer(self._buffer)]
+            if sentence_ends:
+                return sentence_ends[-1]
+        
+        if len(self._buffer) > self.max_chars:
+            space = self._buffer.rfind(" ", 0, self.max_chars)
+            return space if space > 0 else self.max_chars
+        
+        return None
+
 
 class SerenaSDRAgent:
     """Agente conversacional principal do Serena SDR."""
     
-    def __init__(self):
-        """Inicializa o agente SDR."""
+    # Funções somente leitura: podem rodar em paralelo quando o modelo pede
+    # várias na mesma resposta. As demais (envios e escritas) rodam em
+    # sequência, na ordem pedida, para preservar a ordem das mensagens.
+    PARALLEL_SAFE_FUNCTIONS = frozenset({
+        "get_lead_data",
+        "process_energy_bill",
+        "validate_lead_qualification",
+        "get_energy_plans"
+    })
+    
+    # Estados sem etapa pendente em que o FAQ pode responder sem o modelo, com
+    # o próximo passo do fluxo acrescentado à resposta. Nos demais estados o
+    # agente responde, para não perder a pergunta pendente da conversa.
+    FAQ_FAST_PATH_STATES = {
+        "INITIAL": "Para eu calcular sua economia, pode me enviar uma foto da sua conta de luz? 📸",
+        "CONTRACT_CREATED": None
+    }
+    
+    def __init__(self, supabase_tools: SupabaseTools = None):
+        """
+        Inicializa o agente SDR.
+        
+        Args:
+            supabase_tools: Ferramentas do Supabase compartilhadas com quem cria
+                o agente (o webhook importa os módulos como scripts.agent_tools,
+                o agente como agent_tools; com instâncias separadas, o cache de
+                leads de um lado não veria as escritas do outro)
+        """
         self.config = get_config()
         openai.api_key = self.config.openai_api_key
+        self.client = openai.OpenAI(api_key=self.config.openai_api_key)
         
         # Inicializar ferramentas
-        self.supabase_tools = SupabaseTools()
+        self.supabase_tools = supabase_tools or SupabaseTools()
         self.serena_tools = SerenaTools()
         self.whatsapp_tools = WhatsAppTools()
         self.ocr_tools = OCRTools()
         
+        # Perguntas frequentes respondidas pelo FAQ, sem o loop de function calling
+        self.faq_router = get_faq_router()
+        
         # Configurar OpenAI
         self.model = self.config.openai_model
         self.max_tokens = self.config.openai_max_tokens
         self.temperature = self.config.openai_temperature
         self.max_retries = self.config.max_retries
         
-        # Definir funções disponíveis para OpenAI Function Calling
+        # Definir funções disponíveis para OpenAI Function Calling (tools API)
         self.functions = self._define_functions()
+        self.tools = [{"type": "function", "function": function} for function in self.functions]
+        
+        # Prompt do sistema estático: junto com as tools forma um prefixo idêntico
+        # em todas as chamadas, aproveitado pelo cache de prompt da OpenAI
+        self.system_prompt = self._build_system_prompt()
+        
+        # Uso de tokens acumulado (inclui tokens servidos pelo cache de prompt)
+        self._usage = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+        self._usage_lock = threading.Lock()
+        
+        # Montagem do contexto dentro do orçamento de tokens
+        self.context_builder = ContextBuilder(
+            model=self.model,
+            token_budget=min(self.config.context_token_budget, self.config.context_size_limit),
+            recent_messages=self.config.context_recent_messages
+        )
+        self.summary_model = self.config.context_summary_model
+        self._summaries_in_progress = set()
+        self._summaries_lock = threading.Lock()
+        
+        # Pool para executar tool calls independentes em paralelo
+        self.tool_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('AGENT_TOOL_MAX_WORKERS', '4')),
+            thread_name_prefix="sdr-tool"
+        )
         
         logger.info("Agente Serena SDR inicializado", 
                    model=self.model, max_tokens=self.max_tokens, temperature=self.temperature)
@@ -93,13 +231,13 @@ class SerenaSDRAgent:
             },
             {
                 "name": "process_energy_bill",
-                "description": "Processa imagem de fatura de energia via OCR",
+                "description": "Classifica a imagem ou PDF e, se for fatura de energia, extrai os dados via OCR",
         "parameters": {
             "type": "object",
             "properties": {
                         "image_url": {
                             "type": "string",
-                            "description": "URL da imagem da fatura"
+                            "description": "URL da imagem ou do PDF da fatura"
                         }
             },
             "required": ["image_url"]
@@ -126,6 +264,10 @@ class SerenaSDRAgent:
                         "valor_conta": {
                             "type": "number",
                             "description": "Valor da conta de energia"
+                        },
+                        "confirmacao_oficial": {
+                            "type": "boolean",
+                            "description": "Consultar a Serena diretamente (use antes de cadastro ou contrato)"
                         }
                     },
                     "required": ["cidade", "estado", "tipo_pessoa", "valor_conta"]
@@ -282,7 +424,8 @@ class SerenaSDRAgent:
                     cidade=arguments.get("cidade"),
                     estado=arguments.get("estado"),
                     tipo_pessoa=arguments.get("tipo_pessoa"),
-                    valor_conta=arguments.get("valor_conta")
+                    valor_conta=arguments.get("valor_conta"),
+                    autoritativo=bool(arguments.get("confirmacao_oficial"))
                 )
                 return result
             
@@ -342,7 +485,9 @@ class SerenaSDRAgent:
     
     def run_agent(self, lead_id: str = None, user_message: str = None, 
                   message_type: str = "text", media_id: str = None, 
-                  lead_data: Dict[str, Any] = None, conversation_state: str = None) -> Dict[str, Any]:
+                  lead_data: Dict[str, Any] = None, conversation_state: str = None,
+                  conversation_history: List[Dict[str, Any]] = None,
+                  on_chunk: Callable[[str], None] = None) -> Dict[str, Any]:
         """
         Executa o agente conversacional.
         
@@ -353,9 +498,12 @@ class SerenaSDRAgent:
             media_id: ID da mídia (se aplicável)
             lead_data: Dados do lead (se disponível)
             conversation_state: Estado atual da conversa
+            conversation_history: Histórico já carregado (evita nova consulta)
+            on_chunk: Callback de streaming; recebe cada trecho da resposta
+                assim que fica completo (o chamador envia ao lead)
             
         Returns:
-            Dict: Resposta do agente
+            Dict: Resposta do agente (`streamed` indica se já foi entregue via on_chunk)
         """
         start_time = datetime.now()
         
@@ -371,46 +519,71 @@ class SerenaSDRAgent:
             # Determinar estado da conversa
             current_state = conversation_state or (lead_data.get('conversation_state') if lead_data else 'INITIAL')
             
-            # Buscar histórico de conversa se temos lead_id
-            conversation_history = []
-            if lead_id:
+            # Pergunta frequente com resposta de alta confiança no FAQ: responde sem
+            # chamar o modelo, apenas em estados sem etapa pendente
+            faq_answer = None
+            if user_message and not media_id and current_state in self.FAQ_FAST_PATH_STATES:
+                faq_answer = self.faq_router.route(user_message, message_type)
+            if faq_answer:
+                next_step = self.FAQ_FAST_PATH_STATES[current_state]
+                answer = f"{faq_answer['response']}\n\n{next_step}" if next_step else faq_answer["response"]
+                if on_chunk:
+                    on_chunk(faq_answer["response"])
+                    if next_step:
+                        on_chunk(next_step)
+                processing_time = (datetime.now() - start_time).total_seconds()
+                if lead_id:
+                    log_ai_conversation(lead_id, (lead_data or {}).get('phone_number', ''), user_message,
+                                        answer, processing_time)
+                return {
+                    "response": answer,
+                    "success": True,
+                    "processing_time": processing_time,
+                    "lead_id": lead_id,
+                    "streamed": on_chunk is not None,
+                    "fast_path": f"faq_{faq_answer['method']}"
+                }
+            
+            # Buscar histórico de conversa se temos lead_id e ele não foi informado
+            if conversation_history is None and lead_id:
+                conversation_history = []
                 try:
                     conversation_history = self.supabase_tools.get_lead_conversation_history(lead_id, limit=10)
                 except:
                     pass  # Se não existir o método ainda, continuar sem histórico
             
-            # Construir prompt do sistema com estado
-            system_prompt = self._build_system_prompt(lead_data)
-            system_prompt += f"\n\nEstado atual da conversa: {current_state}"
-            
-            # Construir mensagens
-            messages = [
-                {"role": "system", "content": system_prompt}
-            ]
+            # Foto/PDF da conta já é analisada aqui: o resultado entra no contexto,
+            # antes da mensagem do usuário, e o modelo não precisa chamar o OCR
+            extra_messages = []
+            if media_id and message_type in ("image", "document"):
+                media_result = self.ocr_tools.process_whatsapp_media(media_id, lead_id)
+                extra_messages.append(self._media_context_message(media_result))
             
-            # Adicionar contexto do lead se disponível
-            if lead_data:
-                messages.append({
-                    "role": "system", 
-                    "content": f"Contexto do lead: {json.dumps(lead_data, ensure_ascii=False)}"
-                })
+            # Montar mensagens: prefixo estático e, depois dele, estado, lead
+            # projetado, resumo e mensagens recentes (dentro do orçamento)
+            context = self.context_builder.build(
+                self.system_prompt,
+                lead_data=lead_data,
+                history=conversation_history,
+                user_message=user_message,
+                tools=self.tools,
+                conversation_state=current_state,
+                extra_messages=extra_messages
+            )
+            messages = context.messages
             
-            # Adicionar histórico se disponível
-            if conversation_history:
-                messages.append({
-                    "role": "system",
-                    "content": f"Histórico recente da conversa (últimas {len(conversation_history)} mensagens):"
-                })
-                for msg in conversation_history[-5:]:  # Últimas 5 mensagens
-                    role = "user" if msg.get('message_direction') == 'user' else "assistant"
-                    messages.append({"role": role, "content": msg.get('message_content', '')})
+            logger.debug("Contexto montado", prompt_tokens=context.prompt_tokens,
+                        messages=len(messages), pending_summary=len(context.pending_summary))
             
-            # Adicionar mensagem do usuário
-            if user_message:
-                messages.append({"role": "user", "content": user_message})
+            # Mensagens que saíram da janela entram no resumo fora do caminho da resposta
+            if lead_id and context.pending_summary:
+                self._schedule_summary_update(lead_id, context.summary, context.pending_summary)
             
         # Loop de function calling
-            response = self._process_function_calling(messages)
+            if on_chunk:
+                response = self._process_function_calling_stream(messages, on_chunk)
+            else:
+                response = self._process_function_calling(messages)
             
             # Calcular tempo de processamento
             processing_time = (datetime.now() - start_time).total_seconds()
@@ -426,7 +599,8 @@ class SerenaSDRAgent:
                 "response": response,
                 "success": True,
                 "processing_time": processing_time,
-                "lead_id": lead_id
+                "lead_id": lead_id,
+                "streamed": on_chunk is not None
             }
             
         except Exception as e:
@@ -439,8 +613,116 @@ class SerenaSDRAgent:
                 "lead_id": lead_id
             }
     
-    def _build_system_prompt(self, lead_data: Dict[str, Any] = None) -> str:
-        """Constrói o prompt do sistema."""
+    @staticmethod
+    def _media_context_message(media_result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Mensagem de sistema com o resultado da análise da mídia recebida.
+        
+        Args:
+            media_result: Retorno de OCRTools.process_whatsapp_media
+            
+        Returns:
+            Dict: Mensagem de sistema
+        """
+        if not media_result.get("success"):
+            summary = {"erro": "Não foi possível ler a mídia enviada; peça uma foto mais nítida da conta de luz"}
+        else:
+            summary = {
+                name: media_result.get(name)
+                for name in ("classification", "is_energy_bill", "valor_conta", "distribuidora",
+                             "data_vencimento", "consumo_kwh", "confianca", "media_url")
+                if media_result.get(name) not in (None, "")
+            }
+        return {
+            "role": "system",
+            "content": f"Análise da mídia recebida nesta mensagem: {json.dumps(summary, ensure_ascii=False, default=str)}"
+        }
+    
+    def _schedule_summary_update(self, phone_number: str, previous_summary: Optional[str],
+                                 turns: List[Dict[str, Any]]):
+        """
+        Agenda a atualização do resumo incremental em segundo plano.
+        
+        Args:
+            phone_number: Telefone do lead
+            previous_summary: Resumo atual do lead
+            turns: Mensagens que saíram da janela e ainda não foram resumidas
+        """
+        with self._summaries_lock:
+            if phone_number in self._summaries_in_progress:
+                return
+            self._summaries_in_progress.add(phone_number)
+        
+        self.tool_executor.submit(self._update_conversation_summary, phone_number, previous_summary, turns)
+    
+    def _update_conversation_summary(self, phone_number: str, previous_summary: Optional[str],
+                                     turns: List[Dict[str, Any]]):
+        """Incorpora os turnos ao resumo com o modelo de resumo e grava no lead."""
+        try:
+            response = self.client.chat.completions.create(
+                model=self.summary_model,
+                messages=self.context_builder.summary_messages(previous_summary, turns),
+                max_tokens=300,
+                temperature=0.2
+            )
+            summary = (response.choices[0].message.content or "").strip()
+            
+            if summary:
+                self.supabase_tools.update_conversation_summary(
+                    phone_number,
+                    summary,
+                    summary_until_id=max(int(turn["id"]) for turn in turns)
+                )
+                logger.debug("Resumo da conversa atualizado", lead_id=phone_number, turns=len(turns))
+        
+        except Exception as e:
+            logger.warning(f"Erro ao atualizar resumo da conversa: {str(e)}", lead_id=phone_number, error=str(e))
+        
+        finally:
+            with self._summaries_lock:
+                self._summaries_in_progress.discard(phone_number)
+    
+    def _record_usage(self, usage: Any):
+        """
+        Registra o uso de tokens de uma chamada, incluindo os tokens em cache.
+        
+        Args:
+            usage: Objeto `usage` da resposta da OpenAI
+        """
+        if usage is None:
+            return
+        
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details else 0
+        
+        with self._usage_lock:
+            self._usage["calls"] += 1
+            self._usage["prompt_tokens"] += usage.prompt_tokens or 0
+            self._usage["cached_tokens"] += cached_tokens
+            self._usage["completion_tokens"] += usage.completion_tokens or 0
+        
+        logger.info("Uso de tokens", prompt_tokens=usage.prompt_tokens, cached_tokens=cached_tokens,
+                   completion_tokens=usage.completion_tokens)
+    
+    def usage_stats(self) -> Dict[str, Any]:
+        """
+        Retorna o uso de tokens acumulado desde o início do processo.
+        
+        Returns:
+            Dict: Chamadas, tokens de entrada/saída e taxa de acerto do cache de prompt
+        """
+        with self._usage_lock:
+            stats = dict(self._usage)
+        stats["cached_ratio"] = round(stats["cached_tokens"] / stats["prompt_tokens"], 4) if stats["prompt_tokens"] else 0.0
+        return stats
+    
+    def _build_system_prompt(self) -> str:
+        """
+        Constrói o prompt do sistema.
+        
+        Deve permanecer estático (sem dados do lead ou do estado da conversa)
+        para manter o prefixo da requisição idêntico entre chamadas.
+        """
         prompt = """Você é Sílvia, agente virtual de pré-vendas da Serena Energia. 
 
 MISSÃO: Ajudar leads a economizar até 95% na conta de luz com energia solar.
@@ -453,7 +735,7 @@ PERSONALIDADE:
 
 FLUXO DE CONVERSA:
 1. PRIMEIRO CONTATO: Cumprimente calorosamente e peça foto da conta de energia
-2. PROCESSAMENTO: Se receber imagem, processe via OCR e extraia valor
+2. PROCESSAMENTO: Se receber imagem ou PDF da conta, use a análise da mídia já incluída no contexto (ou process_energy_bill, se receber apenas uma URL)
 3. QUALIFICAÇÃO: Se conta >= R$ 200, qualifique o lead
 4. APRESENTAÇÃO: Se qualificado, apresente planos disponíveis
 5. FECHAMENTO: Se interesse, registre dados e crie contrato
@@ -462,14 +744,15 @@ REGRAS IMPORTANTES:
 - SEMPRE peça foto da conta de energia no primeiro contato
 - Só qualifique leads com conta >= R$ 200
 - Use as funções disponíveis para buscar dados e enviar mensagens
+- Quando precisar de várias informações independentes (ex.: dados do lead e planos), chame as funções na mesma resposta
 - Se não souber algo, seja honesto e ofereça contato humano
 - Mantenha conversa focada em energia solar e economia
 
 FUNÇÕES DISPONÍVEIS:
 - get_lead_data: Busca dados do lead
 - create_or_update_lead: Salva dados do lead
-- process_energy_bill: Processa imagem de fatura
-- validate_lead_qualification: Valida qualificação
+- process_energy_bill: Processa imagem ou PDF de fatura
+- validate_lead_qualification: Valida qualificação (confirmacao_oficial=true antes de cadastro ou contrato)
 - get_energy_plans: Obtém planos disponíveis
 - send_whatsapp_message: Envia mensagem
 - send_welcome_message: Envia boas-vindas
@@ -481,55 +764,216 @@ Lembre-se: Seja Sílvia, a consultora virtual que ajuda a economizar com energia
         
         return prompt
     
-    def _process_function_calling(self, messages: List[Dict[str, str]]) -> str:
-        """Processa o loop de function calling."""
+    def _process_function_calling(self, messages: List[Dict[str, Any]]) -> str:
+        """Processa o loop de function calling (tools API com chamadas paralelas)."""
         max_iterations = 10  # Evitar loop infinito
         iteration = 0
         
         while iteration < max_iterations:
             try:
+                # Resultados de tool acumulados contam no orçamento a cada rodada
+                self.context_builder.fit(messages, self.tools)
+                
                 # Chamar OpenAI
-                response = openai.ChatCompletion.create(
+                response = self.client.chat.completions.create(
                     model=self.model,
                     messages=messages,
-                    functions=self.functions,
-                    function_call="auto",
+                    tools=self.tools,
+                    tool_choice="auto",
+                    parallel_tool_calls=True,
                     max_tokens=self.max_tokens,
                     temperature=self.temperature
                 )
                 
+                self._record_usage(response.usage)
                 message = response.choices[0].message
                 
-                # Se não há function call, retornar resposta final
-                if not message.get("function_call"):
-                    return message["content"]
+                # Se não há tool calls, retornar resposta final
+                if not message.tool_calls:
+                    logger.debug("Function calling concluído", iterations=iteration + 1)
+                    return message.content
+                
+                # Registrar a resposta do assistente com as tool calls
+                messages.append({
+                    "role": "assistant",
+                    "content": message.content,
+                    "tool_calls": [tool_call.model_dump() for tool_call in message.tool_calls]
+                })
+                
+                # Executar todas as tool calls da resposta e adicionar os resultados
+                messages.extend(self._execute_tool_calls(message.tool_calls))
+                
+                iteration += 1
+                
+            except Exception as e:
+                logger.error(f"Erro no function calling: {str(e)}", error=str(e), error_type=type(e).__name__)
+                return TECHNICAL_ERROR_MESSAGE
+        
+        return "Desculpe, o processamento demorou muito. Tente novamente."
+    
+    def _process_function_calling_stream(self, messages: List[Dict[str, Any]],
+                                         on_chunk: Callable[[str], None]) -> str:
+        """
+        Processa o loop de function calling com streaming da resposta.
+        
+        O texto do modelo é repassado a `on_chunk` em trechos completos (frase
+        ou parágrafo) enquanto é gerado; as tool calls são acumuladas a partir
+        dos deltas e executadas como no modo sem streaming.
+        
+        Args:
+            messages: Mensagens da conversa
+            on_chunk: Callback que recebe cada trecho pronto para envio
+            
+        Returns:
+            str: Texto completo entregue ao lead
+        """
+        max_iterations = 10  # Evitar loop infinito
+        iteration = 0
+        chunker = ResponseChunker()
+        delivered = []
+        
+        def emit(chunks: List[str]):
+            for chunk in chunks:
+                delivered.append(chunk)
+                on_chunk(chunk)
+        
+        while iteration < max_iterations:
+            try:
+                # Resultados de tool acumulados contam no orçamento a cada rodada
+                self.context_builder.fit(messages, self.tools)
+                
+                stream = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    tools=self.tools,
+                    tool_choice="auto",
+                    parallel_tool_calls=True,
+                    max_tokens=self.max_tokens,
+                    temperature=self.temperature,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
                 
-                # Executar function call
-                function_call = message["function_call"]
-                function_name = function_call["name"]
-                function_args = json.loads(function_call["arguments"])
+                content = []
+                tool_calls: Dict[int, Dict[str, Any]] = {}
                 
-                logger.debug(f"Executando function call: {function_name}", 
-                           function=function_name, arguments=function_args)
+                for event in stream:
+                    # O último evento traz apenas o uso de tokens
+                    if getattr(event, "usage", None):
+                        self._record_usage(event.usage)
+                    if not event.choices:
+                        continue
+                    delta = event.choices[0].delta
+                    
+                    if delta.content:
+                        content.append(delta.content)
+                        emit(chunker.feed(delta.content))
+                    
+                    # Tool calls chegam fragmentadas: acumular por índice
+                    for tool_delta in delta.tool_calls or []:
+                        call = tool_calls.setdefault(tool_delta.index, {"id": None, "name": "", "arguments": ""})
+                        if tool_delta.id:
+                            call["id"] = tool_delta.id
+                        if tool_delta.function and tool_delta.function.name:
+                            call["name"] += tool_delta.function.name
+                        if tool_delta.function and tool_delta.function.arguments:
+                            call["arguments"] += tool_delta.function.arguments
                 
-                # Executar função
-                function_result = self._call_function(function_name, function_args)
+                # Se não há tool calls, a resposta final já foi transmitida
+                if not tool_calls:
+                    emit(chunker.flush())
+                    logger.debug("Function calling concluído", iterations=iteration + 1, chunks=len(delivered))
+                    return "\n\n".join(delivered)
                 
-                # Adicionar resultado à conversa
-                messages.append(message)
+                calls = [tool_calls[index] for index in sorted(tool_calls)]
                 messages.append({
-                    "role": "function",
-                    "name": function_name,
-                    "content": json.dumps(function_result, ensure_ascii=False)
+                    "role": "assistant",
+                    "content": "".join(content) or None,
+                    "tool_calls": [
+                        {
+                            "id": call["id"],
+                            "type": "function",
+                            "function": {"name": call["name"], "arguments": call["arguments"]}
+                        }
+                        for call in calls
+                    ]
                 })
                 
+                messages.extend(self._execute_tool_calls([
+                    types.SimpleNamespace(
+                        id=call["id"],
+                        function=types.SimpleNamespace(name=call["name"], arguments=call["arguments"])
+                    )
+                    for call in calls
+                ]))
+                
                 iteration += 1
                 
             except Exception as e:
-                logger.error(f"Erro no function calling: {str(e)}", error=str(e))
-                return f"Desculpe, ocorreu um erro técnico: {str(e)}"
+                logger.error(f"Erro no function calling: {str(e)}", error=str(e), error_type=type(e).__name__)
+                emit(chunker.flush())
+                emit([TECHNICAL_ERROR_MESSAGE])
+                return "\n\n".join(delivered)
         
-        return "Desculpe, o processamento demorou muito. Tente novamente."
+        emit(chunker.flush())
+        emit(["Desculpe, o processamento demorou muito. Tente novamente."])
+        return "\n\n".join(delivered)
+    
+    def _execute_tool_calls(self, tool_calls: List[Any]) -> List[Dict[str, Any]]:
+        """
+        Executa as tool calls de uma resposta do modelo.
+        
+        Chamadas somente leitura rodam em paralelo no pool de threads; chamadas
+        com efeitos colaterais rodam em sequência, na ordem pedida pelo modelo.
+        
+        Args:
+            tool_calls: Tool calls retornadas pelo modelo
+            
+        Returns:
+            List: Mensagens "tool" na mesma ordem das chamadas (cada resultado
+                limitado a TOOL_RESULT_MAX_TOKENS para respeitar o orçamento)
+        """
+        calls = []
+        for tool_call in tool_calls:
+            try:
+                arguments = json.loads(tool_call.function.arguments or "{}")
+            except json.JSONDecodeError as e:
+                arguments = None
+                logger.warning(f"Argumentos inválidos para {tool_call.function.name}: {str(e)}")
+            calls.append((tool_call.id, tool_call.function.name, arguments))
+        
+        parallel = len(calls) > 1
+        futures = {}
+        results = {}
+        
+        # Disparar as chamadas independentes no pool
+        for call_id, name, arguments in calls:
+            if arguments is None:
+                results[call_id] = {"success": False, "error": "Argumentos JSON inválidos"}
+            elif parallel and name in self.PARALLEL_SAFE_FUNCTIONS:
+                futures[call_id] = self.tool_executor.submit(self._call_function, name, arguments)
+        
+        # Executar as demais em sequência enquanto as paralelas rodam
+        for call_id, name, arguments in calls:
+            if call_id not in results and call_id not in futures:
+                results[call_id] = self._call_function(name, arguments)
+        
+        for call_id, future in futures.items():
+            results[call_id] = future.result()
+        
+        logger.debug("Tool calls executadas", total=len(calls), parallel=len(futures))
+        
+        return [
+            {
+                "role": "tool",
+                "tool_call_id": call_id,
+                "content": self.context_builder.truncate(
+                    json.dumps(results[call_id], ensure_ascii=False, default=str),
+                    TOOL_RESULT_MAX_TOKENS
+                )
+            }
+            for call_id, _, _ in calls
+        ]
     
     def process_image_message(self, image_url: str, lead_id: str = None) -> Dict[str, Any]:
         """Processa mensagem com imagem (fatura de energia)."""
@@ -546,6 +990,14 @@ Lembre-se: Seja Sílvia, a consultora virtual que ajuda a economizar com energia
                     "response": "Desculpe, não consegui ler sua fatura de energia. Pode enviar uma foto mais clara?"
                 }
             
+            # A análise já classificou a imagem: sem extração se não for fatura
+            if ocr_result.get("is_energy_bill") is False:
+                return {
+                    "success": False,
+                    "error": f"Imagem não é fatura de energia ({ocr_result.get('classification')})",
+                    "response": "Essa imagem não parece ser uma conta de luz. 😊 Pode me enviar uma foto da sua fatura de energia?"
+                }
+            
             # Extrair dados
             extracted_data = ocr_result["dados_extraidos"]
             valor_conta = ocr_result["valor_conta"]
@@ -0,0 +1,14 @@
+-- Migration: Idempotent user messages keyed by WhatsApp message id
+-- Author: Serena SDR System
+-- Date: 2026-10-17
+
+-- NOTA: Retentativas da fila de mensagens gravam a mesma mensagem do usuário
+-- mais de uma vez; o ID da mensagem do WhatsApp torna a inserção idempotente
+-- (INSERT ... ON CONFLICT DO NOTHING). Respostas do bot ficam com NULL.
+
+ALTER TABLE lead_messages
+ADD COLUMN IF NOT EXISTS whatsapp_message_id TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_lead_messages_whatsapp_message_id
+ON lead_messages(whatsapp_message_id)
+WHERE whatsapp_message_id IS NOT NULL;
@@ -0,0 +1,13 @@
+-- Migration: Content-addressed storage path for energy bill images
+-- Author: Serena SDR System
+-- Date: 2026-10-17
+
+-- NOTA: O upload grava a imagem no bucket pelo SHA-256 do conteúdo, então a
+-- mesma imagem enviada por leads diferentes compartilha o objeto. O image_id
+-- continua único por envio; o caminho no bucket fica em storage_path.
+
+ALTER TABLE energy_bill_images
+ADD COLUMN IF NOT EXISTS storage_path TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_energy_bill_images_storage_path
+ON energy_bill_images(storage_path);
@@ -26,10 +26,22 @@ import openai
 from typing import Dict, Any, Optional
 from datetime import datetime
 
+# Análise combinada (classificação + extração) e cache de OCR por conteúdo
+# (opcionais: indisponíveis fora do pacote scripts)
+try:
+    from scripts.agent_tools.ocr_cache import get_ocr_cache, content_hash, fetch_image_bytes
+    from scripts.agent_tools.ocr_tools import OCRTools
+except ImportError:
+    get_ocr_cache = None
+    OCRTools = None
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("serena_sdr.media_classification")
 
+# Versão do prompt de classificação (parte da chave do cache)
+CLASSIFICATION_PROMPT_VERSION = "v1"
+
 
 def classify_media_content(media_id: str, message_type: str, message_text: str) -> Dict[str, Any]:
     """
@@ -110,6 +122,13 @@ class MediaClassifier:
         self.max_tokens = 500
         self.temperature = 0.1
         
+        # Cache de classificações por conteúdo da imagem
+        self.cache = get_ocr_cache() if get_ocr_cache else None
+        
+        # Análise combinada: a mesma chamada já extrai a fatura completa, que
+        # fica no cache para o OCRTools.process_energy_bill_image seguinte
+        self.ocr_tools = OCRTools() if OCRTools and self.openai_api_key else None
+        
         logger.info("Media Classifier inicializado")
     
     def classify_media(self, image_url: str, media_id: str = None) -> Dict[str, Any]:
@@ -126,6 +145,30 @@ class MediaClassifier:
         try:
             logger.info(f"Classificando mídia: {image_url}")
             
+            if self.ocr_tools is not None:
+                return self._classify_with_analysis(image_url, media_id)
+            
+            # A mesma imagem (mesmo conteúdo) não é classificada de novo
+            cache_key = None
+            if self.cache is not None:
+                try:
+                    image_hash = content_hash(fetch_image_bytes(image_url))
+                    cache_key = f"classification_{CLASSIFICATION_PROMPT_VERSION}-{image_hash}"
+                except Exception as e:
+                    logger.warning(f"Imagem não disponível para o cache: {str(e)}")
+            
+            if cache_key:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    logger.info("Classificação obtida do cache")
+                    return {
+                        **cached,
+                        "media_id": media_id,
+                        "image_url": image_url,
+                        "timestamp": datetime.now().isoformat(),
+                        "cached": True
+                    }
+            
             # Prompt para classificação
             system_prompt = """
             Você é um classificador especializado em documentos de energia.
@@ -196,6 +239,10 @@ class MediaClassifier:
                 
                 result = json.loads(json_str)
                 
+                # Apenas respostas válidas vão para o cache (o fallback não)
+                if cache_key:
+                    self.cache.set(cache_key, dict(result, model_used=self.model))
+                
             except json.JSONDecodeError:
                 # Fallback se não conseguir extrair JSON
                 logger.warning("Não foi possível extrair JSON da resposta, usando fallback")
@@ -231,6 +278,44 @@ class MediaClassifier:
                 "error": str(e)
             }
     
+    def _classify_with_analysis(self, image_url: str, media_id: str = None) -> Dict[str, Any]:
+        """
+        Classifica via análise combinada do OCRTools (uma chamada de visão).
+        
+        Args:
+            image_url: URL da imagem para classificar
+            media_id: ID da mídia do WhatsApp
+            
+        Returns:
+            Dict com informações da classificação (e a extração completa em "bill_analysis")
+        """
+        analysis = self.ocr_tools.analyze_image(image_url)
+        
+        if not analysis.get("success"):
+            raise RuntimeError(analysis.get("error", "Falha na análise da imagem"))
+        
+        result = {
+            "classification": analysis.get("classification", "energy_bill"),
+            "confidence": analysis.get("classification_confidence", analysis.get("confianca", 0) / 100),
+            "extracted_data": {
+                "total_value": analysis.get("valor_conta"),
+                "due_date": analysis.get("data_vencimento"),
+                "consumption_kwh": analysis.get("consumo_kwh"),
+                "utility_name": analysis.get("distribuidora")
+            } if analysis.get("dados_extraidos") else {},
+            "reasoning": analysis.get("reasoning", ""),
+            "bill_analysis": analysis,
+            "media_id": media_id,
+            "image_url": image_url,
+            "timestamp": datetime.now().isoformat(),
+            "model_used": self.ocr_tools.vision_model,
+            "cached": analysis.get("cached", False)
+        }
+        
+        logger.info(f"Classificação concluída: {result['classification']} (confiança: {result['confidence']})")
+        
+        return result
+    
     def is_energy_bill(self, classification_result: Dict[str, Any]) -> bool:
         """
         Verifica se a classificação indica uma fatura de energia.
@@ -49,6 +49,11 @@ class SDRConfig:
     request_timeout: int = 30
     context_size_limit: int = 102400
     
+    # Context Configuration (orçamento de tokens por chamada ao modelo)
+    context_token_budget: int = 6000
+    context_recent_messages: int = 6
+    context_summary_model: str = "gpt-4o-mini"
+    
     # Logging Configuration
     log_level: str = "INFO"
     log_format: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -113,6 +118,10 @@ class SDRConfig:
             request_timeout=int(os.getenv('REQUEST_TIMEOUT', '30')),
             context_size_limit=int(os.getenv('CONTEXT_SIZE_LIMIT', '102400')),
             
+            context_token_budget=int(os.getenv('CONTEXT_TOKEN_BUDGET', '6000')),
+            context_recent_messages=int(os.getenv('CONTEXT_RECENT_MESSAGES', '6')),
+            context_summary_model=os.getenv('CONTEXT_SUMMARY_MODEL', 'gpt-4o-mini'),
+            
             log_level=os.getenv('LOG_LEVEL', 'INFO'),
             log_format=os.getenv('LOG_FORMAT', '%(asctime)s - %(name)s - %(levelname)s - %(message)s'),
             
@@ -151,6 +160,9 @@ class SDRConfig:
             'max_retries': self.max_retries,
             'request_timeout': self.request_timeout,
             'context_size_limit': self.context_size_limit,
+            'context_token_budget': self.context_token_budget,
+            'context_recent_messages': self.context_recent_messages,
+            'context_summary_model': self.context_summary_model,
             'log_level': self.log_level,
             'min_invoice_amount': self.min_invoice_amount,
             'follow_up_delay_hours': self.follow_up_delay_hours
@@ -0,0 +1,374 @@
+# =============================================================================
+# SERENA SDR - CONTEXT BUILDER
+# =============================================================================
+
+"""
+Context Builder
+
+Monta as mensagens enviadas ao modelo dentro de um orçamento de tokens:
+
+- Conta tokens com tiktoken (mesmo tokenizer do modelo configurado)
+- Projeta o lead apenas nos campos usados pelo prompt
+- Mantém as mensagens mais recentes na íntegra e devolve as que saíram da
+  janela para serem incorporadas ao resumo incremental da conversa, que fica
+  guardado no lead (additional_data.conversation_summary)
+- No loop de function calling, recalcula os tokens antes de cada chamada e
+  compacta resultados de tool de rodadas anteriores se o orçamento estourar
+
+Author: Serena SDR System
+Version: 1.0.0
+Created: 2026-10-17
+"""
+
+import json
+import logging
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, Any, Optional, List
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# Campos do lead relevantes para o prompt (o restante da linha fica de fora)
+LEAD_CONTEXT_FIELDS = (
+    "name",
+    "phone_number",
+    "city",
+    "state",
+    "invoice_amount",
+    "client_type",
+    "qualification_status",
+    "conversation_state"
+)
+
+# Limite de tokens de cada resultado de tool devolvido ao modelo
+TOOL_RESULT_MAX_TOKENS = 1500
+
+# Limite de resultados de tool de rodadas anteriores quando o orçamento estoura
+COMPACT_TOOL_RESULT_TOKENS = 200
+OMITTED_TOOL_RESULT = '{"omitido": "resultado anterior removido para caber no contexto"}'
+
+# Custo fixo de cada mensagem no formato de chat e do início da resposta
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_OVERHEAD_TOKENS = 3
+
+SUMMARY_INSTRUCTIONS = """Você resume conversas de pré-vendas da Serena Energia (energia solar por assinatura).
+Atualize o resumo com as novas mensagens, mantendo em até 120 palavras:
+- dados informados pelo lead (nome, cidade, valor da conta, tipo de cliente)
+- dúvidas e objeções levantadas
+- planos apresentados e o interesse demonstrado
+- combinados e próximos passos
+Responda apenas com o resumo atualizado."""
+
+
+@lru_cache(maxsize=8)
+def _encoding_for_model(model: str):
+    """Tokenizer do modelo (o200k_base quando o modelo não é reconhecido)."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+@dataclass
+class BuiltContext:
+    """Resultado da montagem do contexto."""
+    
+    messages: List[Dict[str, Any]]
+    prompt_tokens: int
+    # Mensagens que saíram da janela e ainda não estão no resumo
+    pending_summary: List[Dict[str, Any]] = field(default_factory=list)
+    summary: Optional[str] = None
+
+
+class ContextBuilder:
+    """Monta o contexto do agente respeitando o orçamento de tokens."""
+    
+    def __init__(self, model: str, token_budget: int = 6000, recent_messages: int = 6):
+        """
+        Inicializa o montador de contexto.
+        
+        Args:
+            model: Modelo usado nas chamadas (define o tokenizer)
+            token_budget: Máximo de tokens de entrada por chamada (mensagens + tools)
+            recent_messages: Máximo de mensagens recentes mantidas na íntegra
+        """
+        self.model = model
+        self.token_budget = token_budget
+        self.recent_messages = recent_messages
+        self.encoding = _encoding_for_model(model)
+    
+    def count_tokens(self, text: str) -> int:
+        """Conta os tokens de um texto."""
+        return len(self.encoding.encode(text or ""))
+    
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Corta um texto para caber em max_tokens.
+        
+        Args:
+            text: Texto original
+            max_tokens: Limite de tokens
+        
+        Returns:
+            str: Texto (cortado com reticências se necessário)
+        """
+        tokens = self.encoding.encode(text or "")
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoding.decode(tokens[:max_tokens]) + "…"
+    
+    def count_messages(self, messages: List[Dict[str, Any]]) -> int:
+        """
+        Estima os tokens de uma lista de mensagens no formato de chat.
+        
+        Args:
+            messages: Mensagens (role/content e tool_calls do assistente)
+        
+        Returns:
+            int: Tokens estimados
+        """
+        total = 0
+        for message in messages:
+            total += MESSAGE_OVERHEAD_TOKENS + self.count_tokens(message.get("content") or "")
+            for tool_call in message.get("tool_calls") or []:
+                function = tool_call.get("function") or {}
+                total += self.count_tokens(function.get("name")) + self.count_tokens(function.get("arguments"))
+        return total
+    
+    def count_tools(self, tools: List[Dict[str, Any]] = None) -> int:
+        """Estima os tokens das definições de tools enviadas em cada chamada."""
+        if not tools:
+            return 0
+        return self.count_tokens(json.dumps(tools, ensure_ascii=False))
+    
+    @staticmethod
+    def project_lead(lead_data: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Reduz a linha do lead aos campos usados pelo prompt.
+        
+        Args:
+            lead_data: Linha completa da tabela leads
+        
+        Returns:
+            Dict: Campos relevantes e preenchidos
+        """
+        if not lead_data:
+            return {}
+        return {
+            name: lead_data[name]
+            for name in LEAD_CONTEXT_FIELDS
+            if lead_data.get(name) not in (None, "")
+        }
+    
+    @staticmethod
+    def _additional_data(lead_data: Dict[str, Any] = None) -> Dict[str, Any]:
+        """additional_data do lead (o MCP Server pode devolver JSONB como texto)."""
+        additional_data = (lead_data or {}).get("additional_data") or {}
+        if isinstance(additional_data, str):
+            try:
+                additional_data = json.loads(additional_data)
+            except ValueError:
+                return {}
+        return additional_data if isinstance(additional_data, dict) else {}
+    
+    @classmethod
+    def stored_summary(cls, lead_data: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Resumo incremental guardado no lead.
+        
+        Args:
+            lead_data: Linha da tabela leads
+        
+        Returns:
+            Dict: summary (texto ou None) e until_id (última mensagem resumida)
+        """
+        additional_data = cls._additional_data(lead_data)
+        try:
+            until_id = int(additional_data.get("summary_until_id") or 0)
+        except (TypeError, ValueError):
+            until_id = 0
+        return {"summary": additional_data.get("conversation_summary"), "until_id": until_id}
+    
+    @staticmethod
+    def normalize_history(history: List[Dict[str, Any]] = None, user_message: str = None) -> List[Dict[str, Any]]:
+        """
+        Converte o histórico de lead_messages em turnos de chat, do mais antigo ao mais recente.
+        
+        A mensagem atual do usuário pode já ter sido gravada antes da leitura
+        do histórico; nesse caso ela é removida para não aparecer duas vezes.
+        
+        Args:
+            history: Linhas de lead_messages (em qualquer ordem)
+            user_message: Mensagem atual do usuário
+        
+        Returns:
+            List: Turnos com id, role e content
+        """
+        rows = [row for row in history or [] if row.get("message_content")]
+        rows.sort(key=lambda row: (str(row.get("created_at") or ""), row.get("id") or 0))
+        
+        turns = [
+            {
+                "id": row.get("id"),
+                "role": "user" if row.get("message_direction") == "user" else "assistant",
+                "content": row["message_content"]
+            }
+            for row in rows
+        ]
+        
+        if turns and user_message and turns[-1]["role"] == "user" and turns[-1]["content"] == user_message:
+            turns.pop()
+        
+        return turns
+    
+    def build(self, system_prompt: str, lead_data: Dict[str, Any] = None,
+              history: List[Dict[str, Any]] = None, user_message: str = None,
+              tools: List[Dict[str, Any]] = None, conversation_state: str = None,
+              extra_messages: List[Dict[str, Any]] = None) -> BuiltContext:
+        """
+        Monta as mensagens da chamada dentro do orçamento de tokens.
+        
+        Ordem: prompt do sistema, estado + lead projetado, resumo, mensagens
+        recentes, mensagens extras (ex.: análise da mídia) e a mensagem atual. O prompt do sistema deve ser estático:
+        tudo o que varia por lead vem depois dele, para que o prefixo da
+        requisição (tools + prompt) seja idêntico entre chamadas e aproveite
+        o cache de prompt do provedor. As mensagens recentes entram da mais
+        nova para a mais antiga enquanto couberem no orçamento.
+        
+        Args:
+            system_prompt: Prompt do sistema
+            lead_data: Linha do lead
+            history: Histórico de lead_messages
+            user_message: Mensagem atual do usuário
+            tools: Definições de tools enviadas junto (entram no orçamento)
+            conversation_state: Estado atual da conversa
+            extra_messages: Mensagens de sistema deste turno, logo antes da
+                mensagem do usuário (entram no orçamento)
+        
+        Returns:
+            BuiltContext: Mensagens, tokens estimados e turnos a resumir
+        """
+        stored = self.stored_summary(lead_data)
+        summary = stored["summary"]
+        
+        head = [{"role": "system", "content": system_prompt}]
+        
+        lead_context = self.project_lead(lead_data)
+        conversation_state = conversation_state or lead_context.get("conversation_state")
+        lead_context.pop("conversation_state", None)
+        
+        dynamic_lines = []
+        if conversation_state:
+            dynamic_lines.append(f"Estado atual da conversa: {conversation_state}")
+        if lead_context:
+            dynamic_lines.append(f"Contexto do lead: {json.dumps(lead_context, ensure_ascii=False, default=str)}")
+        if dynamic_lines:
+            head.append({"role": "system", "content": "\n".join(dynamic_lines)})
+        
+        tail = list(extra_messages or [])
+        if user_message:
+            tail.append({"role": "user", "content": user_message})
+        
+        fixed_tokens = self.count_messages(head + tail) + self.count_tools(tools) + REPLY_OVERHEAD_TOKENS
+        
+        if summary:
+            # O resumo é o primeiro a ser cortado se o contexto fixo estourar o orçamento
+            available = self.token_budget - fixed_tokens - MESSAGE_OVERHEAD_TOKENS
+            summary_tokens = self.encoding.encode(f"Resumo da conversa até aqui: {summary}")
+            if len(summary_tokens) > available:
+                summary_tokens = summary_tokens[:max(available, 0)]
+            if summary_tokens:
+                head.append({"role": "system", "content": self.encoding.decode(summary_tokens)})
+                fixed_tokens += MESSAGE_OVERHEAD_TOKENS + len(summary_tokens)
+        
+        if fixed_tokens > self.token_budget:
+            logger.warning(f"Contexto fixo ({fixed_tokens} tokens) excede o orçamento de {self.token_budget}")
+        
+        turns = self.normalize_history(history, user_message)
+        remaining = self.token_budget - fixed_tokens
+        recent: List[Dict[str, Any]] = []
+        
+        for turn in reversed(turns):
+            cost = MESSAGE_OVERHEAD_TOKENS + self.count_tokens(turn["content"])
+            if len(recent) >= self.recent_messages or cost > remaining:
+                break
+            recent.insert(0, turn)
+            remaining -= cost
+        
+        dropped = turns[:len(turns) - len(recent)]
+        pending = [turn for turn in dropped if turn["id"] is not None and int(turn["id"]) > stored["until_id"]]
+        
+        messages = head + [{"role": turn["role"], "content": turn["content"]} for turn in recent] + tail
+        
+        return BuiltContext(
+            messages=messages,
+            prompt_tokens=self.token_budget - remaining,
+            pending_summary=pending,
+            summary=summary
+        )
+    
+    def fit(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]] = None) -> int:
+        """
+        Recalcula os tokens antes de cada chamada do loop de function calling.
+        
+        Se o orçamento estourar, os resultados de tool de rodadas anteriores
+        (já vistos pelo modelo) são cortados e, se ainda preciso, omitidos, do
+        mais antigo para o mais recente. Os resultados da última rodada ficam
+        intactos. As mensagens são alteradas no lugar.
+        
+        Args:
+            messages: Mensagens da chamada
+            tools: Definições de tools enviadas junto
+        
+        Returns:
+            int: Tokens estimados após a compactação
+        """
+        total = self.count_messages(messages) + self.count_tools(tools) + REPLY_OVERHEAD_TOKENS
+        if total <= self.token_budget:
+            return total
+        
+        last_round = max(
+            (index for index, message in enumerate(messages)
+             if message.get("role") == "assistant" and message.get("tool_calls")),
+            default=len(messages)
+        )
+        older = [index for index in range(last_round) if messages[index].get("role") == "tool"]
+        
+        for compact in (lambda content: self.truncate(content, COMPACT_TOOL_RESULT_TOKENS),
+                        lambda content: OMITTED_TOOL_RESULT):
+            for index in older:
+                if total <= self.token_budget:
+                    return total
+                content = messages[index].get("content") or ""
+                compacted = compact(content)
+                total += self.count_tokens(compacted) - self.count_tokens(content)
+                messages[index]["content"] = compacted
+        
+        if total > self.token_budget:
+            logger.warning(f"Contexto do function calling ({total} tokens) excede o orçamento de {self.token_budget}")
+        return total
+    
+    def summary_messages(self, previous_summary: Optional[str], turns: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Mensagens para o modelo atualizar o resumo com os turnos que saíram da janela.
+        
+        Args:
+            previous_summary: Resumo atual (ou None)
+            turns: Turnos a incorporar
+        
+        Returns:
+            List: Mensagens da chamada de resumo
+        """
+        transcript = "\n".join(
+            f"{'Lead' if turn['role'] == 'user' else 'Sílvia'}: {turn['content']}"
+            for turn in turns
+        )
+        return [
+            {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+            {
+                "role": "user",
+                "content": f"Resumo atual:\n{previous_summary or '(vazio)'}\n\nNovas mensagens:\n{transcript}"
+            }
+        ]
@@ -14,12 +14,15 @@ Created: 2025-01-17
 """
 
 import json
-import requests
 import logging
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 import time
 
+import httpx
+
+from agent_tools.mcp_transport import get_transport
+
 from .config import get_config
 from .logger import get_logger
 
@@ -41,13 +44,9 @@ class MCPClient:
         self.base_url = base_url.rstrip('/')
         self.timeout = timeout
         self.max_retries = max_retries
-        self.session = requests.Session()
         
-        # Configurar headers padrão
-        self.session.headers.update({
-            'Content-Type': 'application/json',
-            'User-Agent': 'Serena-SDR-MCP-Client/1.0.0'
-        })
+        # Pool de conexões compartilhado por host (keep-alive/HTTP2)
+        self.transport = get_transport()
     
     def _make_request(self, method: str, params: Dict[str, Any] = None) -> Dict[str, Any]:
         """
@@ -60,49 +59,32 @@ class MCPClient:
         Returns:
             Dict: Resposta do servidor
         """
-        payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": method
-        }
-        
-        if params:
-            payload["params"] = params
-        
         for attempt in range(self.max_retries):
             try:
                 logger.debug(f"Fazendo requisição MCP: {method}", 
                            service=self.base_url, method=method, attempt=attempt + 1)
                 
-                response = self.session.post(
-                    f"{self.base_url}/mcp",
-                    json=payload,
-                    timeout=self.timeout
+                result = self.transport.request(
+                    self.base_url,
+                    method,
+                    params or None,
+                    timeout=self.timeout,
+                    max_retries=1
                 )
-                response.raise_for_status()
-                
-                result = response.json()
-                
-                # Verificar se há erro na resposta
-                if "error" in result:
-                    error_msg = result["error"]
-                    logger.error(f"Erro MCP: {error_msg}", 
-                               service=self.base_url, method=method, error=error_msg)
-                    raise Exception(f"MCP Error: {error_msg}")
                 
                 logger.debug(f"Requisição MCP bem-sucedida: {method}", 
                            service=self.base_url, method=method)
                 
-                return result.get("result", {})
+                return result
                 
-            except requests.exceptions.Timeout:
+            except httpx.TimeoutException:
                 logger.warning(f"Timeout na tentativa {attempt + 1} para {method}", 
                              service=self.base_url, method=method, attempt=attempt + 1)
                 if attempt == self.max_retries - 1:
                     raise Exception(f"Timeout após {self.max_retries} tentativas")
                 time.sleep(1)
                 
-            except requests.exceptions.RequestException as e:
+            except httpx.HTTPError as e:
                 logger.error(f"Erro de requisição na tentativa {attempt + 1}: {str(e)}", 
                            service=self.base_url, method=method, error=str(e))
                 if attempt == self.max_retries - 1:
@@ -171,7 +153,7 @@ class MCPClient:
             Dict: Status de saúde do servidor
         """
         try:
-            response = self.session.get(f"{self.base_url}/health", timeout=10)
+            response = self.transport.get(self.base_url, "/health", timeout=10)
             response.raise_for_status()
             return response.json()
         except Exception as e: